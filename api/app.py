@@ -1,74 +1,308 @@
-import base64
 import json
 import os
+import queue
+import threading
+import time
+import zlib
 from http.server import BaseHTTPRequestHandler, HTTPServer
-from urllib.parse import urlparse
-
-from etl.parse_xml import save_to_json
+from urllib.parse import parse_qs, urlparse
+
+from api.auth import get_user_table
+from api.cache import CachedResponse, ResponseCache, response_key
+from api.db import get_database
+from api.indexes import is_paged_query, parse_query
+from api.schemas import SMS_RECORD
+from api.search import parse_search_query
+from api.stats import parse_stats_query
+from api.store import get_store
+from etl import metrics
+from etl.clean_normalize import record_dict
 
 DATA_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "processed", "sms_records.json")
 USER_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "processed", "users.json")
+DB_FILE = os.environ.get("MOMO_DB_FILE",
+                         os.path.join(os.path.dirname(__file__), "..", "data", "processed", "momo.db"))
+
+# "json" serves DATA_FILE from memory; "sqlite" serves DB_FILE (see etl/load_db.py)
+STORAGE = os.environ.get("MOMO_STORAGE", "json")
+
+# Records encoded per chunk of a streamed response
+STREAM_BATCH = 256
+GZIP_LEVEL = 1
+
+# Encoded GET responses kept per store, in bytes; 0 turns the cache off
+RESPONSE_CACHE_BYTES = int(os.environ.get("MOMO_RESPONSE_CACHE_BYTES", 64 * 1024 * 1024))
+
+# Longest sampling run GET /debug/profile takes, in seconds
+MAX_PROFILE_SECONDS = 60
+
+# POST /transactions/batch: largest body, longest NDJSON line, and most
+# per-line errors listed in the response (all of them are counted)
+MAX_BATCH_BYTES = 256 * 1024 * 1024
+MAX_BATCH_LINE_BYTES = 1024 * 1024
+MAX_BATCH_ERRORS = 100
+
+REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    "http_request_duration_seconds", "Time to serve a request, response included", ("method", "endpoint", "status"))
+IN_FLIGHT = metrics.REGISTRY.gauge("http_requests_in_flight", "Requests being served", ("endpoint",))
+QUEUED = metrics.REGISTRY.gauge("http_connections_queued", "Accepted connections waiting for a worker")
+
+# The store holds records as etl.clean_normalize.SmsRecord mappings
+_encode_compact = json.JSONEncoder(separators=(",", ":"), default=record_dict).encode
+
+
+def get_transactions():
+    """The transaction store backing the API, per STORAGE"""
+    if STORAGE == "sqlite":
+        return get_database(DB_FILE)
+    return get_store(DATA_FILE)
+
+
+def iter_json_array(records, batch=STREAM_BATCH):
+    """Compact JSON text of a list of records, in pieces of `batch` records"""
+    yield "["
+    for start in range(0, len(records), batch):
+        piece = ",".join(map(_encode_compact, records[start:start + batch]))
+        yield piece if start == 0 else "," + piece
+    yield "]"
+
 
+def iter_json_page(page):
+    """Compact JSON text of a page from TransactionIndex.page, in pieces"""
+    yield '{"items":'
+    yield from iter_json_array(page["items"])
+    yield ',"next_cursor":' + _encode_compact(page["next_cursor"]) + "}"
 
-def load_data():
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
 
+def response_cache():
+    """A ResponseCache of RESPONSE_CACHE_BYTES, registered with a store through TransactionStore.index"""
+    return ResponseCache(RESPONSE_CACHE_BYTES)
 
-def load_users():
-    try:
-        with open(USER_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
+
+def endpoint_name(path):
+    """The route a request path belongs to, as used in metric labels"""
+    path = path.partition("?")[0]
+    if path in ("/transactions", "/transactions/search", "/transactions/batch", "/stats", "/metrics",
+                "/debug/profile"):
+        return path
+    if path.startswith("/transactions/"):
+        return "/transactions/{id}"
+    if path.startswith("/transaction/"):
+        return "/transaction/{id}"
+    return "other"
+
+
+def get_users():
+    """The cached user table used to authenticate requests"""
+    return get_user_table(USER_FILE)
 
 
 class SMSHandler(BaseHTTPRequestHandler):
-    def _send_json(self, data, status=200):
+    # Keep connections open between requests; every response carries a
+    # Content-Length so the client knows where it ends
+    protocol_version = "HTTP/1.1"
+    # An idle keep-alive connection gives its worker back after this long
+    timeout = 15
+    # Headers and body go out in separate writes; don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+        if metrics.enabled:
+            endpoint = endpoint_name(self.path)
+            IN_FLIGHT.labels(endpoint).inc()
+            self._timing = (time.perf_counter(), endpoint)
+        return True
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
+
+    def handle_one_request(self):
+        # Requests are timed from the parsed request line to the flushed response
+        self._timing = None
+        self._status = None
+        # (cache, key, token, transaction id) while a GET may keep its response
+        self._caching = None
+        try:
+            super().handle_one_request()
+        finally:
+            self._record_timing()
+
+    def _record_timing(self):
+        if self._timing is not None:
+            started, endpoint = self._timing
+            self._timing = None
+            IN_FLIGHT.labels(endpoint).dec()
+            REQUEST_SECONDS.labels(self.command, endpoint, str(self._status or 0)).observe(
+                time.perf_counter() - started)
+
+    def _keep_alive(self):
+        """
+        Whether the connection may stay open for another request. Only a
+        server with a worker pool keeps connections, and only while no other
+        connection is waiting for a worker.
+        """
+        busy = getattr(self.server, "busy", None)
+        return busy is not None and not busy()
+
+    def _send_json(self, data, status=200, headers=(), close=False, cache=False):
+        body = json.dumps(data, indent=2, default=record_dict).encode("utf-8")
+        if cache:
+            self._keep(status, headers, body)
+        self._send_body(body, "application/json", status, headers, close)
+
+    def _send_body(self, body, content_type, status=200, headers=(), close=False):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        if close or not self._keep_alive():
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _accepts_gzip(self):
+        for coding in self.headers.get("Accept-Encoding", "").split(","):
+            name, _, params = coding.partition(";")
+            if name.strip().lower() == "gzip":
+                try:
+                    return float(params.strip().removeprefix("q=") or 1) > 0
+                except ValueError:
+                    return True
+        return False
+
+    def _not_modified(self, etag):
+        """Answer 304 if the client already holds this version; returns whether it did"""
+        tags = [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]
+        if "*" not in tags and etag.removeprefix("W/") not in [t.removeprefix("W/") for t in tags]:
+            return False
+
+        self.send_response(304)
+        self.send_header("ETag", etag)
+        self.end_headers()
+        return True
+
+    def _send_json_stream(self, pieces, status=200, headers=(), cache=False):
+        """
+        Send JSON text as it is produced, gzip-compressed if the client
+        accepts it. HTTP/1.1 clients get a chunked response; HTTP/1.0
+        clients get the body up to the connection closing. With `cache`,
+        the body is also collected for the response cache, as long as it
+        stays small enough to be kept.
+        """
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31) if self._accepts_gzip() else None
+        chunked = self.request_version != "HTTP/1.0"
+        kept = [] if cache and self._caching is not None else None
+        kept_gzip = [] if kept is not None and compressor else None
+        kept_bytes = 0
+
         self.send_response(status)
         self.send_header("Content-Type", "application/json")
+        self.send_header("Vary", "Accept-Encoding")
+        if compressor:
+            self.send_header("Content-Encoding", "gzip")
+        for name, value in headers:
+            self.send_header(name, value)
+        if chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+        if not chunked or not self._keep_alive():
+            self.send_header("Connection", "close")
         self.end_headers()
-        self.wfile.write(json.dumps(data, indent=2).encode("utf-8"))
+
+        def write(data):
+            if not data:
+                return
+            if chunked:
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            else:
+                self.wfile.write(data)
+
+        for piece in pieces:
+            data = piece.encode("utf-8")
+            compressed = compressor.compress(data) if compressor else data
+            write(compressed)
+            if kept is not None:
+                kept.append(data)
+                kept_bytes += len(data)
+                if kept_gzip is not None:
+                    kept_gzip.append(compressed)
+                    kept_bytes += len(compressed)
+                if kept_bytes > self._caching[0].max_entry_bytes:
+                    kept = kept_gzip = None
+        if compressor:
+            compressed = compressor.flush()
+            write(compressed)
+            if kept_gzip is not None:
+                kept_gzip.append(compressed)
+        if chunked:
+            self.wfile.write(b"0\r\n\r\n")
+
+        if kept is not None:
+            self._keep(status, headers, b"".join(kept), b"".join(kept_gzip) if kept_gzip is not None else None,
+                       compressible=True)
+
+    def _response_cache(self, store, path):
+        """The response cache for a GET of `path` from `store`, or None if it isn't cached"""
+        if not RESPONSE_CACHE_BYTES or not hasattr(store, "index"):
+            return None
+        if path in ("/transactions", "/transactions/search", "/stats") or (
+                path.startswith("/transaction/") and path.split("/")[-1]):
+            return store.index(response_cache)
+        return None
+
+    def _keep(self, status, headers, body, gzipped=None, compressible=False):
+        """Put the response being sent into the response cache, if this request is cached"""
+        if self._caching is None:
+            return
+        cache, key, token, tx_id = self._caching
+        self._caching = None
+        cache.put(CachedResponse(key, status, headers, body, gzipped, compressible, tx_id), token)
+
+    def _send_cached(self, cache, entry):
+        """Send a response from the cache as it was first sent, without encoding anything"""
+        if entry.etag is not None and self._not_modified(entry.etag):
+            return
+        body = entry.body
+        headers = list(entry.headers)
+        if entry.compressible:
+            headers.append(("Vary", "Accept-Encoding"))
+            if self._accepts_gzip():
+                body = cache.gzipped(entry, GZIP_LEVEL)
+                headers.append(("Content-Encoding", "gzip"))
+        self._send_body(body, "application/json", entry.status, headers)
+
+    def _reject(self, error, status=401):
+        # The request body, if any, is never read, so the connection can't be reused
+        headers = [("WWW-Authenticate", 'Basic realm="SMS API"')] if status == 401 else []
+        self._send_json({"error": error}, status, headers, close=True)
 
     def _authenticate(self):
         auth_header = self.headers.get("Authorization")
 
         if not auth_header:
-            self.send_response(401)
-            self.send_header("WWW-Authenticate", 'Basic realm="SMS API"')
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "Authentication required"}).encode("utf-8"))
+            self._reject("Authentication required")
             return False
 
         try:
             auth_type, credentials = auth_header.split(" ", 1)
 
             if auth_type.lower() != "basic":
-                self._send_json({"error": "Only Basic authentication is supported"}, 401)
+                self._send_json({"error": "Only Basic authentication is supported"}, 401, close=True)
                 return False
 
-            # Decode base64 credentials
-            decoded = base64.b64decode(credentials).decode("utf-8")
-            email, password = decoded.split(":", 1)
-
-            # Load users and validate
-            users = load_users()
-
-            for user in users:
-                if user.get("email") == email and user.get("password") == password:
-                    return True
+            # Checks the cached user table; repeat clients skip the password hash
+            if get_users().verify_basic(credentials):
+                return True
 
             # Invalid credentials
-            self.send_response(401)
-            self.send_header("WWW-Authenticate", 'Basic realm="SMS API"')
-            self.send_header("Content-Type", "application/json")
-            self.end_headers()
-            self.wfile.write(json.dumps({"error": "Invalid credentials"}).encode("utf-8"))
+            self._reject("Invalid credentials")
             return False
 
         except (ValueError, KeyError):
-            self._send_json({"error": "Invalid authorization header format"}, 400)
+            self._reject("Invalid authorization header format", 400)
             return False
 
     def do_GET(self):
@@ -79,14 +313,100 @@ class SMSHandler(BaseHTTPRequestHandler):
         parsed = urlparse(self.path)
         path = parsed.path
 
+        if path == "/metrics":
+            if not metrics.enabled:
+                self._send_json({"error": "metrics are disabled"}, 404)
+                return
+            queued = getattr(self.server, "queued", None)
+            if queued is not None:
+                QUEUED.labels().set(queued())
+            self._send_body(metrics.REGISTRY.render().encode("utf-8"), metrics.CONTENT_TYPE)
+            return
+
+        if path == "/debug/profile":
+            try:
+                seconds = float(parse_qs(parsed.query).get("seconds", ["5"])[0])
+            except ValueError:
+                self._send_json({"error": "seconds must be a number"}, 400)
+                return
+            if not 0 < seconds <= MAX_PROFILE_SECONDS:
+                self._send_json({"error": f"seconds must be between 0 and {MAX_PROFILE_SECONDS}"}, 400)
+                return
+            self._send_body(metrics.profile(seconds).encode("utf-8"), "text/plain; charset=utf-8")
+            return
+
+        store = get_transactions()
+
         try:
-            sms_data = load_data()
+            store.refresh()
         except FileNotFoundError:
             self._send_json({"error": "sms_records.json not found"}, 404)
             return
 
+        cache = self._response_cache(store, path)
+        # Both taken before the data, so a write in between only makes the tag
+        # stale and keeps the response out of the cache
+        token = cache.token() if cache is not None else None
+        version = store.epoch, store.version
+        etag = 'W/"%s-%s"' % version
+
+        if cache is not None:
+            one_record = path.startswith("/transaction/")
+            key = response_key(path, parsed.query, None if one_record else version)
+            entry = cache.get(key)
+            if entry is not None:
+                self._send_cached(cache, entry)
+                return
+            self._caching = cache, key, token, path.split("/")[-1] if one_record else None
+
         if path == "/transactions":
-            self._send_json(sms_data)
+            if self._not_modified(etag):
+                return
+
+            params = parse_qs(parsed.query)
+            if not is_paged_query(params):
+                self._send_json_stream(iter_json_array(store.all()), headers=[("ETag", etag)], cache=True)
+                return
+
+            try:
+                page = store.page(parse_query(params))
+            except ValueError as e:
+                self._send_json({"error": str(e)}, 400)
+                return
+
+            self._send_json_stream(iter_json_page(page), headers=[("ETag", etag)], cache=True)
+
+        elif path == "/transactions/search":
+            if not hasattr(store, "search"):
+                self._send_json({"error": f"search is not available with {STORAGE} storage"}, 501)
+                return
+
+            if self._not_modified(etag):
+                return
+
+            try:
+                page = store.search(parse_search_query(parse_qs(parsed.query)))
+            except ValueError as e:
+                self._send_json({"error": str(e)}, 400)
+                return
+
+            self._send_json_stream(iter_json_page(page), headers=[("ETag", etag)], cache=True)
+
+        elif path == "/stats":
+            if not hasattr(store, "stats"):
+                self._send_json({"error": f"stats are not available with {STORAGE} storage"}, 501)
+                return
+
+            if self._not_modified(etag):
+                return
+
+            try:
+                stats = store.stats(parse_stats_query(parse_qs(parsed.query)))
+            except ValueError as e:
+                self._send_json({"error": str(e)}, 400)
+                return
+
+            self._send_json(stats, headers=[("ETag", etag)], cache=True)
 
         elif path.startswith("/transaction/"):
             tx_id = path.split("/")[-1]
@@ -94,12 +414,12 @@ class SMSHandler(BaseHTTPRequestHandler):
                 self._send_json({"error": "transaction id required"}, 400)
                 return
 
-            record = next((sms for sms in sms_data if sms.get("transaction_id") == tx_id), None)
+            record = store.get(tx_id)
 
             if record:
-                self._send_json(record)
+                self._send_json(record, cache=True)
             else:
-                self._send_json({"error": f"Transaction {tx_id} not found"}, 404)
+                self._send_json({"error": f"Transaction {tx_id} not found"}, 404, cache=True)
 
         else:
             self._send_json({"error": "endpoint not found"}, 404)
@@ -118,31 +438,82 @@ class SMSHandler(BaseHTTPRequestHandler):
 
             try:
                 new_record = json.loads(post_data)
+            except json.JSONDecodeError:
+                self._send_json({"error": "Invalid JSON"}, 400)
+                return
 
-                # Basic validation
-                required_fields = ["protocol", "address", "date", "type", "body", "type", "subject", "body", "toa",
-                                   "sc_toa", "service_center", "read", "status", "locked", "date_sent", "sub_id",
-                                   "readable_date", "contact_name"]
+            try:
+                SMS_RECORD.validate(new_record)
+            except ValueError as e:
+                self._send_json({"error": str(e)}, 400)
+                return
 
-                for field in required_fields:
-                    if field not in new_record:
-                        self._send_json({"error": f"Missing required field: {field}"}, 400)
-                        return
+            get_transactions().add(new_record)
 
-            except json.JSONDecodeError:
-                self._send_json({"error": "Invalid JSON"}, 400)
+            self._send_json(new_record, 201)
+
+        elif path == "/transactions/batch":
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                self._send_json({"error": "Bad Content-Length"}, 400, close=True)
+                return
+            if length > MAX_BATCH_BYTES:
+                self._send_json({"error": f"batch larger than {MAX_BATCH_BYTES} bytes"}, 413, close=True)
                 return
 
             try:
-                sms_data = load_data()
-            except FileNotFoundError:
-                sms_data = []
+                records, errors, rejected = self._read_batch(length)
+            except EOFError:
+                self._send_json({"error": "request body ended early"}, 400, close=True)
+                return
 
-            sms_data.append(new_record)
+            if records:
+                get_transactions().add_many(records)
+            self._send_json({"accepted": len(records), "rejected": rejected, "errors": errors})
+        else:
+            self._reject("endpoint not found", 404)
+
+    def _read_batch(self, length):
+        """
+        Read an NDJSON body of `length` bytes line by line, validating each
+        record as it arrives. Returns (valid records, the first
+        MAX_BATCH_ERRORS errors as {"line", "error"}, number of bad lines).
+        """
+        records, errors, rejected = [], [], 0
+        remaining = length
+        number = 0
+        while remaining:
+            line = self.rfile.readline(min(remaining, MAX_BATCH_LINE_BYTES + 1))
+            if not line:
+                raise EOFError
+            remaining -= len(line)
+            number += 1
+
+            if len(line) > MAX_BATCH_LINE_BYTES:
+                # Skip the rest of an overlong line without holding it
+                while remaining and not line.endswith(b"\n"):
+                    line = self.rfile.readline(min(remaining, MAX_BATCH_LINE_BYTES))
+                    if not line:
+                        raise EOFError
+                    remaining -= len(line)
+                error = f"line longer than {MAX_BATCH_LINE_BYTES} bytes"
+            elif not line.strip():
+                continue
+            else:
+                try:
+                    records.append(SMS_RECORD.validate(json.loads(line)))
+                    continue
+                except json.JSONDecodeError as e:
+                    error = f"Invalid JSON: {e}"
+                except ValueError as e:
+                    error = str(e)
 
-            save_to_json(sms_data)
+            rejected += 1
+            if len(errors) < MAX_BATCH_ERRORS:
+                errors.append({"line": number, "error": error})
 
-            self._send_json(new_record, 201)
+        return records, errors, rejected
 
     def do_PUT(self):
 
@@ -155,7 +526,7 @@ class SMSHandler(BaseHTTPRequestHandler):
         if path.startswith("/transactions/"):
             tx_id = path.split("/")[-1]
             if not tx_id:
-                self._send_json({"error": "transaction id required"}, 400)
+                self._reject("transaction id required", 400)
                 return
 
             content_length = int(self.headers.get('Content-Length', 0))
@@ -163,37 +534,28 @@ class SMSHandler(BaseHTTPRequestHandler):
 
             try:
                 updated_record = json.loads(put_data)
-
-                # basic validation
-                required_fields = ["protocol", "address", "date", "type", "body", "type", "subject", "body", "toa",
-                                   "sc_toa", "service_center", "read", "status", "locked", "date_sent", "sub_id",
-                                   "readable_date", "contact_name"]
-
-                for field in required_fields:
-                    if field not in updated_record:
-                        self._send_json({"error": f"Missing required field: {field}"}, 400)
-                        return
-
             except json.JSONDecodeError:
                 self._send_json({"error": "Invalid JSON"}, 400)
                 return
 
             try:
-                sms_data = load_data()
+                SMS_RECORD.validate(updated_record)
+            except ValueError as e:
+                self._send_json({"error": str(e)}, 400)
+                return
+
+            try:
+                record = get_transactions().update(tx_id, updated_record)
             except FileNotFoundError:
                 self._send_json({"error": "sms_records.json not found"}, 404)
                 return
 
-            record_index = next((i for i, sms in enumerate(sms_data) if sms.get("transaction_id") == tx_id), None)
-
-            if record_index is not None:
-                sms_data[record_index].update(updated_record)
-                save_to_json(sms_data)
-                self._send_json(sms_data[record_index])
+            if record is not None:
+                self._send_json(record)
             else:
                 self._send_json({"error": f"Transaction {tx_id} not found"}, 404)
         else:
-            self._send_json({"error": "endpoint not found"}, 404)
+            self._reject("endpoint not found", 404)
 
     def do_DELETE(self):
 
@@ -210,16 +572,12 @@ class SMSHandler(BaseHTTPRequestHandler):
                 return
 
             try:
-                sms_data = load_data()
+                deleted_record = get_transactions().delete(tx_id)
             except FileNotFoundError:
                 self._send_json({"error": "sms_records.json not found"}, 404)
                 return
 
-            record_index = next((i for i, sms in enumerate(sms_data) if sms.get("transaction_id") == tx_id), None)
-
-            if record_index is not None:
-                deleted_record = sms_data.pop(record_index)
-                save_to_json(sms_data)
+            if deleted_record is not None:
                 self._send_json(deleted_record)
             else:
                 self._send_json({"error": f"Transaction {tx_id} not found"}, 404)
@@ -227,7 +585,61 @@ class SMSHandler(BaseHTTPRequestHandler):
             self._send_json({"error": "endpoint not found"}, 404)
 
 
-def run(server_class=HTTPServer, handler_class=SMSHandler, port=8000):
+class PooledHTTPServer(HTTPServer):
+    """
+    HTTPServer that serves connections on a fixed pool of worker threads.
+
+    Accepted connections wait in a bounded queue for a free worker; when the
+    queue is full the accept loop blocks and further clients wait in the
+    listen backlog, so load never turns into an unbounded number of threads.
+    Keep-alive connections are closed after their current response while
+    others are queued, so a few busy clients cannot hold every worker.
+    """
+
+    workers = 16
+    queue_size = 64
+    request_queue_size = 128    # listen backlog
+
+    def __init__(self, server_address, handler_class, bind_and_activate=True):
+        super().__init__(server_address, handler_class, bind_and_activate)
+        self._pending = queue.Queue(maxsize=self.queue_size)
+        self._threads = [threading.Thread(target=self._work, name=f"http-worker-{i}", daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def process_request(self, request, client_address):
+        self._pending.put((request, client_address))
+
+    def busy(self):
+        """True while accepted connections are waiting for a worker"""
+        return not self._pending.empty()
+
+    def queued(self):
+        """The number of accepted connections waiting for a worker"""
+        return self._pending.qsize()
+
+    def _work(self):
+        while True:
+            job = self._pending.get()
+            if job is None:
+                return
+
+            request, client_address = job
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        for _ in self._threads:
+            self._pending.put(None)
+
+
+def run(server_class=PooledHTTPServer, handler_class=SMSHandler, port=8000):
     server_address = ("", port)
     httpd = server_class(server_address, handler_class)
     print(f"Serving on port {port}...")
@@ -0,0 +1,286 @@
+import asyncio
+import io
+import logging
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+from api.app import MAX_BATCH_BYTES, SMSHandler
+from etl import metrics
+
+# Headers of one request, request line included, must fit in this many bytes
+MAX_HEADER_BYTES = 64 * 1024
+# Seconds a keep-alive connection may sit idle between requests
+IDLE_TIMEOUT = 75
+# Seconds a client may take to read a response's buffered data before it is dropped
+WRITE_TIMEOUT = 30
+# Seconds a request may wait for a free worker before it is answered 503
+QUEUE_TIMEOUT = 10
+# Response bytes a worker buffers before handing them to the event loop
+FLUSH_BYTES = 64 * 1024
+# Request bodies up to this size are read before the handler runs; larger
+# ones are read from the connection as the handler asks for them
+MAX_BUFFERED_BODY = 1024 * 1024
+
+OPEN_CONNECTIONS = metrics.REGISTRY.gauge("http_connections_open", "Client connections held by the asyncio server")
+
+logger = logging.getLogger("api.async_server")
+
+
+class _ResponseWriter:
+    """
+    The handler's wfile. Output is buffered; a worker thread hands every
+    FLUSH_BYTES to the event loop and waits until the socket has taken
+    them, so a client that reads slowly holds back its own response, and
+    one worker, rather than filling memory.
+    """
+
+    def __init__(self, loop, writer):
+        self._loop = loop
+        self._writer = writer
+        self._buffer = bytearray()
+
+    def write(self, data):
+        size = len(data)
+        self._buffer += data
+        if len(self._buffer) >= FLUSH_BYTES and not self._in_loop():
+            pending, self._buffer = bytes(self._buffer), bytearray()
+            asyncio.run_coroutine_threadsafe(self._send(pending), self._loop).result()
+        return size
+
+    def flush(self):
+        pass
+
+    def _in_loop(self):
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    async def _send(self, data):
+        self._writer.write(data)
+        await asyncio.wait_for(self._writer.drain(), WRITE_TIMEOUT)
+
+    async def finish(self):
+        """Send whatever is still buffered; called on the event loop"""
+        if self._buffer:
+            data, self._buffer = bytes(self._buffer), bytearray()
+            await self._send(data)
+
+
+class _BodyReader(io.RawIOBase):
+    """
+    The handler's rfile for a body too large to buffer: a worker thread
+    reads it from the connection as the handler asks, waiting at most
+    IDLE_TIMEOUT seconds for each piece, and never past its `length` bytes.
+    """
+
+    def __init__(self, loop, reader, length):
+        self._loop = loop
+        self._reader = reader
+        self.remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self.remaining:
+            return 0
+        read = asyncio.wait_for(self._reader.read(min(len(buffer), self.remaining)), IDLE_TIMEOUT)
+        data = asyncio.run_coroutine_threadsafe(read, self._loop).result()
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+
+class _AsyncRequest:
+    """
+    Mixed into the handler class so it serves one request parsed by the
+    event loop instead of reading its own socket
+    """
+
+    def handle_expect_100(self):
+        # The event loop answers "100 Continue" itself, before reading the body
+        return True
+
+
+class AsyncHTTPServer:
+    """
+    Serves a handler class such as SMSHandler from one asyncio event loop.
+
+    Connections cost a coroutine and their buffers rather than a thread,
+    so thousands of idle keep-alive clients can stay connected. The event
+    loop reads and parses each request; the handler's do_* method, which
+    may block on the store, the user file or the disk, runs on a pool of
+    `workers` threads. Bodies over MAX_BATCH_BYTES are refused with 413
+    unread; those over MAX_BUFFERED_BODY are not read past their headers
+    until a worker takes the request. Requests waiting for a worker are
+    answered 503 after QUEUE_TIMEOUT seconds, so an overload backs up into
+    the clients instead of into memory.
+
+    The interface follows HTTPServer: bind in the constructor,
+    serve_forever(), shutdown() from another thread, server_close().
+    """
+
+    workers = 16
+    request_queue_size = 1024   # listen backlog
+
+    def __init__(self, server_address, handler_class=SMSHandler):
+        self.socket = socket.create_server(server_address, backlog=self.request_queue_size)
+        self.server_address = self.socket.getsockname()
+        self.handler_class = type(f"Async{handler_class.__name__}", (_AsyncRequest, handler_class), {})
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="http-worker")
+        self._loop = None
+        self._stopped = None
+        self._slots = None
+        self._waiting = 0
+        self._connections = {}
+
+    def busy(self):
+        """Connections are cheap here: keep-alive is never cut short for others"""
+        return False
+
+    def queued(self):
+        """The number of requests waiting for a worker"""
+        return self._waiting
+
+    def serve_forever(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.workers)
+        server = await asyncio.start_server(self._serve_connection, sock=self.socket, limit=MAX_HEADER_BYTES)
+        async with server:
+            await self._stopped.wait()
+
+        # Close idle connections and let the busy ones finish their response
+        for writer in self._connections.values():
+            writer.close()
+        if self._connections:
+            await asyncio.wait(list(self._connections), timeout=WRITE_TIMEOUT)
+
+    def shutdown(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    def server_close(self):
+        self.socket.close()
+        self._executor.shutdown(wait=False)
+
+    async def _serve_connection(self, reader, writer):
+        OPEN_CONNECTIONS.labels().inc()
+        self._connections[asyncio.current_task()] = writer
+        peer = writer.get_extra_info("peername")
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), IDLE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    writer.write(b"HTTP/1.1 431 Request Header Fields Too Large\r\n"
+                                 b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+                    return
+
+                if not await self._serve_request(head, reader, writer, peer):
+                    return
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        except Exception:
+            logger.exception("Error serving %s", peer)
+        finally:
+            OPEN_CONNECTIONS.labels().dec()
+            del self._connections[asyncio.current_task()]
+            writer.close()
+
+    async def _serve_request(self, head, reader, writer, peer):
+        """Serve one request whose headers are `head`; returns whether to keep the connection"""
+        line, _, rest = head.partition(b"\r\n")
+        handler = self.handler_class.__new__(self.handler_class)
+        handler.server = self
+        handler.client_address = peer
+        handler.close_connection = True
+        handler.wfile = _ResponseWriter(self._loop, writer)
+        handler.rfile = io.BytesIO(rest)
+        handler.raw_requestline = line + b"\r\n"
+        handler._timing = None
+        handler._status = None
+        handler._caching = None
+
+        try:
+            if not handler.parse_request():
+                await handler.wfile.finish()
+                return False
+
+            if handler.headers.get("Transfer-Encoding"):
+                handler.send_error(411, "Chunked request bodies are not supported")
+                await handler.wfile.finish()
+                return False
+            try:
+                length = int(handler.headers.get("Content-Length", 0))
+                if length < 0:
+                    raise ValueError(length)
+            except ValueError:
+                handler.send_error(400, "Bad Content-Length")
+                await handler.wfile.finish()
+                return False
+
+            if length > MAX_BATCH_BYTES:
+                handler.send_error(413, f"Request body larger than {MAX_BATCH_BYTES} bytes")
+                await handler.wfile.finish()
+                return False
+
+            body = None
+            if length:
+                if handler.headers.get("Expect", "").lower() == "100-continue" and \
+                        handler.request_version >= "HTTP/1.1":
+                    writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                if length <= MAX_BUFFERED_BODY:
+                    handler.rfile = io.BytesIO(await asyncio.wait_for(reader.readexactly(length), IDLE_TIMEOUT))
+                else:
+                    body = _BodyReader(self._loop, reader, length)
+                    handler.rfile = io.BufferedReader(body, FLUSH_BYTES)
+
+            method = getattr(handler, "do_" + handler.command, None)
+            if method is None:
+                handler.send_error(501, f"Unsupported method ({handler.command!r})")
+            elif not await self._run(method):
+                handler.send_error(503, "Server busy")
+                handler.close_connection = True
+            if body is not None and body.remaining:
+                # The rest of the body is still on the connection
+                handler.close_connection = True
+            await handler.wfile.finish()
+            return not handler.close_connection
+        finally:
+            handler._record_timing()
+
+    async def _run(self, func):
+        """Run func on a worker, once one is free; False if none was within QUEUE_TIMEOUT"""
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiting -= 1
+
+        try:
+            await self._loop.run_in_executor(self._executor, func)
+        finally:
+            self._slots.release()
+        return True
+
+
+def run(server_class=AsyncHTTPServer, handler_class=SMSHandler, port=8000):
+    server = server_class(("", port), handler_class)
+    print(f"Serving on port {port} (asyncio)...")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    run()
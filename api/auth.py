@@ -0,0 +1,174 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+HASH_SCHEME = "pbkdf2_sha256"
+HASH_ITERATIONS = 200_000
+SALT_BYTES = 16
+
+# Recently verified Authorization headers remembered per user table
+VERIFIED_CACHE_SIZE = 1024
+
+
+def hash_password(password, salt=None, iterations=HASH_ITERATIONS):
+    """A salted PBKDF2 hash of `password`, as stored in users.json"""
+    salt = salt if salt is not None else os.urandom(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return "$".join((HASH_SCHEME, str(iterations),
+                     base64.b64encode(salt).decode("ascii"), base64.b64encode(digest).decode("ascii")))
+
+
+def check_password(password, password_hash):
+    """Whether `password` matches a hash from hash_password(), compared in constant time"""
+    try:
+        scheme, iterations, salt, expected = password_hash.split("$")
+        if scheme != HASH_SCHEME:
+            return False
+        salt = base64.b64decode(salt)
+        expected = base64.b64decode(expected)
+        iterations = int(iterations)
+    except ValueError:
+        return False
+
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return hmac.compare_digest(digest, expected)
+
+
+# Checked against when the email is unknown, so that costs as much as a wrong password
+_DUMMY_HASH = hash_password("", salt=b"\0" * SALT_BYTES)
+
+
+class UserTable:
+    """
+    The users of users.json, keyed by email.
+
+    The file is read once and again only when its mtime or size changes.
+    Users carry a "password_hash" (see hash_password); entries still holding
+    a plaintext "password" are accepted too, compared in constant time,
+    until migrate_users_file() has been run on the file.
+
+    A bounded LRU remembers a digest of each Authorization header that
+    verified, so a returning client skips the deliberately slow hash. The
+    cache is emptied whenever the file changes.
+    """
+
+    def __init__(self, path, cache_size=VERIFIED_CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._users = {}
+        self._signature = None
+        self._verified = OrderedDict()
+
+    def refresh(self):
+        try:
+            stat = os.stat(self.path)
+            signature = stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            signature = None
+
+        if signature == self._signature:
+            return
+
+        users = {}
+        if signature is not None:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for user in json.load(f):
+                    # Only the first entry for an email counts
+                    users.setdefault(user.get("email"), user)
+
+        with self._lock:
+            self._users = users
+            self._signature = signature
+            self._verified.clear()
+
+    def verify(self, email, password):
+        """Whether the email and password belong to a user"""
+        self.refresh()
+        user = self._users.get(email)
+        if user is None:
+            check_password(password, _DUMMY_HASH)
+            return False
+
+        if "password_hash" in user:
+            return check_password(password, user["password_hash"])
+
+        stored = user.get("password")
+        if not isinstance(stored, str):
+            return False
+        return hmac.compare_digest(stored.encode("utf-8"), password.encode("utf-8"))
+
+    def verify_basic(self, credentials):
+        """
+        Whether the base64 `credentials` of a Basic Authorization header
+        belong to a user. Raises ValueError if they are malformed.
+        """
+        self.refresh()
+        signature = self._signature
+        key = hashlib.sha256(credentials.encode("utf-8")).digest()
+        with self._lock:
+            if key in self._verified:
+                self._verified.move_to_end(key)
+                return True
+
+        decoded = base64.b64decode(credentials).decode("utf-8")
+        email, password = decoded.split(":", 1)
+        if not self.verify(email, password):
+            return False
+
+        with self._lock:
+            # Not if the file changed meanwhile: the user may be gone
+            if self._signature == signature:
+                self._verified[key] = True
+                if len(self._verified) > self.cache_size:
+                    self._verified.popitem(last=False)
+        return True
+
+
+_tables = {}
+_tables_lock = threading.Lock()
+
+
+def get_user_table(path):
+    """The process-wide UserTable for a users file"""
+    path = os.path.abspath(path)
+    with _tables_lock:
+        if path not in _tables:
+            _tables[path] = UserTable(path)
+        return _tables[path]
+
+
+def migrate_users_file(path):
+    """
+    Replace every plaintext "password" in a users file by a salted
+    "password_hash". Returns the number of users migrated.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        users = json.load(f)
+
+    migrated = 0
+    for user in users:
+        if "password" in user:
+            user["password_hash"] = hash_password(user.pop("password"))
+            migrated += 1
+
+    if migrated:
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(users, f, indent=2)
+        os.replace(tmp_path, path)
+
+    return migrated
+
+
+if __name__ == "__main__":
+    # python -m api.auth [users.json] -- hash the plaintext passwords in place
+    from api.app import USER_FILE
+
+    target = sys.argv[1] if len(sys.argv) > 1 else USER_FILE
+    print(f"Migrated {migrate_users_file(target)} user(s) in {target}")
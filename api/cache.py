@@ -0,0 +1,188 @@
+import threading
+import zlib
+from collections import OrderedDict
+from urllib.parse import parse_qs
+
+from etl import metrics
+
+# Bytes charged per entry on top of its bodies, for the key, entry and indexes
+ENTRY_OVERHEAD = 512
+
+HITS = metrics.REGISTRY.counter("http_response_cache_hits_total", "GET responses sent from the response cache")
+MISSES = metrics.REGISTRY.counter("http_response_cache_misses_total", "Cacheable GET responses that were encoded")
+EVICTIONS = metrics.REGISTRY.counter(
+    "http_response_cache_evictions_total", "Cached responses dropped to keep the cache within its size")
+INVALIDATIONS = metrics.REGISTRY.counter(
+    "http_response_cache_invalidations_total", "Cached responses dropped because the data they hold changed")
+ENTRIES = metrics.REGISTRY.gauge("http_response_cache_entries", "Responses held in the response cache")
+BYTES = metrics.REGISTRY.gauge("http_response_cache_bytes", "Bytes held in the response cache, bodies and overhead")
+
+
+def response_key(path, query, version=None):
+    """
+    The cache key of a GET: its path, its query parameters in a canonical
+    order, and the dataset version the response was made from. Responses
+    about one record rather than the collection pass no version; they are
+    dropped when that record changes instead.
+    """
+    params = tuple(sorted((name, tuple(values)) for name, values in parse_qs(query).items()))
+    return path, params, version
+
+
+class CachedResponse:
+    """An encoded response body with what is needed to send it again"""
+
+    __slots__ = ("key", "status", "headers", "body", "gzipped", "compressible", "tx_id", "size")
+
+    def __init__(self, key, status, headers, body, gzipped=None, compressible=False, tx_id=None):
+        self.key = key
+        self.status = status
+        self.headers = tuple(headers)
+        self.body = body
+        self.gzipped = gzipped
+        self.compressible = compressible
+        self.tx_id = tx_id
+        self.size = ENTRY_OVERHEAD + len(body) + len(gzipped or b"")
+
+    @property
+    def etag(self):
+        return dict(self.headers).get("ETag")
+
+
+class ResponseCache:
+    """
+    A bounded LRU of encoded GET response bodies, limited by their total
+    size in bytes. A response larger than `max_entry_bytes` is not kept.
+
+    The cache is registered with a TransactionStore as one of its indexes
+    (see TransactionStore.index), so it hears of every change under the
+    store's write lock. Collection responses are keyed by dataset version
+    and all dropped on any change; responses about one transaction are
+    dropped only when a record with that transaction_id is added, updated
+    or deleted. A reload of the data file empties the cache.
+
+    A response made while the data changed must not be kept: take token()
+    before reading the store and pass it to put(), which then declines.
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 4
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> CachedResponse, least recently used first
+        self._by_id = {}                # transaction_id -> keys of its entries
+        self._versioned = set()         # keys of collection entries
+        self._changes = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # -- store listener ----------------------------------------------------
+
+    def rebuild(self, records):
+        with self._lock:
+            self._changes += 1
+            for key in list(self._entries):
+                self._drop(key)
+
+    def added(self, seq, record):
+        self._changed(record)
+
+    def removed(self, seq, record):
+        self._changed(record)
+
+    def _changed(self, record):
+        with self._lock:
+            self._changes += 1
+            for key in list(self._by_id.get(record.get("transaction_id"), ())):
+                self._drop(key)
+            for key in list(self._versioned):
+                self._drop(key)
+
+    # -- entries -----------------------------------------------------------
+
+    def token(self):
+        """A marker of the data as it is now, for put()"""
+        return self._changes
+
+    def get(self, key):
+        """The cached response for `key`, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        if metrics.enabled:
+            (MISSES if entry is None else HITS).labels().inc()
+        return entry
+
+    def put(self, entry, token):
+        """
+        Keep `entry` unless it is too large or the data changed since
+        `token` was taken. Returns whether it was kept.
+        """
+        if entry.size > self.max_entry_bytes:
+            return False
+        with self._lock:
+            if token != self._changes:
+                return False
+            if entry.key in self._entries:
+                self._drop(entry.key, counted=None)
+            self._entries[entry.key] = entry
+            if entry.key[2] is not None:
+                self._versioned.add(entry.key)
+            else:
+                self._by_id.setdefault(entry.tx_id, set()).add(entry.key)
+            self._resize(entry.size, 1)
+            while self.bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)), counted=EVICTIONS)
+        return True
+
+    def gzipped(self, entry, level):
+        """The gzip encoding of a cached body, compressed on first use and kept"""
+        gzipped = entry.gzipped
+        if gzipped is None:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            gzipped = compressor.compress(entry.body) + compressor.flush()
+            with self._lock:
+                if entry.gzipped is None and self._entries.get(entry.key) is entry:
+                    entry.gzipped = gzipped
+                    entry.size += len(gzipped)
+                    self._resize(len(gzipped), 0)
+        return gzipped
+
+    def stats(self):
+        """Hit ratio, size and drop counts, for tuning the cache size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "hit_ratio": self.hits / lookups if lookups else 0.0,
+                    "evictions": self.evictions, "invalidations": self.invalidations}
+
+    def _resize(self, size, count):
+        self.bytes += size
+        if metrics.enabled:
+            BYTES.labels().inc(size)
+            ENTRIES.labels().inc(count)
+
+    def _drop(self, key, counted=INVALIDATIONS):
+        """Remove an entry; the lock must be held"""
+        entry = self._entries.pop(key)
+        if key[2] is not None:
+            self._versioned.discard(key)
+        else:
+            keys = self._by_id[entry.tx_id]
+            keys.discard(key)
+            if not keys:
+                del self._by_id[entry.tx_id]
+        self._resize(-entry.size, -1)
+        if counted is EVICTIONS:
+            self.evictions += 1
+        elif counted is INVALIDATIONS:
+            self.invalidations += 1
+        if counted is not None and metrics.enabled:
+            counted.labels().inc()
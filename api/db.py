@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+
+from api.indexes import encode_cursor
+from etl.db_schema import BUMP_VERSION, INSERT_RECORD, connect, record_row
+
+UPDATE_RECORD = ("UPDATE sms_records SET transaction_id = ?, transaction_type = ?, counterparty = ?, "
+                 "amount = ?, transaction_date = ?, record = ? WHERE seq = ?")
+SELECT_BY_ID = "SELECT seq, record FROM sms_records WHERE transaction_id = ? ORDER BY seq LIMIT 1"
+SELECT_ALL = "SELECT record FROM sms_records ORDER BY seq"
+DELETE_BY_SEQ = "DELETE FROM sms_records WHERE seq = ?"
+SELECT_VERSION = "SELECT version FROM sms_meta WHERE id = 1"
+
+
+class SQLiteStore:
+    """
+    The API's transaction records in SQLite, a drop-in for TransactionStore.
+
+    Each thread gets its own connection; in WAL mode readers never wait on
+    the writer, and writes from this process are serialized by a lock.
+    Every statement is a fixed SQL string with parameters, so sqlite3's
+    per-connection statement cache prepares each one once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        # Tells this instance's versions apart from those of an earlier run
+        self.epoch = os.urandom(4).hex()
+        self._conn()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = connect(self.path)
+        return conn
+
+    @property
+    def version(self):
+        """Bumped on every change to the records, by this process or by a loader"""
+        return self._conn().execute(SELECT_VERSION).fetchone()[0]
+
+    def refresh(self, missing_ok=False):
+        """Nothing to reload: every query reads the database"""
+
+    # -- queries -----------------------------------------------------------
+
+    def all(self):
+        """All records, in insertion order"""
+        return [json.loads(row[0]) for row in self._conn().execute(SELECT_ALL)]
+
+    def get(self, tx_id):
+        """The first record with this transaction_id, or None"""
+        row = self._conn().execute(SELECT_BY_ID, (tx_id,)).fetchone()
+        return json.loads(row[1]) if row else None
+
+    def page(self, query):
+        """One page of records matching `query`; same contract as TransactionIndex.page"""
+        by_date = "date_from" in query or "date_to" in query
+        cursor = query.get("cursor")
+        if cursor is not None and (len(cursor) == 2) != by_date:
+            raise ValueError("cursor does not belong to this query")
+
+        where, params = [], []
+        for column, op, name in (("transaction_type", "=", "transaction_type"),
+                                 ("counterparty", "=", "counterparty"),
+                                 ("amount", ">=", "min_amount"),
+                                 ("amount", "<=", "max_amount"),
+                                 ("transaction_date", ">=", "date_from"),
+                                 ("transaction_date", "<=", "date_to")):
+            if name in query:
+                where.append(f"{column} {op} ?")
+                params.append(query[name])
+
+        if by_date:
+            where.append("transaction_date IS NOT NULL")
+            if cursor is not None:
+                where.append("(transaction_date, seq) > (?, ?)")
+                params.extend(cursor)
+            order = "transaction_date, seq"
+        else:
+            if cursor is not None:
+                where.append("seq > ?")
+                params.append(cursor[0])
+            order = "seq"
+
+        sql = "SELECT seq, transaction_date, record FROM sms_records"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order} LIMIT ?"
+        params.append(query["limit"] + 1)
+
+        rows = self._conn().execute(sql, params).fetchall()
+        more = len(rows) > query["limit"]
+        rows = rows[:query["limit"]]
+
+        fields = query.get("fields")
+        items = []
+        for _, _, text in rows:
+            record = json.loads(text)
+            items.append({f: record[f] for f in fields if f in record} if fields else record)
+
+        next_cursor = None
+        if more:
+            seq, date, _ = rows[-1]
+            next_cursor = encode_cursor((date, seq) if by_date else (seq,))
+        return {"items": items, "next_cursor": next_cursor}
+
+    # -- writes ------------------------------------------------------------
+
+    def _write(self, func):
+        conn = self._conn()
+        with self._write_lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(conn)
+                if result is not None:
+                    conn.execute(BUMP_VERSION)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+            return result
+
+    def add(self, record):
+        """Append a record"""
+        self._write(lambda conn: conn.execute(INSERT_RECORD, record_row(record)))
+        return record
+
+    def add_many(self, records):
+        """Append a batch of records in one transaction"""
+        self._write(lambda conn: conn.executemany(INSERT_RECORD, map(record_row, records)))
+        return records
+
+    def update(self, tx_id, fields):
+        """Merge `fields` into the record with this id; returns it, or None if absent"""
+        def apply(conn):
+            row = conn.execute(SELECT_BY_ID, (tx_id,)).fetchone()
+            if row is None:
+                return None
+            record = json.loads(row[1])
+            record.update(fields)
+            conn.execute(UPDATE_RECORD, record_row(record) + (row[0],))
+            return record
+
+        return self._write(apply)
+
+    def delete(self, tx_id):
+        """Remove the record with this id; returns it, or None if absent"""
+        def apply(conn):
+            row = conn.execute(SELECT_BY_ID, (tx_id,)).fetchone()
+            if row is None:
+                return None
+            conn.execute(DELETE_BY_SEQ, (row[0],))
+            return json.loads(row[1])
+
+        return self._write(apply)
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_database(path):
+    """The process-wide SQLiteStore for a database file"""
+    path = os.path.abspath(path)
+    with _databases_lock:
+        if path not in _databases:
+            _databases[path] = SQLiteStore(path)
+        return _databases[path]
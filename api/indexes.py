@@ -0,0 +1,407 @@
+import base64
+import binascii
+import json
+import math
+import re
+from bisect import bisect_left, bisect_right, insort
+from functools import partial
+
+import numpy as np
+
+from etl.record_keys import encode_transaction_date, format_transaction_date, record_amount, record_date
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+
+QUERY_PARAMS = ("limit", "cursor", "fields", "transaction_type", "counterparty",
+                "min_amount", "max_amount", "date_from", "date_to")
+
+DATE_PARAM = re.compile(r"\d{4}-\d{2}-\d{2}( \d{2}:\d{2}:\d{2})?$")
+
+
+class Bucket:
+    """
+    The records sharing one indexed value: their seqs in file order, and
+    (transaction_date, seq) keys sorted by date for those that have a date.
+    """
+
+    __slots__ = ("seqs", "dated")
+
+    def __init__(self):
+        self.seqs = []
+        self.dated = []
+
+    def add(self, seq, date):
+        insort(self.seqs, seq)
+        if date is not None:
+            insort(self.dated, (date, seq))
+
+    def remove(self, seq, date):
+        del self.seqs[bisect_left(self.seqs, seq)]
+        if date is not None:
+            del self.dated[bisect_left(self.dated, (date, seq))]
+
+
+class MergedKeys:
+    """
+    A sorted sequence of keys read from a sorted base through `key(i)`,
+    less those removed and plus those added since, which are kept in two
+    sorted lists. Indexing and len() work as on a list, in O(log n) time
+    whatever was changed, so bisect works on it too, and nothing is copied
+    out of the base. `find(key)` gives the base position of a base key.
+    """
+
+    __slots__ = ("_size", "_key", "_find", "removed", "added")
+
+    def __init__(self, size, key, find):
+        self._size = size
+        self._key = key
+        self._find = find
+        self.removed = []   # base positions
+        self.added = []     # keys
+
+    def __len__(self):
+        return self._size - len(self.removed) + len(self.added)
+
+    def _base(self, k):
+        """The k-th base key that was not removed"""
+        position = k
+        while True:
+            following = k + bisect_right(self.removed, position)
+            if following == position:
+                return self._key(position)
+            position = following
+
+    def __getitem__(self, i):
+        size = len(self)
+        if i < 0:
+            i += size
+        if not 0 <= i < size:
+            raise IndexError("MergedKeys index out of range")
+        added = self.added
+        if not added and not self.removed:
+            return self._key(i)
+
+        # The i-th key is preceded by j added keys and i - j base keys
+        base = self._size - len(self.removed)
+        lo, hi = max(0, i - base), min(i, len(added))
+        while lo < hi:
+            j = (lo + hi) // 2
+            if added[j] < self._base(i - j - 1):
+                lo = j + 1
+            else:
+                hi = j
+        if lo == len(added):
+            return self._base(i - lo)
+        if i - lo == base:
+            return added[lo]
+        return min(added[lo], self._base(i - lo))
+
+    def add(self, key):
+        insort(self.added, key)
+
+    def remove(self, key):
+        i = bisect_left(self.added, key)
+        if i < len(self.added) and self.added[i] == key:
+            del self.added[i]
+        else:
+            insort(self.removed, self._find(key))
+
+
+class SnapshotBucket:
+    """A Bucket whose seqs and dated keys are MergedKeys over a snapshot (see etl.snapshot)"""
+
+    __slots__ = ("seqs", "dated")
+
+    def __init__(self, seqs, dated):
+        self.seqs = seqs
+        self.dated = dated
+
+    def add(self, seq, date):
+        self.seqs.add(seq)
+        if date is not None:
+            self.dated.add((date, seq))
+
+    def remove(self, seq, date):
+        self.seqs.remove(seq)
+        if date is not None:
+            self.dated.remove((date, seq))
+
+
+class SnapshotBuckets(dict):
+    """
+    value -> Bucket, where the SnapshotBucket of a value the snapshot
+    holds is only made, by `make(code)`, when it is first asked for
+    """
+
+    def __init__(self, make, codes):
+        super().__init__()
+        self._make = make
+        self._codes = codes     # value -> code, for buckets not yet made
+
+    def __missing__(self, key):
+        bucket = self[key] = self._make(self._codes.pop(key))
+        return bucket
+
+    def get(self, key, default=None):
+        if key in self or key in self._codes:
+            return self[key]
+        return default
+
+    def __len__(self):
+        return super().__len__() + len(self._codes)
+
+
+def _seq_keys(seqs):
+    return MergedKeys(len(seqs), lambda i: int(seqs[i]), lambda seq: int(np.searchsorted(seqs, seq)))
+
+
+def _dated_keys(dates, seqs):
+    def find(key):
+        date = encode_transaction_date(key[0])
+        lo = int(np.searchsorted(dates, date, "left"))
+        hi = int(np.searchsorted(dates, date, "right"))
+        return lo + int(np.searchsorted(seqs[lo:hi], key[1]))
+
+    return MergedKeys(len(dates), lambda i: (format_transaction_date(dates[i]), int(seqs[i])), find)
+
+
+def _snapshot_buckets(snapshot, field):
+    bounds = snapshot.array(f"tx.{field}.bounds")
+    codes = {key: code for code, key in enumerate(snapshot.categories[field]) if bounds[code] < bounds[code + 1]}
+    return SnapshotBuckets(partial(_snapshot_bucket, snapshot, field), codes)
+
+
+def _snapshot_bucket(snapshot, field, code):
+    bounds, dated_bounds = snapshot.array(f"tx.{field}.bounds"), snapshot.array(f"tx.{field}.dated_bounds")
+    lo, hi = bounds[code], bounds[code + 1]
+    dated_lo, dated_hi = dated_bounds[code], dated_bounds[code + 1]
+    return SnapshotBucket(_seq_keys(snapshot.array(f"tx.{field}.seqs")[lo:hi]),
+                          _dated_keys(snapshot.array(f"tx.{field}.dates")[dated_lo:dated_hi],
+                                      snapshot.array(f"tx.{field}.dated_seqs")[dated_lo:dated_hi]))
+
+
+class TransactionIndex:
+    """
+    Secondary indexes over the store for paged, filtered listings: hash
+    buckets per transaction_type and per counterparty, plus one bucket
+    holding every record. Each bucket keeps its records sorted both by seq
+    and by date, so a page is found by bisection and costs time in
+    proportion to the page rather than the dataset.
+
+    Kept current by TransactionStore through rebuild/added/removed. Over
+    records loaded from a snapshot, the buckets are read from it rather
+    than built.
+    """
+
+    def __init__(self):
+        self.rebuild({})
+
+    def rebuild(self, records):
+        snapshot = getattr(records, "snapshot", None)
+        if snapshot is not None and snapshot.meta["transaction_index"]:
+            self._restore(snapshot)
+            records.replay(self)
+            return
+
+        self.all = Bucket()
+        self.by_type = {}
+        self.by_counterparty = {}
+
+        dated = []
+        fields = (("transaction_type", self.by_type), ("counterparty", self.by_counterparty))
+        for seq, record in records.items():
+            self.all.seqs.append(seq)
+            date = record_date(record)
+            if date is not None:
+                dated.append((date, seq))
+            for field, buckets in fields:
+                key = record.get(field)
+                if not isinstance(key, str):
+                    continue
+                bucket = buckets.get(key)
+                if bucket is None:
+                    bucket = buckets[key] = Bucket()
+                bucket.seqs.append(seq)
+                if date is not None:
+                    bucket.dated.append((date, seq))
+
+        # records come in seq order, so only the date lists need sorting
+        self.all.dated = sorted(dated)
+        for buckets in (self.by_type, self.by_counterparty):
+            for bucket in buckets.values():
+                bucket.dated.sort()
+
+    def _restore(self, snapshot):
+        self.all = SnapshotBucket(MergedKeys(snapshot.rows, int, int),
+                                  _dated_keys(snapshot.array("tx.all.dates"), snapshot.array("tx.all.seqs")))
+
+        self.by_type = _snapshot_buckets(snapshot, "transaction_type")
+        self.by_counterparty = _snapshot_buckets(snapshot, "counterparty")
+
+    def _buckets(self, record):
+        for buckets, field in ((self.by_type, "transaction_type"), (self.by_counterparty, "counterparty")):
+            key = record.get(field)
+            if isinstance(key, str):
+                yield buckets, key
+
+    def added(self, seq, record):
+        date = record_date(record)
+        self.all.add(seq, date)
+        for buckets, key in self._buckets(record):
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = Bucket()
+            bucket.add(seq, date)
+
+    def removed(self, seq, record):
+        date = record_date(record)
+        self.all.remove(seq, date)
+        for buckets, key in self._buckets(record):
+            bucket = buckets[key]
+            bucket.remove(seq, date)
+            if not bucket.seqs:
+                del buckets[key]
+
+    def page(self, records, query):
+        """
+        One page of records matching `query` (see parse_query), as
+        {"items": [...], "next_cursor": str or None}. Records are returned
+        in file order, or by transaction_date when a date range is given.
+        """
+        bucket = self.all
+        for buckets, field in ((self.by_type, "transaction_type"), (self.by_counterparty, "counterparty")):
+            if field in query:
+                candidate = buckets.get(query[field])
+                if candidate is None:
+                    return {"items": [], "next_cursor": None}
+                if len(candidate.seqs) < len(bucket.seqs):
+                    bucket = candidate
+
+        by_date = "date_from" in query or "date_to" in query
+        cursor = query.get("cursor")
+        if cursor is not None and (len(cursor) == 2) != by_date:
+            raise ValueError("cursor does not belong to this query")
+
+        if by_date:
+            keys = bucket.dated
+            start = bisect_left(keys, (query.get("date_from", ""),))
+            if cursor is not None:
+                start = max(start, bisect_right(keys, tuple(cursor)))
+            date_to = query.get("date_to")
+            end = bisect_right(keys, (date_to, float("inf"))) if date_to is not None else len(keys)
+        else:
+            keys = bucket.seqs
+            start = bisect_right(keys, cursor[0]) if cursor is not None else 0
+            end = len(keys)
+
+        limit = query["limit"]
+        fields = query.get("fields")
+        items, last = [], None
+        for i in range(start, end):
+            key = keys[i]
+            record = records[key[1] if by_date else key]
+            if not _matches(record, query):
+                continue
+            if len(items) == limit:
+                return {"items": items, "next_cursor": encode_cursor(last)}
+            items.append({f: record[f] for f in fields if f in record} if fields else record)
+            last = key if by_date else (key,)
+
+        return {"items": items, "next_cursor": None}
+
+
+def _matches(record, query):
+    for field in ("transaction_type", "counterparty"):
+        if field in query and record.get(field) != query[field]:
+            return False
+
+    if "min_amount" in query or "max_amount" in query:
+        amount = record_amount(record)
+        if amount is None:
+            return False
+        if amount < query.get("min_amount", amount) or amount > query.get("max_amount", amount):
+            return False
+
+    return True
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, binascii.Error, UnicodeError):
+        raise ValueError("invalid cursor")
+
+    if not (isinstance(key, list) and key and isinstance(key[-1], int)
+            and (len(key) == 1 or (len(key) == 2 and isinstance(key[0], str)))):
+        raise ValueError("invalid cursor")
+    return key
+
+
+def is_paged_query(params):
+    """Whether a parse_qs() result asks for a paged listing"""
+    return any(name in params for name in QUERY_PARAMS)
+
+
+def parse_query(params):
+    """
+    Turn a parse_qs() result into the query TransactionIndex.page expects.
+    Raises ValueError with a message fit for a 400 response.
+    """
+    query = {}
+
+    def single(name):
+        values = params.get(name)
+        if values is None:
+            return None
+        if len(values) != 1:
+            raise ValueError(f"{name} given more than once")
+        return values[0]
+
+    limit = single("limit")
+    try:
+        query["limit"] = int(limit) if limit is not None else DEFAULT_LIMIT
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if not 1 <= query["limit"] <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+
+    cursor = single("cursor")
+    if cursor:
+        query["cursor"] = decode_cursor(cursor)
+
+    fields = single("fields")
+    if fields:
+        query["fields"] = [f for f in fields.split(",") if f]
+
+    for name in ("transaction_type", "counterparty"):
+        value = single(name)
+        if value is not None:
+            query[name] = value
+
+    for name in ("min_amount", "max_amount"):
+        value = single(name)
+        if value is not None:
+            try:
+                amount = float(value)
+            except ValueError:
+                amount = math.nan
+            # nan and inf parse as floats, but bound nothing
+            if not math.isfinite(amount):
+                raise ValueError(f"{name} must be a number")
+            query[name] = amount
+
+    for name in ("date_from", "date_to"):
+        value = single(name)
+        if value is not None:
+            if not DATE_PARAM.match(value):
+                raise ValueError(f"{name} must be YYYY-MM-DD or YYYY-MM-DD HH:MM:SS")
+            if name == "date_to" and len(value) == 10:
+                value += " 23:59:59"
+            query[name] = value
+
+    return query
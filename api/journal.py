@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import time
+
+
+class Journal:
+    """
+    Append-only write-ahead log of store mutations, one JSON op per line.
+
+    Every op gets an increasing log sequence number (lsn). Appends are
+    flushed to the OS straight away, so a crashed process loses nothing;
+    fsync is batched, and runs after `fsync_batch` unsynced ops or at most
+    `fsync_interval` seconds after a write, whichever comes first.
+
+    Compaction folds the log into a new snapshot of the data file. Before
+    the snapshot is moved into place a marker recording the folded lsn and
+    the new snapshot's (mtime_ns, size) signature is made durable, so replay
+    knows whether the snapshot on disk already contains those ops, even if
+    the process died halfway through.
+    """
+
+    def __init__(self, path, fsync_interval=0.05, fsync_batch=256):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.fsync_batch = fsync_batch
+        self.lsn = 0
+        self._lock = threading.Lock()
+        self._file = None
+        self._unsynced = 0
+        self._wakeup = threading.Event()
+        self._flusher = None
+
+    # -- reading -----------------------------------------------------------
+
+    def _read_ops(self):
+        """All ops in the log; a torn last line from a crash is cut off"""
+        ops = []
+        good_size = 0
+
+        try:
+            with open(self.path, "rb") as f:
+                for line in f:
+                    try:
+                        ops.append(json.loads(line))
+                    except ValueError:
+                        break
+                    good_size += len(line)
+        except FileNotFoundError:
+            return ops
+
+        if os.path.getsize(self.path) != good_size:
+            with open(self.path, "r+b") as f:
+                f.truncate(good_size)
+
+        return ops
+
+    def replay(self, snapshot_signature):
+        """
+        Ops to apply on top of the snapshot with this signature, in order.
+        Ops already folded into that snapshot by compaction are skipped.
+        """
+        with self._lock:
+            ops = self._read_ops()
+
+        folded = 0
+        for op in ops:
+            self.lsn = max(self.lsn, op["lsn"])
+            if op["op"] == "compact" and snapshot_signature == tuple(op["snapshot"]):
+                folded = op["folded"]
+
+        return [op for op in ops if op["op"] != "compact" and op["lsn"] > folded]
+
+    # -- writing -----------------------------------------------------------
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "ab")
+        if self._flusher is None and self.fsync_interval:
+            self._flusher = threading.Thread(target=self._flush_loop, name="journal-fsync", daemon=True)
+            self._flusher.start()
+        return self._file
+
+    def _write(self, entry):
+        f = self._open()
+        f.write(json.dumps(entry, ensure_ascii=False).encode("utf-8") + b"\n")
+        f.flush()
+        self._unsynced += 1
+
+    def append(self, op):
+        """Log one op; returns its lsn"""
+        with self._lock:
+            self.lsn += 1
+            self._write(dict(op, lsn=self.lsn))
+            if self._unsynced >= self.fsync_batch:
+                self._sync()
+            else:
+                self._wakeup.set()
+            return self.lsn
+
+    def append_many(self, ops):
+        """Log several ops with one write and one fsync; returns the last lsn"""
+        with self._lock:
+            lines = []
+            for op in ops:
+                self.lsn += 1
+                lines.append(json.dumps(dict(op, lsn=self.lsn), ensure_ascii=False).encode("utf-8") + b"\n")
+            if lines:
+                f = self._open()
+                f.write(b"".join(lines))
+                f.flush()
+                self._unsynced += len(lines)
+                self._sync()
+            return self.lsn
+
+    def _sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def sync(self):
+        """Make every logged op durable now"""
+        with self._lock:
+            self._sync()
+
+    def _flush_loop(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            time.sleep(self.fsync_interval)
+            with self._lock:
+                self._sync()
+
+    def size(self):
+        with self._lock:
+            return self._file.tell() if self._file is not None else self._disk_size()
+
+    def _disk_size(self):
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    # -- compaction --------------------------------------------------------
+
+    def mark_compacted(self, folded_lsn, snapshot_signature):
+        """Durably record that a snapshot with this signature holds every op up to folded_lsn"""
+        with self._lock:
+            self.lsn += 1
+            self._write({"op": "compact", "lsn": self.lsn, "folded": folded_lsn,
+                         "snapshot": list(snapshot_signature)})
+            self._sync()
+
+    def truncate_through(self, folded_lsn, offset):
+        """
+        Rewrite the log keeping only the ops after folded_lsn. `offset` is
+        the log size when that lsn was reached; nothing before it is kept.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._unsynced = 0
+
+            tmp_path = self.path + ".tmp"
+            with open(self.path, "rb") as src, open(tmp_path, "wb") as dst:
+                src.seek(offset)
+                for line in src:
+                    op = json.loads(line)
+                    if op["op"] != "compact" and op["lsn"] > folded_lsn:
+                        dst.write(line)
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,78 @@
+class ValidationError(ValueError):
+    """A record that does not fit its schema; the message is fit for a 400 response"""
+
+
+def _is_text(value):
+    return isinstance(value, str)
+
+
+def _is_digits(value):
+    # Epoch milliseconds, as the backup writes them or as a JSON number
+    if isinstance(value, str):
+        return value.isascii() and value.isdigit()
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def _is_scalar(value):
+    return value is None or isinstance(value, (str, int, float))
+
+
+# What a field may hold: name -> check
+KINDS = {
+    "text": _is_text,
+    "digits": _is_digits,
+    "scalar": _is_scalar,
+}
+
+
+class Schema:
+    """
+    The fields a JSON record must or may have and what each may hold.
+
+    The field list is compiled once, when the schema is created, into a
+    frozenset of required names and a tuple of (name, check) pairs, so
+    validating a record costs one subset test plus one check per typed
+    field, with nothing looked up or parsed per call.
+    """
+
+    def __init__(self, fields, required=()):
+        unknown = set(fields.values()) - KINDS.keys()
+        if unknown:
+            raise ValueError(f"unknown field kinds: {sorted(unknown)}")
+
+        self.fields = dict(fields)
+        # In declaration order, so errors name the same field every time
+        self.required = tuple(dict.fromkeys(required))
+        self._required = frozenset(self.required)
+        self._checks = tuple((name, KINDS[kind], kind) for name, kind in self.fields.items())
+
+    def validate(self, record):
+        """Return `record` if it fits the schema; raise ValidationError naming its first problem otherwise"""
+        if not isinstance(record, dict):
+            raise ValidationError("record must be a JSON object")
+
+        if not self._required.issubset(record.keys()):
+            missing = next(name for name in self.required if name not in record)
+            raise ValidationError(f"Missing required field: {missing}")
+
+        for name, check, kind in self._checks:
+            if name in record and not check(record[name]):
+                raise ValidationError(f"Field {name} must be {kind}, got {type(record[name]).__name__}")
+
+        return record
+
+
+# An SMS record as POST /transactions takes it: the attributes of an
+# <sms> element in the backup, optionally with the fields the ETL extracts
+SMS_RECORD = Schema(
+    {
+        "protocol": "scalar", "address": "scalar", "date": "digits", "type": "scalar", "body": "text",
+        "subject": "scalar", "toa": "scalar", "sc_toa": "scalar", "service_center": "scalar", "read": "scalar",
+        "status": "scalar", "locked": "scalar", "date_sent": "scalar", "sub_id": "scalar",
+        "readable_date": "scalar", "contact_name": "scalar",
+        "transaction_id": "scalar", "transaction_type": "scalar", "amount": "scalar", "balance": "scalar",
+        "counterparty": "scalar", "transaction_date": "scalar", "category": "scalar",
+    },
+    required=("protocol", "address", "date", "type", "body", "subject", "toa", "sc_toa", "service_center",
+              "read", "status", "locked", "date_sent", "sub_id", "readable_date", "contact_name"),
+)
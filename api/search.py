@@ -0,0 +1,327 @@
+import base64
+import binascii
+import json
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+from api.indexes import encode_cursor, parse_query
+from etl.search_index import (BLOCK_SIZE, COUNTERPARTY_PREFIX, SEGMENT_RECORDS, PostingsBuffer, Segment,
+                              merge_segments, mergeable, open_segments, read_search_meta, record_fingerprint,
+                              record_terms, source_signature, tokenize)
+
+# Words a search may combine
+MAX_TERMS = 8
+
+# Decode a whole postings list rather than block by block once the blocks
+# to check hold more than this share of it
+FULL_DECODE_SHARE = 0.25
+
+# Most blocks a search decodes in one step while it walks a postings list
+MAX_WINDOW_BLOCKS = 64
+
+_EMPTY = np.empty(0, np.int64)
+
+
+def _isin_sorted(values, sorted_values):
+    """np.isin(values, sorted_values) for a sorted second array, by bisection"""
+    if not len(sorted_values):
+        return np.zeros(len(values), bool)
+    positions = np.minimum(np.searchsorted(sorted_values, values), len(sorted_values) - 1)
+    return sorted_values[positions] == values
+
+
+class TermPostings:
+    """
+    Every seq one term occurs in: its postings in each segment, minus the
+    seqs whose record changed since the segments were built (`stale`),
+    plus those of records added or changed since (`overlay`). Both are
+    sorted int64 arrays.
+    """
+
+    def __init__(self, parts, stale, overlay):
+        self.parts = parts          # (Segment, term position) in row order
+        self.stale = stale
+        self.overlay = overlay
+        self.count = sum(segment.count(i) for segment, i in parts) + len(overlay)
+        self._decoded = {}          # part -> its whole postings, once decoded
+
+    def _live(self, rows):
+        return rows[~_isin_sorted(rows, self.stale)] if len(self.stale) and len(rows) else rows
+
+    def contains(self, seqs):
+        """
+        A mask of which of `seqs`, a sorted array, the term occurs in.
+        Only the blocks the seqs fall in are decoded.
+        """
+        found = np.zeros(len(seqs), bool)
+        for part, (segment, i) in enumerate(self.parts):
+            lo, hi = np.searchsorted(seqs, [segment.start, segment.start + segment.rows])
+            if lo == hi:
+                continue
+            wanted = seqs[lo:hi]
+            rows = self._decoded.get(part)
+            if rows is None:
+                blocks = np.searchsorted(segment.block_starts(i), wanted, "right") - 1
+                blocks = blocks[blocks >= 0]
+                if not len(blocks):
+                    continue
+                blocks = blocks[np.concatenate(([True], blocks[1:] != blocks[:-1]))]
+                if len(blocks) * BLOCK_SIZE > FULL_DECODE_SHARE * segment.count(i):
+                    # Kept: a search walking another list asks again for the next window
+                    rows = self._decoded[part] = segment.decode(i)
+                else:
+                    rows = np.concatenate([segment.decode_block(i, block) for block in blocks.tolist()])
+            found[lo:hi] = _isin_sorted(wanted, rows)
+
+        if len(self.stale):
+            found &= ~_isin_sorted(seqs, self.stale)
+        if len(self.overlay):
+            found |= _isin_sorted(seqs, self.overlay)
+        return found
+
+    def windows_desc(self, below=None):
+        """
+        The term's seqs under `below`, newest first, as sorted arrays of
+        one block, then two, four and so on up to MAX_WINDOW_BLOCKS: a
+        search whose page fills early decodes little, and one whose other
+        words rule out most seqs takes few steps
+        """
+        starts = [segment.block_starts(i) for segment, i in self.parts]
+        firsts = np.cumsum([0] + [len(part) for part in starts])
+        bounds = np.concatenate(starts) if starts else _EMPTY
+
+        hi = np.inf if below is None else below
+        end = int(np.searchsorted(bounds, hi))
+        span = 1
+        while end:
+            start = max(0, end - span)
+            rows = []
+            for k in range(start, end):
+                n = int(np.searchsorted(firsts, k, "right")) - 1
+                segment, i = self.parts[n]
+                rows.append(segment.decode_block(i, k - int(firsts[n])))
+            rows = self._live(np.concatenate(rows))
+            rows = rows[rows < hi]
+            lo = int(bounds[start])
+            added = self.overlay[(self.overlay >= lo) & (self.overlay < hi)]
+            yield np.union1d(rows, added) if len(added) else rows
+            hi, end = lo, start
+            span = min(2 * span, MAX_WINDOW_BLOCKS)
+
+        added = self.overlay[self.overlay < hi]
+        if len(added):
+            yield added
+
+
+class SearchIndex:
+    """
+    Full-text index over the body and counterparty of the store's records,
+    answering multi-word AND queries ranked by how many of the words are
+    in the counterparty, then newest first.
+
+    On load the inverted index the ETL wrote next to the data file (see
+    etl/search_index.py) is memory mapped if it describes that very file;
+    otherwise the records are indexed in memory, on the first search
+    rather than on every reload. Writes through the API are not written to
+    the segments: each added or updated record goes into a small in-memory
+    overlay, and the base postings of updated or deleted ones are masked
+    out, so the index stays exact without rewriting anything.
+
+    Kept current by TransactionStore through rebuild/added/removed.
+    """
+
+    def __init__(self, path, data_path):
+        self.path = path
+        self.data_path = data_path
+        self._build_lock = threading.Lock()
+        self.rebuild({})
+
+    def rebuild(self, records):
+        self.segments = None
+        self._overlay = defaultdict(list)
+        self._overlay_seqs = set()
+        self._stale = set()
+        self._stale_array = None
+        self._rows = len(records)
+        self._source = source_signature(self.data_path)
+        self._adopt(records)
+
+    def _adopt(self, records):
+        """Use the index on disk if it was built from the loaded snapshot"""
+        try:
+            meta = read_search_meta(self.path)
+        except (OSError, ValueError):
+            return False
+        if meta is None or self._source is None or meta["source"] != self._source or meta["rows"] != self._rows:
+            return False
+
+        for entry in meta["segments"]:
+            for seq, fingerprint in entry["samples"]:
+                if seq in self._stale:
+                    continue
+                record = records.get(seq)
+                if record is None or record_fingerprint(record) != fingerprint:
+                    return False
+
+        self.segments = open_segments(self.path, meta)
+        return True
+
+    def _build(self, records):
+        """Index the current records in memory, segment by segment"""
+        segments = []
+        chunk = []
+        for seq, record in records.items():
+            chunk.append((seq, record))
+            if len(chunk) == SEGMENT_RECORDS:
+                segments.append(self._build_segment(chunk))
+                chunk = []
+                while len(segments) > 1 and mergeable(segments[-2].postings, segments[-1].postings):
+                    older, newer = segments.pop(-2), segments.pop()
+                    # Seqs of deleted records leave gaps, so the extent runs to the end of the newer one
+                    segments.append(Segment(older.start, newer.start + newer.rows - older.start,
+                                            merge_segments([older, newer])))
+        if chunk:
+            segments.append(self._build_segment(chunk))
+
+        self._overlay = defaultdict(list)
+        self._overlay_seqs = set()
+        self._stale = set()
+        self._stale_array = None
+        self.segments = segments
+
+    @staticmethod
+    def _build_segment(chunk):
+        postings = PostingsBuffer()
+        for seq, record in chunk:
+            postings.add(seq, record_terms(record))
+        start = chunk[0][0]
+        return Segment(start, chunk[-1][0] - start + 1, postings.arrays())
+
+    def _ensure_built(self, records):
+        if self.segments is None:
+            with self._build_lock:
+                if self.segments is None and not self._adopt(records):
+                    self._build(records)
+
+    def added(self, seq, record):
+        for term in record_terms(record):
+            seqs = self._overlay[term]
+            seqs.append(seq)
+            if len(seqs) > 1 and seqs[-2] > seq:
+                seqs.sort()
+        self._overlay_seqs.add(seq)
+
+    def removed(self, seq, record):
+        if seq in self._overlay_seqs:
+            self._overlay_seqs.discard(seq)
+            for term in record_terms(record):
+                seqs = self._overlay[term]
+                seqs.remove(seq)
+                if not seqs:
+                    del self._overlay[term]
+        else:
+            self._stale.add(seq)
+            self._stale_array = None
+
+    def postings(self, term):
+        parts = []
+        for segment in self.segments:
+            i = segment.find(term)
+            if i is not None:
+                parts.append((segment, i))
+
+        if self._stale_array is None:
+            self._stale_array = np.array(sorted(self._stale), np.int64)
+        overlay = np.array(self._overlay.get(term, ()), np.int64)
+        return TermPostings(parts, self._stale_array, overlay)
+
+    def search(self, records, query):
+        """
+        One page of records containing every word of `query` (see
+        parse_search_query), as {"items": [...], "next_cursor": str or None}.
+        Records with more of the words in their counterparty come first,
+        and within that newest first.
+
+        Each score is served by walking, newest first, the shortest
+        postings list every record with that score must be in, and
+        checking the others block by block, so the work follows the rarest
+        word and the page rather than how common the other words are.
+        """
+        self._ensure_built(records)
+
+        postings = sorted((self.postings(term) for term in query["terms"]), key=lambda p: p.count)
+        if not postings[0].count:
+            return {"items": [], "next_cursor": None}
+        boosts = [p for p in (self.postings(COUNTERPARTY_PREFIX + term) for term in query["terms"]) if p.count]
+
+        cursor = query.get("cursor")
+        wanted = query["limit"] + 1
+        found = []
+        for score in range(len(boosts) if cursor is None else min(cursor[0], len(boosts)), -1, -1):
+            below = cursor[1] if cursor is not None and score == cursor[0] else None
+            required = postings + boosts if score == len(boosts) else postings
+            driver = min(required, key=lambda p: p.count)
+            for window in driver.windows_desc(below):
+                for p in required:
+                    if p is not driver and len(window):
+                        window = window[p.contains(window)]
+                if score < len(boosts) and len(window):
+                    window = window[sum(p.contains(window).astype(np.int64) for p in boosts) == score]
+                found.extend((score, seq) for seq in window[::-1][:wanted - len(found)].tolist())
+                if len(found) == wanted:
+                    break
+            if len(found) == wanted:
+                break
+
+        next_cursor = None
+        if len(found) == wanted:
+            found.pop()
+            next_cursor = encode_cursor(found[-1])
+
+        fields = query.get("fields")
+        items = []
+        for score, seq in found:
+            record = records[seq]
+            items.append({f: record[f] for f in fields if f in record} if fields else record)
+        return {"items": items, "next_cursor": next_cursor}
+
+
+def decode_search_cursor(cursor):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, binascii.Error, UnicodeError):
+        raise ValueError("invalid cursor")
+
+    if not (isinstance(key, list) and len(key) == 2 and all(type(v) is int and v >= 0 for v in key)):
+        raise ValueError("invalid cursor")
+    return key
+
+
+def parse_search_query(params):
+    """
+    Turn a parse_qs() result into the query SearchIndex.search expects.
+    Raises ValueError with a message fit for a 400 response.
+    """
+    values = params.get("q")
+    if not values:
+        raise ValueError("q is required")
+    if len(values) != 1:
+        raise ValueError("q given more than once")
+
+    terms = list(dict.fromkeys(tokenize(values[0])))
+    if not terms:
+        raise ValueError("q must contain at least one word")
+    if len(terms) > MAX_TERMS:
+        raise ValueError(f"q may contain at most {MAX_TERMS} words")
+
+    query = parse_query({name: params[name] for name in ("limit", "fields") if name in params})
+    query["terms"] = terms
+
+    cursor = params.get("cursor")
+    if cursor:
+        if len(cursor) != 1:
+            raise ValueError("cursor given more than once")
+        query["cursor"] = decode_search_cursor(cursor[0])
+    return query
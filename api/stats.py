@@ -0,0 +1,249 @@
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from api.indexes import DATE_PARAM
+from etl.block_tree import (AMOUNT_MAX, AMOUNT_MIN, AMOUNT_N, AMOUNT_SUM, BALANCE_MAX, BALANCE_MIN, BALANCE_N,
+                            BALANCE_SUM, COUNT, EMPTY_SUMMARY, BlockTree, combine, summarize)
+from etl.config import TIMEZONE_OFFSET_HOURS
+from etl.record_keys import MAX_TIMESTAMP, record_time, record_value
+
+# Records added since the last merge, kept in a sorted list
+BUFFER_RECORDS = 1024
+
+# The smaller run is folded into the main one once it passes this share of it
+DELTA_SHARE = 16
+
+# Dates given as text are read in the messages' local time, as in etl/config.py
+LOCAL_TIME = timezone(timedelta(hours=TIMEZONE_OFFSET_HOURS))
+
+
+def _empty_tree():
+    return BlockTree(np.empty(0, np.int64), np.empty(0, np.int64), np.empty((0, 2)))
+
+
+class RangeAggregates:
+    """
+    Range aggregates over one transaction_type, as a small log-structured
+    set: a main BlockTree, a delta BlockTree of at most 1/DELTA_SHARE its
+    size, and a sorted list of the last few added records. An addition
+    goes to the list; a full list is merged into the delta, and a large
+    delta into the main tree, so the cost of rebuilding is spread over the
+    additions that caused it. A query asks the two trees (O(log n) each)
+    and bisects the list, whose length is bounded.
+    """
+
+    def __init__(self, main=None):
+        self.main = main if main is not None else _empty_tree()
+        self.delta = _empty_tree()
+        self.buffer = []        # (date, seq, amount, balance), sorted
+
+    def __len__(self):
+        return len(self.main) + len(self.delta) + len(self.buffer)
+
+    def add(self, date, seq, amount, balance):
+        insort(self.buffer, (date, seq, amount, balance))
+        if len(self.buffer) < BUFFER_RECORDS:
+            return
+
+        dates, seqs, amounts, balances = zip(*self.buffer)
+        self.delta = self._merge(self.delta, (dates, seqs, np.column_stack((amounts, balances))))
+        self.buffer = []
+        if len(self.delta) * DELTA_SHARE > len(self.main):
+            self.main = self._merge(self.main, self.delta.entries())
+            self.delta = _empty_tree()
+
+    @staticmethod
+    def _merge(tree, extra):
+        return BlockTree(*(np.concatenate([old, new]) for old, new in zip(tree.entries(), extra)))
+
+    def remove(self, date, seq):
+        i = bisect_left(self.buffer, (date, seq))
+        if i < len(self.buffer) and self.buffer[i][:2] == (date, seq):
+            del self.buffer[i]
+            return
+        for tree in (self.delta, self.main):
+            leaf = tree.find(date, seq)
+            if leaf is not None:
+                tree.remove(leaf)
+                return
+
+    def summary(self, date_from, date_to):
+        """The summary vector of records dated date_from..date_to, inclusive"""
+        nodes, values, alive = zip(self.main.parts(date_from, date_to), self.delta.parts(date_from, date_to))
+        values, alive = list(values), list(alive)
+
+        lo = bisect_left(self.buffer, (date_from,))
+        hi = bisect_right(self.buffer, (date_to, float("inf")))
+        if lo < hi:
+            values.append(np.array([entry[2:] for entry in self.buffer[lo:hi]]))
+            alive.append(np.ones(hi - lo, bool))
+
+        # Every loose leaf is summarized in one go, then joined to the nodes
+        leaves = summarize(np.concatenate(values), np.concatenate(alive))
+        return combine(np.concatenate(nodes + (leaves[None],)))
+
+
+class StatsIndex:
+    """
+    Sum, count, min and max of amount and balance per transaction_type
+    over any range of `date` (epoch milliseconds), each answered in
+    O(log n) from a RangeAggregates per type rather than by a pass over
+    the records. Records without a numeric date or a transaction_type are
+    left out.
+
+    Kept current by TransactionStore through rebuild/added/removed. Over
+    records loaded from a snapshot, the trees are read from it rather
+    than built.
+    """
+
+    def __init__(self):
+        self.rebuild({})
+
+    @staticmethod
+    def _key(record):
+        tx_type = record.get("transaction_type")
+        date = record_time(record)
+        if not isinstance(tx_type, str) or date is None:
+            return None, None
+        return tx_type, date
+
+    def rebuild(self, records):
+        snapshot = getattr(records, "snapshot", None)
+        if snapshot is not None:
+            self._restore(snapshot)
+            records.replay(self)
+            return
+
+        columns = {}
+        for seq, record in records.items():
+            tx_type, date = self._key(record)
+            if tx_type is None:
+                continue
+            column = columns.get(tx_type)
+            if column is None:
+                column = columns[tx_type] = ([], [], [])
+            column[0].append(date)
+            column[1].append(seq)
+            column[2].append((record_value(record, "amount"), record_value(record, "balance")))
+
+        self.by_type = {tx_type: RangeAggregates(BlockTree(*column)) for tx_type, column in columns.items()}
+
+    def _restore(self, snapshot):
+        dates, seqs, values = (snapshot.array(f"stats.{name}") for name in ("dates", "seqs", "values"))
+        tree, bounds, tree_bounds = (snapshot.array(f"stats.{name}") for name in ("tree", "bounds", "tree_bounds"))
+        self.by_type = {}
+        for code, tx_type in enumerate(snapshot.categories["transaction_type"]):
+            lo, hi = bounds[code], bounds[code + 1]
+            if lo < hi:
+                main = BlockTree.restore(dates[lo:hi], seqs[lo:hi], values[lo:hi],
+                                         tree[tree_bounds[code]:tree_bounds[code + 1]])
+                self.by_type[tx_type] = RangeAggregates(main)
+
+    def added(self, seq, record):
+        tx_type, date = self._key(record)
+        if tx_type is None:
+            return
+        aggregates = self.by_type.get(tx_type)
+        if aggregates is None:
+            aggregates = self.by_type[tx_type] = RangeAggregates()
+        aggregates.add(date, seq, record_value(record, "amount"), record_value(record, "balance"))
+
+    def removed(self, seq, record):
+        tx_type, date = self._key(record)
+        if tx_type is None:
+            return
+        aggregates = self.by_type[tx_type]
+        aggregates.remove(date, seq)
+        if not len(aggregates):
+            del self.by_type[tx_type]
+
+    def stats(self, records, query):
+        """
+        Aggregates of the records matching `query` (see parse_stats_query),
+        as {"date_from", "date_to", "types": {type: stats}, "total": stats}
+        where stats is {"count", "amount": {"count", "sum", "min", "max"},
+        "balance": {...}}. `records` is unused; it is there for
+        TransactionStore.query.
+        """
+        date_from, date_to = query.get("date_from", 0), query.get("date_to", MAX_TIMESTAMP)
+        types = query.get("transaction_type")
+        if types is None:
+            types = sorted(self.by_type)
+
+        summaries = {tx_type: self.by_type[tx_type].summary(date_from, date_to)
+                     for tx_type in types if tx_type in self.by_type}
+        total = combine(np.array(list(summaries.values()))) if summaries else EMPTY_SUMMARY
+        return {
+            "date_from": query.get("date_from"),
+            "date_to": query.get("date_to"),
+            "types": {tx_type: _stats_json(summary) for tx_type, summary in summaries.items() if summary[COUNT]},
+            "total": _stats_json(total),
+        }
+
+
+def _number(value):
+    if np.isnan(value):
+        return None
+    return int(value) if value.is_integer() else float(value)
+
+
+def _stats_json(summary):
+    return {
+        "count": int(summary[COUNT]),
+        "amount": {"count": int(summary[AMOUNT_N]), "sum": _number(summary[AMOUNT_SUM]),
+                   "min": _number(summary[AMOUNT_MIN]), "max": _number(summary[AMOUNT_MAX])},
+        "balance": {"count": int(summary[BALANCE_N]), "sum": _number(summary[BALANCE_SUM]),
+                    "min": _number(summary[BALANCE_MIN]), "max": _number(summary[BALANCE_MAX])},
+    }
+
+
+def _date_millis(name, value):
+    """
+    A date_from/date_to parameter as epoch milliseconds: given as such, or
+    as YYYY-MM-DD[ HH:MM:SS] in local time like GET /transactions takes it.
+    A date_to without a time means the end of that day.
+    """
+    if value.isascii() and value.isdigit():
+        if int(value) > MAX_TIMESTAMP:
+            raise ValueError(f"{name} is out of range")
+        return int(value)
+
+    if DATE_PARAM.match(value):
+        try:
+            when = datetime.fromisoformat(value).replace(tzinfo=LOCAL_TIME)
+        except ValueError:
+            when = None
+        if when is not None:
+            millis = int(when.timestamp()) * 1000
+            if name == "date_to":
+                millis += 86_400_000 - 1 if len(value) == 10 else 999
+            return millis
+
+    raise ValueError(f"{name} must be YYYY-MM-DD, YYYY-MM-DD HH:MM:SS or epoch milliseconds")
+
+
+def parse_stats_query(params):
+    """
+    Turn a parse_qs() result into the query StatsIndex.stats expects:
+    optional date_from/date_to in epoch milliseconds (see _date_millis)
+    and any number of transaction_type values. Raises ValueError with a
+    message fit for a 400 response.
+    """
+    query = {}
+    for name in ("date_from", "date_to"):
+        values = params.get(name)
+        if values is None:
+            continue
+        if len(values) != 1:
+            raise ValueError(f"{name} given more than once")
+        query[name] = _date_millis(name, values[0])
+
+    if query.get("date_from", 0) > query.get("date_to", float("inf")):
+        raise ValueError("date_from must not be after date_to")
+
+    types = params.get("transaction_type")
+    if types is not None:
+        query["transaction_type"] = list(dict.fromkeys(types))
+    return query
@@ -0,0 +1,548 @@
+import json
+import os
+import threading
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+
+from api.indexes import TransactionIndex
+from api.journal import Journal
+from api.search import SearchIndex
+from api.stats import StatsIndex
+from etl.clean_normalize import compact_record
+from etl.parse_xml import write_records_stream
+from etl.snapshot import open_snapshot
+
+# Fold the journal into a new snapshot once it grows past this many bytes
+COMPACT_THRESHOLD_BYTES = 8 * 1024 * 1024
+
+
+class ReadWriteLock:
+    """
+    Many readers or a single writer. A waiting writer holds back new readers,
+    so a steady stream of reads cannot starve writes. Not reentrant.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._waiting_writers += 1
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+
+class SnapshotRecords(MutableMapping):
+    """
+    seq -> record over an etl.snapshot.Snapshot, whose rows are seqs
+    0..rows-1. Records are decoded from the snapshot when read, and
+    changes made since it was loaded are held apart from it, so that an
+    index restored from the snapshot can catch up with them (replay()).
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self._rows = snapshot.rows
+        self._replaced = {}     # seq -> record, for rows changed since
+        self._removed = set()   # rows deleted since
+        self._added = {}        # seq -> record, for seqs past the rows
+
+    def __getitem__(self, seq):
+        if seq >= self._rows:
+            return self._added[seq]
+        record = self._replaced.get(seq)
+        if record is not None:
+            return record
+        if seq < 0 or seq in self._removed:
+            raise KeyError(seq)
+        return self.snapshot.record(seq)
+
+    def __setitem__(self, seq, record):
+        if seq >= self._rows:
+            self._added[seq] = record
+        else:
+            self._removed.discard(seq)
+            self._replaced[seq] = record
+
+    def __delitem__(self, seq):
+        if seq >= self._rows:
+            del self._added[seq]
+        elif seq < 0 or seq in self._removed:
+            raise KeyError(seq)
+        else:
+            self._replaced.pop(seq, None)
+            self._removed.add(seq)
+
+    def __contains__(self, seq):
+        if seq >= self._rows:
+            return seq in self._added
+        return seq >= 0 and seq not in self._removed
+
+    def __len__(self):
+        return self._rows - len(self._removed) + len(self._added)
+
+    def __iter__(self):
+        removed = self._removed
+        for seq in range(self._rows):
+            if seq not in removed:
+                yield seq
+        yield from list(self._added)
+
+    def copy(self):
+        copy = SnapshotRecords(self.snapshot)
+        copy._replaced = dict(self._replaced)
+        copy._removed = set(self._removed)
+        copy._added = dict(self._added)
+        return copy
+
+    def replay(self, listener):
+        """Tell a listener rebuilt from the snapshot about every change since"""
+        for seq in sorted(self._removed.union(self._replaced)):
+            listener.removed(seq, self.snapshot.record(seq))
+            if seq in self._replaced:
+                listener.added(seq, self._replaced[seq])
+        for seq, record in self._added.items():
+            listener.added(seq, record)
+
+
+class SnapshotIds:
+    """
+    transaction_id -> seq of its first record, read from the id lookup of
+    an etl.snapshot.Snapshot, with the changes made since held apart
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self._set = {}
+        self._unset = set()
+
+    def get(self, tx_id, default=None):
+        seq = self._set.get(tx_id)
+        if seq is None and tx_id not in self._unset:
+            seq = self.snapshot.find_id(tx_id)
+        return default if seq is None else seq
+
+    def __contains__(self, tx_id):
+        return self.get(tx_id) is not None
+
+    def __getitem__(self, tx_id):
+        seq = self.get(tx_id)
+        if seq is None:
+            raise KeyError(tx_id)
+        return seq
+
+    def __setitem__(self, tx_id, seq):
+        self._unset.discard(tx_id)
+        self._set[tx_id] = seq
+
+    def __delitem__(self, tx_id):
+        self[tx_id]
+        self._set.pop(tx_id, None)
+        self._unset.add(tx_id)
+
+
+class TransactionStore:
+    """
+    Process-wide, in-memory copy of sms_records.json.
+
+    The file is decoded once and kept resident together with a hash index on
+    transaction_id, so a lookup by id costs O(1) whatever the dataset size.
+    The file is re-read only when its mtime or size changes on disk.
+
+    Writes never rewrite the file. Each mutation is appended to a journal
+    (sms_records.json.journal) and then applied to the resident records, so
+    a write costs O(1) in the dataset size. The resident state is always the
+    snapshot file plus a replay of the journal, and once the journal passes
+    `compact_bytes` a background thread folds it into a new snapshot.
+
+    Records keep the order of the file. When several records share a
+    transaction_id, lookups return the first one, like the linear scan the
+    handlers used to do. Stored records are never modified in place (an
+    update swaps in a new record), so a list returned by all() stays
+    consistent while writes continue. Records with the parser's shape are
+    held as compact, read-only etl.clean_normalize.SmsRecord mappings.
+
+    Reads take a shared lock and run in parallel; writes, reloads and the
+    final step of compaction take it exclusively.
+
+    Secondary indexes subscribe to changes through index(): each one is
+    rebuilt from the records on load and then told about every record
+    added or removed (an update is a removal followed by an addition).
+    The full-text SearchIndex is always subscribed, so that on load it sees
+    the snapshot before the journal and can use the index the ETL wrote
+    for that snapshot in `search_path` (sms_search/ next to the file).
+
+    When the ETL has also written a binary snapshot of the file
+    (etl.snapshot, at `snapshot_path`, sms_snapshot.bin next to the file)
+    and it is still current, the store is loaded from it instead: the
+    file is memory-mapped, records are decoded only when read and the
+    secondary indexes are read from it rather than built, so start-up
+    costs little whatever the dataset size. Otherwise the JSON is read.
+    """
+
+    def __init__(self, path, compact_bytes=COMPACT_THRESHOLD_BYTES, journal=None, search_path=None,
+                 snapshot_path=None):
+        self.path = path
+        self.compact_bytes = compact_bytes
+        self._journal = journal or Journal(path + ".journal")
+        self._lock = ReadWriteLock()
+        self._compact_lock = threading.Lock()
+        self._records = {}      # seq -> record, in file order
+        self._by_id = {}        # transaction_id -> seq of its first record
+        self._duplicates = {}   # transaction_id -> later seqs sharing that id
+        self._next_seq = 0
+        self._signature = None
+        self._loaded = False
+        self._compactor = None
+        self._search = SearchIndex(search_path or os.path.join(os.path.dirname(path), "sms_search"), path)
+        self._listeners = [self._search]
+        self.snapshot_path = snapshot_path or os.path.join(os.path.dirname(path), "sms_snapshot.bin")
+        self._indexes = {}      # factory -> its instance for this store
+        # Bumped on every change to the data, whatever its origin
+        self.version = 0
+        # Tells this instance's versions apart from those of an earlier run
+        self.epoch = os.urandom(4).hex()
+
+    def _file_signature(self, path=None):
+        stat = os.stat(path or self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _current_signature(self):
+        try:
+            return self._file_signature()
+        except FileNotFoundError:
+            return None
+
+    def _load(self, records, signature, snapshot=None):
+        self._records = {}
+        self._by_id = {}
+        self._duplicates = {}
+        self._next_seq = 0
+
+        # Listeners are rebuilt from the snapshot in one go rather than fed
+        # record by record; the journal then reaches them op by op
+        listeners, self._listeners = self._listeners, []
+        if snapshot is not None:
+            self._records = SnapshotRecords(snapshot)
+            self._by_id = SnapshotIds(snapshot)
+            self._duplicates = snapshot.duplicates()
+            self._next_seq = snapshot.rows
+        for record in records:
+            self._append(record)
+
+        self._listeners = listeners
+        for listener in listeners:
+            listener.rebuild(self._records)
+
+        for op in self._journal.replay(signature):
+            self._apply(op)
+
+        self._signature = signature
+        self._loaded = True
+        self.version += 1
+
+    def _reload(self):
+        """Re-read the snapshot if it changed; the write lock must be held"""
+        signature = self._current_signature()
+        if self._loaded and signature == self._signature:
+            return
+
+        if signature is None:
+            self._load([], None)
+            return
+
+        try:
+            snapshot = open_snapshot(self.snapshot_path, self.path)
+        except ValueError:
+            # A damaged snapshot is only a slower start
+            snapshot = None
+        if snapshot is not None:
+            self._load([], signature, snapshot)
+        else:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._load(json.load(f, object_hook=compact_record), signature)
+
+    def refresh(self, missing_ok=False):
+        """
+        Reload the snapshot (and replay the journal) if the file changed
+        since it was last read. Raises FileNotFoundError if there is no data
+        at all, unless `missing_ok`, in which case the store starts empty.
+        """
+        signature = self._current_signature()
+        # Only a changed file needs the exclusive lock
+        if not self._loaded or signature != self._signature:
+            with self._lock.write():
+                self._reload()
+
+        if signature is None and not missing_ok and not self._records:
+            raise FileNotFoundError(self.path)
+
+    # -- journal and compaction -------------------------------------------
+
+    def _apply(self, op):
+        kind = op["op"]
+        if kind == "add":
+            return self._append(op["record"])
+        elif kind == "update":
+            return self._update(op["id"], op["fields"])
+        elif kind == "delete":
+            return self._delete(op["id"])
+
+    def _log(self, op):
+        """Write-ahead: journal the op, then apply it to the resident records"""
+        self._journal.append(op)
+        result = self._apply(op)
+        self.version += 1
+        self._compact_if_due()
+        return result
+
+    def _compact_if_due(self):
+        if self._compactor is None and self._journal.size() >= self.compact_bytes:
+            self._compactor = threading.Thread(target=self.compact, name="store-compactor", daemon=True)
+            self._compactor.start()
+
+    def compact(self):
+        """
+        Fold the journal into a new snapshot of the data file. Only copying
+        the list of records and swapping the file in hold the lock;
+        serializing the records does not, so requests carry on meanwhile.
+        """
+        with self._compact_lock:
+            try:
+                self._compact()
+            finally:
+                self._compactor = None
+
+    def _compact(self):
+        with self._lock.read():
+            records = self._records.copy()
+            folded_lsn = self._journal.lsn
+            offset = self._journal.size()
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            write_records_stream(records.values(), f)
+            f.flush()
+            os.fsync(f.fileno())
+
+        with self._lock.write():
+            # os.replace keeps mtime and size, so this is also the
+            # signature of the snapshot once it is in place
+            signature = self._file_signature(tmp_path)
+            self._journal.mark_compacted(folded_lsn, signature)
+            os.replace(tmp_path, self.path)
+            self._signature = signature
+            self._journal.truncate_through(folded_lsn, offset)
+
+    # -- index maintenance -------------------------------------------------
+
+    def _index_add(self, tx_id, seq):
+        if tx_id is None:
+            return
+
+        first = self._by_id.get(tx_id)
+        if first is None:
+            self._by_id[tx_id] = seq
+            return
+
+        # Keep the earliest record (in file order) as the one lookups return
+        seqs = sorted([first, seq] + self._duplicates.get(tx_id, []))
+        self._by_id[tx_id] = seqs[0]
+        self._duplicates[tx_id] = seqs[1:]
+
+    def _index_remove(self, tx_id, seq):
+        if tx_id is None:
+            return
+
+        if self._by_id.get(tx_id) == seq:
+            later = self._duplicates.pop(tx_id, None)
+            if later:
+                self._by_id[tx_id] = later[0]
+                if later[1:]:
+                    self._duplicates[tx_id] = later[1:]
+            else:
+                del self._by_id[tx_id]
+        elif tx_id in self._duplicates:
+            self._duplicates[tx_id].remove(seq)
+            if not self._duplicates[tx_id]:
+                del self._duplicates[tx_id]
+
+    def _append(self, record):
+        record = compact_record(record)
+        seq = self._next_seq
+        self._next_seq += 1
+        self._records[seq] = record
+        self._index_add(record.get("transaction_id"), seq)
+        for listener in self._listeners:
+            listener.added(seq, record)
+        return record
+
+    def _update(self, tx_id, fields):
+        seq = self._by_id.get(tx_id)
+        if seq is None:
+            return None
+
+        old = self._records[seq]
+        record = dict(old)
+        record.update(fields)
+        record = compact_record(record)
+        self._records[seq] = record
+        self._index_remove(old.get("transaction_id"), seq)
+        self._index_add(record.get("transaction_id"), seq)
+        for listener in self._listeners:
+            listener.removed(seq, old)
+            listener.added(seq, record)
+        return record
+
+    def _delete(self, tx_id):
+        seq = self._by_id.get(tx_id)
+        if seq is None:
+            return None
+
+        record = self._records.pop(seq)
+        self._index_remove(record.get("transaction_id"), seq)
+        for listener in self._listeners:
+            listener.removed(seq, record)
+        return record
+
+    # -- queries -----------------------------------------------------------
+
+    def all(self):
+        """All records, in file order"""
+        self.refresh()
+        with self._lock.read():
+            return list(self._records.values())
+
+    def get(self, tx_id):
+        """The first record with this transaction_id, or None"""
+        self.refresh()
+        with self._lock.read():
+            seq = self._by_id.get(tx_id)
+            return self._records[seq] if seq is not None else None
+
+    def index(self, factory):
+        """
+        The secondary index built by `factory` for this store, created on
+        first use. It must provide rebuild(records), added(seq, record) and
+        removed(seq, record), where records maps seq to record in file order.
+        """
+        index = self._indexes.get(factory)
+        if index is None:
+            self.refresh(missing_ok=True)
+            with self._lock.write():
+                index = self._indexes.get(factory)
+                if index is None:
+                    index = factory()
+                    index.rebuild(self._records)
+                    self._listeners.append(index)
+                    self._indexes[factory] = index
+        return index
+
+    def query(self, func, *args, **kwargs):
+        """Call func(records, *args, **kwargs) under the read lock and return its result"""
+        self.refresh()
+        with self._lock.read():
+            return func(self._records, *args, **kwargs)
+
+    def page(self, query):
+        """One page of records matching `query`, from the TransactionIndex (see its page())"""
+        return self.query(self.index(TransactionIndex).page, query)
+
+    def search(self, query):
+        """One page of records matching a full-text `query`, from the SearchIndex (see its search())"""
+        return self.query(self._search.search, query)
+
+    def stats(self, query):
+        """Range aggregates of amount and balance per transaction_type, from the StatsIndex (see its stats())"""
+        return self.query(self.index(StatsIndex).stats, query)
+
+    # -- writes ------------------------------------------------------------
+
+    def add(self, record):
+        """Append a record; a missing data file starts a new one"""
+        self.refresh(missing_ok=True)
+        with self._lock.write():
+            missing = self._signature is None
+            self._log({"op": "add", "record": record})
+        if missing:
+            # Create the data file straight away, as the API always has
+            self.compact()
+        return record
+
+    def add_many(self, records):
+        """
+        Append a batch of records under one hold of the lock, with a single
+        journal write and fsync for all of them, so they are durable when
+        this returns. A missing data file starts a new one.
+        """
+        self.refresh(missing_ok=True)
+        with self._lock.write():
+            missing = self._signature is None
+            self._journal.append_many([{"op": "add", "record": record} for record in records])
+            for record in records:
+                self._append(record)
+            self.version += 1
+            self._compact_if_due()
+        if missing:
+            self.compact()
+        return records
+
+    def update(self, tx_id, fields):
+        """Merge `fields` into the record with this id; returns it, or None if absent"""
+        self.refresh()
+        with self._lock.write():
+            if tx_id not in self._by_id:
+                return None
+            return self._log({"op": "update", "id": tx_id, "fields": fields})
+
+    def delete(self, tx_id):
+        """Remove the record with this id; returns it, or None if absent"""
+        self.refresh()
+        with self._lock.write():
+            if tx_id not in self._by_id:
+                return None
+            return self._log({"op": "delete", "id": tx_id})
+
+    def sync(self):
+        """Make every acknowledged write durable now"""
+        self._journal.sync()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path):
+    """The process-wide TransactionStore for a data file"""
+    path = os.path.abspath(path)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = TransactionStore(path)
+        return _stores[path]
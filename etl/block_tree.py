@@ -0,0 +1,156 @@
+import numpy as np
+
+# Leaves summarized together at the bottom of a BlockTree; a query scans at
+# most two partial blocks and combines O(log n) tree nodes for the rest
+LEAF_BLOCK = 64
+
+# Columns of a summary vector, amount and balance side by side. The first
+# five add up, the rest combine by min and max; NaN stands for "no value",
+# which np.fmin/np.fmax skip
+COUNT, AMOUNT_N, BALANCE_N, AMOUNT_SUM, BALANCE_SUM, AMOUNT_MIN, BALANCE_MIN, AMOUNT_MAX, BALANCE_MAX = range(9)
+SUMS = slice(0, 5)
+MINS = slice(5, 7)
+MAXS = slice(7, 9)
+
+EMPTY_SUMMARY = np.array([0, 0, 0, 0, 0, np.nan, np.nan, np.nan, np.nan])
+
+
+def summarize(values, alive, axis=0):
+    """
+  The summary vector of leaves, from their (amount, balance) `values`
+  and `alive` flags; with axis=1, one per row of a (rows, leaves, 2) stack
+  """
+    if not values.shape[axis]:
+        return EMPTY_SUMMARY.copy()
+    present = ~np.isnan(values)
+    return np.concatenate([alive.sum(axis)[..., None], present.sum(axis), np.where(present, values, 0).sum(axis),
+                           np.fmin.reduce(values, axis), np.fmax.reduce(values, axis)], axis=-1)
+
+
+def combine(summaries):
+    """
+  One summary vector for a stack of them
+  """
+    if not len(summaries):
+        return EMPTY_SUMMARY.copy()
+    return np.concatenate([summaries[:, SUMS].sum(0),
+                           np.fmin.reduce(summaries[:, MINS], 0), np.fmax.reduce(summaries[:, MAXS], 0)])
+
+
+class BlockTree:
+    """
+  Records of one transaction_type sorted by (date, seq), with the amount
+  and balance of each, and a segment tree of summary vectors over blocks
+  of LEAF_BLOCK of them. The shape is fixed once built: a removal only
+  clears its leaf and refreshes the summaries above it, and new records
+  go into a new tree (see api.stats.RangeAggregates).
+  """
+
+    def __init__(self, dates, seqs, values):
+        order = np.lexsort((seqs, dates))
+        self.dates = np.asarray(dates, np.int64)[order]
+        self.seqs = np.asarray(seqs, np.int64)[order]
+        self.values = np.asarray(values, np.float64).reshape(-1, 2)[order]
+        self.alive = np.ones(len(self.dates), bool)
+        self.live = len(self.dates)
+
+        blocks = -(-len(self.dates) // LEAF_BLOCK)
+        self.size = 1 << max(blocks - 1, 0).bit_length()
+        self.tree = np.tile(EMPTY_SUMMARY, (2 * self.size, 1))
+
+        if blocks:
+            # Leaves padded to whole blocks, so every block is summarized at once
+            pad = blocks * LEAF_BLOCK - len(self.dates)
+            self.tree[self.size:self.size + blocks] = summarize(
+                np.concatenate([self.values, np.full((pad, 2), np.nan)]).reshape(blocks, LEAF_BLOCK, 2),
+                np.concatenate([self.alive, np.zeros(pad, bool)]).reshape(blocks, LEAF_BLOCK), axis=1)
+
+        level = self.size
+        while level > 1:
+            children = self.tree[level:2 * level].reshape(level // 2, 2, -1)
+            parents = self.tree[level // 2:level]
+            parents[:, SUMS] = children[:, :, SUMS].sum(1)
+            parents[:, MINS] = np.fmin.reduce(children[:, :, MINS], 1)
+            parents[:, MAXS] = np.fmax.reduce(children[:, :, MAXS], 1)
+            level //= 2
+
+    @classmethod
+    def restore(cls, dates, seqs, values, tree):
+        """
+      A tree as built before, from its sorted arrays and summaries (see etl.snapshot)
+      """
+        self = cls.__new__(cls)
+        self.dates, self.seqs, self.values, self.tree = dates, seqs, values, tree
+        self.alive = np.ones(len(dates), bool)
+        self.live = len(dates)
+        self.size = len(tree) // 2
+        return self
+
+    def __len__(self):
+        return self.live
+
+    def find(self, date, seq):
+        """
+      The leaf holding (date, seq) if it is alive, or None
+      """
+        lo = np.searchsorted(self.dates, date, 'left')
+        hi = np.searchsorted(self.dates, date, 'right')
+        i = lo + int(np.searchsorted(self.seqs[lo:hi], seq))
+        if i < hi and self.seqs[i] == seq and self.alive[i]:
+            return i
+        return None
+
+    def remove(self, i):
+        """
+      Clear leaf i and refresh the summaries of its block and above
+      """
+        if not self.values.flags.writeable:
+            # Restored from a snapshot, whose arrays are read-only
+            self.values, self.tree = self.values.copy(), self.tree.copy()
+        self.alive[i] = False
+        self.values[i] = np.nan
+        self.live -= 1
+
+        block = i // LEAF_BLOCK
+        lo, hi = block * LEAF_BLOCK, (block + 1) * LEAF_BLOCK
+        node = self.size + block
+        self.tree[node] = summarize(self.values[lo:hi], self.alive[lo:hi])
+        node //= 2
+        while node:
+            self.tree[node] = combine(self.tree[2 * node:2 * node + 2])
+            node //= 2
+
+    def entries(self):
+        """
+      The live records as (dates, seqs, values)
+      """
+        alive = self.alive
+        return self.dates[alive], self.seqs[alive], self.values[alive]
+
+    def parts(self, date_from, date_to):
+        """
+      What records dated date_from..date_to (inclusive) are made of: the
+      tree nodes covering their whole blocks, O(log n) of them, and the
+      values and alive flags of the leaves in the partial blocks at
+      either end
+      """
+        lo = int(np.searchsorted(self.dates, date_from, 'left'))
+        hi = int(np.searchsorted(self.dates, date_to, 'right'))
+        first, last = lo // LEAF_BLOCK + 1, hi // LEAF_BLOCK
+        if first > last:
+            return self.tree[:0], self.values[lo:hi], self.alive[lo:hi]
+
+        nodes = []
+        left, right = first + self.size, last + self.size
+        while left < right:
+            if left & 1:
+                nodes.append(left)
+                left += 1
+            if right & 1:
+                right -= 1
+                nodes.append(right)
+            left //= 2
+            right //= 2
+
+        leaves = np.r_[lo:first * LEAF_BLOCK, last * LEAF_BLOCK:hi]
+        return self.tree[nodes], self.values[leaves], self.alive[leaves]
@@ -0,0 +1,226 @@
+import re
+import sys
+from collections import deque
+from functools import lru_cache
+
+from etl.config import CATEGORY_RULES, DEFAULT_CATEGORY, TEMPLATE_CACHE_SIZE
+
+DIGITS_TO_HASH = bytes.maketrans(b'0123456789', b'##########')
+
+
+def _template_key(body):
+    # bytes.translate runs in C: an order of magnitude cheaper than re.sub
+    return body.encode('utf-8').translate(DIGITS_TO_HASH)
+
+
+def message_template(body):
+    """
+  The body with every digit replaced by '#': the part of a MoMo message
+  that stays the same from one transaction to the next
+  """
+    return _template_key(body).decode('utf-8')
+
+
+class KeywordAutomaton:
+    """
+  Aho-Corasick automaton finding every occurrence of a set of keywords in
+  one left-to-right pass over the text, however many keywords there are.
+
+  The failure links are folded into a full transition table when the
+  automaton is built, so scanning costs one dict lookup per character.
+  """
+
+    def __init__(self, keywords):
+        goto = [{}]
+        outputs = [set()]
+
+        for index, keyword in enumerate(keywords):
+            state = 0
+            for char in keyword:
+                if char not in goto[state]:
+                    goto.append({})
+                    outputs.append(set())
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            outputs[state].add(index)
+
+        # Breadth first, so the states a failure link points to are complete
+        fail = [0] * len(goto)
+        delta = [dict(goto[0])] + [None] * (len(goto) - 1)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            outputs[state] |= outputs[fail[state]]
+            delta[state] = dict(delta[fail[state]])
+            for char, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(char, 0) if state else 0
+                delta[state][char] = child
+                queue.append(child)
+
+        self._delta = delta
+        self._outputs = [frozenset(found) if found else None for found in outputs]
+
+    def find(self, text):
+        """
+    The indexes of the keywords that occur in `text`
+    """
+        delta = self._delta
+        outputs = self._outputs
+        found = set()
+        state = 0
+        for char in text:
+            state = delta[state].get(char, 0)
+            if outputs[state] is not None:
+                found |= outputs[state]
+        return found
+
+
+def _collapse_numbers(anchor):
+    return re.sub('#+', '#', anchor)
+
+
+class AnchorTrie:
+    """
+  Trie of the anchors of a rule set, finding every anchor a template
+  starts with in one walk from its first character, however many anchors
+  there are.
+
+  In an anchor '#' stands for a number: a run of '#' in the template is
+  read as one '#', so '*#*S*' matches the templates '*###*S*' and '*#*S*'
+  alike.
+  """
+
+    def __init__(self, anchors):
+        self._children = [{}]
+        self._ends = [None]
+
+        for index, anchor in enumerate(anchors):
+            state = 0
+            for char in _collapse_numbers(anchor):
+                if char not in self._children[state]:
+                    self._children.append({})
+                    self._ends.append(None)
+                    self._children[state][char] = len(self._children) - 1
+                state = self._children[state][char]
+            self._ends[state] = (self._ends[state] or ()) + (index,)
+
+    def find(self, text):
+        """
+    The indexes of the anchors `text` starts with
+    """
+        children = self._children
+        ends = self._ends
+        found = set()
+        state = 0
+        previous = None
+        for char in text:
+            if char == '#' and previous == '#':
+                continue
+            previous = char
+            state = children[state].get(char)
+            if state is None:
+                break
+            if ends[state] is not None:
+                found.update(ends[state])
+        return found
+
+
+class Categorizer:
+    """
+  Assigns every message body one category from a list of rules (see
+  CATEGORY_RULES in etl/config.py); the first rule that matches wins.
+
+  All rule keywords share one KeywordAutomaton and all anchors one
+  AnchorTrie, so a template is scanned once for keywords and walked once
+  from the start for anchors, whatever the number of rules. Every anchor
+  that matches counts: one anchor may be a prefix of another. Only the
+  rules touching a keyword or an anchor that was found are then checked. Results are cached per message template,
+  so this runs once for each distinct template.
+  """
+
+    def __init__(self, rules=CATEGORY_RULES, default=DEFAULT_CATEGORY, cache_size=TEMPLATE_CACHE_SIZE):
+        self.rules = list(rules)
+        self.default = default
+
+        keywords = {}
+        anchors = {}
+        self._requirements = []
+        self._by_keyword = {}
+        self._by_anchor = {}
+
+        for priority, (category, anchor, rule_keywords) in enumerate(self.rules):
+            if anchor is None and not rule_keywords:
+                raise ValueError(f'Rule {priority} ({category}) has neither an anchor nor keywords')
+
+            anchor_id = anchors.setdefault(anchor, len(anchors)) if anchor is not None else None
+            keyword_ids = frozenset(keywords.setdefault(k.lower(), len(keywords)) for k in rule_keywords)
+            self._requirements.append((anchor_id, keyword_ids))
+
+            if anchor_id is not None:
+                self._by_anchor.setdefault(anchor_id, []).append(priority)
+            for keyword_id in keyword_ids:
+                self._by_keyword.setdefault(keyword_id, []).append(priority)
+
+        self._automaton = KeywordAutomaton(keywords)
+        self._anchors = AnchorTrie(anchors)
+        self._cached = lru_cache(maxsize=cache_size)(lambda key: self.categorize_template(key.decode('utf-8')))
+
+    def categorize_template(self, template):
+        """
+    The category of a message template, without the cache
+    """
+        found = self._automaton.find(template.lower())
+        anchored = self._anchors.find(template)
+
+        candidates = set()
+        for anchor_id in anchored:
+            candidates.update(self._by_anchor[anchor_id])
+        for keyword_id in found:
+            candidates.update(self._by_keyword[keyword_id])
+
+        for priority in sorted(candidates):
+            required_anchor, required_keywords = self._requirements[priority]
+            if (required_anchor is None or required_anchor in anchored) and required_keywords <= found:
+                return self.rules[priority][0]
+        return self.default
+
+    def categorize(self, body):
+        """
+    The category of a message body
+    """
+        return self._cached(_template_key(body or ''))
+
+    def cache_info(self):
+        return self._cached.cache_info()
+
+
+_default = None
+
+
+def categorize(body):
+    """
+  The category of a message body under the rules of etl/config.py
+  """
+    global _default
+    if _default is None:
+        _default = Categorizer()
+    return _default.categorize(body)
+
+
+# Example usage
+if __name__ == "__main__":
+    # python -m etl.categorize [backup.xml] -- count the categories in a backup
+    from etl.parse_xml import iter_sms_records, xml_file_path
+
+    source = sys.argv[1] if len(sys.argv) > 1 else xml_file_path
+    counts = {}
+
+    try:
+        for record in iter_sms_records(source):
+            category = categorize(record['body'])
+            counts[category] = counts.get(category, 0) + 1
+    except FileNotFoundError:
+        print(f"Error: File not found at {source}")
+    else:
+        for category, count in sorted(counts.items(), key=lambda item: -item[1]):
+            print(f"{category:<24} {count}")
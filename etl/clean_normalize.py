@@ -0,0 +1,188 @@
+import json
+import sys
+import tracemalloc
+from collections.abc import Mapping
+from operator import attrgetter
+
+from etl.parse_xml import SMS_ATTRIBUTES
+
+# Every key a parsed record can have, in the order the parser emits them
+RECORD_FIELDS = SMS_ATTRIBUTES + (
+    'amount', 'transaction_type', 'balance', 'counterparty', 'transaction_id',
+    'transaction_date', 'category'
+)
+
+# Digit strings held as ints. transaction_id stays a string: the store's id
+# index keys on it, and an int here would only add a second object
+INT_FIELDS = frozenset(('date', 'date_sent', 'amount', 'balance'))
+
+# Strings repeated across many records, shared through sys.intern
+INTERNED_FIELDS = frozenset((
+    'protocol', 'address', 'type', 'subject', 'toa', 'sc_toa', 'service_center',
+    'read', 'status', 'locked', 'sub_id', 'contact_name', 'transaction_type',
+    'counterparty', 'category'
+))
+
+_FIELD_ORDER = {name: i for i, name in enumerate(RECORD_FIELDS)}
+
+# Per-field encodings
+PLAIN, INTEGER, INTERNED = range(3)
+
+
+class RecordShape:
+    """
+  The keys of a group of records, in order, with what it takes to store
+  and read them back. Parsed records come in a few shapes, each shared
+  by every record that has it.
+  """
+    __slots__ = ('keys', 'key_set', 'fields', 'getter', 'int_positions')
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.key_set = frozenset(keys)
+        self.fields = [(getattr(SmsRecord, key).__set__,
+                        INTEGER if key in INT_FIELDS else INTERNED if key in INTERNED_FIELDS else PLAIN)
+                       for key in keys]
+        getter = attrgetter(*keys)
+        self.getter = getter if len(keys) > 1 else lambda record: (getter(record),)
+        self.int_positions = [i for i, key in enumerate(keys) if key in INT_FIELDS]
+
+
+class SmsRecord(Mapping):
+    """
+  A parsed SMS record stored in slots instead of a dict.
+
+  It reads like the record dict it replaces (same keys, same order, same
+  string values), so code that only reads records does not change, while
+  costing less than half the memory: no per-record hash table, repeated
+  strings shared and dates and amounts held as ints. Which keys a record
+  has is kept by its RecordShape; None stays a value of its own.
+  """
+    __slots__ = RECORD_FIELDS + ('_shape',)
+
+    def __getitem__(self, key):
+        if key not in self._shape.key_set:
+            raise KeyError(key)
+        value = getattr(self, key)
+        return str(value) if type(value) is int else value
+
+    def __contains__(self, key):
+        return key in self._shape.key_set
+
+    def __iter__(self):
+        return iter(self._shape.keys)
+
+    def __len__(self):
+        return len(self._shape.keys)
+
+    def __repr__(self):
+        return f'SmsRecord({self.to_dict()!r})'
+
+    def __reduce__(self):
+        return compact_record, (self.to_dict(),)
+
+    def to_dict(self):
+        """
+    The record as the plain dict the parser produces
+    """
+        shape = self._shape
+        values = list(shape.getter(self))
+        for i in shape.int_positions:
+            if type(values[i]) is int:
+                values[i] = str(values[i])
+        return dict(zip(shape.keys, values))
+
+
+# Shapes by key tuple, None for keys that are not the parser's: keys outside
+# RECORD_FIELDS or out of their order. Past MAX_SHAPES, new key tuples are
+# checked without being cached
+MAX_SHAPES = 1024
+_shapes = {}
+
+
+def _record_shape(keys):
+    position = -1
+    for key in keys:
+        index = _FIELD_ORDER.get(key)
+        if index is None or index <= position:
+            return None
+        position = index
+    return RecordShape(keys)
+
+
+def compact_record(record):
+    """
+  An SmsRecord holding the same data as the record dict, or the dict itself
+  when it does not have the parser's shape: keys outside RECORD_FIELDS or
+  out of their order, or values other than strings and None for the
+  numeric fields. Usable as a json.load object_hook.
+  """
+    if type(record) is not dict:
+        return record
+
+    keys = tuple(record)
+    shape = _shapes.get(keys, False)
+    if shape is False:
+        shape = _record_shape(keys)
+        if len(_shapes) < MAX_SHAPES:
+            _shapes[keys] = shape
+    if shape is None:
+        return record
+
+    compact = SmsRecord.__new__(SmsRecord)
+    for (setter, kind), value in zip(shape.fields, record.values()):
+        if type(value) is str:
+            if kind is INTERNED:
+                value = sys.intern(value)
+            # Only canonical digit strings, so str(int(value)) gives them back unchanged
+            elif kind is INTEGER and value.isdigit() and value.isascii() and (value[0] != '0' or value == '0'):
+                value = int(value)
+        elif kind is INTEGER and value is not None:
+            return record
+        setter(compact, value)
+    compact._shape = shape
+    return compact
+
+
+def record_dict(value):
+    """
+  json `default` hook: SmsRecords are written as the dicts they stand for
+  """
+    if type(value) is SmsRecord:
+        return value.to_dict()
+    return dict(value)
+
+
+def memory_per_record(load):
+    """
+  Bytes allocated per record by `load()`, which returns a list of records,
+  as traced by tracemalloc
+  """
+    tracemalloc.start()
+    try:
+        records = load()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return size / max(len(records), 1)
+
+
+# Example usage
+if __name__ == "__main__":
+    # python -m etl.clean_normalize [sms_records.json] -- memory report, bytes per record
+    from etl.pipeline import json_file_path
+
+    source = sys.argv[1] if len(sys.argv) > 1 else json_file_path
+
+    def load(object_hook=None):
+        with open(source, 'r', encoding='utf-8') as f:
+            return json.load(f, object_hook=object_hook)
+
+    try:
+        before = memory_per_record(load)
+        after = memory_per_record(lambda: load(compact_record))
+    except FileNotFoundError:
+        print(f"Error: File not found at {source}")
+    else:
+        print(f"dict records:     {before:8.0f} bytes/record")
+        print(f"SmsRecord:        {after:8.0f} bytes/record ({after / before:.0%})")
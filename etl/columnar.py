@@ -0,0 +1,315 @@
+import json
+import os
+import re
+import shutil
+import sys
+import uuid
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+json_file_path = os.path.join(BASE_DIR, "../data/processed/sms_records.json")
+columns_dir_path = os.path.join(BASE_DIR, "../data/processed/sms_columns")
+
+FORMAT_VERSION = 1
+
+# Fixed-width little-endian int64 columns; missing values are NULL
+INT_COLUMNS = ('date', 'date_sent', 'amount', 'balance', 'fee')
+# int32 codes into a per-column dictionary of values; missing values are -1
+CATEGORY_COLUMNS = ('transaction_type', 'address', 'service_center', 'counterparty')
+# Variable-length UTF-8 text: an int64 offsets file (rows + 1) and a blob file
+BLOB_COLUMNS = ('body',)
+
+NULL = np.iinfo(np.int64).min
+INT_DTYPE = np.dtype('<i8')
+CODE_DTYPE = np.dtype('<i4')
+
+# Records converted per write, bounding the memory a large append needs
+BATCH_SIZE = 65_536
+
+FEE_PATTERN = re.compile(r'fee (?:was|paid):?\s*([\d,]+)', re.IGNORECASE)
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return NULL
+
+
+def record_fee(record):
+    """
+  The fee a message reports ("Fee was: 100 RWF", "Fee paid: 350 RWF"), or None
+  """
+    match = FEE_PATTERN.search(record.get('body') or '')
+    return int(match.group(1).replace(',', '')) if match else None
+
+
+def read_meta(path):
+    try:
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_meta(path, meta):
+    meta_path = os.path.join(path, 'meta.json')
+    with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(meta_path + '.tmp', meta_path)
+
+
+def _committed_sizes(meta):
+    """
+  Byte size of every column file holding exactly the rows of `meta`
+  """
+    rows = meta['rows']
+    sizes = {}
+    for name in INT_COLUMNS:
+        sizes[f'{name}.i8'] = rows * INT_DTYPE.itemsize
+    for name in CATEGORY_COLUMNS:
+        sizes[f'{name}.codes'] = rows * CODE_DTYPE.itemsize
+    for name in BLOB_COLUMNS:
+        sizes[f'{name}.offsets'] = (rows + 1) * INT_DTYPE.itemsize
+        sizes[f'{name}.blob'] = meta['blob_bytes'][name]
+    return sizes
+
+
+class ColumnAppender:
+    """
+  Appends records to a columnar directory, creating it if needed.
+
+  Column files are only ever appended to, and meta.json, which holds the
+  row count and the category dictionaries, is replaced once the data is
+  on disk. Readers never look past the committed row count, and bytes a
+  failed append left beyond it are truncated by the next one.
+  """
+
+    def __init__(self, path=columns_dir_path, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        os.makedirs(path, exist_ok=True)
+
+        self.meta = read_meta(path) or {
+            'format': FORMAT_VERSION, 'id': uuid.uuid4().hex, 'rows': 0,
+            'categories': {name: [] for name in CATEGORY_COLUMNS},
+            'blob_bytes': {name: 0 for name in BLOB_COLUMNS},
+        }
+        if self.meta['format'] != FORMAT_VERSION:
+            raise ValueError(f"{path} has format {self.meta['format']}, expected {FORMAT_VERSION}")
+
+        self._codes = {name: {value: code for code, value in enumerate(values)}
+                       for name, values in self.meta['categories'].items()}
+        self._pending = []
+        self._handles = {}
+
+        for file_name, size in _committed_sizes(self.meta).items():
+            f = open(os.path.join(path, file_name), 'ab')
+            # Also extends a new offsets file to its leading 0
+            f.truncate(size)
+            self._handles[file_name] = f
+
+    def add(self, record):
+        self._pending.append(record)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        for name in INT_COLUMNS:
+            if name == 'fee':
+                values = [NULL if fee is None else fee for fee in map(record_fee, batch)]
+            else:
+                values = [_to_int(record.get(name)) for record in batch]
+            np.array(values, INT_DTYPE).tofile(self._handles[f'{name}.i8'])
+
+        for name in CATEGORY_COLUMNS:
+            lookup = self._codes[name]
+            values = self.meta['categories'][name]
+            codes = []
+            for record in batch:
+                value = record.get(name)
+                if value is None:
+                    codes.append(-1)
+                    continue
+                code = lookup.get(value)
+                if code is None:
+                    code = lookup[value] = len(values)
+                    values.append(value)
+                codes.append(code)
+            np.array(codes, CODE_DTYPE).tofile(self._handles[f'{name}.codes'])
+
+        for name in BLOB_COLUMNS:
+            encoded = [(record.get(name) or '').encode('utf-8') for record in batch]
+            lengths = np.fromiter(map(len, encoded), INT_DTYPE, len(encoded))
+            offsets = np.cumsum(lengths) + self.meta['blob_bytes'][name]
+            offsets.astype(INT_DTYPE).tofile(self._handles[f'{name}.offsets'])
+            self._handles[f'{name}.blob'].write(b''.join(encoded))
+            self.meta['blob_bytes'][name] = int(offsets[-1])
+
+        self.meta['rows'] += len(batch)
+
+    def commit(self):
+        """
+      Make the appended rows visible: flush, fsync the column files, then
+      replace meta.json. Returns the committed row count.
+      """
+        self.flush()
+        for f in self._handles.values():
+            f.flush()
+            os.fsync(f.fileno())
+
+        write_meta(self.path, self.meta)
+        return self.meta['rows']
+
+    def close(self):
+        for f in self._handles.values():
+            f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                self.commit()
+        finally:
+            self.close()
+
+
+def append_columns(records, path=columns_dir_path):
+    """
+  Append SMS records (any iterable) to a columnar directory. Returns the
+  number of records appended.
+  """
+    count = 0
+    with ColumnAppender(path) as appender:
+        for record in records:
+            appender.add(record)
+            count += 1
+    return count
+
+
+def truncate_columns(path, rows):
+    """
+  Roll a columnar directory back to its first `rows` rows, as when a run
+  resumes from a checkpoint. Only meta.json is rewritten: the next
+  ColumnAppender truncates the column files, and category values that
+  only later rows used stay in the dictionaries unused. Directories with
+  `rows` rows or fewer are left alone.
+  """
+    meta = read_meta(path)
+    if meta is None or meta['rows'] <= rows:
+        return
+
+    for name in BLOB_COLUMNS:
+        with open(os.path.join(path, f'{name}.offsets'), 'rb') as f:
+            f.seek(rows * INT_DTYPE.itemsize)
+            meta['blob_bytes'][name] = int(np.frombuffer(f.read(INT_DTYPE.itemsize), INT_DTYPE)[0])
+    meta['rows'] = rows
+    write_meta(path, meta)
+
+
+def write_columns(records, path=columns_dir_path):
+    """
+  Write SMS records to a new columnar directory, replacing any existing
+  one only once the new one is complete. Returns the number of records.
+  """
+    tmp_path = path + '.tmp'
+    old_path = path + '.old'
+    for leftover in (tmp_path, old_path):
+        shutil.rmtree(leftover, ignore_errors=True)
+
+    count = append_columns(records, tmp_path)
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return count
+
+
+class ColumnarTable:
+    """
+  Read-only view of a columnar directory written by ColumnAppender.
+
+  Only meta.json is read on open. Each column file is memory mapped the
+  first time it is asked for and handed out as a read-only NumPy array
+  over the mapping, without copying, so a query pays only for the
+  columns it touches. The table holds the rows committed when it was
+  opened; appends made later need a new ColumnarTable. `id` changes
+  whenever write_columns() rebuilds the directory.
+  """
+
+    def __init__(self, path=columns_dir_path):
+        self.path = path
+        self.meta = read_meta(path)
+        if self.meta is None:
+            raise FileNotFoundError(os.path.join(path, 'meta.json'))
+        if self.meta['format'] != FORMAT_VERSION:
+            raise ValueError(f"{path} has format {self.meta['format']}, expected {FORMAT_VERSION}")
+        self.id = self.meta.get('id')
+        self.rows = self.meta['rows']
+        self._arrays = {}
+
+    def __len__(self):
+        return self.rows
+
+    def _map(self, file_name, dtype, count):
+        if file_name not in self._arrays:
+            if count == 0:
+                self._arrays[file_name] = np.empty(0, dtype)
+            else:
+                self._arrays[file_name] = np.memmap(os.path.join(self.path, file_name),
+                                                    dtype=dtype, mode='r', shape=(count,))
+        return self._arrays[file_name]
+
+    def column(self, name):
+        """
+      An int64 column, or the int32 codes of a categorical column
+      """
+        if name in INT_COLUMNS:
+            return self._map(f'{name}.i8', INT_DTYPE, self.rows)
+        if name in CATEGORY_COLUMNS:
+            return self._map(f'{name}.codes', CODE_DTYPE, self.rows)
+        raise KeyError(name)
+
+    def categories(self, name):
+        """
+      The dictionary of a categorical column: code -> value
+      """
+        return self.meta['categories'][name]
+
+    def code(self, name, value):
+        """
+      The code of `value` in a categorical column, or None if it never occurs
+      """
+        try:
+            return self.meta['categories'][name].index(value)
+        except ValueError:
+            return None
+
+    def text(self, name, row):
+        """
+      The text of a blob column at one row
+      """
+        offsets = self._map(f'{name}.offsets', INT_DTYPE, self.rows + 1)
+        blob = self._map(f'{name}.blob', np.uint8, self.meta['blob_bytes'][name])
+        return bytes(blob[offsets[row]:offsets[row + 1]]).decode('utf-8')
+
+
+# Example usage
+if __name__ == "__main__":
+    # python -m etl.columnar [sms_records.json] [sms_columns/]
+    source = sys.argv[1] if len(sys.argv) > 1 else json_file_path
+    target = sys.argv[2] if len(sys.argv) > 2 else columns_dir_path
+
+    try:
+        with open(source, 'r', encoding='utf-8') as f:
+            count = write_columns(json.load(f), target)
+        print(f"Wrote {count} records from {source} as columns in {target}")
+    except FileNotFoundError:
+        print(f"Error: File not found at {source}")
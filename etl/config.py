@@ -0,0 +1,44 @@
+# Settings shared by the ETL stages
+
+# MoMo messages are stamped in Kigali time (CAT, UTC+2, no daylight saving);
+# dashboard periods start at local midnight
+TIMEZONE_OFFSET_HOURS = 2
+
+# Entries listed under "top counterparties" in dashboard.json
+TOP_COUNTERPARTIES = 10
+
+# Message categories, first matching rule wins. Rules are matched against
+# the message template: the body with every digit replaced by '#' (so
+# "*165*S*2500 RWF" reads "*###*S*#### RWF"), which is also what the
+# categorizer caches results on. A rule is
+#   (category, anchor or None, keywords)
+# The anchor is a literal the template must start with, in which '#'
+# stands for a whole number whatever its length; the keywords are
+# lower-case literals that must all occur somewhere in the template.
+# Every rule needs at least one of the two.
+CATEGORY_RULES = [
+    ('incoming_money', 'You have received ', ()),
+    ('payment_to_code_holder', 'TxId: #. Your payment of ', ()),
+    ('transfer_to_mobile', '*#*S*# RWF transferred to ', ()),
+    ('bank_deposit', None, ('bank deposit of', 'has been added to your mobile money account')),
+    ('bank_deposit', None, ('deposit rwf', 'receiver:')),
+    ('airtime', None, ('your payment of', 'to airtime')),
+    ('cash_power', None, ('your payment of', 'cash power')),
+    ('internet_bundle', None, ('your payment of', 'bundles and packs')),
+    ('internet_bundle', 'Yello!Umaze kugura ', ()),
+    ('bill_payment', '*#*TxId:#*S*Your payment of ', ()),
+    ('merchant_payment', None, ('a transaction of', 'on your momo account was successfully completed')),
+    ('agent_withdrawal', None, ('via agent', 'withdrawn')),
+    ('bank_transfer', 'You have transferred ', ('.bank',)),
+    ('transfer_to_mobile', 'You have transferred ', ()),
+    ('payment', 'Your payment of ', ('has been completed',)),
+    ('reversal', None, ('has been reversed',)),
+    ('reversal', None, ('a reversal has been initiated',)),
+    ('failed_transaction', None, ('failed at',)),
+    ('one_time_password', None, ('one-time password',)),
+]
+
+DEFAULT_CATEGORY = 'other'
+
+# Distinct message templates whose category the categorizer remembers
+TEMPLATE_CACHE_SIZE = 65_536
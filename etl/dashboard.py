@@ -0,0 +1,227 @@
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+import numpy as np
+
+from etl.columnar import NULL, ColumnarTable, columns_dir_path
+from etl.config import TIMEZONE_OFFSET_HOURS, TOP_COUNTERPARTIES
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+dashboard_file_path = os.path.join(BASE_DIR, "../data/processed/dashboard.json")
+
+# Rows aggregated per step; bounds the temporary arrays of a full rebuild
+CHUNK_ROWS = 1 << 22
+
+DAY_MS = 86_400_000
+OFFSET_MS = TIMEZONE_OFFSET_HOURS * 3_600_000
+# (day, type code) pairs are packed into one int64 key as day * CODE_SPAN + code
+CODE_SPAN = 1 << 16
+
+STATE_ARRAYS = ('day_keys', 'day_counts', 'day_amounts', 'day_fees',
+                'party_counts', 'party_amounts', 'balance_days', 'balance_dates', 'balances')
+
+
+def _state_path(dashboard_path):
+    return os.path.splitext(dashboard_path)[0] + '_state.npz'
+
+
+def _empty_state(table_id):
+    state = {name: np.zeros(0, np.int64) for name in STATE_ARRAYS}
+    state.update(table_id=table_id or '', rows=0)
+    return state
+
+
+def _load_state(path):
+    try:
+        with np.load(path) as saved:
+            state = {name: saved[name] for name in STATE_ARRAYS}
+            state.update(table_id=str(saved['table_id']), rows=int(saved['rows']))
+            return state
+    except FileNotFoundError:
+        return None
+
+
+def _save_state(state, path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, table_id=np.array(state['table_id']), rows=np.array(state['rows']),
+                 **{name: state[name] for name in STATE_ARRAYS})
+    os.replace(tmp_path, path)
+
+
+def _sum_by(keys, *values):
+    """
+  The unique keys and the sum of each of `values` per key. The sums go
+  through float64 bincount weights, exact below 2**53 per bucket.
+  """
+    unique, inverse = np.unique(keys, return_inverse=True)
+    sums = [np.rint(np.bincount(inverse, weights=v, minlength=len(unique))).astype(np.int64) for v in values]
+    return (unique, *sums)
+
+
+def _padded(counts, size):
+    return np.pad(counts, (0, size - len(counts)))
+
+
+def _merge_chunk(state, table, lo, hi):
+    """
+  Fold rows [lo, hi) of the table into the running totals
+  """
+    date = table.column('date')[lo:hi]
+    code = table.column('transaction_type')[lo:hi].astype(np.int64)
+    amount = table.column('amount')[lo:hi]
+    amount = np.where(amount == NULL, 0, amount)
+    fee = table.column('fee')[lo:hi]
+    fee = np.where(fee == NULL, 0, fee)
+
+    dated = (date != NULL) & (code >= 0)
+    day = (date + OFFSET_MS) // DAY_MS
+
+    # Per day and type: message count, amount and fees, merged with the totals so far
+    keys, counts, amounts, fees = _sum_by(day[dated] * CODE_SPAN + code[dated], np.ones(dated.sum()),
+                                          amount[dated], fee[dated])
+    keys, counts, amounts, fees = _sum_by(
+        np.concatenate((state['day_keys'], keys)),
+        np.concatenate((state['day_counts'], counts)),
+        np.concatenate((state['day_amounts'], amounts)),
+        np.concatenate((state['day_fees'], fees)))
+    state.update(day_keys=keys, day_counts=counts, day_amounts=amounts, day_fees=fees)
+
+    # Per counterparty, indexed by dictionary code
+    party = table.column('counterparty')[lo:hi]
+    named = party >= 0
+    size = len(table.categories('counterparty'))
+    state['party_counts'] = _padded(state['party_counts'], size) + np.bincount(party[named], minlength=size)
+    state['party_amounts'] = _padded(state['party_amounts'], size) + np.rint(
+        np.bincount(party[named], weights=amount[named], minlength=size)).astype(np.int64)
+
+    # Closing balance per day: the balance reported by the day's latest message
+    balance = table.column('balance')[lo:hi]
+    reported = (date != NULL) & (balance != NULL)
+    days = np.concatenate((state['balance_days'], day[reported]))
+    dates = np.concatenate((state['balance_dates'], date[reported]))
+    balances = np.concatenate((state['balances'], balance[reported]))
+    order = np.lexsort((dates, days))
+    days, dates, balances = days[order], dates[order], balances[order]
+    last = np.append(days[1:] != days[:-1], True) if len(days) else np.zeros(0, bool)
+    state.update(balance_days=days[last], balance_dates=dates[last], balances=balances[last])
+
+
+def _labels(periods, unit):
+    return np.datetime_as_string(periods.astype(f'datetime64[{unit}]'), unit=unit).tolist()
+
+
+def _series(periods, codes, counts, amounts, fees, labels, types):
+    """
+  One entry per period, with totals and a breakdown by transaction type
+  """
+    keys, counts, amounts, fees = _sum_by(periods * CODE_SPAN + codes, counts, amounts, fees)
+    series = []
+    current = None
+    for key, count, amount, fee in zip(keys.tolist(), counts.tolist(), amounts.tolist(), fees.tolist()):
+        period, code = divmod(key, CODE_SPAN)
+        if current is None or current['period'] != labels[period]:
+            current = {'period': labels[period], 'count': 0, 'amount': 0, 'fees': 0, 'by_type': {}}
+            series.append(current)
+        current['count'] += count
+        current['amount'] += amount
+        current['fees'] += fee
+        current['by_type'][types[code]] = {'count': count, 'amount': amount, 'fees': fee}
+    return series
+
+
+def render_dashboard(state, table):
+    """
+  The dashboard.json document for the running totals of `table`
+  """
+    types = table.categories('transaction_type')
+    days, codes = np.divmod(state['day_keys'], CODE_SPAN)
+    columns = (state['day_counts'], state['day_amounts'], state['day_fees'])
+
+    def rollup(periods, unit):
+        unique, index = np.unique(periods, return_inverse=True)
+        return _series(index, codes, *columns, _labels(unique, unit), types)
+
+    by_type = {}
+    for code, count, amount, fee in zip(codes.tolist(), *(c.tolist() for c in columns)):
+        totals = by_type.setdefault(types[code], {'count': 0, 'amount': 0, 'fees': 0})
+        totals['count'] += count
+        totals['amount'] += amount
+        totals['fees'] += fee
+
+    parties = table.categories('counterparty')
+    top = np.argsort(-state['party_amounts'], kind='stable')[:TOP_COUNTERPARTIES]
+
+    return {
+        'generated_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'records': int(state['rows']),
+        'timezone_offset_hours': TIMEZONE_OFFSET_HOURS,
+        'totals': {
+            'count': int(state['day_counts'].sum()),
+            'amount': int(state['day_amounts'].sum()),
+            'fees': int(state['day_fees'].sum()),
+            'by_type': by_type,
+        },
+        'daily': rollup(days, 'D'),
+        # Weeks start on Monday; day 0 (1970-01-01) was a Thursday
+        'weekly': rollup(days - (days + 3) % 7, 'D'),
+        'monthly': rollup(days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64), 'M'),
+        'top_counterparties': [
+            {'name': parties[i], 'count': int(state['party_counts'][i]), 'amount': int(state['party_amounts'][i])}
+            for i in top.tolist() if state['party_counts'][i]
+        ],
+        'balance': [
+            {'date': label, 'balance': balance}
+            for label, balance in zip(_labels(state['balance_days'], 'D'), state['balances'].tolist())
+        ],
+    }
+
+
+def update_dashboard(columns_path=columns_dir_path, dashboard_path=dashboard_file_path,
+                     state_path=None, chunk_rows=CHUNK_ROWS):
+    """
+  Bring dashboard.json up to date with the columnar records.
+
+  The running totals behind the dashboard are kept in a state file next
+  to it, with the number of rows they cover. Only rows appended since are
+  read, in chunks of `chunk_rows`, and folded in with NumPy; a rebuilt
+  columnar directory starts the totals over. Returns the number of rows
+  aggregated.
+  """
+    state_path = state_path or _state_path(dashboard_path)
+    table = ColumnarTable(columns_path)
+    state = _load_state(state_path)
+
+    if state is None or state['table_id'] != (table.id or '') or state['rows'] > len(table):
+        state = _empty_state(table.id)
+    elif state['rows'] == len(table) and os.path.exists(dashboard_path):
+        return 0
+
+    start = state['rows']
+    for lo in range(start, len(table), chunk_rows):
+        _merge_chunk(state, table, lo, min(lo + chunk_rows, len(table)))
+    state['rows'] = len(table)
+    _save_state(state, state_path)
+
+    tmp_path = dashboard_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        # Compact, so the C encoder does the work: a long history has many periods
+        f.write(json.dumps(render_dashboard(state, table), ensure_ascii=False, separators=(',', ':')))
+    os.replace(tmp_path, dashboard_path)
+
+    return len(table) - start
+
+
+# Example usage
+if __name__ == "__main__":
+    # python -m etl.dashboard [sms_columns/] [dashboard.json]
+    source = sys.argv[1] if len(sys.argv) > 1 else columns_dir_path
+    target = sys.argv[2] if len(sys.argv) > 2 else dashboard_file_path
+
+    try:
+        count = update_dashboard(source, target)
+        print(f"Aggregated {count} new records from {source} into {target}")
+    except FileNotFoundError:
+        print(f"Error: No columnar records at {source} (python -m etl.columnar builds them)")
@@ -0,0 +1,183 @@
+import json
+import os
+import sqlite3
+
+from etl.clean_normalize import record_dict
+from etl.record_keys import record_amount, record_date
+
+# data/momo_system.sql translated to SQLite, plus the sms_records table the
+# API serves. SMS messages carry no wallet ids, so they are not forced into
+# `transactions`; sms_records keeps each record as its JSON text next to the
+# columns the API filters on, indexed the way `transactions` is indexed on
+# status and created_at.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS banks (
+    bank_id TEXT PRIMARY KEY,
+    bank_name TEXT NOT NULL,
+    bank_code TEXT NOT NULL,
+    swift_code TEXT,
+    country TEXT NOT NULL,
+    is_active INTEGER DEFAULT 1,
+    integration_type TEXT,
+    api_endpoint TEXT,
+    settlement_account TEXT
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    phone_number TEXT NOT NULL UNIQUE,
+    status TEXT DEFAULT 'ACTIVE',
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_users_phone_number ON users (phone_number);
+CREATE INDEX IF NOT EXISTS idx_users_status ON users (status);
+
+CREATE TABLE IF NOT EXISTS wallets (
+    wallet_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+    bank_id TEXT REFERENCES banks (bank_id) ON DELETE SET NULL,
+    balance NUMERIC DEFAULT 0.00,
+    currency TEXT NOT NULL,
+    pin_hash TEXT NOT NULL,
+    status TEXT DEFAULT 'ACTIVE'
+);
+CREATE INDEX IF NOT EXISTS idx_wallets_user_id ON wallets (user_id);
+CREATE INDEX IF NOT EXISTS idx_wallets_bank_id ON wallets (bank_id);
+
+CREATE TABLE IF NOT EXISTS transaction_categories (
+    category_id TEXT PRIMARY KEY,
+    type TEXT NOT NULL UNIQUE,
+    description TEXT
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    transaction_id TEXT PRIMARY KEY,
+    sender_wallet_id TEXT NOT NULL REFERENCES wallets (wallet_id),
+    receiver_wallet_id TEXT NOT NULL REFERENCES wallets (wallet_id),
+    amount NUMERIC NOT NULL,
+    currency TEXT NOT NULL,
+    category_id TEXT NOT NULL REFERENCES transaction_categories (category_id),
+    status TEXT NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    notes TEXT
+);
+CREATE INDEX IF NOT EXISTS fk_transactions_category ON transactions (category_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_sender_wallet ON transactions (sender_wallet_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_receiver_wallet ON transactions (receiver_wallet_id);
+CREATE INDEX IF NOT EXISTS idx_transactions_created_at ON transactions (created_at);
+CREATE INDEX IF NOT EXISTS idx_transactions_status ON transactions (status);
+
+CREATE TABLE IF NOT EXISTS transaction_fees (
+    fee_id TEXT PRIMARY KEY,
+    transaction_id TEXT NOT NULL UNIQUE REFERENCES transactions (transaction_id) ON DELETE CASCADE,
+    amount NUMERIC NOT NULL CHECK (amount >= 0),
+    currency TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS system_logs (
+    log_id TEXT PRIMARY KEY,
+    transaction_id TEXT REFERENCES transactions (transaction_id) ON DELETE SET NULL,
+    status TEXT NOT NULL,
+    log_message TEXT NOT NULL,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_system_logs_transaction_id ON system_logs (transaction_id);
+CREATE INDEX IF NOT EXISTS idx_system_logs_created_at ON system_logs (created_at);
+
+CREATE TABLE IF NOT EXISTS promotions (
+    promotion_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    description TEXT,
+    discount_type TEXT NOT NULL,
+    discount_value NUMERIC NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    is_active INTEGER DEFAULT 1,
+    max_usage_per_user INTEGER DEFAULT 1,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS user_promotions (
+    user_promotion_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+    promotion_id TEXT NOT NULL REFERENCES promotions (promotion_id) ON DELETE CASCADE,
+    usage_count INTEGER DEFAULT 0,
+    total_discount_earned NUMERIC DEFAULT 0.00,
+    first_used_at TEXT,
+    last_used_at TEXT,
+    status TEXT DEFAULT 'ELIGIBLE'
+);
+CREATE INDEX IF NOT EXISTS idx_user_promotions_user_id ON user_promotions (user_id);
+CREATE INDEX IF NOT EXISTS idx_user_promotions_promotion_id ON user_promotions (promotion_id);
+
+CREATE TABLE IF NOT EXISTS sms_records (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    transaction_id TEXT,
+    transaction_type TEXT,
+    counterparty TEXT,
+    amount REAL,
+    transaction_date TEXT,
+    record TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS sms_meta (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO sms_meta (id, version) VALUES (1, 0);
+"""
+
+# Kept apart so a bulk load can drop them and build them once at the end
+SMS_INDEXES = {
+    'idx_sms_records_transaction_id': 'sms_records (transaction_id)',
+    'idx_sms_records_type': 'sms_records (transaction_type)',
+    'idx_sms_records_type_date': 'sms_records (transaction_type, transaction_date)',
+    'idx_sms_records_counterparty': 'sms_records (counterparty)',
+    'idx_sms_records_date': 'sms_records (transaction_date)',
+}
+
+INSERT_RECORD = ('INSERT INTO sms_records (transaction_id, transaction_type, counterparty, amount, '
+                 'transaction_date, record) VALUES (?, ?, ?, ?, ?, ?)')
+BUMP_VERSION = 'UPDATE sms_meta SET version = version + 1 WHERE id = 1'
+
+_encode_compact = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, default=record_dict).encode
+
+
+def _text(value):
+    return value if isinstance(value, str) else None
+
+
+def record_row(record):
+    """
+  The sms_records column values for a record, ending with its JSON text
+  """
+    return (_text(record.get('transaction_id')), _text(record.get('transaction_type')),
+            _text(record.get('counterparty')), record_amount(record), record_date(record),
+            _encode_compact(record))
+
+
+def connect(path):
+    """
+  A connection to the database at `path`, created with the schema if missing
+  """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # isolation_level=None: transactions are opened explicitly with BEGIN
+    conn = sqlite3.connect(path, isolation_level=None, cached_statements=256)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    conn.execute('PRAGMA foreign_keys = ON')
+    conn.execute('PRAGMA busy_timeout = 5000')
+    conn.executescript(SCHEMA)
+    create_sms_indexes(conn)
+    return conn
+
+
+def create_sms_indexes(conn):
+    for name, columns in SMS_INDEXES.items():
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {columns}')
+
+
+def drop_sms_indexes(conn):
+    for name in SMS_INDEXES:
+        conn.execute(f'DROP INDEX IF EXISTS {name}')
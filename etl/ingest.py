@@ -0,0 +1,451 @@
+import glob
+import hashlib
+import json
+import math
+import os
+import shutil
+import sys
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+from etl import metrics
+from etl.clean_normalize import compact_record
+from etl.columnar import ColumnAppender, columns_dir_path, read_meta, write_meta
+from etl.dashboard import dashboard_file_path, update_dashboard
+from etl.parse_xml import (PARALLEL_CHUNK_BYTES, is_utf8_backup, iter_sms_records, parse_byte_range_isolated,
+                           split_sms_byte_ranges)
+from etl.pipeline import (CHECKPOINT_RECORDS, backup_signature, content_hash, dead_letter_file_path,
+                          finish_snapshot, hash_file_path, json_file_path, load_state, prepare_output, rollback,
+                          save_checkpoint, save_state, seed_snapshot, state_file_path, store_batch,
+                          write_dead_letters)
+from etl.search_index import SearchIndexAppender, search_dir_path, source_signature
+from etl.snapshot import snapshot_file_path
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+raw_dir_path = os.path.join(BASE_DIR, "../data/raw")
+ingest_dir_path = os.path.join(BASE_DIR, "../data/processed/etl_ingest")
+
+# False positive rate the Bloom filter is sized for; it is sized for at
+# least BLOOM_MIN_CAPACITY keys, and twice the keys known at the start
+BLOOM_ERROR_RATE = 0.01
+BLOOM_MIN_CAPACITY = 1 << 20
+
+# Keys hashed into the filter at once when it is built
+BLOOM_CHUNK = 1 << 20
+
+IngestResult = namedtuple('IngestResult', 'backups skipped parsed new duplicates rejected seconds')
+
+
+def record_key(record):
+    """
+  64-bit key a message is deduplicated on across backups: a hash of its
+  transaction_id, or, for a message without one, its content_hash
+  """
+    tx_id = record.get('transaction_id')
+    if tx_id is None:
+        return content_hash(record)
+    digest = hashlib.blake2b(f'id\x1f{tx_id}'.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def backup_paths(pattern):
+    """
+  The backups a directory (every .xml file in it), a glob or a single
+  file names, sorted by path
+  """
+    if os.path.isdir(pattern):
+        return sorted(glob.glob(os.path.join(glob.escape(pattern), '*.xml')))
+    return sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+
+
+class BloomFilter:
+    """
+  Approximate set of 64-bit keys: never misses a key that was added, and
+  wrongly reports one that was not with probability `error_rate` while
+  it holds at most `capacity` keys. Takes about 1.2 bytes a key at 1%.
+  Keys are added and looked up as numpy arrays.
+  """
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.size = max(64, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.probes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = np.zeros(-(-self.size // 8), np.uint8)
+
+    def _positions(self, keys):
+        # Double hashing on the two halves of the key, which is already a hash
+        keys = np.asarray(keys, np.uint64)
+        low = keys & np.uint64(0xFFFFFFFF)
+        high = (keys >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.probes, dtype=np.uint64)
+        return (low[:, None] + steps * high[:, None]) % np.uint64(self.size)
+
+    def add(self, keys):
+        positions = self._positions(keys).ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3),
+                         (np.uint64(1) << (positions & np.uint64(7))).astype(np.uint8))
+
+    def might_contain(self, keys):
+        positions = self._positions(keys)
+        found = self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)
+        return (found & 1).all(axis=1)
+
+
+class KeySet:
+    """
+  Exact set of 64-bit keys: the sorted array of those already stored,
+  memory-mapped from disk, and sorted runs of those added since, merged
+  as they pile up so that there are O(log n) of them
+  """
+
+    def __init__(self, base=None):
+        self.runs = [base] if base is not None and len(base) else []
+        self._mapped = len(self.runs)
+
+    def __len__(self):
+        return sum(len(run) for run in self.runs)
+
+    def contains(self, keys):
+        found = np.zeros(len(keys), bool)
+        for run in self.runs:
+            positions = np.searchsorted(run, keys)
+            inside = positions < len(run)
+            found[inside] |= run[positions[inside]] == keys[inside]
+        return found
+
+    def add(self, keys):
+        """
+      Add keys that are distinct and not in the set yet
+      """
+        if not len(keys):
+            return
+        runs = self.runs
+        runs.append(np.sort(keys))
+        while len(runs) > self._mapped + 1 and len(runs[-2]) <= 2 * len(runs[-1]):
+            newer = runs.pop()
+            runs[-1] = np.sort(np.concatenate([runs[-1], newer]))
+
+    def array(self):
+        return np.sort(np.concatenate(self.runs)) if self.runs else np.empty(0, np.uint64)
+
+
+def _bloom_for(keys, error_rate):
+    bloom = BloomFilter(max(BLOOM_MIN_CAPACITY, 2 * len(keys)), error_rate)
+    for run in keys.runs:
+        for start in range(0, len(run), BLOOM_CHUNK):
+            bloom.add(run[start:start + BLOOM_CHUNK])
+    return bloom
+
+
+def _open_keys(ingest_path, meta, output):
+    """
+  The KeySet of every message in the processed file, read from disk if it
+  was saved for this version of the file, else computed from the file
+  """
+    keys_path = os.path.join(ingest_path, 'keys.npy')
+    if meta['source'] is not None and meta['source'] == source_signature(output) and os.path.exists(keys_path):
+        return KeySet(np.load(keys_path, mmap_mode='r'))
+
+    with open(output, 'r', encoding='utf-8') as f:
+        records = json.load(f, object_hook=compact_record)
+    return KeySet(np.unique(np.fromiter(map(record_key, records), np.uint64, len(records))))
+
+
+def _parse_task(path, start, end):
+    """
+  Worker: parse one byte range of a backup, or the whole of one that is
+  not UTF-8 (`start` None), and hash its messages where they are parsed.
+  Returns (rows, rejects, timings, keys, content hashes, newest date);
+  rows, rejects and timings are as for parse_byte_range_isolated.
+  """
+    if start is None:
+        layouts, rows = {}, []
+        for record in iter_sms_records(path):
+            layout = tuple(record)
+            rows.append((layouts.setdefault(layout, layout), tuple(record.values())))
+        rejects, timings = [], None
+    else:
+        rows, rejects, timings = parse_byte_range_isolated(path, start, end)
+
+    records = [dict(zip(layout, values)) for layout, values in rows]
+    hashes = np.fromiter(map(content_hash, records), np.uint64, len(records))
+    keys = np.array([record_key(record) if record.get('transaction_id') is not None else digest
+                     for record, digest in zip(records, hashes.tolist())], np.uint64)
+    newest = max((int(record.get('date') or 0) for record in records), default=0)
+    return rows, rejects, timings, keys, hashes, newest
+
+
+def _map_tasks(tasks, workers):
+    """
+  Yield (task, _parse_task result) for every (backup, path, start, end)
+  task, in order, parsed in a process pool; at most two tasks per worker
+  are in flight at once, so memory does not grow with the backups
+  """
+    if workers <= 1:
+        for task in tasks:
+            yield task, _parse_task(*task[1:])
+        return
+
+    tasks = iter(tasks)
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for task in islice(tasks, workers * 2):
+            pending.append((task, pool.submit(_parse_task, *task[1:])))
+
+        while pending:
+            task, future = pending.popleft()
+            result = future.result()
+            for following in islice(tasks, 1):
+                pending.append((following, pool.submit(_parse_task, *following[1:])))
+            yield task, result
+
+
+def _tasks(backups, chunk_size):
+    for number, path in enumerate(backups):
+        if not is_utf8_backup(path):
+            yield number, path, None, None
+            continue
+        for start, end in split_sms_byte_ranges(path, chunk_size):
+            yield number, path, start, end
+
+
+def ingest(pattern, output=json_file_path, state_path=state_file_path, hashes_path=hash_file_path,
+           columns_path=columns_dir_path, search_path=search_dir_path, dashboard_path=dashboard_file_path,
+           dead_letter_path=dead_letter_file_path, snapshot_path=snapshot_file_path, ingest_path=ingest_dir_path,
+           workers=None, full=False, batch_records=CHECKPOINT_RECORDS, error_rate=BLOOM_ERROR_RATE,
+           chunk_size=PARALLEL_CHUNK_BYTES):
+    """
+  Merge many backups, from different phones or reinstalls and overlapping
+  heavily, into the processed store in one go. `pattern` is a directory
+  (its .xml files), a glob or a file.
+
+  Every backup is parsed in full, all of them at once: they are split
+  into byte ranges that are parsed on `workers` cores. A message is the
+  same as another if it has the same transaction_id or, without one, the
+  same content_hash (see record_key). Its key is first checked against a
+  Bloom filter, of about 1.2 bytes a key, and only the keys the filter may
+  have seen are confirmed against the exact set of stored keys, a sorted
+  array on disk plus the runs added since. Only the first copy of each
+  message is stored, through the same steps, checkpoints and rollback as
+  etl.run.run, and then with the search index, snapshot and dashboard.
+  In memory there are only the filter, the new keys and a few ranges.
+
+  Which backups held each message is kept in `ingest_path`: the sorted
+  keys of every backup (see Provenance). Backups unchanged since they
+  were last merged, by this or by etl.run.run, are skipped unless
+  `full`. Returns an IngestResult.
+  """
+    started = time.perf_counter()
+    backups = backup_paths(pattern)
+    if not backups:
+        raise FileNotFoundError(pattern)
+    workers = workers or os.cpu_count() or 1
+
+    state = load_state(state_path)
+    checkpoint = state.pop('checkpoint', None)
+    rolled_back = bool(checkpoint) and os.path.exists(output) and \
+        rollback(checkpoint, output, hashes_path, columns_path, search_path, dead_letter_path)
+    if prepare_output(state, output, hashes_path, columns_path, search_path, snapshot_path, rolled_back):
+        shutil.rmtree(ingest_path, ignore_errors=True)
+    os.makedirs(ingest_path, exist_ok=True)
+
+    signatures = {path: backup_signature(path) for path in backups}
+    todo = []
+    for path in backups:
+        previous = state['sources'].get(os.path.abspath(path))
+        if full or not previous or any(previous.get(name) != value for name, value in signatures[path].items()):
+            todo.append(path)
+    if not todo:
+        return IngestResult(len(backups), len(backups), 0, 0, 0, 0, time.perf_counter() - started)
+
+    meta = read_meta(ingest_path) or {'source': None, 'keys': 0, 'backups': {}}
+    with metrics.stage('dedupe'):
+        keys = _open_keys(ingest_path, meta, output)
+        bloom = _bloom_for(keys, error_rate)
+
+    # Keys of the messages of each backup, spooled until they are sorted
+    spools = [open(os.path.join(ingest_path, f'{number}.keys.tmp'), 'wb') for number in range(len(todo))]
+    counts = [{'messages': 0, 'new': 0, 'newest': 0} for _ in todo]
+    totals = {'parsed': 0, 'new': 0, 'duplicates': 0, 'rejected': 0}
+
+    checkpoint = {'source': f'ingest:{os.path.abspath(pattern)}'}
+    appender = ColumnAppender(columns_path) if columns_path else None
+    searcher = SearchIndexAppender(search_path) if search_path else None
+    snapshotter = seed_snapshot(snapshot_path, output) if snapshot_path else None
+    pending_records, pending_hashes = [], []
+
+    def store_pending():
+        with metrics.stage('load', len(pending_records)):
+            store_batch(output, pending_records, pending_hashes, hashes_path, appender, searcher, snapshotter)
+        save_checkpoint(state, state_path, checkpoint, output, hashes_path, appender, searcher, dead_letter_path)
+        pending_records.clear()
+        pending_hashes.clear()
+
+    try:
+        save_checkpoint(state, state_path, checkpoint, output, hashes_path, appender, searcher, dead_letter_path)
+        with open(dead_letter_path, 'ab') as dead_letter:
+            for (number, path, _, _), (rows, rejects, timings, batch_keys, hashes, newest) in _map_tasks(
+                    _tasks(todo, chunk_size), workers):
+                if timings is not None:
+                    metrics.record_stage('parse', timings['parse'], len(rows) + len(rejects))
+                    metrics.record_stage('extract', timings['extract'], len(rows))
+                    metrics.record_stage('categorize', timings['categorize'], len(rows))
+
+                with metrics.stage('dedupe', len(rows)):
+                    batch_keys.tofile(spools[number])
+                    seen = bloom.might_contain(batch_keys)
+                    seen[seen] = keys.contains(batch_keys[seen])
+                    # The first of the unseen copies of each key is new
+                    fresh, first = np.unique(batch_keys[~seen], return_index=True)
+                    new_rows = np.sort(np.flatnonzero(~seen)[first])
+                    keys.add(fresh)
+                    bloom.add(fresh)
+                    if len(keys) > bloom.capacity:
+                        bloom = _bloom_for(keys, error_rate)
+
+                for row in new_rows.tolist():
+                    layout, values = rows[row]
+                    pending_records.append(dict(zip(layout, values)))
+                pending_hashes.extend(hashes[new_rows].tolist())
+
+                count = counts[number]
+                count['messages'] += len(rows)
+                count['new'] += len(new_rows)
+                count['newest'] = max(count['newest'], newest)
+                totals['parsed'] += len(rows)
+                totals['new'] += len(new_rows)
+                totals['duplicates'] += len(rows) - len(new_rows)
+                totals['rejected'] += len(rejects)
+                if rejects:
+                    write_dead_letters(dead_letter, path, rejects)
+
+                if len(pending_records) >= batch_records:
+                    store_pending()
+            store_pending()
+    except BaseException:
+        if snapshotter:
+            snapshotter.discard()
+        for spool in spools:
+            spool.close()
+            os.remove(spool.name)
+        raise
+    finally:
+        if appender:
+            appender.close()
+
+    if columns_path and dashboard_path:
+        with metrics.stage('dashboard', totals['new']):
+            update_dashboard(columns_path, dashboard_path)
+    if snapshotter:
+        with metrics.stage('snapshot', totals['new']):
+            finish_snapshot(snapshotter, output)
+
+    with metrics.stage('dedupe'):
+        _save_ingest(ingest_path, meta, keys, todo, signatures, spools, counts, output)
+
+    for path, count in zip(todo, counts):
+        previous = state['sources'].get(os.path.abspath(path)) or {}
+        watermark = max(count['newest'], previous.get('watermark', 0))
+        state['sources'][os.path.abspath(path)] = dict(signatures[path], watermark=watermark)
+    del state['checkpoint']
+    save_state(state, state_path)
+
+    return IngestResult(len(backups), len(backups) - len(todo), totals['parsed'], totals['new'],
+                        totals['duplicates'], totals['rejected'], time.perf_counter() - started)
+
+
+def _save_ingest(ingest_path, meta, keys, todo, signatures, spools, counts, output):
+    """
+  Save the stored keys, for the version of the processed file they
+  describe, and the sorted keys of each merged backup, one at a time
+  """
+    keys_path = os.path.join(ingest_path, 'keys.npy')
+    with open(keys_path + '.tmp', 'wb') as f:
+        np.save(f, keys.array())
+    os.replace(keys_path + '.tmp', keys_path)
+    meta['source'] = source_signature(output)
+    meta['keys'] = len(keys)
+
+    for path, spool, count in zip(todo, spools, counts):
+        spool.close()
+        held = np.unique(np.fromfile(spool.name, np.uint64))
+        os.remove(spool.name)
+        key = os.path.abspath(path)
+        entry = meta['backups'].get(key) or {'file': f'backup_{len(meta["backups"])}.npy'}
+        with open(os.path.join(ingest_path, entry['file'] + '.tmp'), 'wb') as f:
+            np.save(f, held)
+        os.replace(os.path.join(ingest_path, entry['file'] + '.tmp'), os.path.join(ingest_path, entry['file']))
+        entry.update(backup_set=signatures[path]['backup_set'], messages=count['messages'], new=count['new'],
+                     distinct=len(held))
+        meta['backups'][key] = entry
+
+    write_meta(ingest_path, meta)
+
+
+class Provenance:
+    """
+  The backups ingest() merged into a processed store and, for any
+  message, which of them held it. Each backup's keys are read from disk,
+  memory-mapped, when first needed.
+  """
+
+    def __init__(self, path=ingest_dir_path):
+        self.path = path
+        meta = read_meta(path) or {'backups': {}}
+        self.backups = meta['backups']
+        self._keys = {}
+
+    def _held(self, backup):
+        held = self._keys.get(backup)
+        if held is None:
+            held = self._keys[backup] = np.load(os.path.join(self.path, self.backups[backup]['file']),
+                                                mmap_mode='r')
+        return held
+
+    def sources_of(self, record):
+        """
+      The paths of the backups that held this message (see record_key)
+      """
+        key = np.uint64(record_key(record))
+        found = []
+        for backup in self.backups:
+            held = self._held(backup)
+            position = int(np.searchsorted(held, key))
+            if position < len(held) and held[position] == key:
+                found.append(backup)
+        return found
+
+
+# Example usage
+if __name__ == "__main__":
+    # python -m etl.ingest DIRECTORY_OR_GLOB [--full] [--workers N] -- merge many backups at once
+    # python -m etl.ingest --sources TRANSACTION_ID -- the backups that held a transaction
+    args = sys.argv[1:]
+
+    if args[:1] == ['--sources']:
+        for backup in Provenance().sources_of({'transaction_id': args[1]}):
+            print(backup)
+        sys.exit(0)
+
+    worker_count = None
+    if '--workers' in args:
+        position = args.index('--workers')
+        worker_count = int(args[position + 1])
+        del args[position:position + 2]
+    full_run = '--full' in args
+    args = [arg for arg in args if arg != '--full']
+
+    try:
+        outcome = ingest(args[0] if args else raw_dir_path, workers=worker_count, full=full_run)
+    except FileNotFoundError as e:
+        print(f"Error: No backups found at {e}")
+        sys.exit(1)
+
+    print(f"{outcome.backups} backups, {outcome.skipped} unchanged: parsed {outcome.parsed}, added {outcome.new}, "
+          f"skipped {outcome.duplicates} held by another backup ({outcome.seconds:.2f} s)")
+    if outcome.rejected:
+        print(f"{outcome.rejected} malformed messages written to {dead_letter_file_path}")
@@ -0,0 +1,93 @@
+import json
+import os
+import sys
+from itertools import islice
+
+from etl.clean_normalize import compact_record
+from etl.db_schema import BUMP_VERSION, INSERT_RECORD, connect, create_sms_indexes, drop_sms_indexes, record_row
+from etl.parse_xml import iter_sms_records_parallel
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+json_file_path = os.path.join(BASE_DIR, "../data/processed/sms_records.json")
+db_file_path = os.path.join(BASE_DIR, "../data/processed/momo.db")
+
+# Rows handed to one executemany() call, and rows committed per transaction
+BATCH_SIZE = 10_000
+ROWS_PER_TRANSACTION = 250_000
+
+
+def load_records(records, db_path=db_file_path, replace=False,
+                 batch_size=BATCH_SIZE, rows_per_transaction=ROWS_PER_TRANSACTION):
+    """
+  Bulk load SMS records (any iterable) into the sms_records table.
+
+  Rows go in through executemany() in batches of `batch_size`, inside
+  transactions of `rows_per_transaction` rows, never one statement and
+  commit per row. Loading into an empty table drops its indexes first and
+  builds them once at the end, which is much faster than keeping them
+  current row by row. With `replace=True` existing records are deleted
+  first. Returns the number of records loaded.
+  """
+    conn = connect(db_path)
+    total = 0
+
+    try:
+        if replace:
+            conn.execute('DELETE FROM sms_records')
+        empty = conn.execute('SELECT NOT EXISTS (SELECT 1 FROM sms_records)').fetchone()[0]
+        if empty:
+            drop_sms_indexes(conn)
+
+        rows = map(record_row, records)
+        in_transaction = 0
+        conn.execute('BEGIN')
+
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+
+            conn.executemany(INSERT_RECORD, batch)
+            total += len(batch)
+            in_transaction += len(batch)
+
+            if in_transaction >= rows_per_transaction:
+                conn.execute(BUMP_VERSION)
+                conn.execute('COMMIT')
+                conn.execute('BEGIN')
+                in_transaction = 0
+
+        conn.execute(BUMP_VERSION)
+        conn.execute('COMMIT')
+
+    finally:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        create_sms_indexes(conn)
+        conn.close()
+
+    return total
+
+
+def iter_source_records(path):
+    """
+  Records from a processed JSON file or straight from an SMS backup XML
+  """
+    if path.endswith('.xml'):
+        return iter_sms_records_parallel(path)
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return iter(json.load(f, object_hook=compact_record))
+
+
+# Example usage
+if __name__ == "__main__":
+    # python -m etl.load_db [sms_records.json | backup.xml] [momo.db]
+    source = sys.argv[1] if len(sys.argv) > 1 else json_file_path
+    target = sys.argv[2] if len(sys.argv) > 2 else db_file_path
+
+    try:
+        count = load_records(iter_source_records(source), target, replace=True)
+        print(f"Loaded {count} records from {source} into {target}")
+    except FileNotFoundError:
+        print(f"Error: File not found at {source}")
@@ -0,0 +1,358 @@
+import os
+import signal
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as Tally
+
+# Collection is on unless MOMO_METRICS=0. Every instrumented call site
+# checks this flag first, so disabled metrics cost one attribute lookup
+enabled = os.environ.get('MOMO_METRICS', '1') != '0'
+
+# Upper bounds, in seconds, of the default latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Sampling profiler defaults: seconds between samples, frames kept per stack
+PROFILE_INTERVAL = 0.005
+PROFILE_DEPTH = 64
+
+# Innermost frames of threads that are blocked rather than running; their
+# stacks are left out of a profile unless asked for
+IDLE_FRAMES = frozenset((
+    'Condition.wait', 'Event.wait', 'Thread._wait_for_tstate_lock', 'SocketIO.readinto',
+    '_PollLikeSelector.select', 'SelectSelector.select', 'EpollSelector.select'
+))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+  A value that only goes up
+  """
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Gauge:
+    """
+  A value that goes up and down, like the number of requests in flight
+  """
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Histogram:
+    """
+  Observations counted into fixed buckets, with their count and sum. The
+  buckets are upper bounds in increasing order; +Inf is implied.
+  """
+    __slots__ = ('buckets', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            yield name + '_bucket', labels + (('le', _number(bound)),), cumulative
+        yield name + '_sum', labels, self.sum
+        yield name + '_count', labels, self.count
+
+
+class Family:
+    """
+  A named metric and its children, one per combination of label values
+  """
+
+    def __init__(self, name, kind, help, labelnames, make):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._make = make
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """
+    The child for these label values, created on first use
+    """
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} takes labels {self.labelnames}, got {values}')
+            with self._lock:
+                child = self._children.setdefault(values, self._make())
+        return child
+
+    def children(self):
+        return sorted(self._children.items())
+
+
+class Registry:
+    """
+  The metrics of a process, rendered in the Prometheus text format
+  """
+
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _family(self, name, kind, help, labelnames, make):
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = Family(name, kind, help, labelnames, make)
+            elif family.kind != kind or family.labelnames != tuple(labelnames):
+                raise ValueError(f'{name} is already registered as a {family.kind} with labels {family.labelnames}')
+            return family
+
+    def counter(self, name, help, labelnames=()):
+        return self._family(name, 'counter', help, labelnames, Counter)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._family(name, 'gauge', help, labelnames, Gauge)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._family(name, 'histogram', help, labelnames, lambda: Histogram(buckets))
+
+    def render(self):
+        """
+    Every metric in the Prometheus text exposition format, version 0.0.4
+    """
+        lines = []
+        for family in list(self._families.values()):
+            lines.append(f'# HELP {family.name} {_escape(family.help)}')
+            lines.append(f'# TYPE {family.name} {family.kind}')
+            for values, child in family.children():
+                for name, labels, value in child.samples(family.name, tuple(zip(family.labelnames, values))):
+                    if labels:
+                        text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels)
+                        lines.append(f'{name}{{{text}}} {_number(value)}')
+                    else:
+                        lines.append(f'{name} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """
+    Write the rendered metrics to `path` atomically, for a textfile collector
+    """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+
+REGISTRY = Registry()
+
+# The ETL stages in pipeline order
+STAGES = ('parse', 'extract', 'categorize', 'clean', 'load', 'dashboard')
+
+STAGE_SECONDS = REGISTRY.counter(
+    'etl_stage_seconds_total', 'Seconds spent in each ETL stage, summed over worker processes', ('stage',))
+STAGE_RECORDS = REGISTRY.counter('etl_stage_records_total', 'Records handled by each ETL stage', ('stage',))
+
+
+def record_stage(stage, seconds, records=0):
+    """
+  Add a stage's time and record count to the ETL stage counters
+  """
+    STAGE_SECONDS.labels(stage).inc(seconds)
+    STAGE_RECORDS.labels(stage).inc(records)
+
+
+class Stage:
+    """
+  Context manager timing one pass through an ETL stage. Set `records`
+  inside the block to count what went through it.
+  """
+    __slots__ = ('name', 'records', 'started')
+
+    def __init__(self, name, records=0):
+        self.name = name
+        self.records = records
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_stage(self.name, time.perf_counter() - self.started, self.records)
+
+
+class _NullStage:
+    __slots__ = ('records',)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+def stage(name, records=0):
+    """
+  A Stage timer, or a shared no-op one when metrics are disabled
+  """
+    return Stage(name, records) if enabled else _NULL_STAGE
+
+
+def stage_summary():
+    """
+  (stage, seconds, records) for every ETL stage recorded so far, in
+  pipeline order
+  """
+    records = {values[0]: child.value for values, child in STAGE_RECORDS.children()}
+    seconds = {values[0]: child.value for values, child in STAGE_SECONDS.children()}
+    order = [name for name in STAGES if name in seconds] + sorted(seconds.keys() - set(STAGES))
+    return [(name, seconds[name], records.get(name, 0)) for name in order]
+
+
+class SamplingProfiler:
+    """
+  Samples the stack of every other thread of this process every
+  `interval` seconds and counts how often each stack was seen. The result
+  is in the folded format flame graph tools read: one line per stack,
+  outermost frame first, frames separated by ';', then the count. Only
+  this process is sampled, not the workers of a process pool. Threads
+  blocked in one of IDLE_FRAMES are skipped unless `idle` is set.
+  """
+
+    def __init__(self, interval=PROFILE_INTERVAL, depth=PROFILE_DEPTH, idle=False):
+        self.interval = interval
+        self.depth = depth
+        self.idle = idle
+        self.stacks = Tally()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, name='sampling-profiler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return self
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own or not self.idle and frame.f_code.co_qualname in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.depth:
+                    code = frame.f_code
+                    stack.append(f'{code.co_qualname} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self, limit=None):
+        """
+    The sampled stacks in the folded format, most frequent first
+    """
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common(limit))
+
+
+def profile(seconds, interval=PROFILE_INTERVAL, idle=False):
+    """
+  Sample this process for `seconds` and return the folded stacks
+  """
+    profiler = SamplingProfiler(interval, idle=idle).start()
+    try:
+        time.sleep(seconds)
+    finally:
+        profiler.stop()
+    return profiler.folded()
+
+
+def install_profile_signal(path, signum=getattr(signal, 'SIGUSR2', None), interval=PROFILE_INTERVAL):
+    """
+  Profile on demand: the first `signum` starts a SamplingProfiler, the
+  next stops it and writes its folded stacks to `path`, and so on. Only
+  the main thread can install a handler; returns whether one was.
+  """
+    if signum is None or threading.current_thread() is not threading.main_thread():
+        return False
+
+    profiler = None
+
+    def toggle(received, frame):
+        nonlocal profiler
+        if profiler is None:
+            profiler = SamplingProfiler(interval).start()
+            return
+        profiler.stop()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(profiler.folded())
+        profiler = None
+
+    signal.signal(signum, toggle)
+    return True
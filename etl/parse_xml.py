@@ -1,111 +1,480 @@
 import json
+import mmap
 import os
 import re
+import time
 import xml.etree.ElementTree as ET
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from etl import metrics
+from etl.categorize import categorize
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 xml_file_path = os.path.join(BASE_DIR, "../data/raw/modified_sms_v2.xml")
 
 
+SMS_ATTRIBUTES = (
+    'protocol', 'address', 'date', 'type', 'subject', 'body', 'toa', 'sc_toa',
+    'service_center', 'read', 'status', 'locked', 'date_sent', 'sub_id',
+    'readable_date', 'contact_name'
+)
+
+
+def build_sms_record(attrib, timings=None):
+    """
+  Build one SMS record dict from the attributes of an <sms> element. With
+  a `timings` dict, the seconds spent extracting fields from the body and
+  categorizing it are added to its 'extract' and 'categorize' entries.
+  """
+    sms_data = {name: attrib.get(name) for name in SMS_ATTRIBUTES}
+
+    # Parse and add additional useful fields from the body
+    body = attrib.get('body', '')
+    if timings is None:
+        sms_data.update(parse_transaction_details(body))
+        sms_data['category'] = categorize(body)
+        return sms_data
+
+    started = time.perf_counter()
+    sms_data.update(parse_transaction_details(body))
+    extracted = time.perf_counter()
+    sms_data['category'] = categorize(body)
+    timings['extract'] += extracted - started
+    timings['categorize'] += time.perf_counter() - extracted
+
+    return sms_data
+
+
 def parse_sms_xml_to_json(xml_data):
     try:
         # Parse the XML content
         root = ET.fromstring(xml_data)
 
-        # List to store all sms records as dictionaries
-        sms_records = []
-
-        # Iterate through all SMS elements
-        for sms in root.findall('sms'):
-            sms_data = {
-                'protocol': sms.get('protocol'),
-                'address': sms.get('address'),
-                'date': sms.get('date'),
-                'type': sms.get('type'),
-                'subject': sms.get('subject'),
-                'body': sms.get('body'),
-                'toa': sms.get('toa'),
-                'sc_toa': sms.get('sc_toa'),
-                'service_center': sms.get('service_center'),
-                'read': sms.get('read'),
-                'status': sms.get('status'),
-                'locked': sms.get('locked'),
-                'date_sent': sms.get('date_sent'),
-                'sub_id': sms.get('sub_id'),
-                'readable_date': sms.get('readable_date'),
-                'contact_name': sms.get('contact_name')
-            }
-
-            # Parse and add additional useful fields from the body
-
-            body = sms.get('body', '')
-            sms_data.update(parse_transaction_details(body))
-
-            sms_records.append(sms_data)
-
-        return sms_records
+        # Build a record for every SMS element
+        return [build_sms_record(sms.attrib) for sms in root.findall('sms')]
 
     except ET.ParseError as exception:
         print(f"Error parsing XML: {exception}")
         return []
 
 
-def parse_transaction_details(body):
-    details = {}
+def iter_sms_records(source):
+    """
+  Stream SMS records from a backup one at a time.
 
-    # Extract amount
-    amount_patterns = [
-        r'received (\d+) RWF',
-        r'payment of (\d+[,]?\d*) RWF',
-        r'deposit of (\d+[,]?\d*) RWF',
-        r'transferred to.*?(\d+[,]?\d*) RWF'
-    ]
+  `source` is a file path or a file object opened in binary mode. The
+  document is parsed incrementally and every <sms> element is cleared as
+  soon as its record has been built, so memory use does not grow with the
+  size of the backup. Raises ET.ParseError on malformed XML.
+  """
+    depth = 0
+    root = None
+
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+
+        depth -= 1
+
+        # Only direct children of <smses>, like root.findall('sms')
+        if depth == 1 and elem.tag == 'sms':
+            yield build_sms_record(elem.attrib)
+            # Drop the finished element and the root's reference to it
+            root.clear()
+
+
+# Start of an <sms> element; element boundaries for the parallel parser
+SMS_TAG = re.compile(rb'<sms[\s/>]')
+XML_ENCODING = re.compile(rb'encoding=["\']([A-Za-z0-9._-]+)["\']')
+
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+PARALLEL_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def split_sms_byte_ranges(path, chunk_size=PARALLEL_CHUNK_BYTES):
+    """
+  Split the <sms> elements of a UTF-8 backup into (start, end) byte ranges
+  of roughly `chunk_size` bytes. Every range starts on an <sms element and
+  holds only whole top-level elements. A backup cut short before its
+  closing </smses> is split up to its last byte. Returns [] if there are
+  no <sms> elements.
+  """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            first = SMS_TAG.search(data)
+            end = data.rfind(b'</smses>')
+            if end == -1:
+                end = len(data)
+            if first is None or first.start() >= end:
+                return []
+
+            ranges = []
+            start = first.start()
+            while start < end:
+                boundary = SMS_TAG.search(data, min(start + chunk_size, end), end)
+                stop = boundary.start() if boundary else end
+                ranges.append((start, stop))
+                start = stop
+
+            return ranges
+
+
+def _parse_byte_range(path, start, end, timings=None):
+    """
+  Worker: parse one byte range and return its records as a list of
+  (keys, values) tuples. Records with the same set of fields share one
+  keys tuple, so pickle sends each key layout once per batch instead of
+  the field names of every record. `timings` is as for build_sms_record.
+  """
+    with open(path, 'rb') as f:
+        f.seek(start)
+        chunk = f.read(end - start)
+
+    root = ET.fromstring(b'<smses>' + chunk + b'</smses>')
+    layouts = {}
+    rows = []
+
+    for sms in root.findall('sms'):
+        record = build_sms_record(sms.attrib, timings)
+        keys = tuple(record)
+        rows.append((layouts.setdefault(keys, keys), tuple(record.values())))
+
+    return rows
+
+
+def parse_byte_range_isolated(path, start, end):
+    """
+  Worker: like _parse_byte_range, but a malformed element, or a body that
+  fails to parse, does not fail the range. The range is then parsed again
+  one element at a time, and the elements that fail are returned as
+  (byte offset, error, element text) rejects. Returns (rows, rejects,
+  timings): with metrics enabled, the seconds the range took to parse,
+  extract and categorize, else None.
+  """
+    if not metrics.enabled:
+        return _parse_byte_range_rows(path, start, end, None) + (None,)
+
+    timings = {'extract': 0.0, 'categorize': 0.0}
+    started = time.perf_counter()
+    rows, rejects = _parse_byte_range_rows(path, start, end, timings)
+    timings['parse'] = time.perf_counter() - started - timings['extract'] - timings['categorize']
+    return rows, rejects, timings
+
+
+def _parse_byte_range_rows(path, start, end, timings):
+    try:
+        return _parse_byte_range(path, start, end, timings), []
+    except Exception:
+        pass
+
+    with open(path, 'rb') as f:
+        f.seek(start)
+        chunk = f.read(end - start)
+
+    bounds = [match.start() for match in SMS_TAG.finditer(chunk)]
+    if not bounds or bounds[0] != 0:
+        bounds.insert(0, 0)
+    bounds.append(len(chunk))
+    layouts = {}
+    rows = []
+    rejects = []
+
+    for lo, hi in zip(bounds, bounds[1:]):
+        element = chunk[lo:hi]
+        try:
+            # Wrapped, so anything between two <sms> elements parses as it would in the document
+            root = ET.fromstring(b'<smses>' + element + b'</smses>')
+            records = [build_sms_record(sms.attrib, timings) for sms in root.findall('sms')]
+        except Exception as exception:
+            rejects.append((start + lo, f'{type(exception).__name__}: {exception}',
+                            element.decode('utf-8', 'replace').strip()))
+            continue
+        for record in records:
+            keys = tuple(record)
+            rows.append((layouts.setdefault(keys, keys), tuple(record.values())))
+
+    return rows, rejects
+
+
+def _map_byte_ranges(parse, path, ranges, workers):
+    """
+  Yield (start, end, parse(path, start, end)) for every range, in order,
+  with the ranges parsed in a process pool; at most two ranges per worker
+  are in flight at once.
+  """
+    ranges = iter(ranges)
+    pending = deque()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for start, end in islice(ranges, workers * 2):
+            pending.append((start, end, pool.submit(parse, path, start, end)))
+
+        while pending:
+            start, end, future = pending.popleft()
+            result = future.result()
+            for next_start, next_end in islice(ranges, 1):
+                pending.append((next_start, next_end, pool.submit(parse, path, next_start, next_end)))
+            yield start, end, result
+
+
+def is_utf8_backup(path):
+    with open(path, 'rb') as f:
+        head = f.read(256)
+    declared = XML_ENCODING.search(head.split(b'?>', 1)[0]) if head.startswith(b'<?xml') else None
+    return declared is None or declared.group(1).lower() in (b'utf-8', b'utf8', b'us-ascii', b'ascii')
+
+
+def iter_sms_records_parallel(path, workers=None, chunk_size=PARALLEL_CHUNK_BYTES,
+                              min_size=PARALLEL_MIN_BYTES):
+    """
+  Parse a backup on several cores, yielding the same records in the same
+  order as iter_sms_records(path).
+
+  The file is split into byte ranges on <sms> element boundaries and each
+  range is parsed in a process pool; at most two batches per worker are in
+  flight at once. Falls back to the serial streaming parser for a single
+  worker, files smaller than `min_size` bytes, or non-UTF-8 backups.
+  """
+    workers = workers or os.cpu_count() or 1
+
+    if workers <= 1 or os.path.getsize(path) < min_size or not is_utf8_backup(path):
+        yield from iter_sms_records(path)
+        return
+
+    ranges = split_sms_byte_ranges(path, chunk_size)
+    for _, _, rows in _map_byte_ranges(_parse_byte_range, path, ranges, workers):
+        for keys, values in rows:
+            yield dict(zip(keys, values))
 
-    for pattern in amount_patterns:
-        match = re.search(pattern, body)
-        if match:
-            details['amount'] = match.group(1).replace(',', '')
-            break
 
-    # Extract transaction type
-    if 'received' in body.lower():
-        details['transaction_type'] = 'credit'
-    elif 'payment' in body.lower() or 'transferred' in body.lower():
-        details['transaction_type'] = 'debit'
-    elif 'deposit' in body.lower():
-        details['transaction_type'] = 'deposit'
-    elif 'withdrawn' in body.lower():
-        details['transaction_type'] = 'withdrawal'
+def iter_sms_batches(path, offset=0, workers=None, chunk_size=PARALLEL_CHUNK_BYTES):
+    """
+  Parse a UTF-8 backup from byte `offset` on (an <sms> element start, or
+  0), one byte range at a time, yielding (end, records, rejects) per range
+  in file order. `end` is the offset to resume from once the range's
+  records are stored. Malformed elements do not stop the parse: they come
+  back as (byte offset, error, element text) rejects, see
+  parse_byte_range_isolated. Ranges are parsed on `workers` cores, and
+  the time they took goes to the parse, extract and categorize stages of
+  etl.metrics.
+  """
+    workers = workers or os.cpu_count() or 1
+    ranges = [(max(start, offset), end) for start, end in split_sms_byte_ranges(path, chunk_size) if end > offset]
+
+    if workers <= 1:
+        parsed = ((start, end, parse_byte_range_isolated(path, start, end)) for start, end in ranges)
     else:
-        details['transaction_type'] = 'other'
+        parsed = _map_byte_ranges(parse_byte_range_isolated, path, ranges, workers)
+
+    for _, end, (rows, rejects, timings) in parsed:
+        if timings is not None:
+            metrics.record_stage('parse', timings['parse'], len(rows) + len(rejects))
+            metrics.record_stage('extract', timings['extract'], len(rows))
+            metrics.record_stage('categorize', timings['categorize'], len(rows))
+        yield end, [dict(zip(keys, values)) for keys, values in rows], rejects
+
+
+# Field patterns, compiled once. The order of each list is significant: the
+# first pattern that matches anywhere in the body wins.
+AMOUNT_PATTERNS = [
+    re.compile(r'received (\d+) RWF'),
+    re.compile(r'payment of (\d+[,]?\d*) RWF'),
+    re.compile(r'deposit of (\d+[,]?\d*) RWF'),
+    re.compile(r'transferred to.*?(\d+[,]?\d*) RWF')
+]
+RECIPIENT_PATTERNS = [
+    re.compile(r'to (.*?) \d'),
+    re.compile(r'from (.*?) \('),
+    re.compile(r'received.*?from (.*?) \(')
+]
+BALANCE_PATTERN = re.compile(r'balance[:\s]*([\d,]+)', re.IGNORECASE)
+TX_ID_PATTERN = re.compile(r'[Tt]x[Ii]d:?\s*(\d+)')
+DATE_PATTERN = re.compile(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})')
+
+# Literal every amount / recipient pattern needs, in the same order
+AMOUNT_LITERALS = ('received ', 'payment of', 'deposit of', 'transferred to')
+RECIPIENT_LITERALS = ('to ', 'from ')
+
+# Anything in (lower-cased) free text, such as names or messages, that one of
+# the field patterns could latch onto before the place a template expects
+FREE_TEXT_HAZARDS = ('balance', 'txid', 'to ', 'from ', 'received', 'payment of', 'deposit of',
+                     'transferred to')
+
+_DATE = r'(?P<transaction_date>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})'
+_BALANCE = r'(?i:balance)[:\s]*(?P<balance>[\d,]+)'
+
+MessageTemplate = namedtuple('MessageTemplate', 'leading pattern amount_rank counterparty_rank free_text')
+
+# Known MoMo message layouts. Each pattern captures every field at the place
+# the generic patterns would find it; amount_rank / counterparty_rank say
+# which entry of AMOUNT_PATTERNS / RECIPIENT_PATTERNS produced the capture
+# (len() of the list when the message carries none).
+MESSAGE_TEMPLATES = [
+    MessageTemplate('TxId: ', re.compile(
+        r'TxId: (?P<transaction_id>\d+)\. Your payment of (?P<amount>\d+,?\d*) RWF to '
+        r'(?P<counterparty>[^\d\n]*?) \d+ has been completed at ' + _DATE + r'\. Your new ' + _BALANCE
+    ), 1, 0, ('counterparty',)),
+    MessageTemplate('You have received ', re.compile(
+        r'You have received (?P<amount>\d+) RWF from (?P<counterparty>[^\n(]*?) \((?P<ref>[^)\n]*)\) '
+        r'on your mobile money account at ' + _DATE + r'\. Message from sender: (?P<message>.*?)\. '
+        r'Your new ' + _BALANCE
+    ), 0, 1, ('counterparty', 'ref', 'message')),
+    MessageTemplate('Your payment of ', re.compile(
+        r'Your payment of (?P<amount>\d+,?\d*) RWF to (?P<counterparty>[^\d\n(]*? \(\d*\) has been '
+        r'completed at) ' + _DATE + r'\. Message: (?P<message>.*?)\. Your new ' + _BALANCE
+    ), 1, 0, ('counterparty', 'message')),
+    MessageTemplate('You ', re.compile(
+        r'You (?P<name>[^\n(]*?) \((?P<ref>[^)\n]*)\) have via agent: (?P<agent>[^\n(]*?) \(\d*\), '
+        r'withdrawn \d+ RWF from (?P<from>)your mobile money account: \d+ at ' + _DATE +
+        r' and you can now collect your money in cash\. Your new ' + _BALANCE
+    ), 4, 1, ('name', 'ref', 'agent')),
+    MessageTemplate('*', re.compile(
+        r'\*\d+\*S\*\d+ RWF transferred to (?P<counterparty>(?P<name>[^\d\n(]*?) \(\d*\) from) \d+ at '
+        + _DATE + r' \. Fee was: (?P<amount>\d+,?\d*) RWF\. New ' + _BALANCE
+    ), 3, 0, ('name',)),
+    MessageTemplate('*', re.compile(
+        r'\*\d+\*TxId:(?P<transaction_id>\d+)\*S\*Your payment of (?P<amount>\d+,?\d*) RWF to '
+        r'(?P<counterparty>[^\d\n]*?) ' + _DATE + r'\. Fee was \d+ RWF\. Your new ' + _BALANCE
+    ), 1, 0, ('counterparty',)),
+    MessageTemplate('*', re.compile(
+        r'\*\d+\*R\*A bank deposit of (?P<amount>\d+,?\d*) RWF has been added to '
+        r'(?P<counterparty>[^\d\n]*?) ' + _DATE + r'\. Your (?i:new) ' + _BALANCE
+    ), 2, 0, ('counterparty',)),
+]
+
+_TEMPLATES_BY_FIRST_CHAR = {}
+for _template in MESSAGE_TEMPLATES:
+    _TEMPLATES_BY_FIRST_CHAR.setdefault(_template.leading[0], []).append(_template)
+
+
+def _transaction_type(lowered):
+    if 'received' in lowered:
+        return 'credit'
+    elif 'payment' in lowered or 'transferred' in lowered:
+        return 'debit'
+    elif 'deposit' in lowered:
+        return 'deposit'
+    elif 'withdrawn' in lowered:
+        return 'withdrawal'
+    return 'other'
+
+
+def _extract_with_template(body, lowered, template, match):
+    """
+  Pull every field from a template match, or return None when the message
+  deviates from the template in a way the generic patterns might read
+  differently (caller then falls back to _extract_generic).
+  """
+    # Free text is checked together with the character on either side, so a
+    # name ending in "from" before the template's own space is caught too
+    for group in template.free_text:
+        start, end = match.span(group)
+        text = lowered[max(start - 1, 0):end + 1]
+        for hazard in FREE_TEXT_HAZARDS:
+            if hazard in text:
+                return None
+        if '-' in text and DATE_PATTERN.search(text):
+            return None
+
+    # An earlier pattern in the cascade would have matched somewhere else
+    for literal in AMOUNT_LITERALS[:template.amount_rank]:
+        if literal in body:
+            return None
+    for literal in RECIPIENT_LITERALS[:template.counterparty_rank]:
+        if literal in body:
+            return None
+
+    fields = match.groupdict()
+
+    if 'from' in fields:
+        # 'from (.*?) \(' may run past the end of the template
+        start = match.end('from')
+        end = body.find(' (', start)
+        fields['counterparty'] = body[start:end] if end != -1 else None
+
+    if fields.get('transaction_id') is None:
+        tx_id_match = TX_ID_PATTERN.search(body, match.end())
+        fields['transaction_id'] = tx_id_match.group(1) if tx_id_match else None
+
+    return fields
+
+
+def _extract_generic(body):
+    """Run the full pattern cascade over the body"""
+    fields = {}
+
+    for pattern in AMOUNT_PATTERNS:
+        match = pattern.search(body)
+        if match:
+            fields['amount'] = match.group(1)
+            break
 
-    # Extract balance
-    balance_match = re.search(r'balance[:\s]*([\d,]+)', body, re.IGNORECASE)
+    balance_match = BALANCE_PATTERN.search(body)
     if balance_match:
-        details['balance'] = balance_match.group(1).replace(',', '')
+        fields['balance'] = balance_match.group(1)
 
-    # Extract recipient/sender
-    recipient_patterns = [
-        r'to (.*?) \d',
-        r'from (.*?) \(',
-        r'received.*?from (.*?) \('
-    ]
-
-    for pattern in recipient_patterns:
-        match = re.search(pattern, body)
+    for pattern in RECIPIENT_PATTERNS:
+        match = pattern.search(body)
         if match:
-            details['counterparty'] = match.group(1).strip()
+            fields['counterparty'] = match.group(1)
             break
 
-    # Extract transaction ID
-    tx_id_match = re.search(r'[Tt]x[Ii]d:?\s*(\d+)', body)
+    tx_id_match = TX_ID_PATTERN.search(body)
     if tx_id_match:
-        details['transaction_id'] = tx_id_match.group(1)
+        fields['transaction_id'] = tx_id_match.group(1)
 
-    # Extract date from body
-    date_match = re.search(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})', body)
+    date_match = DATE_PATTERN.search(body)
     if date_match:
-        details['transaction_date'] = date_match.group(1)
+        fields['transaction_date'] = date_match.group(1)
+
+    return fields
+
+
+def parse_transaction_details(body):
+    fields = None
+    lowered = body.lower()
+
+    # Route well-known layouts to a single-match extractor. '.' in the
+    # generic patterns stops at line breaks, so multi-line bodies skip this,
+    # as do the rare bodies whose length changes when lower-cased.
+    if body and '\n' not in body and len(lowered) == len(body):
+        for template in _TEMPLATES_BY_FIRST_CHAR.get(body[0], ()):
+            match = body.startswith(template.leading) and template.pattern.match(body)
+            if match:
+                fields = _extract_with_template(body, lowered, template, match)
+                break
+
+    if fields is None:
+        fields = _extract_generic(body)
+
+    details = {}
+
+    amount = fields.get('amount')
+    if amount is not None:
+        details['amount'] = amount.replace(',', '')
+
+    details['transaction_type'] = _transaction_type(lowered)
+
+    balance = fields.get('balance')
+    if balance is not None:
+        details['balance'] = balance.replace(',', '')
+
+    counterparty = fields.get('counterparty')
+    if counterparty is not None:
+        details['counterparty'] = counterparty.strip()
+
+    if fields.get('transaction_id') is not None:
+        details['transaction_id'] = fields['transaction_id']
+
+    if fields.get('transaction_date') is not None:
+        details['transaction_date'] = fields['transaction_date']
 
     return details
 
@@ -115,47 +484,104 @@ def save_to_json(sms_data, filename='sms_records.json'):
   Save SMS records to JSON file
   """
 
+    json_file_path = _processed_path(filename)
+
+    with open(json_file_path, 'w', encoding='utf-8') as f:
+        json.dump(sms_data, f, indent=2, ensure_ascii=False)
+
+    return json_file_path
+
+
+def _processed_path(filename):
     parse_folder = os.path.join(BASE_DIR, "../data/processed")
 
     os.makedirs(parse_folder, exist_ok=True)
 
-    json_file_path = os.path.join(parse_folder, filename)
+    return os.path.join(parse_folder, filename)
 
-    with open(json_file_path, 'w', encoding='utf-8') as f:
-        json.dump(sms_data, f, indent=2, ensure_ascii=False)
 
-    return json_file_path
+def write_records_stream(records, file_obj, ndjson=False):
+    """
+  Write records to an open text file one at a time.
+
+  The JSON array layout is byte-for-byte what json.dump(records, indent=2)
+  produces, without holding the whole list or its encoding in memory.
+  With `ndjson=True` every record is written compactly on its own line.
+  Records may be any mapping, such as etl.clean_normalize.SmsRecord.
+  Returns the number of records written.
+  """
+    # Imported here: etl.clean_normalize builds on this module
+    from etl.clean_normalize import record_dict
+
+    count = 0
+
+    if ndjson:
+        for record in records:
+            file_obj.write(json.dumps(record, ensure_ascii=False, default=record_dict))
+            file_obj.write('\n')
+            count += 1
+        return count
+
+    for record in records:
+        file_obj.write('[\n  ' if count == 0 else ',\n  ')
+        file_obj.write(json.dumps(record, indent=2, ensure_ascii=False, default=record_dict).replace('\n', '\n  '))
+        count += 1
+
+    file_obj.write('\n]' if count else '[]')
+    return count
+
+
+def save_to_json_stream(records, filename='sms_records.json', ndjson=False):
+    """
+  Stream SMS records (any iterable) to a JSON or NDJSON file in the
+  processed folder. The file is written next to its final location and
+  moved into place once complete, so a failed run never leaves a
+  truncated output behind. Returns (file path, records written).
+  """
+    json_file_path = _processed_path(filename)
+    tmp_path = json_file_path + '.tmp'
+
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            count = write_records_stream(records, f, ndjson=ndjson)
+        os.replace(tmp_path, json_file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return json_file_path, count
 
 
 # Example usage
 if __name__ == "__main__":
 
     try:
-        with open(xml_file_path, 'r', encoding='utf-8') as file:
-            xml_content = file.read()
+        transaction_types = {}
+        first_records = []
 
-        # Parse XML to JSON objects
-        sms_data_records = parse_sms_xml_to_json(xml_content)
+        def tracked(records):
+            # Collect statistics and a preview while the records stream past
+            for record in records:
+                tx_type = record.get('transaction_type', 'unknown')
+                transaction_types[tx_type] = transaction_types.get(tx_type, 0) + 1
+                if len(first_records) < 3:
+                    first_records.append(record)
+                yield record
+
+        # Parse the XML and stream the records straight to the processed folder
+        file_path, total = save_to_json_stream(tracked(iter_sms_records_parallel(xml_file_path)))
 
         # Will print first few records as example
-        print(f"Total SMS records: {len(sms_data_records)}")
+        print(f"Total SMS records: {total}")
         print("\nFirst 3 records:")
 
-        for i, record in enumerate(sms_data_records[:3]):
+        for i, record in enumerate(first_records):
             print(f"\nRecord {i + 1}:")
             print(json.dumps(record, indent=2, ensure_ascii=False))
 
-        # Save all records to JSON file in the processed folder
-        file_path = save_to_json(sms_data_records)
         print(f"\nAll records saved to: {file_path}")
 
         # Print some statistics
-        transaction_types = {}
-
-        for record in sms_data_records:
-            tx_type = record.get('transaction_type', 'unknown')
-            transaction_types[tx_type] = transaction_types.get(tx_type, 0) + 1
-
         print("\nTransaction Statistics:")
         for tx_type, count in transaction_types.items():
             print(f"{tx_type}: {count} transactions")
@@ -163,5 +589,7 @@ if __name__ == "__main__":
     except FileNotFoundError:
         print(f"Error: File not found at {xml_file_path}")
         print("Please check the file path and make sure the XML file exists.")
+    except ET.ParseError as exception:
+        print(f"Error parsing XML: {exception}")
     except Exception as e:
         print(f"An error occurred: {e}")
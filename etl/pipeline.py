@@ -0,0 +1,369 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+from array import array
+
+from etl.clean_normalize import compact_record, record_dict
+from etl.columnar import truncate_columns, write_columns
+from etl.parse_xml import write_records_stream
+from etl.search_index import read_search_meta, source_signature, truncate_search_index, write_search_index
+from etl.snapshot import SnapshotWriter, open_snapshot
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+json_file_path = os.path.join(BASE_DIR, "../data/processed/sms_records.json")
+state_file_path = os.path.join(BASE_DIR, "../data/processed/etl_state.json")
+hash_file_path = os.path.join(BASE_DIR, "../data/processed/etl_hashes.bin")
+dead_letter_file_path = os.path.join(BASE_DIR, "../data/logs/dead_letter")
+
+# Stored content hashes read per chunk when checking a run's messages
+HASH_CHUNK = 1 << 20
+
+# Parsed messages stored between two checkpoints of a run
+CHECKPOINT_RECORDS = 100_000
+
+# The fields that identify a message; flags like `read` may change between backups
+HASH_FIELDS = ('address', 'date', 'type', 'body')
+
+BACKUP_SET = re.compile(rb'backup_set="([^"]*)"')
+
+logger = logging.getLogger('etl.pipeline')
+
+
+def content_hash(record):
+    """
+  64-bit hash of the fields that identify a message, as an int
+  """
+    text = '\x1f'.join(str(record.get(name)) for name in HASH_FIELDS)
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def backup_signature(path):
+    """
+  The backup_set id, size and mtime of a backup: what tells a run whether
+  it changed since it was last merged
+  """
+    stat = os.stat(path)
+    with open(path, 'rb') as f:
+        head = f.read(4096)
+    match = BACKUP_SET.search(head)
+    backup_set = match.group(1).decode('utf-8', 'replace') if match else None
+    return {'backup_set': backup_set, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def load_state(path=state_file_path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'sources': {}}
+
+
+def save_state(state, path=state_file_path):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_hashes(path, wanted=None):
+    """
+  The stored content hashes, or only those also in `wanted`. Checking a
+  small run against the file reads it in chunks instead of building a set
+  of every message ever processed.
+  """
+    found = set()
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return found
+
+    with f:
+        while True:
+            chunk = array('Q')
+            chunk.frombytes(f.read(HASH_CHUNK * chunk.itemsize))
+            if not chunk:
+                return found
+            found.update(chunk if wanted is None else wanted.intersection(chunk))
+
+
+def _append_hashes(path, hashes):
+    with open(path, 'ab') as f:
+        array('Q', hashes).tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _seed_hashes(hashes_path, output):
+    """
+  Hash the records already in a processed file that predates the hash
+  set, so the first incremental run does not add them a second time.
+  """
+    if os.path.exists(hashes_path) or not os.path.exists(output):
+        return
+    with open(output, 'r', encoding='utf-8') as f:
+        _append_hashes(hashes_path, [content_hash(record) for record in json.load(f, object_hook=compact_record)])
+
+
+def _seed_columns(columns_path, output):
+    """
+  Build the columnar copy of a processed file written before it existed
+  """
+    if os.path.exists(os.path.join(columns_path, 'meta.json')) or not os.path.exists(output):
+        return
+    with open(output, 'r', encoding='utf-8') as f:
+        write_columns(json.load(f, object_hook=compact_record), columns_path)
+
+
+def _seed_search(search_path, output, rolled_back):
+    """
+  Index a processed file from scratch when it has no search index, or one
+  built for another version of the file, as after the API folded its
+  journal into it. An index just rolled back with the file is kept.
+  """
+    if not os.path.exists(output):
+        return
+    meta = read_search_meta(search_path)
+    if meta is not None and (rolled_back or meta['source'] == source_signature(output)):
+        return
+    with open(output, 'r', encoding='utf-8') as f:
+        write_search_index(json.load(f, object_hook=compact_record), search_path, output)
+
+
+def seed_snapshot(snapshot_path, output):
+    """
+  A SnapshotWriter adding to the snapshot of a processed file, or, when it
+  has none or one of another version of the file, already holding every
+  record in it
+  """
+    try:
+        base = open_snapshot(snapshot_path, output)
+    except ValueError:
+        base = None
+    writer = SnapshotWriter(snapshot_path, base)
+    if base is None:
+        with open(output, 'r', encoding='utf-8') as f:
+            for record in json.load(f, object_hook=compact_record):
+                writer.add(record)
+    return writer
+
+
+def finish_snapshot(writer, output):
+    """
+  Write the snapshot a seed_snapshot writer was building, unless it had
+  nothing to add to a current one
+  """
+    if writer.added or writer.base is None:
+        writer.commit(output)
+    else:
+        writer.discard()
+
+
+def append_records(path, records):
+    """
+  Append records to a processed JSON file in place, in the layout of
+  write_records_stream. Only the closing bracket is rewritten, so the cost
+  is that of the new records, not of the file. A missing file is created.
+  Returns the number of records written.
+  """
+    if not os.path.exists(path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            count = write_records_stream(records, f)
+        os.replace(tmp_path, path)
+        return count
+
+    count = 0
+    with open(path, 'r+b') as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - 64))
+        tail = f.read()
+        body = tail.rstrip()
+        if not body.endswith(b']'):
+            raise ValueError(f'{path} is not a JSON array')
+        body = body[:-1].rstrip()
+        empty = body.endswith(b'[')
+
+        try:
+            f.seek(size - len(tail) + len(body))
+            f.truncate()
+            for record in records:
+                f.write(b'\n  ' if empty and count == 0 else b',\n  ')
+                f.write(json.dumps(record, indent=2, ensure_ascii=False, default=record_dict).replace('\n', '\n  ').encode('utf-8'))
+                count += 1
+            f.write(b']' if empty and count == 0 else b'\n]')
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.seek(size - len(tail))
+            f.truncate()
+            f.write(tail)
+            raise
+
+    return count
+
+
+def _records_size(path):
+    """
+  Byte size of a processed JSON file up to, not including, the whitespace
+  and bracket that close the array
+  """
+    with open(path, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - 64))
+        tail = f.read()
+    body = tail.rstrip()
+    if not body.endswith(b']'):
+        raise ValueError(f'{path} is not a JSON array')
+    return size - len(tail) + len(body[:-1].rstrip())
+
+
+def _truncate_records(path, size):
+    """
+  Cut a processed JSON file back to `size` bytes as measured by
+  _records_size, closing the array again
+  """
+    with open(path, 'r+b') as f:
+        f.seek(size - 1)
+        empty = f.read(1) == b'['
+        f.truncate(size)
+        f.seek(size)
+        f.write(b']' if empty else b'\n]')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def _truncate_file(path, size):
+    if _file_size(path) > size:
+        os.truncate(path, size)
+
+
+def _changed_since(checkpoint, output):
+    """
+  Whether the processed file was rewritten or added to since the
+  checkpoint, and is whole. One whose array was left open can only have
+  been torn by the killed run's own append, and is cut back as before.
+  """
+    if source_signature(output) == checkpoint.get('output_signature'):
+        return False
+    try:
+        _records_size(output)
+    except ValueError:
+        return False
+    return True
+
+
+def rollback(checkpoint, output, hashes_path, columns_path, search_path, dead_letter_path):
+    """
+  Undo whatever a run stored after its last checkpoint, which covers
+  every step but the last of each batch. Returns whether it could.
+
+  The processed file is cut back only while it is still the file the
+  checkpoint measured. A whole file written since, by the killed run's
+  last batch or by the API folding its journal into it, may no longer
+  hold the checkpoint's records up to its byte offset: it is kept as it
+  is, and its hashes, columns and search index are dropped so that
+  prepare_output builds them again from it.
+  """
+    if _changed_since(checkpoint, output):
+        logger.warning('%s changed since the last checkpoint: indexing it again instead of rolling back', output)
+        # The source is parsed again from where the run started
+        _truncate_file(dead_letter_path, checkpoint.get('dead_letter_start', checkpoint['dead_letter_bytes']))
+        if os.path.exists(hashes_path):
+            os.remove(hashes_path)
+        if columns_path:
+            shutil.rmtree(columns_path, ignore_errors=True)
+        if search_path:
+            shutil.rmtree(search_path, ignore_errors=True)
+        return False
+
+    _truncate_records(output, checkpoint['output_bytes'])
+    _truncate_file(hashes_path, checkpoint['hashes'] * array('Q').itemsize)
+    _truncate_file(dead_letter_path, checkpoint['dead_letter_bytes'])
+    if columns_path:
+        truncate_columns(columns_path, checkpoint['rows'])
+    if search_path:
+        truncate_search_index(search_path, checkpoint.get('search_rows', 0))
+    return True
+
+
+def prepare_output(state, output, hashes_path, columns_path, search_path, snapshot_path, rolled_back):
+    """
+  Create the processed store if it is gone, forgetting every source, and
+  build whatever a store written by an older version lacks. Returns
+  whether the store was started over.
+  """
+    started_over = not os.path.exists(output)
+    if started_over:
+        # The hashes and watermarks describe a store that is gone: start over
+        state['sources'] = {}
+        if os.path.exists(hashes_path):
+            os.remove(hashes_path)
+        if columns_path:
+            shutil.rmtree(columns_path, ignore_errors=True)
+        if search_path:
+            shutil.rmtree(search_path, ignore_errors=True)
+        if snapshot_path and os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+        append_records(output, [])
+    _seed_hashes(hashes_path, output)
+    if columns_path:
+        _seed_columns(columns_path, output)
+    if search_path:
+        _seed_search(search_path, output, rolled_back)
+    return started_over
+
+
+def save_checkpoint(state, state_path, checkpoint, output, hashes_path, appender, searcher, dead_letter_path):
+    """
+  Record in the state file the size of every output, for rollback
+  """
+    checkpoint.setdefault('dead_letter_start', _file_size(dead_letter_path))
+    checkpoint.update(output_bytes=_records_size(output),
+                      output_signature=source_signature(output),
+                      hashes=_file_size(hashes_path) // array('Q').itemsize,
+                      rows=appender.meta['rows'] if appender else 0,
+                      search_rows=searcher.rows if searcher else 0,
+                      dead_letter_bytes=_file_size(dead_letter_path))
+    state['checkpoint'] = checkpoint
+    save_state(state, state_path)
+
+
+def store_batch(output, records, hashes, hashes_path, appender, searcher, snapshotter):
+    """
+  Append a batch of new records, whose content hashes are `hashes`, to
+  the processed file and to each of its companions that is in use
+  """
+    # An unchanged file keeps the signature its snapshot and index were made for
+    if records:
+        append_records(output, records)
+    if appender:
+        for record in records:
+            appender.add(record)
+        appender.commit()
+    if searcher:
+        for record in records:
+            searcher.add(record)
+        searcher.commit(output)
+    if snapshotter:
+        for record in records:
+            snapshotter.add(record)
+    # Hashes go in only once their records are safely on disk
+    _append_hashes(hashes_path, hashes)
+
+
+def write_dead_letters(f, source, rejects):
+    for offset, error, element in rejects:
+        entry = {'source': source, 'offset': offset, 'error': error, 'element': element}
+        f.write(json.dumps(entry, ensure_ascii=False).encode('utf-8') + b'\n')
+    f.flush()
+    os.fsync(f.fileno())
@@ -0,0 +1,67 @@
+# Keys of a record that the API indexes and aggregates on, and that
+# etl/snapshot.py computes ahead for it
+
+import re
+
+import numpy as np
+
+TRANSACTION_DATE = re.compile(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$')
+
+# Largest date a record or a query may carry, so dates fit int64 arrays
+MAX_TIMESTAMP = np.iinfo(np.int64).max
+
+
+def encode_transaction_date(value):
+    """
+  "YYYY-MM-DD HH:MM:SS" as the int YYYYMMDDHHMMSS, which sorts the same
+  way; None for any other string
+  """
+    if not TRANSACTION_DATE.match(value):
+        return None
+    return int(value[0:4] + value[5:7] + value[8:10] + value[11:13] + value[14:16] + value[17:19])
+
+
+def format_transaction_date(code):
+    """
+  The "YYYY-MM-DD HH:MM:SS" string encode_transaction_date() encoded
+  """
+    code = int(code)
+    return (f'{code // 10**10:04d}-{code // 10**8 % 100:02d}-{code // 10**6 % 100:02d} '
+            f'{code // 10**4 % 100:02d}:{code // 100 % 100:02d}:{code % 100:02d}')
+
+
+def record_date(record):
+    date = record.get('transaction_date')
+    return date if isinstance(date, str) else None
+
+
+def record_amount(record):
+    try:
+        return float(record.get('amount'))
+    except (TypeError, ValueError):
+        return None
+
+
+def record_time(record):
+    """
+  A record's `date` as epoch milliseconds, or None if it has none
+  """
+    date = record.get('date')
+    if isinstance(date, str) and date.isascii() and date.isdigit():
+        date = int(date)
+    elif not isinstance(date, int) or isinstance(date, bool):
+        return None
+    return date if 0 <= date <= MAX_TIMESTAMP else None
+
+
+def record_value(record, field):
+    """
+  A numeric field of a record as a float; NaN if missing or not a number
+  """
+    value = record.get(field)
+    if isinstance(value, bool):
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
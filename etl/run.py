@@ -0,0 +1,285 @@
+import logging
+import mmap
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+from itertools import islice
+
+from etl import metrics
+from etl.columnar import ColumnAppender, columns_dir_path
+from etl.dashboard import dashboard_file_path, update_dashboard
+from etl.parse_xml import (SMS_TAG, is_utf8_backup, iter_sms_batches, iter_sms_records_parallel,
+                           split_sms_byte_ranges, xml_file_path)
+from etl.pipeline import (CHECKPOINT_RECORDS, backup_signature, content_hash, dead_letter_file_path,
+                          finish_snapshot, hash_file_path, json_file_path, load_hashes, load_state, prepare_output,
+                          rollback, save_checkpoint, save_state, seed_snapshot, state_file_path, store_batch,
+                          write_dead_letters)
+from etl.search_index import SearchIndexAppender, search_dir_path
+from etl.snapshot import snapshot_file_path
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+log_file_path = os.path.join(BASE_DIR, "../data/logs/etl.log")
+metrics_file_path = os.path.join(BASE_DIR, "../data/logs/etl_metrics.prom")
+profile_file_path = os.path.join(BASE_DIR, "../data/logs/etl_profile.folded")
+
+# Messages this much older than a source's watermark are parsed again on the
+# next run, in case the phone wrote a few of them slightly out of date order
+LOOKBACK_MS = 24 * 3600 * 1000
+
+SMS_DATE = re.compile(rb'\sdate="(\d+)"')
+
+RunResult = namedtuple('RunResult', 'source unchanged parsed new duplicates watermark seconds rejected resumed')
+
+logger = logging.getLogger('etl.run')
+
+
+def _element_date(data, start, end):
+    match = SMS_DATE.search(data, start, end)
+    return int(match.group(1)) if match else 0
+
+
+def seek_date(path, target):
+    """
+  Byte offset of the first <sms> element dated `target` or later in a
+  UTF-8 backup whose messages are in date order, found by bisecting the
+  file rather than parsing it. Returns None if every message is older.
+  """
+    ranges = split_sms_byte_ranges(path)
+    if not ranges:
+        return None
+    lo, end = ranges[0][0], ranges[-1][1]
+
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        hi = end
+        # lo always sits on an element start; hi is an element start or the end
+        while lo < hi:
+            match = SMS_TAG.search(data, (lo + hi) // 2, hi)
+            if match is None or match.start() == lo:
+                match = SMS_TAG.search(data, lo, hi)
+            following = SMS_TAG.search(data, match.end(), end)
+            stop = following.start() if following else end
+
+            if _element_date(data, match.start(), stop) >= target:
+                hi = match.start()
+            else:
+                lo = stop
+
+    return lo if lo < end else None
+
+
+def _newest_of_backup_set(sources, backup_set):
+    """
+  The state of the source of `backup_set` with the newest watermark, or
+  None: where a backup of the same set saved under another name, as a
+  phone does every day, picks up from
+  """
+    if backup_set is None:
+        return None
+    entries = [entry for entry in sources.values() if entry.get('backup_set') == backup_set]
+    return max(entries, key=lambda entry: entry['watermark'], default=None)
+
+
+def _batches(source, offset, size):
+    """
+  (offset to resume from, records, rejects) per `size` parsed messages or
+  so, from byte `offset` of a UTF-8 backup. Other backups cannot be cut at
+  a byte offset: they are parsed from the start and `offset` counts the
+  messages to skip, while a malformed element still ends the run.
+  """
+    if not is_utf8_backup(source):
+        records = iter_sms_records_parallel(source)
+        for _ in islice(records, offset):
+            pass
+        while True:
+            batch = list(islice(records, size))
+            if not batch:
+                return
+            offset += len(batch)
+            yield offset, batch, []
+
+    batch, rejected = [], []
+    for end, records, rejects in iter_sms_batches(source, offset):
+        batch.extend(records)
+        rejected.extend(rejects)
+        if len(batch) + len(rejected) >= size:
+            yield end, batch, rejected
+            batch, rejected = [], []
+    if batch or rejected:
+        yield end, batch, rejected
+
+
+def run(source=xml_file_path, output=json_file_path, state_path=state_file_path,
+        hashes_path=hash_file_path, columns_path=columns_dir_path, search_path=search_dir_path,
+        dashboard_path=dashboard_file_path, dead_letter_path=dead_letter_file_path, snapshot_path=snapshot_file_path,
+        full=False, lookback_ms=LOOKBACK_MS, checkpoint_records=CHECKPOINT_RECORDS):
+    """
+  Merge the messages of a backup that are not yet in the processed store.
+
+  Every source keeps a watermark in the state file: the newest message
+  date seen, with the backup_set id, size and mtime of the file. A source
+  that has not changed since the last run is skipped outright, and one at
+  a path not seen before starts from the newest watermark of its
+  backup_set, so renaming a backup does not make it new. Otherwise,
+  as each backup is a superset of the previous one and lists messages in
+  date order, only the messages from the watermark (less `lookback_ms`)
+  on are parsed; `full=True` parses the whole backup. Parsed messages
+  whose content hash is already in the hash set are dropped, and the rest
+  are appended to `output` and to the columnar copy at `columns_path`,
+  from which the dashboard at `dashboard_path` is then brought up to
+  date (see etl.columnar and etl.dashboard; None leaves either out). The
+  new records are also added to the full-text index at `search_path`
+  that the API searches (see etl.search_index; None leaves it out).
+  Once the run is done, the binary snapshot the API starts from is
+  brought up to date at `snapshot_path` (see etl.snapshot; None leaves it
+  out); it is not checkpointed, and a run that did not finish leaves one
+  that the API and the next run recognize as out of date.
+
+  Messages are stored in batches of about `checkpoint_records`. After each
+  batch the state file records a checkpoint: the byte offset reached, the
+  counts so far and the size of every output. A run that was killed is
+  rolled back to its last checkpoint by the next one, which carries on
+  from there if the source is unchanged. Elements that fail to parse go
+  to `dead_letter_path`, one JSON line each, instead of failing the run.
+  Returns a RunResult.
+  """
+    started = time.perf_counter()
+    stages_before = {name: (seconds, records) for name, seconds, records in metrics.stage_summary()}
+    key = os.path.abspath(source)
+    signature = backup_signature(source)
+    state = load_state(state_path)
+    previous = state['sources'].get(key)
+
+    checkpoint = state.pop('checkpoint', None)
+    rolled_back = bool(checkpoint) and os.path.exists(output) and \
+        rollback(checkpoint, output, hashes_path, columns_path, search_path, dead_letter_path)
+    if not rolled_back or checkpoint['source'] != key or \
+            any(checkpoint.get(name) != value for name, value in signature.items()):
+        checkpoint = None
+
+    if checkpoint is None and not full and previous and os.path.exists(output) and all(
+            previous.get(name) == value for name, value in signature.items()):
+        return RunResult(source, True, 0, 0, 0, previous['watermark'], time.perf_counter() - started, 0, False)
+
+    if prepare_output(state, output, hashes_path, columns_path, search_path, snapshot_path, rolled_back):
+        previous = None
+    elif previous is None:
+        previous = _newest_of_backup_set(state['sources'], signature['backup_set'])
+
+    resumed = checkpoint is not None
+    if not resumed:
+        offset = 0
+        if not full and previous and is_utf8_backup(source):
+            offset = seek_date(source, previous['watermark'] - lookback_ms)
+            if offset is None:
+                offset = os.path.getsize(source)
+        checkpoint = dict(signature, source=key, offset=offset, parsed=0, new=0, duplicates=0, rejected=0,
+                          watermark=previous['watermark'] if previous else 0)
+
+    # From the start, every stored hash is looked up; a tail, or what is left
+    # of a run, only looks up the hashes of each batch's messages
+    seen = load_hashes(hashes_path) if checkpoint['offset'] == 0 else None
+    appender = ColumnAppender(columns_path) if columns_path else None
+    searcher = SearchIndexAppender(search_path) if search_path else None
+    snapshotter = seed_snapshot(snapshot_path, output) if snapshot_path else None
+
+    def checkpoint_now():
+        save_checkpoint(state, state_path, checkpoint, output, hashes_path, appender, searcher, dead_letter_path)
+
+    try:
+        # Nothing is written before a checkpoint says where to roll back to
+        checkpoint_now()
+        with open(dead_letter_path, 'ab') as dead_letter:
+            for offset, records, rejects in _batches(source, checkpoint['offset'], checkpoint_records):
+                with metrics.stage('clean', len(records)):
+                    digests = [content_hash(record) for record in records]
+                    batch_seen = seen if seen is not None else load_hashes(hashes_path, set(digests))
+                    new_records = []
+                    new_hashes = []
+                    for record, digest in zip(records, digests):
+                        checkpoint['watermark'] = max(checkpoint['watermark'], int(record.get('date') or 0))
+                        if digest in batch_seen:
+                            checkpoint['duplicates'] += 1
+                            continue
+                        batch_seen.add(digest)
+                        new_records.append(record)
+                        new_hashes.append(digest)
+
+                with metrics.stage('load', len(new_records)):
+                    store_batch(output, new_records, new_hashes, hashes_path, appender, searcher, snapshotter)
+                    if rejects:
+                        write_dead_letters(dead_letter, source, rejects)
+                        logger.warning('%s: %d malformed messages sent to %s', source, len(rejects),
+                                       dead_letter_path)
+
+                checkpoint['parsed'] += len(records)
+                checkpoint['new'] += len(new_records)
+                checkpoint['rejected'] += len(rejects)
+                checkpoint['offset'] = offset
+                checkpoint_now()
+    except BaseException:
+        if snapshotter:
+            snapshotter.discard()
+        raise
+    finally:
+        if appender:
+            appender.close()
+
+    if columns_path and dashboard_path:
+        with metrics.stage('dashboard', checkpoint['new']):
+            update_dashboard(columns_path, dashboard_path)
+
+    if snapshotter:
+        with metrics.stage('snapshot', checkpoint['new']):
+            finish_snapshot(snapshotter, output)
+
+    watermark = checkpoint['watermark']
+    state['sources'][key] = dict(signature, watermark=watermark)
+    del state['checkpoint']
+    save_state(state, state_path)
+
+    result = RunResult(source, False, checkpoint['parsed'], checkpoint['new'], checkpoint['duplicates'], watermark,
+                       time.perf_counter() - started, checkpoint['rejected'], resumed)
+    logger.info('%s: parsed %d, added %d, %d already processed, %d malformed, watermark %d%s (%.2f s)',
+                source, result.parsed, result.new, result.duplicates, result.rejected, watermark,
+                ', resumed' if resumed else '', result.seconds)
+    if metrics.enabled:
+        stages = []
+        for name, seconds, records in metrics.stage_summary():
+            seconds_before, records_before = stages_before.get(name, (0, 0))
+            stages.append(f'{name} {seconds - seconds_before:.2f} s/{records - records_before} records')
+        logger.info('%s: stages: %s', source, ', '.join(stages))
+    return result
+
+
+# Example usage
+if __name__ == "__main__":
+    # python -m etl.run [backup.xml ...] [--full]
+    # Stage metrics go to metrics_file_path for a Prometheus textfile
+    # collector; `kill -USR2 <pid>` twice samples the run's stacks in between
+    # into profile_file_path
+    logging.basicConfig(filename=log_file_path, level=logging.INFO,
+                        format='%(asctime)s %(levelname)s %(name)s %(message)s')
+    metrics.install_profile_signal(profile_file_path)
+
+    args = [arg for arg in sys.argv[1:] if arg != '--full']
+    full_run = '--full' in sys.argv[1:]
+
+    for backup in args or [xml_file_path]:
+        try:
+            outcome = run(backup, full=full_run)
+        except FileNotFoundError:
+            print(f"Error: File not found at {backup}")
+            continue
+
+        if outcome.unchanged:
+            print(f"{backup}: unchanged since the last run, nothing to do")
+        else:
+            print(f"{backup}: {'resumed, ' if outcome.resumed else ''}parsed {outcome.parsed}, "
+                  f"added {outcome.new}, skipped {outcome.duplicates} already processed ({outcome.seconds:.2f} s)")
+            if outcome.rejected:
+                print(f"{backup}: {outcome.rejected} malformed messages written to {dead_letter_file_path}")
+
+    if metrics.enabled:
+        metrics.REGISTRY.write(metrics_file_path)
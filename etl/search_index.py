@@ -0,0 +1,546 @@
+import json
+import os
+import re
+import shutil
+import sys
+import uuid
+import zlib
+from collections import defaultdict
+from itertools import count
+
+import numpy as np
+
+from etl.columnar import read_meta, write_meta
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+json_file_path = os.path.join(BASE_DIR, "../data/processed/sms_records.json")
+search_dir_path = os.path.join(BASE_DIR, "../data/processed/sms_search")
+
+FORMAT_VERSION = 1
+
+# Words are runs of letters, digits and underscores, lower-cased, so
+# "Fee was: 100 RWF" gives fee, was, 100 and rwf, and "(*********013)" gives 013
+TOKEN = re.compile(r'\w+')
+# The same split for ASCII text, which str.translate and str.split do faster
+_ASCII_SEPARATORS = str.maketrans({chr(c): ' ' for c in range(128) if not (chr(c).isalnum() or chr(c) == '_')})
+
+# Counterparty words are indexed a second time under this prefix, which no
+# word can contain, so that searches can rank counterparty matches first
+COUNTERPARTY_PREFIX = 'c:'
+
+# Postings per block. A block is decoded on its own, so checking a few
+# rows against a long postings list only decodes the blocks they fall in
+BLOCK_SIZE = 128
+
+# Records per segment when a whole file is indexed
+SEGMENT_RECORDS = 100_000
+
+# Segments are not merged past this many postings, which bounds the memory
+# a merge takes; at about 40 words a message that is some 800k records
+MAX_MERGE_POSTINGS = 1 << 25
+
+# Rows per segment whose fingerprint is kept, to check that an index
+# still describes the records it is used with
+SAMPLES_PER_SEGMENT = 8
+
+INDEX_DTYPE = np.dtype('<i8')
+COUNT_DTYPE = np.dtype('<u4')
+ROW_DTYPE = np.dtype('<i8')
+
+# Byte widths a postings list's gaps can be stored in
+GAP_WIDTHS = (1, 2, 4, 8)
+
+# The arrays of a segment and their types; each is one file in the segment
+# directory. For term i of the sorted, UTF-8 encoded terms:
+#   terms[term_offsets[i]:term_offsets[i + 1]]   the term
+#   counts[i]                                    rows it occurs in
+#   block_firsts[first_block[i]:first_block[i + 1]]
+#                                                the first row of each block
+#   deltas[delta_offsets[i]:delta_offsets[i + 1]]
+#                                                the counts[i] - 1 gaps between
+#                                                consecutive rows, as widths[i]-byte
+#                                                little-endian ints
+SEGMENT_ARRAYS = {
+    'terms': np.uint8, 'term_offsets': INDEX_DTYPE, 'counts': COUNT_DTYPE, 'widths': np.uint8,
+    'first_block': INDEX_DTYPE, 'block_firsts': ROW_DTYPE, 'delta_offsets': INDEX_DTYPE, 'deltas': np.uint8,
+}
+
+
+def tokenize(text):
+    """
+  The words of a text as the index stores them
+  """
+    if not isinstance(text, str):
+        return []
+    text = text.lower()
+    if text.isascii():
+        return text.translate(_ASCII_SEPARATORS).split()
+    return TOKEN.findall(text)
+
+
+def record_terms(record):
+    """
+  The set of terms a record is indexed under: the words of its body and
+  counterparty, and the counterparty words again with COUNTERPARTY_PREFIX
+  """
+    terms = set(tokenize(record.get('body')))
+    words = tokenize(record.get('counterparty'))
+    if words:
+        terms.update(words)
+        terms.update([COUNTERPARTY_PREFIX + word for word in words])
+    return terms
+
+
+def record_fingerprint(record):
+    text = f"{record.get('date')}\x1f{record.get('body')}"
+    return zlib.crc32(text.encode('utf-8'))
+
+
+def _ranges(starts, lengths):
+    """
+  np.concatenate([np.arange(s, s + n) for s, n in zip(starts, lengths)]),
+  without the Python loop
+  """
+    starts = np.asarray(starts, np.int64)
+    lengths = np.asarray(lengths, np.int64)
+    keep = lengths > 0
+    starts, lengths = starts[keep], lengths[keep]
+    if not len(lengths):
+        return np.empty(0, np.int64)
+
+    ends = np.cumsum(lengths)
+    steps = np.ones(int(ends[-1]), np.int64)
+    steps[0] = starts[0]
+    steps[ends[:-1]] = starts[1:] - (starts[:-1] + lengths[:-1] - 1)
+    return np.cumsum(steps)
+
+
+def encode_postings(terms, counts, rows):
+    """
+  The arrays of a segment (see SEGMENT_ARRAYS) from sorted `terms`, the
+  number of rows each occurs in and `rows`, every term's rows in
+  increasing order, one term after the other
+  """
+    counts = np.asarray(counts, np.int64)
+    rows = np.asarray(rows, np.int64)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])) if len(counts) else counts
+
+    gap_counts = counts - 1
+    gaps = np.diff(rows)[_ranges(starts, gap_counts)]
+    gap_starts = np.concatenate(([0], np.cumsum(gap_counts)[:-1])) if len(counts) else counts
+    largest = np.zeros(len(counts), np.int64)
+    several = gap_counts > 0
+    if several.any():
+        largest[several] = np.maximum.reduceat(gaps, gap_starts[several])
+    widths = np.select([largest < 1 << 8, largest < 1 << 16, largest < 1 << 32], [1, 2, 4], 8).astype(np.uint8)
+
+    sizes = gap_counts * widths
+    delta_offsets = np.concatenate(([0], np.cumsum(sizes)))
+    deltas = np.empty(int(delta_offsets[-1]), np.uint8)
+    gap_widths = np.repeat(widths, gap_counts)
+    for width in GAP_WIDTHS:
+        chosen = widths == width
+        if not chosen.any():
+            continue
+        data = gaps[gap_widths == width].astype(f'<u{width}').view(np.uint8)
+        deltas[_ranges(delta_offsets[:-1][chosen], sizes[chosen])] = data
+
+    blocks = (counts + BLOCK_SIZE - 1) // BLOCK_SIZE
+    first_block = np.concatenate(([0], np.cumsum(blocks)))
+    block_firsts = rows[np.repeat(starts, blocks) + BLOCK_SIZE * _ranges(np.zeros_like(blocks), blocks)]
+
+    encoded = [term.encode('utf-8') for term in terms]
+    term_offsets = np.concatenate(([0], np.cumsum([len(term) for term in encoded], dtype=np.int64)))
+
+    return {
+        'terms': np.frombuffer(b''.join(encoded), np.uint8), 'term_offsets': term_offsets.astype(INDEX_DTYPE),
+        'counts': counts.astype(COUNT_DTYPE), 'widths': widths, 'first_block': first_block.astype(INDEX_DTYPE),
+        'block_firsts': block_firsts.astype(ROW_DTYPE), 'delta_offsets': delta_offsets.astype(INDEX_DTYPE),
+        'deltas': deltas,
+    }
+
+
+def _encode_occurrences(vocabulary, term_ids, rows):
+    """
+  The arrays of a segment from every occurrence of a term: its position in
+  `vocabulary` and its row, both as int64 arrays in increasing row order
+  """
+    order = sorted(range(len(vocabulary)), key=vocabulary.__getitem__)
+    rank = np.empty(len(vocabulary), np.int64)
+    rank[order] = np.arange(len(vocabulary))
+    term_ranks = rank[term_ids]
+    # Stable, so each term keeps its rows in increasing order
+    by_term = np.argsort(term_ranks, kind='stable')
+    counts = np.bincount(term_ranks, minlength=len(vocabulary))
+    return encode_postings([vocabulary[i] for i in order], counts, rows[by_term])
+
+
+class PostingsBuffer:
+    """
+  The postings of one segment while it is being built, held as the term
+  id and row of every occurrence so that adding a record runs in C loops
+  rather than appending to a list per term. Rows must be added in
+  increasing order.
+  """
+
+    def __init__(self):
+        self._ids = defaultdict(count().__next__)
+        self._term_ids = []
+        self._rows = []
+        self._lengths = []
+
+    def __len__(self):
+        return len(self._term_ids)
+
+    def add(self, row, terms):
+        self._term_ids.extend(map(self._ids.__getitem__, terms))
+        self._rows.append(row)
+        self._lengths.append(len(terms))
+
+    def arrays(self):
+        rows = np.repeat(np.array(self._rows, np.int64), self._lengths)
+        return _encode_occurrences(list(self._ids), np.array(self._term_ids, np.int64), rows)
+
+
+class Segment:
+    """
+  The postings of the rows [start, start + rows) of the records, from
+  arrays laid out as SEGMENT_ARRAYS describes: memory mapped from a
+  segment directory by open(), or built in memory. Read-only.
+  """
+
+    def __init__(self, start, rows, arrays, name=None, samples=()):
+        self.start = start
+        self.rows = rows
+        self.name = name
+        self.samples = [tuple(sample) for sample in samples]
+        for key in SEGMENT_ARRAYS:
+            setattr(self, key, arrays[key])
+        self.size = len(self.counts)
+
+    @classmethod
+    def open(cls, path, entry):
+        arrays = {}
+        for key, dtype in SEGMENT_ARRAYS.items():
+            file_name = os.path.join(path, entry['name'], key)
+            if os.path.getsize(file_name):
+                arrays[key] = np.memmap(file_name, dtype=dtype, mode='r')
+            else:
+                arrays[key] = np.empty(0, dtype)
+        return cls(entry['start'], entry['rows'], arrays, entry['name'], entry['samples'])
+
+    @property
+    def postings(self):
+        return int(self.counts.sum(dtype=np.int64))
+
+    def term(self, i):
+        return self.terms[self.term_offsets[i]:self.term_offsets[i + 1]].tobytes().decode('utf-8')
+
+    def find(self, term):
+        """
+      The position of `term` among the segment's terms, or None
+      """
+        key = term.encode('utf-8')
+        terms, offsets = self.terms, self.term_offsets
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if terms[offsets[mid]:offsets[mid + 1]].tobytes() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.size and terms[offsets[lo]:offsets[lo + 1]].tobytes() == key:
+            return lo
+        return None
+
+    def count(self, i):
+        return int(self.counts[i])
+
+    def block_starts(self, i):
+        """
+      The first row of every block of term i, in increasing order
+      """
+        return np.asarray(self.block_firsts[self.first_block[i]:self.first_block[i + 1]])
+
+    def _gaps(self, i, start, stop):
+        width = int(self.widths[i])
+        offset = int(self.delta_offsets[i])
+        return self.deltas[offset + start * width:offset + stop * width].view(f'<u{width}')
+
+    def decode(self, i):
+        """
+      Every row term i occurs in, as an increasing int64 array
+      """
+        count = int(self.counts[i])
+        rows = np.empty(count, np.int64)
+        rows[0] = self.block_firsts[self.first_block[i]]
+        np.cumsum(self._gaps(i, 0, count - 1), out=rows[1:])
+        rows[1:] += rows[0]
+        return rows
+
+    def decode_block(self, i, block):
+        """
+      The rows of one block of term i
+      """
+        start = block * BLOCK_SIZE
+        count = min(BLOCK_SIZE, int(self.counts[i]) - start)
+        rows = np.empty(count, np.int64)
+        rows[0] = self.block_firsts[self.first_block[i] + block]
+        np.cumsum(self._gaps(i, start, start + count - 1), out=rows[1:])
+        rows[1:] += rows[0]
+        return rows
+
+    def unpack(self):
+        """
+      (terms, counts, rows): the whole segment in the form encode_postings takes
+      """
+        counts = np.asarray(self.counts, np.int64)
+        total = int(counts.sum())
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1])) if len(counts) else counts
+        widths = np.asarray(self.widths)
+        delta_offsets = np.asarray(self.delta_offsets, np.int64)
+
+        # Each term's first row, then its gaps, summed per term
+        flat = np.empty(total, np.int64)
+        flat[starts] = np.asarray(self.block_firsts)[np.asarray(self.first_block[:-1])]
+        gap_counts = counts - 1
+        gap_positions = np.concatenate(([0], np.cumsum(gap_counts)[:-1])) if len(counts) else counts
+        gaps = np.empty(int(gap_counts.sum()), np.int64)
+        deltas = np.asarray(self.deltas)
+        for width in GAP_WIDTHS:
+            chosen = widths == width
+            if not chosen.any():
+                continue
+            data = deltas[_ranges(delta_offsets[:-1][chosen], gap_counts[chosen] * width)]
+            gaps[_ranges(gap_positions[chosen], gap_counts[chosen])] = data.view(f'<u{width}')
+        flat[_ranges(starts + 1, gap_counts)] = gaps
+
+        sums = np.cumsum(flat)
+        before = np.concatenate(([0], sums[starts[1:] - 1])) if len(counts) else counts
+        rows = sums - np.repeat(before, counts)
+
+        blob = np.asarray(self.terms).tobytes()
+        offsets = np.asarray(self.term_offsets).tolist()
+        terms = [blob[a:b].decode('utf-8') for a, b in zip(offsets, offsets[1:])]
+        return terms, counts, rows
+
+
+def merge_segments(segments):
+    """
+  The arrays of one segment holding the postings of `segments`, which
+  cover consecutive row ranges, in order
+  """
+    unpacked = [segment.unpack() for segment in segments]
+    vocabulary = sorted(set().union(*(terms for terms, _, _ in unpacked)))
+    position = {term: i for i, term in enumerate(vocabulary)}
+
+    term_ids = np.concatenate([np.repeat(np.fromiter((position[term] for term in terms), np.int64, len(terms)), counts)
+                               for terms, counts, _ in unpacked])
+    rows = np.concatenate([rows for _, _, rows in unpacked])
+    # Stable, so each term keeps the rows of earlier segments first
+    order = np.argsort(term_ids, kind='stable')
+    counts = np.bincount(term_ids, minlength=len(vocabulary))
+    return encode_postings(vocabulary, counts, rows[order])
+
+
+def cut_segment(segment, rows):
+    """
+  The arrays of `segment` without the postings of rows `rows` and up
+  """
+    terms, counts, flat = segment.unpack()
+    term_ids = np.repeat(np.arange(len(terms)), counts)
+    keep = flat < rows
+    counts = np.bincount(term_ids[keep], minlength=len(terms))
+    used = counts > 0
+    return encode_postings([term for term, use in zip(terms, used) if use], counts[used], flat[keep])
+
+
+def mergeable(older, newer):
+    """
+  Whether the last two segments, of `older` and `newer` postings, are to be merged
+  """
+    return older <= newer and older + newer <= MAX_MERGE_POSTINGS
+
+
+def _pick_samples(start, fingerprints):
+    if not fingerprints:
+        return []
+    step = max(1, len(fingerprints) // SAMPLES_PER_SEGMENT)
+    picks = sorted(set(range(0, len(fingerprints), step)) | {len(fingerprints) - 1})
+    return [[start + i, fingerprints[i]] for i in picks]
+
+
+def source_signature(path):
+    try:
+        stat = os.stat(path)
+    except (FileNotFoundError, TypeError):
+        return None
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _write_segment(path, arrays):
+    name = f'seg-{uuid.uuid4().hex[:12]}'
+    tmp_path = os.path.join(path, name + '.tmp')
+    os.makedirs(tmp_path)
+    for key, dtype in SEGMENT_ARRAYS.items():
+        with open(os.path.join(tmp_path, key), 'wb') as f:
+            np.asarray(arrays[key], dtype).tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+    os.rename(tmp_path, os.path.join(path, name))
+    return name
+
+
+def _remove_unlisted(path, meta):
+    """
+  Delete segment directories that meta.json does not list: left by a
+  merge or a write that did not finish, or replaced by one that did
+  """
+    listed = {entry['name'] for entry in meta['segments']}
+    for name in os.listdir(path):
+        if name.startswith('seg-') and name not in listed:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def read_search_meta(path=search_dir_path):
+    meta = read_meta(path)
+    if meta is not None and meta['format'] != FORMAT_VERSION:
+        raise ValueError(f"{path} has format {meta['format']}, expected {FORMAT_VERSION}")
+    return meta
+
+
+def open_segments(path=search_dir_path, meta=None):
+    """
+  The Segments of an index directory, in row order
+  """
+    meta = meta or read_search_meta(path)
+    return [Segment.open(path, entry) for entry in meta['segments']] if meta else []
+
+
+class SearchIndexAppender:
+    """
+  Appends records to the inverted index in a search directory, creating
+  it if needed.
+
+  Postings are gathered in memory and written as a new segment on
+  commit(); meta.json, which lists the segments, is replaced once the
+  segment is on disk. Like a binary counter, the last two segments are
+  merged whenever the newer one has at least as many postings as the
+  older, so a directory holds about log2(rows / batch) segments, plus one
+  per MAX_MERGE_POSTINGS postings beyond that.
+  """
+
+    def __init__(self, path=search_dir_path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.meta = read_search_meta(path) or {
+            'format': FORMAT_VERSION, 'id': uuid.uuid4().hex, 'rows': 0, 'segments': [], 'source': None,
+        }
+        _remove_unlisted(path, self.meta)
+        self.rows = self.meta['rows']
+        self._postings = PostingsBuffer()
+        self._fingerprints = []
+
+    def add(self, record):
+        self._postings.add(self.rows, record_terms(record))
+        self._fingerprints.append(record_fingerprint(record))
+        self.rows += 1
+
+    def commit(self, source=None):
+        """
+      Write the added records as a segment and record `source`, the
+      processed JSON file they were appended to, as the file the index
+      describes. Returns the committed row count.
+      """
+        segments = self.meta['segments']
+        start = self.meta['rows']
+        if self.rows > start:
+            name = _write_segment(self.path, self._postings.arrays())
+            segments.append({'name': name, 'start': start, 'rows': self.rows - start,
+                             'postings': len(self._postings),
+                             'samples': _pick_samples(start, self._fingerprints)})
+            self._postings = PostingsBuffer()
+            self._fingerprints = []
+
+            while len(segments) > 1 and mergeable(segments[-2]['postings'], segments[-1]['postings']):
+                older, newer = segments[-2], segments[-1]
+                arrays = merge_segments([Segment.open(self.path, older), Segment.open(self.path, newer)])
+                segments[-2:] = [{'name': _write_segment(self.path, arrays), 'start': older['start'],
+                                  'rows': older['rows'] + newer['rows'],
+                                  'postings': older['postings'] + newer['postings'],
+                                  'samples': older['samples'] + newer['samples']}]
+
+        self.meta['rows'] = self.rows
+        self.meta['source'] = source_signature(source)
+        write_meta(self.path, self.meta)
+        _remove_unlisted(self.path, self.meta)
+        return self.rows
+
+
+def truncate_search_index(path, rows):
+    """
+  Roll a search directory back to its first `rows` rows, as when a run
+  resumes from a checkpoint. Segments past `rows` are dropped and one
+  that straddles it is rewritten without the later rows.
+  """
+    meta = read_search_meta(path)
+    if meta is None or meta['rows'] <= rows:
+        return
+
+    kept = []
+    for entry in meta['segments']:
+        if entry['start'] >= rows:
+            continue
+        if entry['start'] + entry['rows'] > rows:
+            arrays = cut_segment(Segment.open(path, entry), rows)
+            entry = dict(entry, name=_write_segment(path, arrays), rows=rows - entry['start'],
+                         postings=int(arrays['counts'].sum(dtype=np.int64)),
+                         samples=[sample for sample in entry['samples'] if sample[0] < rows])
+        kept.append(entry)
+
+    meta['segments'] = kept
+    meta['rows'] = rows
+    meta['source'] = None
+    write_meta(path, meta)
+    _remove_unlisted(path, meta)
+
+
+def write_search_index(records, path=search_dir_path, source=None):
+    """
+  Index SMS records (any iterable, in file order) into a new search
+  directory, replacing any existing one only once the new one is
+  complete. Returns the number of records.
+  """
+    tmp_path = path + '.tmp'
+    old_path = path + '.old'
+    for leftover in (tmp_path, old_path):
+        shutil.rmtree(leftover, ignore_errors=True)
+
+    appender = SearchIndexAppender(tmp_path)
+    for record in records:
+        appender.add(record)
+        if appender.rows - appender.meta['rows'] >= SEGMENT_RECORDS:
+            appender.commit()
+    appender.commit(source)
+
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return appender.rows
+
+
+# Example usage
+if __name__ == "__main__":
+    # python -m etl.search_index [sms_records.json] [sms_search/] -- index a processed file from scratch
+    from etl.clean_normalize import compact_record
+
+    source = sys.argv[1] if len(sys.argv) > 1 else json_file_path
+    target = sys.argv[2] if len(sys.argv) > 2 else search_dir_path
+
+    try:
+        with open(source, 'r', encoding='utf-8') as f:
+            count = write_search_index(json.load(f, object_hook=compact_record), target, source)
+        print(f"Indexed {count} records from {source} in {target}")
+    except FileNotFoundError:
+        print(f"Error: File not found at {source}")
@@ -0,0 +1,497 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+import numpy as np
+
+from etl.block_tree import BlockTree
+from etl.clean_normalize import compact_record, record_dict
+from etl.record_keys import encode_transaction_date, record_date, record_time, record_value
+from etl.search_index import source_signature
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+json_file_path = os.path.join(BASE_DIR, "../data/processed/sms_records.json")
+snapshot_file_path = os.path.join(BASE_DIR, "../data/processed/sms_snapshot.bin")
+
+FORMAT_VERSION = 1
+
+# File layout:
+#   header    MAGIC, format version (HEADER)
+#   blob      every record as compact JSON, back to back, from BLOB_START
+#   sections  little-endian arrays, each starting on an ALIGN boundary
+#   toc       JSON: row count, source file, categories and, per section,
+#             its offset, dtype, shape and CRC-32
+#   trailer   toc offset, toc length, toc CRC-32, MAGIC (TRAILER)
+# The blob is checksummed per CHUNK_BYTES chunk (section records.crc), so a
+# record is checked when the chunk it is in is first read; every section
+# is checked as a whole when it is first used.
+MAGIC = b'MOMOSNAP'
+HEADER = struct.Struct('<8sI')
+TRAILER = struct.Struct('<QII8s')
+ALIGN = 64
+BLOB_START = ALIGN
+CHUNK_BYTES = 1 << 20
+
+# Missing dates in the int64 key columns
+NULL = np.iinfo(np.int64).min
+
+# Per-row keys the indexes are computed from; a snapshot built on top of
+# an older one reuses the older one's keys rather than its records
+KEY_COLUMNS = {
+    'id_hash': '<u8',           # id_hash(transaction_id), 0 without one
+    'transaction_type': '<i4',  # code into categories, -1 without one
+    'counterparty': '<i4',
+    'transaction_date': '<i8',  # encode_transaction_date, NULL without one
+    'date': '<i8',              # epoch milliseconds, NULL without one
+    'amount': '<f8',            # NaN without one
+    'balance': '<f8',
+}
+CATEGORY_FIELDS = ('transaction_type', 'counterparty')
+
+_encode_compact = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, default=record_dict).encode
+
+
+def id_hash(tx_id):
+    """
+  64-bit hash of a transaction_id, the same in every process and never 0
+  """
+    digest = hashlib.blake2b(str(tx_id).encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+
+def _groups(codes, count, *keys):
+    """
+  Rows grouped by code and, within a group, sorted by `keys` then row.
+  Returns (rows, bounds) where rows[bounds[c]:bounds[c + 1]] are those of
+  code c; rows with a negative code or a NULL key are left out.
+  """
+    mask = codes >= 0
+    for key in keys:
+        mask &= key != NULL
+    rows = np.flatnonzero(mask)
+    order = np.lexsort([rows] + [key[rows] for key in reversed(keys)] + [codes[rows]])
+    rows = rows[order]
+    bounds = np.searchsorted(codes[rows], np.arange(count + 1))
+    return rows, bounds.astype(np.int64)
+
+
+class Snapshot:
+    """
+  A snapshot file, memory-mapped. Arrays are read-only views of the file
+  rather than copies (an index that changes one copies it first), and
+  records are decoded only when they are read. Raises ValueError for a file that is not a snapshot, has
+  another format version or fails a checksum.
+  """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        size = len(self._map)
+        if size < HEADER.size + TRAILER.size:
+            raise ValueError(f'{path} is not a snapshot')
+
+        magic, version = HEADER.unpack_from(self._map, 0)
+        toc_offset, toc_length, toc_crc, end_magic = TRAILER.unpack_from(self._map, size - TRAILER.size)
+        if magic != MAGIC or end_magic != MAGIC:
+            raise ValueError(f'{path} is not a snapshot')
+        if version != FORMAT_VERSION:
+            raise ValueError(f'{path} has format {version}, expected {FORMAT_VERSION}')
+        toc = self._map[toc_offset:toc_offset + toc_length]
+        if zlib.crc32(toc) != toc_crc:
+            raise ValueError(f'{path}: table of contents fails its checksum')
+
+        self.meta = json.loads(toc)
+        self.rows = self.meta['rows']
+        self.source = self.meta['source']
+        self.categories = self.meta['categories']
+        self._arrays = {}
+        self._blob = memoryview(self._map)[BLOB_START:BLOB_START + self.meta['blob_bytes']]
+        self._offsets = None
+        self._crcs = None
+        self._checked = bytearray(-(-self.meta['blob_bytes'] // CHUNK_BYTES))
+
+    def has(self, name):
+        return name in self.meta['sections']
+
+    def array(self, name):
+        """
+      A section as a numpy array, checked against its CRC on first use
+      """
+        found = self._arrays.get(name)
+        if found is None:
+            section = self.meta['sections'][name]
+            start, length = section['offset'], section['length']
+            if zlib.crc32(memoryview(self._map)[start:start + length]) != section['crc32']:
+                raise ValueError(f'{self.path}: section {name} fails its checksum')
+            found = np.frombuffer(self._map, np.dtype(section['dtype']), int(np.prod(section['shape'])), start)
+            found = self._arrays[name] = found.reshape(section['shape'])
+        return found
+
+    def _check_chunks(self, start, end):
+        if self._crcs is None:
+            self._crcs = self.array('records.crc')
+        for chunk in range(start // CHUNK_BYTES, (end - 1) // CHUNK_BYTES + 1):
+            if not self._checked[chunk]:
+                data = self._blob[chunk * CHUNK_BYTES:(chunk + 1) * CHUNK_BYTES]
+                if zlib.crc32(data) != self._crcs[chunk]:
+                    raise ValueError(f'{self.path}: record chunk {chunk} fails its checksum')
+                self._checked[chunk] = 1
+
+    def record_bytes(self, row):
+        """
+      The compact JSON text of a row's record
+      """
+        if self._offsets is None:
+            self._offsets = self.array('records.offsets')
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        self._check_chunks(start, end)
+        return self._blob[start:end].tobytes()
+
+    def record(self, row):
+        """
+      The record of a row, decoded as the API's store decodes sms_records.json
+      """
+        if not 0 <= row < self.rows:
+            raise IndexError(row)
+        return json.loads(self.record_bytes(row), object_hook=compact_record)
+
+    def iter_records(self):
+        for row in range(self.rows):
+            yield json.loads(self.record_bytes(row), object_hook=compact_record)
+
+    def duplicates(self):
+        """
+      transaction_id -> later rows with it, for every id held by more than one
+      """
+        return {tx_id: rows for tx_id, rows in self.meta['duplicates']}
+
+    def find_id(self, tx_id):
+        """
+      The first row whose record has this transaction_id, or None
+      """
+        hashes = self.array('ids.hash')
+        target = np.uint64(id_hash(tx_id))
+        lo = int(np.searchsorted(hashes, target, 'left'))
+        hi = int(np.searchsorted(hashes, target, 'right'))
+        if lo == hi:
+            return None
+        # Rows sharing a hash are in file order; a different id with the same hash is skipped
+        for row in self.array('ids.row')[lo:hi]:
+            if self.record(int(row)).get('transaction_id') == tx_id:
+                return int(row)
+        return None
+
+    def verify(self):
+        """
+      Check every section and every record chunk now
+      """
+        for name in self.meta['sections']:
+            self.array(name)
+        if self.meta['blob_bytes']:
+            self._check_chunks(0, self.meta['blob_bytes'])
+
+
+def open_snapshot(path=snapshot_file_path, source=None):
+    """
+  The Snapshot at `path`, or None if there is none or, given `source`, if
+  it was not built from that version of the processed file
+  """
+    try:
+        snapshot = Snapshot(path)
+    except FileNotFoundError:
+        return None
+    if source is not None and snapshot.source != source_signature(source):
+        return None
+    return snapshot
+
+
+class SnapshotWriter:
+    """
+  Builds a snapshot file from records added one at a time, optionally on
+  top of `base`, an older Snapshot of the same processed file whose
+  records then come first.
+
+  Added records are written to a spool file as they come and only their
+  keys are held in memory (some 60 bytes a record). On commit() the new
+  file is written next to `path`: the base's record bytes are copied
+  rather than decoded, the indexes are computed from the keys of all rows
+  with numpy, and the file is moved into place once complete.
+  """
+
+    def __init__(self, path=snapshot_file_path, base=None):
+        self.path = path
+        self.base = base
+        self.categories = {field: list(base.categories[field]) if base else [] for field in CATEGORY_FIELDS}
+        self._codes = {field: {value: code for code, value in enumerate(values)}
+                       for field, values in self.categories.items()}
+        self._keys = {name: array(np.dtype(dtype).char) for name, dtype in KEY_COLUMNS.items()}
+        self._offsets = array('q', [0])
+        self._canonical_dates = base.meta['transaction_index'] if base else True
+        self._spool = open(path + '.spool', 'w+b')
+
+    @property
+    def added(self):
+        return len(self._offsets) - 1
+
+    def _code(self, field, value):
+        if not isinstance(value, str):
+            return -1
+        code = self._codes[field].get(value)
+        if code is None:
+            code = self._codes[field][value] = len(self.categories[field])
+            self.categories[field].append(value)
+        return code
+
+    def add(self, record):
+        data = _encode_compact(record).encode('utf-8')
+        self._spool.write(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+        keys = self._keys
+        tx_id = record.get('transaction_id')
+        keys['id_hash'].append(id_hash(tx_id) if tx_id is not None else 0)
+        for field in CATEGORY_FIELDS:
+            keys[field].append(self._code(field, record.get(field)))
+
+        transaction_date = record_date(record)
+        code = encode_transaction_date(transaction_date) if transaction_date is not None else None
+        if transaction_date is not None and code is None:
+            # The listing index cannot be stored for this file
+            self._canonical_dates = False
+        keys['transaction_date'].append(NULL if code is None else code)
+
+        date = record_time(record)
+        keys['date'].append(NULL if date is None else date)
+        keys['amount'].append(record_value(record, 'amount'))
+        keys['balance'].append(record_value(record, 'balance'))
+
+    def discard(self):
+        self._spool.close()
+        os.remove(self._spool.name)
+
+    def commit(self, source=None):
+        """
+      Write the snapshot, recording `source`, the processed JSON file the
+      records come from, as the file it describes. Returns the row count.
+      """
+        self._spool.flush()
+        base = self.base
+        base_rows = base.rows if base else 0
+        base_bytes = base.meta['blob_bytes'] if base else 0
+        rows = base_rows + self.added
+
+        keys = {}
+        for name, dtype in KEY_COLUMNS.items():
+            new = np.frombuffer(self._keys[name], dtype) if self.added else np.empty(0, dtype)
+            keys[name] = np.concatenate([base.array(f'keys.{name}'), new]) if base else new.copy()
+        offsets = np.concatenate([base.array('records.offsets')[:-1] if base else np.empty(0, np.int64),
+                                  np.frombuffer(self._offsets, np.int64) + base_bytes])
+
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w+b') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+            f.seek(BLOB_START)
+            crcs = self._write_blob(f, base, base_bytes)
+            blob_bytes = f.tell() - BLOB_START
+
+            sections = {}
+
+            def section(name, values):
+                values = np.ascontiguousarray(values)
+                start = -(-f.tell() // ALIGN) * ALIGN
+                f.write(bytes(start - f.tell()))
+                data = values.tobytes()
+                f.write(data)
+                sections[name] = {'offset': start, 'length': len(data), 'dtype': values.dtype.str,
+                                  'shape': list(values.shape), 'crc32': zlib.crc32(data)}
+
+            section('records.offsets', offsets)
+            section('records.crc', crcs)
+            for name, values in keys.items():
+                section(f'keys.{name}', values)
+
+            meta = {'format': FORMAT_VERSION, 'rows': rows, 'blob_bytes': blob_bytes,
+                    'source': source_signature(source), 'categories': self.categories,
+                    'transaction_index': self._canonical_dates}
+            meta['duplicates'] = self._write_ids(section, f, keys['id_hash'], offsets)
+            if self._canonical_dates:
+                self._write_transaction_index(section, keys, rows)
+            self._write_stats(section, keys)
+            meta['sections'] = sections
+
+            toc = json.dumps(meta, ensure_ascii=False).encode('utf-8')
+            toc_offset = f.seek(0, os.SEEK_END)
+            f.write(toc)
+            f.write(TRAILER.pack(toc_offset, len(toc), zlib.crc32(toc), MAGIC))
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_path, self.path)
+        self.discard()
+        return rows
+
+    def _write_blob(self, f, base, base_bytes):
+        """
+      Copy the base's records, then the spooled ones, into `f`; returns
+      the CRC-32 of every CHUNK_BYTES chunk of the result
+      """
+        crcs = array('I')
+        tail = b''
+        if base:
+            # Whole chunks keep the base's checksums; its last, partial
+            # chunk is checked again together with what follows it
+            whole = base_bytes // CHUNK_BYTES
+            crcs.extend(int(crc) for crc in base.array('records.crc')[:whole])
+            f.flush()
+            with open(base.path, 'rb') as source:
+                _copy(source.fileno(), BLOB_START, f.fileno(), BLOB_START, whole * CHUNK_BYTES)
+                tail = os.pread(source.fileno(), base_bytes - whole * CHUNK_BYTES,
+                                BLOB_START + whole * CHUNK_BYTES)
+            f.seek(BLOB_START + whole * CHUNK_BYTES)
+
+        self._spool.seek(0)
+        pending = tail
+        while True:
+            data = self._spool.read(CHUNK_BYTES - len(pending))
+            pending += data
+            if len(pending) == CHUNK_BYTES or (pending and not data):
+                crcs.append(zlib.crc32(pending))
+                f.write(pending)
+                pending = b''
+            if not data:
+                return np.frombuffer(crcs, np.uint32) if crcs else np.empty(0, np.uint32)
+
+    @staticmethod
+    def _write_ids(section, f, hashes, offsets):
+        """
+      Write the id lookup, (hash, row) sorted by hash then row, and return
+      [id, later rows] for every id held by more than one record
+      """
+        rows = np.flatnonzero(hashes)
+        rows = rows[np.argsort(hashes[rows], kind='stable')]
+        sorted_hashes = hashes[rows]
+        section('ids.hash', sorted_hashes)
+        section('ids.row', rows)
+
+        # Records sharing a hash almost always share the id; read the few
+        # candidates back from the blob to tell the two apart
+        f.flush()
+        same = np.flatnonzero(sorted_hashes[1:] == sorted_hashes[:-1])
+        duplicates = {}
+        for position in np.unique(np.concatenate([same, same + 1])):
+            row = int(rows[position])
+            start, end = int(offsets[row]), int(offsets[row + 1])
+            tx_id = json.loads(os.pread(f.fileno(), end - start, BLOB_START + start))['transaction_id']
+            duplicates.setdefault((type(tx_id), tx_id), []).append(row)
+        return [[tx_id, sorted(found)[1:]] for (_, tx_id), found in duplicates.items() if len(found) > 1]
+
+    def _write_transaction_index(self, section, keys, rows):
+        """
+      The buckets of api.indexes.TransactionIndex: records with a
+      transaction_date sorted by it, and per transaction_type and per
+      counterparty the rows in file order and sorted by that date
+      """
+        dates = keys['transaction_date']
+        dated = np.flatnonzero(dates != NULL)
+        dated = dated[np.argsort(dates[dated], kind='stable')]
+        section('tx.all.dates', dates[dated])
+        section('tx.all.seqs', dated)
+        for field in CATEGORY_FIELDS:
+            count = len(self.categories[field])
+            seqs, bounds = _groups(keys[field], count)
+            section(f'tx.{field}.seqs', seqs)
+            section(f'tx.{field}.bounds', bounds)
+            dated, dated_bounds = _groups(keys[field], count, dates)
+            section(f'tx.{field}.dates', dates[dated])
+            section(f'tx.{field}.dated_seqs', dated)
+            section(f'tx.{field}.dated_bounds', dated_bounds)
+
+    def _write_stats(self, section, keys):
+        """
+      The BlockTrees of api.stats.StatsIndex, one per transaction_type
+      """
+        count = len(self.categories['transaction_type'])
+        rows, bounds = _groups(keys['transaction_type'], count, keys['date'])
+        values = np.column_stack((keys['amount'][rows], keys['balance'][rows]))
+        trees, tree_bounds = [], [0]
+        for code in range(count):
+            lo, hi = bounds[code], bounds[code + 1]
+            tree = BlockTree(keys['date'][rows[lo:hi]], rows[lo:hi], values[lo:hi]).tree
+            trees.append(tree)
+            tree_bounds.append(tree_bounds[-1] + len(tree))
+        section('stats.dates', keys['date'][rows])
+        section('stats.seqs', rows)
+        section('stats.values', values.reshape(-1, 2))
+        section('stats.bounds', bounds)
+        section('stats.tree', np.concatenate(trees) if trees else np.empty((0, 9)))
+        section('stats.tree_bounds', np.array(tree_bounds, np.int64))
+
+
+def _copy(source, source_offset, target, target_offset, length):
+    """
+  Copy `length` bytes between two file descriptors at the given offsets,
+  in the kernel where it can
+  """
+    while length:
+        try:
+            copied = os.copy_file_range(source, target, length, source_offset, target_offset)
+        except (AttributeError, OSError):
+            copied = 0
+        if not copied:
+            data = os.pread(source, min(length, 16 * CHUNK_BYTES), source_offset)
+            if not data:
+                raise ValueError('snapshot ended before its records did')
+            copied = os.pwrite(target, data, target_offset)
+        source_offset += copied
+        target_offset += copied
+        length -= copied
+
+
+def write_snapshot(records, path=snapshot_file_path, source=None):
+    """
+  Write a snapshot of SMS records (any iterable, in file order) from
+  scratch, replacing any existing one once complete. Returns the number
+  of records.
+  """
+    writer = SnapshotWriter(path)
+    try:
+        for record in records:
+            writer.add(record)
+    except BaseException:
+        writer.discard()
+        raise
+    return writer.commit(source)
+
+
+# Example usage
+if __name__ == "__main__":
+    # python -m etl.snapshot [sms_records.json] [sms_snapshot.bin] -- snapshot a processed file from scratch
+    # python -m etl.snapshot --verify [sms_snapshot.bin] -- check every checksum of a snapshot
+    args = [arg for arg in sys.argv[1:] if arg != '--verify']
+
+    if '--verify' in sys.argv[1:]:
+        target = args[0] if args else snapshot_file_path
+        try:
+            Snapshot(target).verify()
+            print(f"{target}: every checksum matches")
+        except FileNotFoundError:
+            print(f"Error: File not found at {target}")
+        except ValueError as e:
+            print(f"Error: {e}")
+        sys.exit(0)
+
+    source = args[0] if args else json_file_path
+    target = args[1] if len(args) > 1 else snapshot_file_path
+
+    try:
+        with open(source, 'r', encoding='utf-8') as f:
+            count = write_snapshot(json.load(f, object_hook=compact_record), target, source)
+        print(f"Wrote a snapshot of {count} records from {source} to {target}")
+    except FileNotFoundError:
+        print(f"Error: File not found at {source}")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bytes, memory and time of the bulk GET /transactions response
+
+For each dataset size, reports:
+  - bytes on the wire for the old pretty-printed body, the compact
+    streamed body and the gzip-compressed streamed body
+  - peak memory allocated while encoding one response, old (json.dumps
+    of the whole list, then encoded to bytes) against streamed
+  - time to the last byte over HTTP, uncompressed and gzip, and for a
+    revalidation answered with 304 Not Modified
+
+Usage:
+    python -m scripts.bench_api_bulk [--sizes 10000 100000] [--requests 5]
+"""
+
+import argparse
+import base64
+import http.client
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+
+import api.app as app
+from scripts.bench_api_lookup import QuietHandler, make_dataset
+
+
+def peak_bytes(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def old_body(records):
+    return json.dumps(records, indent=2).encode("utf-8")
+
+
+def streamed_size(records, gzip=False):
+    """Bytes the streamed response body takes, produced piece by piece as the handler does"""
+    compressor = zlib.compressobj(app.GZIP_LEVEL, zlib.DEFLATED, 31) if gzip else None
+    size = 0
+    for piece in app.iter_json_array(records):
+        data = piece.encode("utf-8")
+        size += len(compressor.compress(data) if compressor else data)
+    if compressor:
+        size += len(compressor.flush())
+    return size
+
+
+def fetch_ms(port, auth, headers, requests):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    samples = []
+    status = None
+    for _ in range(requests):
+        start = time.perf_counter()
+        conn.request("GET", "/transactions", headers={**auth, **headers})
+        response = conn.getresponse()
+        response.read()
+        samples.append((time.perf_counter() - start) * 1000)
+        status = response.status
+    conn.close()
+    return statistics.median(samples), status, response.getheader("ETag")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--requests", type=int, default=5)
+    args = parser.parse_args()
+
+    auth = {"Authorization": "Basic " + base64.b64encode(b"bench@momo.rw:bench").decode()}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        user_path = os.path.join(tmp, "users.json")
+        with open(user_path, "w", encoding="utf-8") as f:
+            json.dump([{"email": "bench@momo.rw", "password": "bench"}], f)
+
+        for size in args.sizes:
+            data_path = make_dataset(tmp, size)
+            with open(data_path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+
+            old = len(old_body(records))
+            compact = streamed_size(records)
+            gzipped = streamed_size(records, gzip=True)
+            old_peak = peak_bytes(lambda: old_body(records))
+            new_peak = peak_bytes(lambda: streamed_size(records, gzip=True))
+
+            app.DATA_FILE = data_path
+            app.USER_FILE = user_path
+            httpd = app.PooledHTTPServer(("127.0.0.1", 0), QuietHandler)
+            threading.Thread(target=httpd.serve_forever, daemon=True).start()
+            port = httpd.server_address[1]
+
+            plain_ms, _, etag = fetch_ms(port, auth, {}, args.requests)
+            gzip_ms, _, _ = fetch_ms(port, auth, {"Accept-Encoding": "gzip"}, args.requests)
+            cached_ms, status, _ = fetch_ms(port, auth, {"If-None-Match": etag}, args.requests)
+            assert status == 304
+            httpd.shutdown()
+            httpd.server_close()
+
+            print(f"{size} records")
+            print(f"  bytes:      old {old / 1e6:8.2f} MB   compact {compact / 1e6:8.2f} MB   "
+                  f"gzip {gzipped / 1e6:8.2f} MB   ({old / gzipped:.1f}x smaller)")
+            print(f"  peak alloc: old {old_peak / 1e6:8.2f} MB   streamed {new_peak / 1e6:7.2f} MB")
+            print(f"  time:       plain {plain_ms:8.1f} ms   gzip {gzip_ms:8.1f} ms   304 {cached_ms:6.2f} ms")
+
+            os.remove(data_path)
+
+
+if __name__ == "__main__":
+    main()
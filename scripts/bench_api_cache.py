@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Benchmark: hot dashboard reads with and without the response cache
+
+Serves a synthetic sms_records.json through SMSHandler on a local port and
+replays a dashboard-like mix of reads over one keep-alive connection: the
+full listing, a few filtered pages, /stats and lookups of a small set of
+popular ids, with a write every --write-every reads. Reports requests per
+second and p50 / p99 latency with the cache off and on, and the cache's
+hit ratio.
+
+Usage:
+    python -m scripts.bench_api_cache [--size 10000] [--requests 3000] [--write-every 200]
+"""
+
+import argparse
+import base64
+import http.client
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import api.app as app
+from api.store import get_store
+from scripts.bench_api_lookup import make_dataset, percentile, serve
+
+POPULAR_IDS = 20
+
+
+def read_mix(ids, rng):
+    """Paths of a dashboard session: a few listings and stats, mostly popular lookups"""
+    paths = ["/transactions", "/transactions?limit=50", "/transactions?limit=50&transaction_type=sent",
+             "/transactions?transaction_type=received&limit=50", "/stats",
+             "/stats?transaction_type=sent&transaction_type=received"]
+    popular = rng.sample(ids, POPULAR_IDS)
+    while True:
+        if rng.random() < 0.4:
+            yield rng.choice(paths)
+        else:
+            yield f"/transaction/{rng.choice(popular)}"
+
+
+def replay(conn, auth, ids, requests, write_every, seed=5):
+    rng = random.Random(seed)
+    mix = read_mix(ids, rng)
+    samples = []
+    for number in range(requests):
+        if write_every and number % write_every == write_every - 1:
+            record = {"transaction_id": f"bench-{number}", "protocol": "0", "address": "M-Money",
+                      "date": "1706745600000", "type": "1", "body": "bench", "read": "1"}
+            conn.request("POST", "/transactions", body=json.dumps(record), headers=auth)
+            conn.getresponse().read()
+        path = next(mix)
+        start = time.perf_counter()
+        conn.request("GET", path, headers=auth)
+        response = conn.getresponse()
+        response.read()
+        samples.append((time.perf_counter() - start) * 1000)
+        assert response.status in (200, 404), path
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--write-every", type=int, default=200, help="reads between writes, 0 for none")
+    args = parser.parse_args()
+
+    auth = {"Authorization": "Basic " + base64.b64encode(b"bench@momo.rw:bench").decode(),
+            "Content-Type": "application/json"}
+    cache_bytes = app.RESPONSE_CACHE_BYTES
+
+    print(f"{args.size} records, {args.requests} reads, a write every {args.write_every}")
+    print(f"{'cache':>6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'hit ratio':>10}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        user_path = os.path.join(tmp, "users.json")
+        with open(user_path, "w", encoding="utf-8") as f:
+            json.dump([{"email": "bench@momo.rw", "password": "bench"}], f)
+
+        for enabled in (False, True):
+            data_path = make_dataset(tmp, args.size)
+            with open(data_path, "r", encoding="utf-8") as f:
+                ids = [r["transaction_id"] for r in json.load(f) if r.get("transaction_id")]
+
+            app.RESPONSE_CACHE_BYTES = cache_bytes if enabled else 0
+            httpd = serve(data_path, user_path)
+            conn = http.client.HTTPConnection("127.0.0.1", httpd.server_address[1])
+            start = time.perf_counter()
+            samples = replay(conn, auth, ids, args.requests, args.write_every)
+            seconds = time.perf_counter() - start
+            conn.close()
+            httpd.shutdown()
+            httpd.server_close()
+
+            ratio = get_store(data_path).index(app.response_cache).stats()["hit_ratio"] if enabled else 0.0
+            print(f"{'on' if enabled else 'off':>6} {len(samples) / seconds:>8.0f} {statistics.median(samples):>8.3f} "
+                  f"{percentile(samples, 99):>8.3f} {ratio:>10.2f}")
+            os.remove(data_path)
+
+
+if __name__ == "__main__":
+    main()
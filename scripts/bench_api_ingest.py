@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ingest throughput of POST /transactions/batch against POST /transactions
+
+Serves a synthetic sms_records.json through SMSHandler on a local port
+and pushes a partner feed of `--records` parsed messages into it:
+  - one POST /transactions per record, over a keep-alive connection
+    (only the first `--single` records, as this path is the slow one)
+  - POST /transactions/batch with NDJSON bodies of each `--batch-size`
+    lines, `--bad` percent of them broken, streamed from a generator
+
+Reports records accepted per second for each, and checks the batch
+responses list exactly the broken lines and the store holds the rest.
+
+Usage:
+    python -m scripts.bench_api_ingest [--size 10000] [--records 50000] [--single 5000] [--batch-size 1000 50000]
+"""
+
+import argparse
+import base64
+import http.client
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import api.app as app
+from api.store import get_store
+from etl.parse_xml import iter_sms_records
+from scripts.bench_api_lookup import QuietHandler, make_dataset
+from scripts.generate_backup import write_backup
+
+
+def make_feed(tmp, count):
+    xml_path = write_backup(os.path.join(tmp, "feed.xml"), count, seed=11)
+    records = list(iter_sms_records(xml_path))
+    os.remove(xml_path)
+    return records
+
+
+def ndjson_lines(records, bad_lines):
+    for i, record in enumerate(records):
+        if i in bad_lines:
+            # Alternate between a line that is not JSON and a record without a body
+            yield b"{not json\n" if i % 2 else json.dumps(dict(record, body=None)).encode("utf-8") + b"\n"
+        else:
+            yield json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def post_single(port, auth, records):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    start = time.perf_counter()
+    for record in records:
+        conn.request("POST", "/transactions", body=json.dumps(record), headers=auth)
+        response = conn.getresponse()
+        response.read()
+        assert response.status == 201, response.status
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+
+def post_batches(port, auth, records, batch_size, bad_lines):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    accepted = rejected = 0
+    elapsed = 0.0
+    for first in range(0, len(records), batch_size):
+        chunk = records[first:first + batch_size]
+        bad = {i - first for i in bad_lines if first <= i < first + batch_size}
+        body = b"".join(ndjson_lines(chunk, bad))
+
+        start = time.perf_counter()
+        # Sent in pieces, so the server reads the body as it arrives
+        conn.putrequest("POST", "/transactions/batch")
+        conn.putheader("Authorization", auth["Authorization"])
+        conn.putheader("Content-Type", "application/x-ndjson")
+        conn.putheader("Content-Length", str(len(body)))
+        conn.endheaders()
+        for offset in range(0, len(body), 64 * 1024):
+            conn.send(body[offset:offset + 64 * 1024])
+        response = conn.getresponse()
+        result = json.loads(response.read())
+        elapsed += time.perf_counter() - start
+
+        assert response.status == 200, result
+        assert [error["line"] - 1 for error in result["errors"]] == sorted(bad)[:app.MAX_BATCH_ERRORS], result
+        accepted += result["accepted"]
+        rejected += result["rejected"]
+    conn.close()
+    return elapsed, accepted, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=10_000, help="records already in the store")
+    parser.add_argument("--records", type=int, default=50_000)
+    parser.add_argument("--single", type=int, default=5_000)
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[1_000, 50_000])
+    parser.add_argument("--bad", type=float, default=1.0, help="percent of broken batch lines")
+    args = parser.parse_args()
+
+    auth = {"Authorization": "Basic " + base64.b64encode(b"bench@momo.rw:bench").decode()}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        user_path = os.path.join(tmp, "users.json")
+        with open(user_path, "w", encoding="utf-8") as f:
+            json.dump([{"email": "bench@momo.rw", "password": "bench"}], f)
+        app.USER_FILE = user_path
+
+        base_path = make_dataset(tmp, args.size)
+        feed = make_feed(tmp, args.records)
+        bad_lines = set(random.Random(3).sample(range(len(feed)), int(len(feed) * args.bad / 100)))
+
+        print(f"store: {args.size} records, feed: {len(feed)} records, {len(bad_lines)} broken batch lines")
+        print(f"{'endpoint':>28} {'records':>8} {'seconds':>8} {'records/s':>10}")
+
+        runs = [("single", None)] + [("batch", size) for size in args.batch_size]
+        for mode, batch_size in runs:
+            data_path = os.path.join(tmp, f"sms_records_{mode}_{batch_size}.json")
+            shutil.copyfile(base_path, data_path)
+            app.DATA_FILE = data_path
+            httpd = app.PooledHTTPServer(("127.0.0.1", 0), QuietHandler)
+            threading.Thread(target=httpd.serve_forever, daemon=True).start()
+            port = httpd.server_address[1]
+
+            if mode == "single":
+                records = feed[:args.single]
+                elapsed = post_single(port, auth, records)
+                accepted, name = len(records), "POST /transactions"
+            else:
+                elapsed, accepted, rejected = post_batches(port, auth, feed, batch_size, bad_lines)
+                assert rejected == len(bad_lines)
+                name = f"POST /transactions/batch ({batch_size})"
+
+            httpd.shutdown()
+            httpd.server_close()
+            store = get_store(data_path)
+            assert len(store.all()) == args.size + accepted
+            print(f"{name:>28} {accepted:>8} {elapsed:>8.2f} {accepted / elapsed:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark: GET /transaction/<id> latency against dataset size
+
+Serves a synthetic sms_records.json of each size through SMSHandler on a
+local port and reports p50 / p99 latency of id lookups. For comparison it
+also times the old per-request path in-process (json.load of the whole
+file followed by a linear scan for the id).
+
+Usage:
+    python -m scripts.bench_api_lookup [--sizes 1000 10000 100000] [--requests 2000]
+"""
+
+import argparse
+import base64
+import http.client
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from http.server import HTTPServer
+
+import api.app as app
+from etl.parse_xml import iter_sms_records, write_records_stream
+from scripts.generate_backup import write_backup
+
+
+class QuietHandler(app.SMSHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def make_dataset(tmp, size):
+    xml_path = write_backup(os.path.join(tmp, f"backup_{size}.xml"), size)
+    data_path = os.path.join(tmp, f"sms_records_{size}.json")
+    with open(data_path, "w", encoding="utf-8") as f:
+        write_records_stream(iter_sms_records(xml_path), f)
+    os.remove(xml_path)
+    return data_path
+
+
+def legacy_lookup(data_path, tx_id):
+    with open(data_path, "r", encoding="utf-8") as f:
+        sms_data = json.load(f)
+    return next((sms for sms in sms_data if sms.get("transaction_id") == tx_id), None)
+
+
+def serve(data_path, user_path):
+    app.DATA_FILE = data_path
+    app.USER_FILE = user_path
+    httpd = HTTPServer(("127.0.0.1", 0), QuietHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--legacy-requests", type=int, default=20)
+    args = parser.parse_args()
+
+    auth = {"Authorization": "Basic " + base64.b64encode(b"bench@momo.rw:bench").decode()}
+
+    print(f"{'records':>8} {'api p50 ms':>11} {'api p99 ms':>11} {'old p50 ms':>11} {'old p99 ms':>11}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        user_path = os.path.join(tmp, "users.json")
+        with open(user_path, "w", encoding="utf-8") as f:
+            json.dump([{"email": "bench@momo.rw", "password": "bench"}], f)
+
+        for size in args.sizes:
+            data_path = make_dataset(tmp, size)
+            with open(data_path, "r", encoding="utf-8") as f:
+                ids = [r["transaction_id"] for r in json.load(f) if r.get("transaction_id")]
+
+            httpd = serve(data_path, user_path)
+            conn_args = ("127.0.0.1", httpd.server_address[1])
+            samples = []
+            for tx_id in random.choices(ids, k=args.requests):
+                start = time.perf_counter()
+                conn = http.client.HTTPConnection(*conn_args)
+                conn.request("GET", f"/transaction/{tx_id}", headers=auth)
+                response = conn.getresponse()
+                response.read()
+                conn.close()
+                samples.append((time.perf_counter() - start) * 1000)
+                assert response.status == 200
+            httpd.shutdown()
+            httpd.server_close()
+
+            legacy = []
+            for tx_id in random.choices(ids, k=args.legacy_requests):
+                start = time.perf_counter()
+                legacy_lookup(data_path, tx_id)
+                legacy.append((time.perf_counter() - start) * 1000)
+
+            print(f"{size:>8} {statistics.median(samples):>11.3f} {percentile(samples, 99):>11.3f} "
+                  f"{statistics.median(legacy):>11.3f} {percentile(legacy, 99):>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark: paged, filtered GET /transactions queries against dataset size
+
+Runs the same filtered queries through the secondary indexes (what
+GET /transactions?... serves) and through a full scan of every record,
+reporting the median time per page for each dataset size. With the
+indexes the time should follow the page size, not the dataset size.
+
+Usage:
+    python -m scripts.bench_api_query [--sizes 10000 100000 1000000] [--limit 50]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from urllib.parse import parse_qs
+
+from api.indexes import TransactionIndex, _matches, parse_query
+from api.store import TransactionStore
+from scripts.bench_api_lookup import make_dataset
+
+QUERIES = {
+    "first page": "",
+    "one type": "transaction_type=deposit",
+    "type + dates": "transaction_type=debit&date_from=2024-06-01&date_to=2024-06-30",
+    "counterparty": "counterparty=Jane Smith",
+    "amount range": "transaction_type=credit&min_amount=5000&max_amount=20000",
+}
+
+
+def full_scan(records, query):
+    """Filter every record, then cut out the first page"""
+    date_from, date_to = query.get("date_from"), query.get("date_to")
+    matches = [r for r in records if _matches(r, query)
+               and (date_from is None or (r.get("transaction_date") or "") >= date_from)
+               and (date_to is None or (r.get("transaction_date") or "") <= date_to)]
+    if date_from or date_to:
+        matches.sort(key=lambda r: r["transaction_date"])
+    return matches[:query["limit"]]
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'records':>8} {'query':>14} {'index ms':>9} {'scan ms':>9}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            data_path = make_dataset(tmp, size)
+            store = TransactionStore(data_path)
+            records = store.all()
+
+            start = time.perf_counter()
+            index = store.index(TransactionIndex)
+            print(f"{size:>8} {'(build index)':>14} {(time.perf_counter() - start) * 1000:>9.1f}")
+
+            for name, qs in QUERIES.items():
+                query = parse_query(parse_qs(f"{qs}&limit={args.limit}"))
+                indexed = timed(lambda: store.query(index.page, query), args.repeat)
+                scan = timed(lambda: full_scan(records, query), max(3, args.repeat // 100))
+                print(f"{size:>8} {name:>14} {indexed:>9.3f} {scan:>9.1f}")
+
+            del store, index, records
+            os.remove(data_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark: authentication overhead per request
+
+Times the credential check a request pays, for users files of several
+sizes:
+  - old: re-read and parse users.json, then scan for a plaintext match
+  - cached: UserTable.verify_basic for a client it has verified before
+  - first: UserTable.verify_basic for a new client, paying the salted
+    password hash once
+
+Usage:
+    python -m scripts.bench_auth [--users 10 1000 10000] [--requests 5000]
+"""
+
+import argparse
+import base64
+import json
+import os
+import statistics
+import tempfile
+import time
+
+from api.auth import UserTable, hash_password
+
+
+def legacy_authenticate(user_file, credentials):
+    decoded = base64.b64decode(credentials).decode("utf-8")
+    email, password = decoded.split(":", 1)
+    with open(user_file, "r", encoding="utf-8") as f:
+        users = json.load(f)
+    for user in users:
+        if user.get("email") == email and user.get("password") == password:
+            return True
+    return False
+
+
+def per_call_us(func, calls):
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        assert func()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[10, 1_000, 10_000])
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    print(f"{'users':>7} {'old us':>9} {'cached us':>10} {'first us':>10}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain_path = os.path.join(tmp, "users_plain.json")
+        hashed_path = os.path.join(tmp, "users_hashed.json")
+        # Hashing every user is slow and beside the point: one real hash, shared
+        password_hash = hash_password("secret")
+
+        for count in args.users:
+            emails = [f"user{i}@momo.rw" for i in range(count)]
+            with open(plain_path, "w", encoding="utf-8") as f:
+                json.dump([{"email": e, "password": "secret"} for e in emails], f)
+            with open(hashed_path, "w", encoding="utf-8") as f:
+                json.dump([{"email": e, "password_hash": password_hash} for e in emails], f)
+
+            # The last user is the worst case for the old linear scan
+            credentials = base64.b64encode(f"{emails[-1]}:secret".encode()).decode()
+
+            old = per_call_us(lambda: legacy_authenticate(plain_path, credentials),
+                              max(10, args.requests // max(1, count // 100)))
+
+            table = UserTable(hashed_path)
+            table.verify_basic(credentials)
+            cached = per_call_us(lambda: table.verify_basic(credentials), args.requests)
+            first = per_call_us(lambda: UserTable(hashed_path).verify_basic(credentials), 5)
+
+            print(f"{count:>7} {old:>9.1f} {cached:>10.1f} {first:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark: message categorization throughput as the rule set grows
+
+Compares, in messages per second over synthetic bodies:
+  - the if/elif chain of parse_xml._transaction_type (five coarse types)
+  - the CATEGORY_RULES of etl/config.py evaluated one rule after another
+    (anchored re.match plus `in` checks), as an if/elif chain would grow
+  - etl.categorize.Categorizer over the same rules, without and with its
+    template cache
+Filler rules with made-up merchant keywords are put in front of the real
+ones to reach each `--rules` size. The chain and the categorizer are
+checked to agree on every body first.
+
+Usage:
+    python -m scripts.bench_categorize [--count 100000] [--rules 20 100 300 1000]
+"""
+
+import argparse
+import random
+import re
+import string
+import time
+from datetime import datetime
+
+from etl.categorize import Categorizer, message_template
+from etl.config import CATEGORY_RULES, DEFAULT_CATEGORY
+from etl.parse_xml import _transaction_type
+from scripts.generate_backup import _render_body
+
+
+def synthetic_bodies(count, seed=11):
+    rng = random.Random(seed)
+    when = datetime(2024, 5, 10, 16, 30)
+    return [_render_body(rng, when, 50_000)[0] for _ in range(count)]
+
+
+def filler_rules(count, seed=3):
+    rng = random.Random(seed)
+
+    def word():
+        return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9)))
+
+    return [(f"merchant_{i}", None, (f"to {word()} {word()} ltd",)) for i in range(count)]
+
+
+def anchor_pattern(anchor):
+    """The anchor as a regular expression: '#' is a run of digits in the template"""
+    return re.compile("#+".join(re.escape(part) for part in re.split("#+", anchor)))
+
+
+def make_chain(rules):
+    compiled = [(category, anchor_pattern(anchor) if anchor else None, keywords)
+                for category, anchor, keywords in rules]
+
+    def chain(body):
+        template = message_template(body)
+        lowered = template.lower()
+        for category, anchor, keywords in compiled:
+            if (anchor is None or anchor.match(template)) and all(k in lowered for k in keywords):
+                return category
+        return DEFAULT_CATEGORY
+
+    return chain
+
+
+def per_second(func, bodies):
+    start = time.perf_counter()
+    for body in bodies:
+        func(body)
+    return len(bodies) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--rules", type=int, nargs="+", default=[len(CATEGORY_RULES), 100, 300, 1000])
+    args = parser.parse_args()
+
+    bodies = synthetic_bodies(args.count)
+    current = per_second(lambda body: _transaction_type(body.lower()), bodies)
+    print(f"{args.count} messages; current 5-type chain: {current:,.0f} msg/s")
+    print(f"{'rules':>6} {'chain msg/s':>13} {'compiled':>13} {'+ cache':>13} {'templates':>10}")
+
+    for size in args.rules:
+        rules = filler_rules(max(0, size - len(CATEGORY_RULES))) + CATEGORY_RULES
+        chain = make_chain(rules)
+        uncached = Categorizer(rules, cache_size=0)
+        for body in bodies[:5000]:
+            assert chain(body) == uncached.categorize(body), body
+
+        cached = Categorizer(rules)
+        rates = [per_second(f, bodies) for f in (chain, uncached.categorize, cached.categorize)]
+        print(f"{len(rules):>6} " + " ".join(f"{rate:>13,.0f}" for rate in rates)
+              + f" {cached.cache_info().currsize:>10}")
+
+
+if __name__ == "__main__":
+    main()
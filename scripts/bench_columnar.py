@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Benchmark: columnar memory-mapped format against sms_records.json
+
+Writes `--rows` records (cycling a parsed synthetic backup) both as
+sms_records.json and as an etl.columnar directory, then reports:
+  - size on disk of each
+  - time to open: json.load of the whole file against ColumnarTable
+    reading meta.json and mapping the two columns the query needs
+  - a typical analytic, total amount per transaction_type within one
+    month, as a Python loop over the decoded records and as NumPy over
+    the mapped date, amount and transaction_type columns
+
+Usage:
+    python -m scripts.bench_columnar [--rows 1000000] [--base 50000]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from etl.columnar import NULL, ColumnarTable, write_columns
+from etl.parse_xml import iter_sms_records, write_records_stream
+from scripts.generate_backup import write_backup
+
+MONTH = (datetime(2024, 9, 1, tzinfo=timezone.utc), datetime(2024, 10, 1, tzinfo=timezone.utc))
+
+
+def iter_rows(base, count):
+    for i in range(count):
+        yield base[i % len(base)]
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def totals_from_records(records, start_ms, end_ms):
+    totals = {}
+    for record in records:
+        if start_ms <= int(record["date"]) < end_ms and record.get("amount") is not None:
+            tx_type = record["transaction_type"]
+            totals[tx_type] = totals.get(tx_type, 0) + int(record["amount"])
+    return totals
+
+
+def totals_from_columns(table, start_ms, end_ms):
+    date = table.column("date")
+    amount = table.column("amount")
+    codes = table.column("transaction_type")
+    mask = (date >= start_ms) & (date < end_ms) & (amount != NULL)
+    sums = np.bincount(codes[mask], weights=amount[mask], minlength=len(table.categories("transaction_type")))
+    return {name: int(total) for name, total in zip(table.categories("transaction_type"), sums) if total}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--base", type=int, default=50_000)
+    args = parser.parse_args()
+
+    start_ms, end_ms = (int(bound.timestamp() * 1000) for bound in MONTH)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = write_backup(os.path.join(tmp, "backup.xml"), args.base)
+        base = list(iter_sms_records(xml_path))
+
+        json_path = os.path.join(tmp, "sms_records.json")
+        columns_path = os.path.join(tmp, "sms_columns")
+        with open(json_path, "w", encoding="utf-8") as f:
+            write_records_stream(iter_rows(base, args.rows), f)
+        start = time.perf_counter()
+        write_columns(iter_rows(base, args.rows), columns_path)
+        write_seconds = time.perf_counter() - start
+        del base
+
+        print(f"{args.rows} records: json {os.path.getsize(json_path) / 1e6:.0f} MB, "
+              f"columns {dir_size(columns_path) / 1e6:.0f} MB (written in {write_seconds:.1f} s)")
+
+        start = time.perf_counter()
+        table = ColumnarTable(columns_path)
+        table.column("date"), table.column("amount"), table.column("transaction_type")
+        open_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        columns_totals = totals_from_columns(table, start_ms, end_ms)
+        columns_query_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with open(json_path, "r", encoding="utf-8") as f:
+            records = json.load(f)
+        json_open_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        json_totals = totals_from_records(records, start_ms, end_ms)
+        json_query_ms = (time.perf_counter() - start) * 1000
+
+        assert json_totals == columns_totals, (json_totals, columns_totals)
+        print(f"  {'':8} {'open ms':>10} {'query ms':>10}")
+        print(f"  {'json':8} {json_open_ms:>10.1f} {json_query_ms:>10.1f}")
+        print(f"  {'columns':8} {open_ms:>10.2f} {columns_query_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark: dashboard aggregation at 10M records
+
+Builds an etl.columnar directory of `--rows` records by cycling a parsed
+synthetic backup (about 17 years of messages at the default `--base`),
+then reports:
+  - a full etl.dashboard.update_dashboard run over every row
+  - an incremental run after appending `--new` percent more records
+  - for reference, the same aggregates as a Python loop over decoded
+    record dicts, timed on `--loop-rows` records and scaled up
+
+Usage:
+    python -m scripts.bench_dashboard [--rows 10000000] [--new 1] [--loop-rows 200000]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from etl.columnar import append_columns, record_fee, write_columns
+from etl.config import TIMEZONE_OFFSET_HOURS
+from etl.dashboard import update_dashboard
+from etl.parse_xml import iter_sms_records
+from scripts.generate_backup import write_backup
+
+
+def iter_rows(base, start, count):
+    for i in range(start, start + count):
+        yield base[i % len(base)]
+
+
+def loop_aggregate(records):
+    zone = timezone(timedelta(hours=TIMEZONE_OFFSET_HOURS))
+    periods, parties, balances = {}, {}, {}
+    for record in records:
+        when = datetime.fromtimestamp(int(record["date"]) / 1000, zone).date()
+        amount = int(record["amount"]) if record.get("amount") else 0
+        fee = record_fee(record) or 0
+        for period in (when, when - timedelta(days=when.weekday()), when.replace(day=1)):
+            totals = periods.setdefault((period, record["transaction_type"]), [0, 0, 0])
+            totals[0] += 1
+            totals[1] += amount
+            totals[2] += fee
+        if record.get("counterparty") is not None:
+            party = parties.setdefault(record["counterparty"], [0, 0])
+            party[0] += 1
+            party[1] += amount
+        if record.get("balance") is not None:
+            balances[when] = max(balances.get(when, (0, 0)), (int(record["date"]), int(record["balance"])))
+    return periods, parties, balances
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--base", type=int, default=50_000)
+    parser.add_argument("--new", type=float, default=1.0, help="percent of records appended")
+    parser.add_argument("--loop-rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = write_backup(os.path.join(tmp, "backup.xml"), args.base)
+        base = list(iter_sms_records(xml_path))
+        columns_path = os.path.join(tmp, "sms_columns")
+        dashboard_path = os.path.join(tmp, "dashboard.json")
+
+        start = time.perf_counter()
+        write_columns(iter_rows(base, 0, args.rows), columns_path)
+        print(f"{args.rows} records written as columns in {time.perf_counter() - start:.1f} s")
+
+        start = time.perf_counter()
+        update_dashboard(columns_path, dashboard_path)
+        full = time.perf_counter() - start
+
+        added = int(args.rows * args.new / 100)
+        append_columns(iter_rows(base, args.rows, added), columns_path)
+        start = time.perf_counter()
+        update_dashboard(columns_path, dashboard_path)
+        incremental = time.perf_counter() - start
+
+        sample = list(iter_rows(base, 0, args.loop_rows))
+        start = time.perf_counter()
+        loop_aggregate(sample)
+        loop = (time.perf_counter() - start) * args.rows / args.loop_rows
+
+        print(f"  full (numpy)         {full:8.2f} s   {args.rows / full / 1e6:6.1f} M records/s")
+        print(f"  +{args.new:g}% incremental     {incremental:8.2f} s   ({added} records)")
+        print(f"  python loop (scaled) {loop:8.2f} s   {args.rows / loop / 1e6:6.2f} M records/s")
+        print(f"  dashboard.json {os.path.getsize(dashboard_path) / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark: SQLite backend against the JSON store at 1M+ rows
+
+Builds `--rows` records by cycling a parsed synthetic backup (each copy
+gets its own transaction_id), then reports:
+  - bulk load rows/s through etl.load_db.load_records (batched
+    executemany, large transactions, indexes built at the end) against
+    row-at-a-time inserts committed one by one
+  - median latency of indexed queries on the SQLite store: lookup by id
+    and 50-record pages by type, type + month, and counterparty
+  - the same for the JSON path: the time to load sms_records.json into
+    TransactionStore and build its indexes, then the same queries
+
+Usage:
+    python -m scripts.bench_db [--rows 1000000] [--base 50000] [--skip-json]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from urllib.parse import parse_qs
+
+from api.db import SQLiteStore
+from api.indexes import parse_query
+from api.store import TransactionStore
+from etl.db_schema import INSERT_RECORD, connect, record_row
+from etl.load_db import load_records
+from etl.parse_xml import iter_sms_records, write_records_stream
+from scripts.generate_backup import write_backup
+
+QUERIES = {
+    "by type": "transaction_type=debit",
+    "type + month": "transaction_type=debit&date_from=2024-09-01&date_to=2024-09-30",
+    "counterparty": "counterparty=Jane Smith",
+}
+
+
+def iter_rows(base, count):
+    for i in range(count):
+        yield dict(base[i % len(base)], transaction_id=f"TX{i:09d}")
+
+
+def median_ms(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def report_queries(label, store, ids, repeat):
+    lookup = median_ms(lambda: store.get(random.choice(ids)), repeat)
+    print(f"  {label:<7} get by id {lookup:8.3f} ms", end="")
+    for name, qs in QUERIES.items():
+        query = parse_query(parse_qs(f"{qs}&limit=50"))
+        print(f"   {name} {median_ms(lambda: store.page(query), repeat):7.3f} ms", end="")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--base", type=int, default=50_000)
+    parser.add_argument("--single-rows", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=500)
+    parser.add_argument("--skip-json", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = write_backup(os.path.join(tmp, "backup.xml"), args.base)
+        base = list(iter_sms_records(xml_path))
+        ids = [f"TX{i:09d}" for i in random.sample(range(args.rows), 1000)]
+
+        single_path = os.path.join(tmp, "single.db")
+        conn = connect(single_path)
+        start = time.perf_counter()
+        for record in iter_rows(base, args.single_rows):
+            conn.execute("BEGIN")
+            conn.execute(INSERT_RECORD, record_row(record))
+            conn.execute("COMMIT")
+        single_rate = args.single_rows / (time.perf_counter() - start)
+        conn.close()
+
+        db_path = os.path.join(tmp, "momo.db")
+        start = time.perf_counter()
+        loaded = load_records(iter_rows(base, args.rows), db_path)
+        bulk_rate = loaded / (time.perf_counter() - start)
+
+        print(f"{args.rows} rows, {os.path.getsize(db_path) / 1e6:.0f} MB database")
+        print(f"  load    row at a time {single_rate:9.0f} rows/s   batched {bulk_rate:9.0f} rows/s "
+              f"({bulk_rate / single_rate:.0f}x)")
+        report_queries("sqlite", SQLiteStore(db_path), ids, args.repeat)
+
+        if args.skip_json:
+            return
+
+        json_path = os.path.join(tmp, "sms_records.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            write_records_stream(iter_rows(base, args.rows), f)
+        del base
+
+        start = time.perf_counter()
+        store = TransactionStore(json_path)
+        store.refresh()
+        store.page(parse_query({}))
+        print(f"  json    load + index build {time.perf_counter() - start:.1f} s")
+        report_queries("json", store, ids, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
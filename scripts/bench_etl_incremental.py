@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark: incremental ETL runs against full reprocessing
+
+Writes a synthetic backup of `--count` messages, then times etl.run.run
+on it:
+  - first: an empty store, so every message is parsed and written
+  - unchanged: the same backup again, skipped on its watermark
+  - +N%: the next backup, a superset holding `--new` percent more
+    messages, of which only the tail past the watermark is parsed
+  - full: the same superset with full=True, parsing every message and
+    dropping those already in the hash set, for comparison
+
+Usage:
+    python -m scripts.bench_etl_incremental [--count 1000000] [--new 1]
+"""
+
+import argparse
+import os
+import tempfile
+
+from etl.run import run
+from scripts.generate_backup import iter_sms_lines
+
+
+def write_prefix(path, lines, count):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        f.write(f'<smses count="{count}" backup_set="bench-{count}" type="full">\n')
+        f.writelines(lines[:count])
+        f.write("</smses>\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--new", type=float, default=1.0, help="percent of new messages")
+    args = parser.parse_args()
+
+    grown = args.count + int(args.count * args.new / 100)
+    lines = list(iter_sms_lines(grown))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "backup.xml")
+        paths = dict(output=os.path.join(tmp, "sms_records.json"),
+                     state_path=os.path.join(tmp, "etl_state.json"),
+                     hashes_path=os.path.join(tmp, "etl_hashes.bin"),
+                     columns_path=os.path.join(tmp, "sms_columns"),
+                     search_path=os.path.join(tmp, "sms_search"),
+                     dashboard_path=os.path.join(tmp, "dashboard.json"),
+                     snapshot_path=os.path.join(tmp, "sms_snapshot.bin"),
+                     dead_letter_path=os.path.join(tmp, "dead_letter"))
+
+        write_prefix(source, lines, args.count)
+        first = run(source, **paths)
+        unchanged = run(source, **paths)
+
+        write_prefix(source, lines, grown)
+        del lines
+        incremental = run(source, **paths)
+        full = run(source, full=True, **paths)
+
+        print(f"{args.count} messages, then {grown - args.count} new ({args.new:g}%)")
+        for label, result in (("first", first), ("unchanged", unchanged),
+                              (f"+{args.new:g}%", incremental), ("full", full)):
+            print(f"  {label:<10} {result.seconds:9.3f} s  parsed {result.parsed:>9}  "
+                  f"added {result.new:>9}  ({result.seconds / first.seconds * 100:6.2f}% of first)")
+
+
+if __name__ == "__main__":
+    main()
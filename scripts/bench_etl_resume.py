@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark: resuming a killed ETL run from its last checkpoint
+
+Writes a synthetic backup of `--count` messages, with `--malformed`
+broken <sms> elements spread through it, then:
+  - starts etl.run.run on it in a child process and SIGKILLs it once its
+    checkpoint has passed `--kill-at` percent of the file
+  - times the next run, which rolls the outputs back to the checkpoint
+    and parses only what is left
+  - times a clean run of the same backup into an empty store, for
+    comparison, and checks both stores hold the same records and search
+    index and send the same elements to the dead-letter file
+
+Usage:
+    python -m scripts.bench_etl_resume [--count 1000000] [--kill-at 90] [--malformed 10]
+"""
+
+import argparse
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from etl.run import CHECKPOINT_RECORDS, load_state, run
+from etl.search_index import merge_segments, open_segments
+from scripts.generate_backup import iter_sms_lines
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import sys, json
+from etl.run import run
+run(sys.argv[1], checkpoint_records=int(sys.argv[2]), **json.loads(sys.argv[3]))
+"""
+
+
+def write_backup_with_errors(path, count, malformed, seed=5):
+    lines = list(iter_sms_lines(count))
+    rng = random.Random(seed)
+    for i in rng.sample(range(count), malformed):
+        # An unescaped quote inside the body: the element is no longer well-formed
+        lines[i] = lines[i].replace(' body="', ' body="broken " quote ', 1)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        f.write(f'<smses count="{count}" backup_set="resume-{count}" type="full">\n')
+        f.writelines(lines)
+        f.write("</smses>\n")
+
+
+def store_paths(directory):
+    os.makedirs(directory)
+    return dict(output=os.path.join(directory, "sms_records.json"),
+                state_path=os.path.join(directory, "etl_state.json"),
+                hashes_path=os.path.join(directory, "etl_hashes.bin"),
+                columns_path=os.path.join(directory, "sms_columns"),
+                search_path=os.path.join(directory, "sms_search"),
+                dashboard_path=os.path.join(directory, "dashboard.json"),
+                snapshot_path=os.path.join(directory, "sms_snapshot.bin"),
+                dead_letter_path=os.path.join(directory, "dead_letter"))
+
+
+def kill_at(source, paths, checkpoint_records, percent):
+    target = os.path.getsize(source) * percent / 100
+    child = subprocess.Popen([sys.executable, "-c", CHILD, source, str(checkpoint_records), json.dumps(paths)],
+                             cwd=ROOT)
+    offset = 0
+    while child.poll() is None:
+        checkpoint = load_state(paths["state_path"]).get("checkpoint") if os.path.exists(paths["state_path"]) else None
+        offset = checkpoint["offset"] if checkpoint else 0
+        if offset >= target:
+            child.send_signal(signal.SIGKILL)
+            child.wait()
+            return offset
+        time.sleep(0.05)
+    raise RuntimeError(f"the run finished before reaching {percent}% (exit code {child.returncode})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=1_000_000)
+    parser.add_argument("--kill-at", type=float, default=90.0, help="percent of the backup")
+    parser.add_argument("--malformed", type=int, default=10)
+    parser.add_argument("--checkpoint", type=int, default=CHECKPOINT_RECORDS, help="messages per checkpoint")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, "backup.xml")
+        write_backup_with_errors(source, args.count, args.malformed)
+        killed = store_paths(os.path.join(tmp, "killed"))
+        clean = store_paths(os.path.join(tmp, "clean"))
+
+        offset = kill_at(source, killed, args.checkpoint, args.kill_at)
+        resumed = run(source, checkpoint_records=args.checkpoint, **killed)
+        reference = run(source, checkpoint_records=args.checkpoint, **clean)
+
+        with open(killed["output"], "rb") as a, open(clean["output"], "rb") as b:
+            assert a.read() == b.read(), "the resumed store differs from a clean run"
+        with open(killed["dead_letter_path"], "rb") as a, open(clean["dead_letter_path"], "rb") as b:
+            assert a.read() == b.read(), "the dead letters differ from a clean run"
+        killed_index = merge_segments(open_segments(killed["search_path"]))
+        clean_index = merge_segments(open_segments(clean["search_path"]))
+        assert all(np.array_equal(killed_index[name], clean_index[name]) for name in clean_index), \
+            "the resumed search index differs from a clean run"
+        assert resumed.resumed and resumed.rejected == reference.rejected == args.malformed
+
+        print(f"{args.count} messages, {args.malformed} malformed, checkpoint every {args.checkpoint}")
+        print(f"  killed at byte {offset} of {os.path.getsize(source)} "
+              f"({offset / os.path.getsize(source):.0%})")
+        print(f"  resume     {resumed.seconds:8.2f} s  ({resumed.seconds / reference.seconds:.1%} of a clean run)")
+        print(f"  clean run  {reference.seconds:8.2f} s  parsed {reference.parsed:>9}  added {reference.new:>9}")
+        print(f"  outputs and search indexes identical; {reference.rejected} elements in the dead-letter file")
+
+
+if __name__ == "__main__":
+    main()
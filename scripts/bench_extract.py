@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark: field extraction throughput for parse_transaction_details
+
+Measures messages per second for the original per-message regex cascade
+(kept below verbatim as the baseline) against the template-dispatched
+extractor in etl/parse_xml.py, on the sample backup and on synthetic
+bodies. Both implementations are checked to agree on every body first.
+
+Usage:
+    python -m scripts.bench_extract [--count 200000] [--repeat 3]
+"""
+
+import argparse
+import random
+import re
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+from etl.parse_xml import parse_transaction_details, xml_file_path
+from scripts.generate_backup import _render_body
+
+
+def legacy_parse_transaction_details(body):
+    details = {}
+
+    # Extract amount
+    amount_patterns = [
+        r'received (\d+) RWF',
+        r'payment of (\d+[,]?\d*) RWF',
+        r'deposit of (\d+[,]?\d*) RWF',
+        r'transferred to.*?(\d+[,]?\d*) RWF'
+    ]
+
+    for pattern in amount_patterns:
+        match = re.search(pattern, body)
+        if match:
+            details['amount'] = match.group(1).replace(',', '')
+            break
+
+    # Extract transaction type
+    if 'received' in body.lower():
+        details['transaction_type'] = 'credit'
+    elif 'payment' in body.lower() or 'transferred' in body.lower():
+        details['transaction_type'] = 'debit'
+    elif 'deposit' in body.lower():
+        details['transaction_type'] = 'deposit'
+    elif 'withdrawn' in body.lower():
+        details['transaction_type'] = 'withdrawal'
+    else:
+        details['transaction_type'] = 'other'
+
+    # Extract balance
+    balance_match = re.search(r'balance[:\s]*([\d,]+)', body, re.IGNORECASE)
+    if balance_match:
+        details['balance'] = balance_match.group(1).replace(',', '')
+
+    # Extract recipient/sender
+    recipient_patterns = [
+        r'to (.*?) \d',
+        r'from (.*?) \(',
+        r'received.*?from (.*?) \('
+    ]
+
+    for pattern in recipient_patterns:
+        match = re.search(pattern, body)
+        if match:
+            details['counterparty'] = match.group(1).strip()
+            break
+
+    # Extract transaction ID
+    tx_id_match = re.search(r'[Tt]x[Ii]d:?\s*(\d+)', body)
+    if tx_id_match:
+        details['transaction_id'] = tx_id_match.group(1)
+
+    # Extract date from body
+    date_match = re.search(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})', body)
+    if date_match:
+        details['transaction_date'] = date_match.group(1)
+
+    return details
+
+
+def throughput(func, bodies, repeat):
+    """Best-of-`repeat` messages per second"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for body in bodies:
+            func(body)
+        best = min(best, time.perf_counter() - start)
+    return len(bodies) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=200_000, help="synthetic bodies to generate")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    sample = [sms.get("body", "") for sms in ET.parse(xml_file_path).getroot().findall("sms")]
+
+    rng = random.Random(7)
+    balance = 0
+    synthetic = []
+    for _ in range(args.count):
+        body, balance = _render_body(rng, datetime(2024, 5, 10, 16, 30), balance)
+        synthetic.append(body)
+
+    print(f"{'corpus':>10} {'messages':>9} {'legacy msg/s':>14} {'engine msg/s':>14} {'speedup':>8}")
+
+    for name, bodies in (("sample", sample), ("synthetic", synthetic)):
+        mismatches = sum(legacy_parse_transaction_details(b) != parse_transaction_details(b) for b in bodies)
+        if mismatches:
+            raise SystemExit(f"{name}: {mismatches} bodies extract differently")
+
+        legacy = throughput(legacy_parse_transaction_details, bodies, args.repeat)
+        engine = throughput(parse_transaction_details, bodies, args.repeat)
+        print(f"{name:>10} {len(bodies):>9} {legacy:>14,.0f} {engine:>14,.0f} {engine / legacy:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark: merging many overlapping backups with etl.ingest
+
+Writes `--backups` synthetic backups, each a random window of
+`--window` messages out of `--messages`, as from many phones and
+reinstalls holding the same transactions. Then, each in a child process
+so that peak memory is its own:
+  - etl.ingest.ingest of the whole directory, once per `--workers` count
+  - etl.run.run of the backups one by one, as before, for comparison
+Reports the time, messages parsed per second, records kept and the peak
+resident memory of the main process.
+
+Usage:
+    python -m scripts.bench_ingest [--backups 100] [--messages 100000] [--window 10000] [--workers 1 4]
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+
+from scripts.generate_backup import iter_sms_lines
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import glob, json, resource, sys, time
+from etl.ingest import ingest
+from etl.run import run
+paths = json.loads(sys.argv[3])
+if sys.argv[1] == "ingest":
+    result = ingest(sys.argv[2], workers=int(sys.argv[4]), ingest_path=paths.pop("ingest_path"), **paths)
+    parsed, new, seconds = result.parsed, result.new, result.seconds
+else:
+    paths.pop("ingest_path")
+    results = [run(path, **paths) for path in sorted(glob.glob(sys.argv[2] + "/*.xml"))]
+    parsed, new, seconds = (sum(getattr(r, name) for r in results) for name in ("parsed", "new", "seconds"))
+print(json.dumps({"parsed": parsed, "new": new, "seconds": seconds,
+                  "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+
+def write_backups(directory, backups, messages, window, seed=3):
+    lines = list(iter_sms_lines(messages))
+    rng = random.Random(seed)
+    for number in range(backups):
+        start = rng.randrange(max(messages - window, 0) + 1)
+        with open(os.path.join(directory, f"backup_{number:03d}.xml"), "w", encoding="utf-8") as f:
+            f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+            f.write(f'<smses count="{window}" backup_set="bench-{number}" type="full">\n')
+            f.writelines(lines[start:start + window])
+            f.write("</smses>\n")
+
+
+def store_paths(directory):
+    os.makedirs(directory)
+    return dict(output=os.path.join(directory, "sms_records.json"),
+                state_path=os.path.join(directory, "etl_state.json"),
+                hashes_path=os.path.join(directory, "etl_hashes.bin"),
+                columns_path=os.path.join(directory, "sms_columns"),
+                search_path=os.path.join(directory, "sms_search"),
+                dashboard_path=os.path.join(directory, "dashboard.json"),
+                snapshot_path=os.path.join(directory, "sms_snapshot.bin"),
+                dead_letter_path=os.path.join(directory, "dead_letter"),
+                ingest_path=os.path.join(directory, "etl_ingest"))
+
+
+def measure(mode, backups, paths, workers=1):
+    output = subprocess.run([sys.executable, "-c", CHILD, mode, backups, json.dumps(paths), str(workers)],
+                            cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backups", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=100_000, help="distinct messages across all backups")
+    parser.add_argument("--window", type=int, default=10_000, help="messages per backup")
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({1, os.cpu_count() or 1}))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backups = os.path.join(tmp, "backups")
+        os.makedirs(backups)
+        write_backups(backups, args.backups, args.messages, args.window)
+
+        runs = [(f"ingest, {workers} workers", measure("ingest", backups, store_paths(os.path.join(tmp, f"w{workers}")),
+                                                      workers)) for workers in args.workers]
+        runs.append(("etl.run one by one", measure("run", backups, store_paths(os.path.join(tmp, "serial")))))
+
+        print(f"{args.backups} backups of {args.window} messages out of {args.messages} ({os.cpu_count()} cores)")
+        for label, result in runs:
+            print(f"  {label:<20} {result['seconds']:8.2f} s  {result['parsed'] / result['seconds']:>9.0f} msg/s  "
+                  f"kept {result['new']:>8}  peak {result['rss_mb']:7.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
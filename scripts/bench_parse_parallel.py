@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Benchmark: parallel byte-range parsing of one backup
+
+Parses a synthetic backup with the serial streaming parser and with
+iter_sms_records_parallel at several worker counts, reporting wall time,
+messages per second and speedup over serial. Scaling is bounded by the
+number of cores on the machine running it.
+
+Usage:
+    python -m scripts.bench_parse_parallel [--count 2000000] [--workers 1 2 4 8]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from etl.parse_xml import iter_sms_records, iter_sms_records_parallel
+from scripts.generate_backup import write_backup
+
+
+def timed(records):
+    start = time.perf_counter()
+    count = sum(1 for _ in records)
+    return count, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=2_000_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, 8, 16])
+    args = parser.parse_args()
+
+    print(f"cores available: {os.cpu_count()}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = write_backup(os.path.join(tmp, "backup.xml"), args.count)
+        print(f"backup: {args.count} messages, {os.path.getsize(xml_path) / 1e6:.1f} MB\n")
+        print(f"{'workers':>8} {'seconds':>9} {'msg/s':>10} {'speedup':>8}")
+
+        count, serial = timed(iter_sms_records(xml_path))
+        print(f"{'serial':>8} {serial:>9.2f} {count / serial:>10.0f} {1:>7.2f}x")
+
+        for workers in args.workers:
+            count, seconds = timed(iter_sms_records_parallel(xml_path, workers=workers, min_size=0))
+            print(f"{workers:>8} {seconds:>9.2f} {count / seconds:>10.0f} {serial / seconds:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
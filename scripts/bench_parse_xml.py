@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark: whole-document vs streaming XML parsing
+
+Compares the original path (read the file, ET.fromstring, build a list,
+json.dump it) against iter_sms_records + write_records_stream on synthetic
+backups. Every measurement runs in a fresh subprocess so the reported peak
+RSS belongs to that run alone.
+
+Usage:
+    python -m scripts.bench_parse_xml [--sizes 10000 1000000 10000000] [--legacy-max 1000000]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from scripts.generate_backup import write_backup
+
+
+def run_legacy(xml_path, out_path):
+    from etl.parse_xml import parse_sms_xml_to_json
+
+    with open(xml_path, "r", encoding="utf-8") as f:
+        records = parse_sms_xml_to_json(f.read())
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(records, f, indent=2, ensure_ascii=False)
+    return len(records)
+
+
+def run_stream(xml_path, out_path, ndjson=False):
+    from etl.parse_xml import iter_sms_records, write_records_stream
+
+    with open(out_path, "w", encoding="utf-8") as f:
+        return write_records_stream(iter_sms_records(xml_path), f, ndjson=ndjson)
+
+
+MODES = {
+    "legacy": run_legacy,
+    "stream": run_stream,
+    "stream-ndjson": lambda xml_path, out_path: run_stream(xml_path, out_path, ndjson=True),
+}
+
+
+def measure(mode, xml_path, out_path):
+    """Run one mode in a subprocess; returns (seconds, peak RSS in MB, records)"""
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "scripts.bench_parse_xml", "--worker", mode, xml_path, out_path],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    elapsed = time.perf_counter() - start
+    result = json.loads(output)
+    return elapsed, result["peak_rss_mb"], result["records"]
+
+
+def worker(mode, xml_path, out_path):
+    count = MODES[mode](xml_path, out_path)
+    # ru_maxrss is reported in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"records": count, "peak_rss_mb": round(peak, 1)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    parser.add_argument("--legacy-max", type=int, default=1_000_000,
+                        help="skip the whole-document parser above this many messages")
+    parser.add_argument("--worker", nargs=3, metavar=("MODE", "XML", "OUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(*args.worker)
+        return
+
+    print(f"{'messages':>10} {'mode':>14} {'file MB':>9} {'seconds':>9} {'msg/s':>10} {'peak RSS MB':>12}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            xml_path = write_backup(os.path.join(tmp, f"backup_{size}.xml"), size)
+            out_path = os.path.join(tmp, "out.json")
+            file_mb = os.path.getsize(xml_path) / 1e6
+
+            for mode in MODES:
+                if mode == "legacy" and size > args.legacy_max:
+                    print(f"{size:>10} {mode:>14} {file_mb:>9.1f} {'skipped':>9}")
+                    continue
+                seconds, peak, count = measure(mode, xml_path, out_path)
+                print(f"{size:>10} {mode:>14} {file_mb:>9.1f} {seconds:>9.2f} "
+                      f"{count / seconds:>10.0f} {peak:>12.1f}")
+
+            os.remove(xml_path)
+
+
+if __name__ == "__main__":
+    main()
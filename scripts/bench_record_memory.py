@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark: memory per record, dicts against etl.clean_normalize.SmsRecord
+
+Writes a synthetic backup of `--count` messages as sms_records.json, then
+reports the bytes per record traced by tracemalloc for:
+  - json.load of the file into plain dicts (before)
+  - json.load with compact_record as object_hook (after)
+  - the resident records of an api.store.TransactionStore on the file,
+    including its transaction_id index
+and the time each load takes without tracing.
+
+Usage:
+    python -m scripts.bench_record_memory [--count 200000]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from api.journal import Journal
+from api.store import TransactionStore
+from etl.clean_normalize import compact_record, memory_per_record
+from etl.parse_xml import iter_sms_records_parallel, write_records_stream
+from scripts.generate_backup import write_backup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--count", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = write_backup(os.path.join(tmp, "backup.xml"), args.count)
+        json_path = os.path.join(tmp, "sms_records.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            write_records_stream(iter_sms_records_parallel(xml_path), f)
+
+        def load_dicts():
+            with open(json_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+
+        def load_compact():
+            with open(json_path, "r", encoding="utf-8") as f:
+                return json.load(f, object_hook=compact_record)
+
+        stores = []
+
+        def load_store():
+            # Kept alive, so the id index is counted along with the records
+            store = TransactionStore(json_path, journal=Journal(os.path.join(tmp, "journal")))
+            store.refresh()
+            stores.append(store)
+            return store.all()
+
+        print(f"{args.count} records, {os.path.getsize(json_path) / 1e6:.0f} MB of JSON")
+        for label, load in (("dict", load_dicts), ("SmsRecord", load_compact), ("store (SmsRecord)", load_store)):
+            start = time.perf_counter()
+            load()
+            seconds = time.perf_counter() - start
+            print(f"  {label:<18} {memory_per_record(load):8.0f} bytes/record   load {seconds:6.2f} s")
+            stores.clear()
+
+
+if __name__ == "__main__":
+    main()
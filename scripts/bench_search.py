@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark: full-text GET /transactions/search queries against dataset size
+
+For each dataset size, builds the inverted index the ETL keeps next to
+sms_records.json (etl.search_index), loads a TransactionStore on top of
+it and reports, per query, the median time for the first page and for a
+page deep into the results, next to a scan that tokenizes every record.
+It then adds and updates records through the store, as the API does,
+and times the same searches again against the in-memory overlay.
+
+Usage:
+    python -m scripts.bench_search [--sizes 100000 1000000] [--limit 50] [--repeat 50]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from urllib.parse import parse_qs
+
+from api.search import parse_search_query
+from api.store import TransactionStore
+from etl.clean_normalize import compact_record
+from etl.search_index import record_terms, write_search_index
+from scripts.bench_api_lookup import make_dataset
+
+QUERIES = {
+    "one common word": "balance",
+    "two words": "payment completed",
+    "counterparty": "linda green",
+    "rare word": "airtime",
+    "words + name": "transferred fee jane",
+    "no match": "linda airtime",
+}
+
+# Pages followed before the "deep page" timing
+DEEP_PAGES = 20
+
+
+def full_scan(records, query):
+    """Check every record's words, rank, then cut out the first page"""
+    terms = query["terms"]
+    matches = []
+    for seq, record in records.items():
+        words = record_terms(record)
+        if all(term in words for term in terms):
+            matches.append((-sum(f"c:{term}" in words for term in terms), -seq))
+    matches.sort()
+    return matches[:query["limit"]]
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def deep_query(store, query):
+    """The query for page DEEP_PAGES + 1 of the results, or the last page"""
+    for _ in range(DEEP_PAGES):
+        cursor = store.search(query)["next_cursor"]
+        if cursor is None:
+            break
+        query = dict(query, cursor=parse_search_query({"q": ["x"], "cursor": [cursor]})["cursor"])
+    return query
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--writes", type=int, default=1000, help="records added and updated through the store")
+    args = parser.parse_args()
+
+    print(f"{'records':>8} {'query':>21} {'page 1 ms':>10} {'deep ms':>8} {'writes ms':>10} {'scan ms':>9}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            data_path = make_dataset(tmp, size)
+            search_path = os.path.join(tmp, f"sms_search_{size}")
+
+            start = time.perf_counter()
+            with open(data_path, "r", encoding="utf-8") as f:
+                write_search_index(json.load(f, object_hook=compact_record), search_path, data_path)
+            print(f"{size:>8} {'(build index)':>21} {(time.perf_counter() - start) * 1000:>10.0f}")
+
+            store = TransactionStore(data_path, search_path=search_path)
+            start = time.perf_counter()
+            store.refresh()
+            print(f"{size:>8} {'(load store)':>21} {(time.perf_counter() - start) * 1000:>10.0f}")
+
+            queries = {name: parse_search_query(parse_qs(f"q={q}&limit={args.limit}"))
+                       for name, q in QUERIES.items()}
+            first = {name: timed(lambda: store.search(query), args.repeat) for name, query in queries.items()}
+            deep_queries = {name: deep_query(store, query) for name, query in queries.items()}
+            deep = {name: timed(lambda: store.search(query), args.repeat) for name, query in deep_queries.items()}
+            scans = {name: timed(lambda: store.query(full_scan, query), 1) for name, query in queries.items()}
+
+            records = store.all()
+            for i in range(args.writes):
+                store.add(dict(records[i], transaction_id=f"bench-{i}"))
+                tx_id = records[-1 - i].get("transaction_id")
+                if tx_id:
+                    store.update(tx_id, {"body": records[-1 - i]["body"] + " updated"})
+            written = {name: timed(lambda: store.search(query), args.repeat) for name, query in queries.items()}
+
+            for name in QUERIES:
+                print(f"{size:>8} {name:>21} {first[name]:>10.3f} {deep[name]:>8.3f} "
+                      f"{written[name]:>10.3f} {scans[name]:>9.0f}")
+
+            del store, records
+            for path in (data_path, data_path + ".journal"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
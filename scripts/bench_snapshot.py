@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark: API cold start from the binary snapshot against the JSON file
+
+For each dataset size, writes sms_records.json and its snapshot (both
+streamed, by cycling a parsed synthetic backup with fresh ids and dates),
+then times a new TransactionStore from nothing to its first answers:
+loading the data, the first lookup by id, the first /stats and the first
+pages of a listing, as a freshly started API would serve them. Up to
+--json-max records the same is timed with the snapshot ignored, which
+is how the store started before.
+
+Usage:
+    python -m scripts.bench_snapshot [--sizes 1000000 10000000] [--json-max 1000000]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from api.store import TransactionStore
+from etl.parse_xml import iter_sms_records, write_records_stream
+from etl.snapshot import write_snapshot
+from scripts.bench_api_lookup import write_backup
+
+PATTERN_RECORDS = 100_000
+DAY_MS = 86_400_000
+
+
+def generate(pattern, size):
+    """`size` records cycling through `pattern`, each cycle with new ids and a day later"""
+    for i in range(size):
+        cycle, record = divmod(i, len(pattern))
+        record = dict(pattern[record])
+        if record.get("transaction_id") is not None:
+            record["transaction_id"] = f"{record['transaction_id']}-{cycle}"
+        if record.get("date"):
+            record["date"] = str(int(record["date"]) + cycle * DAY_MS)
+        yield record
+
+
+def cold_start(data_path, snapshot_path, tx_id):
+    """Seconds to load, then to each first answer, of a new store"""
+    timings = []
+    store = TransactionStore(data_path, search_path=data_path + ".no_search", snapshot_path=snapshot_path)
+    start = time.perf_counter()
+    for step in (store.refresh, lambda: store.get(tx_id), lambda: store.stats({}),
+                 lambda: store.page({"limit": 50}), lambda: store.page({"limit": 50, "transaction_type": "sent"})):
+        step()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000_000])
+    parser.add_argument("--json-max", type=int, default=1_000_000, help="largest size also loaded from JSON")
+    args = parser.parse_args()
+
+    print(f"{'records':>9} {'from':>8} {'load s':>7} {'get s':>7} {'stats s':>8} {'page s':>7} "
+          f"{'type page s':>12} {'write s':>8} {'MB':>7}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backup = write_backup(os.path.join(tmp, "backup.xml"), PATTERN_RECORDS)
+        pattern = [dict(record) for record in iter_sms_records(backup)]
+        os.remove(backup)
+
+        for size in args.sizes:
+            data_path = os.path.join(tmp, "sms_records.json")
+            snapshot_path = os.path.join(tmp, "sms_snapshot.bin")
+            with open(data_path, "w", encoding="utf-8") as f:
+                write_records_stream(generate(pattern, size), f)
+            start = time.perf_counter()
+            write_snapshot(generate(pattern, size), snapshot_path, data_path)
+            written = time.perf_counter() - start
+
+            ids = [record["transaction_id"] for record in pattern if record.get("transaction_id") is not None]
+            tx_id = f"{ids[len(ids) // 2]}-{(size - 1) // len(pattern) // 2}"
+            runs = [("snapshot", snapshot_path, written, os.path.getsize(snapshot_path))]
+            if size <= args.json_max:
+                runs.append(("json", os.path.join(tmp, "none.bin"), 0, os.path.getsize(data_path)))
+
+            for name, path, write_seconds, size_bytes in runs:
+                load, get, stats, page, type_page = cold_start(data_path, path, tx_id)
+                print(f"{size:>9} {name:>8} {load:>7.3f} {get:>7.3f} {stats:>8.3f} {page:>7.3f} "
+                      f"{type_page:>12.3f} {write_seconds:>8.1f} {size_bytes / 2 ** 20:>7.0f}")
+
+            os.remove(data_path)
+            os.remove(snapshot_path)
+
+
+if __name__ == "__main__":
+    main()
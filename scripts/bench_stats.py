@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark: GET /stats range aggregates against dataset size
+
+For each dataset size, loads a TransactionStore and reports the time to
+build its StatsIndex, then the median and p99 time of stats queries over
+random date ranges (all types, and one type), next to a pass that sums
+every record in Python as the endpoint would have to without the index.
+It then adds records through the store, as the API does, and times the
+same queries again.
+
+Usage:
+    python -m scripts.bench_stats [--sizes 100000 1000000] [--queries 500] [--writes 20000]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from api.store import TransactionStore
+from etl.record_keys import record_time, record_value
+from scripts.bench_api_lookup import make_dataset, percentile
+
+
+def full_scan(records, query):
+    """Sum, count, min and max per type by looking at every record"""
+    totals = {}
+    for record in records.values():
+        tx_type, date = record.get("transaction_type"), record_time(record)
+        if tx_type is None or date is None or not query["date_from"] <= date <= query["date_to"]:
+            continue
+        if "transaction_type" in query and tx_type not in query["transaction_type"]:
+            continue
+        total = totals.setdefault(tx_type, [0, 0.0, None, None])
+        total[0] += 1
+        amount = record_value(record, "amount")
+        if amount == amount:
+            total[1] += amount
+            total[2] = amount if total[2] is None else min(total[2], amount)
+            total[3] = amount if total[3] is None else max(total[3], amount)
+    return totals
+
+
+def random_queries(records, count, seed=7):
+    rng = random.Random(seed)
+    dates = sorted(d for d in map(record_time, records) if d is not None)
+    types = sorted({r.get("transaction_type") for r in records} - {None})
+    queries = []
+    for i in range(count):
+        lo, hi = sorted(rng.sample(dates, 2))
+        query = {"date_from": lo, "date_to": hi}
+        if i % 2:
+            query["transaction_type"] = [rng.choice(types)]
+        queries.append(query)
+    return queries
+
+
+def timed(func, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        func(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), percentile(samples, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--scans", type=int, default=3)
+    parser.add_argument("--writes", type=int, default=20_000, help="records added through the store")
+    args = parser.parse_args()
+
+    print(f"{'records':>8} {'build ms':>9} {'p50 ms':>7} {'p99 ms':>7} {'add us':>7} "
+          f"{'p50 ms':>7} {'p99 ms':>7} {'scan ms':>8}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            data_path = make_dataset(tmp, size)
+            store = TransactionStore(data_path, search_path=os.path.join(tmp, "no_search"))
+            records = store.all()
+            queries = random_queries(records, args.queries)
+
+            start = time.perf_counter()
+            store.stats({})
+            build = (time.perf_counter() - start) * 1000
+
+            p50, p99 = timed(store.stats, queries)
+            scan, _ = timed(lambda query: store.query(full_scan, query), queries[:args.scans])
+
+            # New records land anywhere in the date range, not only at the end
+            rng = random.Random(3)
+            start = time.perf_counter()
+            for i in range(args.writes):
+                record = dict(rng.choice(records), transaction_id=f"bench-{i}")
+                store.add(record)
+            add = (time.perf_counter() - start) / max(args.writes, 1) * 1e6
+            written_p50, written_p99 = timed(store.stats, queries)
+
+            print(f"{size:>8} {build:>9.0f} {p50:>7.3f} {p99:>7.3f} {add:>7.0f} "
+                  f"{written_p50:>7.3f} {written_p99:>7.3f} {scan:>8.0f}")
+
+            del store, records
+            for path in (data_path, data_path + ".journal"):
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
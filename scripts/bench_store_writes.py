@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark: sustained write throughput of the transaction store
+
+Runs a mix of POST / PUT / DELETE style writes against a TransactionStore
+holding a synthetic dataset of each size, and reports writes per second
+plus the time to reopen the store afterwards (snapshot load and journal
+replay). For comparison it also times the old write path, which rewrote
+the whole sms_records.json with json.dump on every change.
+
+Usage:
+    python -m scripts.bench_store_writes [--sizes 1000 100000] [--writes 5000]
+"""
+
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from api.store import TransactionStore
+from scripts.bench_api_lookup import make_dataset
+
+
+def legacy_write(data_path, record):
+    with open(data_path, "r", encoding="utf-8") as f:
+        sms_data = json.load(f)
+    sms_data.append(record)
+    with open(data_path, "w", encoding="utf-8") as f:
+        json.dump(sms_data, f, indent=2)
+
+
+def run_writes(store, ids, writes, rng):
+    start = time.perf_counter()
+    for i in range(writes):
+        kind = rng.random()
+        if kind < 0.6 or not ids:
+            tx_id = f"bench{i}"
+            store.add({"transaction_id": tx_id, "amount": str(i), "transaction_type": "credit"})
+            ids.append(tx_id)
+        elif kind < 0.9:
+            store.update(rng.choice(ids), {"amount": str(i)})
+        else:
+            store.delete(ids.pop(rng.randrange(len(ids))))
+    store.sync()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000])
+    parser.add_argument("--writes", type=int, default=5000)
+    parser.add_argument("--legacy-writes", type=int, default=5)
+    parser.add_argument("--compact-mb", type=float, default=8)
+    args = parser.parse_args()
+
+    print(f"{'records':>8} {'writes/s':>10} {'reopen s':>9} {'old writes/s':>13}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            data_path = make_dataset(tmp, size)
+            rng = random.Random(size)
+
+            store = TransactionStore(data_path, compact_bytes=int(args.compact_mb * 1024 * 1024))
+            ids = [r["transaction_id"] for r in store.all() if r.get("transaction_id")]
+            seconds = run_writes(store, ids, args.writes, rng)
+            expected = store.all()
+
+            start = time.perf_counter()
+            reopened = TransactionStore(data_path)
+            assert reopened.all() == expected
+            reopen = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for i in range(args.legacy_writes):
+                legacy_write(data_path, {"transaction_id": f"legacy{i}", "amount": str(i)})
+            legacy = time.perf_counter() - start
+
+            print(f"{size:>8} {args.writes / seconds:>10.0f} {reopen:>9.2f} "
+                  f"{args.legacy_writes / legacy:>13.1f}")
+
+            os.remove(data_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite: the pipeline's hot paths at dataset sizes from 10k to 10M
+
+For every `--sizes` entry a synthetic backup is generated with
+scripts.generate_backup (kept in `--data-dir` for the next run when one
+is given) and parsed once into sms_records.json. The cases, each run
+`--repeat` times, are:
+  - xml_parse, xml_parse_parallel: etl.parse_xml.iter_sms_records and
+    iter_sms_records_parallel over the backup
+  - extract: parse_transaction_details over the message bodies
+  - json_save: write_records_stream of `size` records
+  - json_load: json.load of sms_records.json
+  - store_load: api.store.TransactionStore reading it
+  - lookup_linear, lookup_dict: the linear search and dictionary lookup of
+    scripts/dsa_compare.py over the parsed transactions
+  - api_list, api_page, api_get, api_create, api_update, api_delete: each
+    endpoint through the pooled server running in a child process, with
+    `--requests` requests on one keep-alive connection (api_list: one full
+    dump, counted in records)
+Cases that hold every record in memory are skipped above
+`--max-resident` records.
+
+Results (median seconds and items per second per case and size) are
+written as JSON to `--output`. With `--baseline`, every result is matched
+with the same case and size in that file and reported as a regression
+when its throughput is more than `--tolerance` percent lower; the exit
+status is then 1. `--results` compares an existing results file instead
+of running the suite.
+
+Usage:
+    python -m scripts.bench_suite [--sizes 10000 100000] [--cases xml_parse json_load ...]
+        [--output bench_results.json] [--baseline baseline.json] [--tolerance 10]
+    python -m scripts.bench_suite --results bench_results.json --baseline baseline.json
+"""
+
+import argparse
+import base64
+import http.client
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from itertools import cycle, islice
+
+import api.app as app
+from api.journal import Journal
+from api.store import TransactionStore
+from etl.parse_xml import (iter_sms_records, iter_sms_records_parallel, parse_transaction_details,
+                           write_records_stream)
+from scripts.bench_api_lookup import QuietHandler
+from scripts.dsa_compare import dictionary_lookup, linear_search, transactions_from_records
+from scripts.generate_backup import write_backup
+
+RESULTS_FORMAT = 1
+
+# Records cycled through by json_save, so the case needs no more memory at 10M
+SAVE_SAMPLE = 50_000
+
+AUTH = {"Authorization": "Basic " + base64.b64encode(b"bench@momo.rw:bench").decode()}
+
+CASES = {}
+
+
+def case(name, resident=False):
+    """Register a benchmark: func(dataset, args) -> (seconds, items)"""
+    def register(func):
+        CASES[name] = (func, resident)
+        return func
+    return register
+
+
+class Dataset:
+    """The backup and processed records of one size, made on first use"""
+
+    def __init__(self, directory, size):
+        self.directory = directory
+        self.size = size
+        self.xml_path = os.path.join(directory, f"backup_{size}.xml")
+        self.json_path = os.path.join(directory, f"sms_records_{size}.json")
+        self._records = None
+
+        if not os.path.exists(self.xml_path):
+            write_backup(self.xml_path + ".tmp", size)
+            os.replace(self.xml_path + ".tmp", self.xml_path)
+        if not os.path.exists(self.json_path):
+            with open(self.json_path + ".tmp", "w", encoding="utf-8") as f:
+                write_records_stream(iter_sms_records_parallel(self.xml_path), f)
+            os.replace(self.json_path + ".tmp", self.json_path)
+
+    def records(self):
+        if self._records is None:
+            with open(self.json_path, "r", encoding="utf-8") as f:
+                self._records = json.load(f)
+        return self._records
+
+    def sample(self, count):
+        return list(islice(iter_sms_records(self.xml_path), count))
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+@case("xml_parse")
+def bench_xml_parse(dataset, args):
+    return timed(lambda: sum(1 for _ in iter_sms_records(dataset.xml_path))), dataset.size
+
+
+@case("xml_parse_parallel")
+def bench_xml_parse_parallel(dataset, args):
+    return timed(lambda: sum(1 for _ in iter_sms_records_parallel(dataset.xml_path))), dataset.size
+
+
+@case("extract")
+def bench_extract(dataset, args):
+    bodies = [record["body"] for record in dataset.sample(min(dataset.size, args.sample))]
+    return timed(lambda: [parse_transaction_details(body) for body in bodies]), len(bodies)
+
+
+@case("json_save")
+def bench_json_save(dataset, args):
+    sample = dataset.sample(min(dataset.size, SAVE_SAMPLE))
+    path = os.path.join(dataset.directory, "json_save.tmp")
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            return timed(lambda: write_records_stream(islice(cycle(sample), dataset.size), f)), dataset.size
+    finally:
+        os.remove(path)
+
+
+@case("json_load", resident=True)
+def bench_json_load(dataset, args):
+    def load():
+        with open(dataset.json_path, "r", encoding="utf-8") as f:
+            json.load(f)
+    return timed(load), dataset.size
+
+
+@case("store_load", resident=True)
+def bench_store_load(dataset, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        store = TransactionStore(dataset.json_path, journal=Journal(os.path.join(tmp, "journal")))
+        return timed(store.refresh), dataset.size
+
+
+@case("lookup_linear", resident=True)
+def bench_lookup_linear(dataset, args):
+    transactions = transactions_from_records(dataset.records())
+    ids = [t.id for t in random.Random(1).sample(transactions, min(args.lookups, len(transactions)))]
+    return timed(lambda: [linear_search(transactions, tx_id) for tx_id in ids]), len(ids)
+
+
+@case("lookup_dict", resident=True)
+def bench_lookup_dict(dataset, args):
+    transactions = transactions_from_records(dataset.records())
+    by_id = {t.id: t for t in transactions}
+    ids = [t.id for t in random.Random(1).sample(transactions, min(args.requests * 100, len(transactions)))]
+    return timed(lambda: [dictionary_lookup(by_id, tx_id) for tx_id in ids]), len(ids)
+
+
+# -- API -------------------------------------------------------------------
+
+def serve(data_path, user_path, port_queue):
+    app.DATA_FILE = data_path
+    app.USER_FILE = user_path
+    httpd = app.PooledHTTPServer(("127.0.0.1", 0), QuietHandler)
+    port_queue.put(httpd.server_address[1])
+    httpd.serve_forever()
+
+
+class ApiServer:
+    """The API on a dataset's records, in a child process"""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.user_path = os.path.join(dataset.directory, "bench_users.json")
+        with open(self.user_path, "w", encoding="utf-8") as f:
+            json.dump([{"email": "bench@momo.rw", "password": "bench"}], f)
+
+        port_queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=serve, args=(dataset.json_path, self.user_path, port_queue),
+                                               daemon=True)
+        self.process.start()
+        self.port = port_queue.get()
+        self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=600)
+        # The first request loads the records
+        self.request("GET", "/transaction/none", expect=404)
+        self.template = next(r for r in dataset.sample(1000) if r.get("transaction_id"))
+        self.ids = [r["transaction_id"] for r in dataset.sample(10_000) if r.get("transaction_id")]
+        self.created = 0
+
+    def request(self, method, path, body=None, expect=200):
+        headers = dict(AUTH)
+        if body is not None:
+            body = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        self.conn.request(method, path, body=body, headers=headers)
+        response = self.conn.getresponse()
+        data = response.read()
+        if response.status != expect:
+            raise RuntimeError(f"{method} {path}: {response.status}, expected {expect}")
+        return data
+
+    def close(self):
+        self.conn.close()
+        self.process.terminate()
+        self.process.join()
+        # Undo the writes: the snapshot itself is only rewritten by compaction
+        for leftover in (self.dataset.json_path + ".journal", self.user_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+def api_case(name, requests=None, per_record=False):
+    """Register an API benchmark: func(server, count) makes `count` requests"""
+    def register(func):
+        def bench(dataset, args):
+            server = args.servers.get(dataset.size)
+            if server is None:
+                server = args.servers[dataset.size] = ApiServer(dataset)
+            count = requests or args.requests
+            return timed(lambda: func(server, count)), dataset.size if per_record else count
+        return case(name, resident=True)(bench)
+    return register
+
+
+@api_case("api_list", requests=1, per_record=True)
+def bench_api_list(server, count):
+    server.request("GET", "/transactions")
+
+
+@api_case("api_page")
+def bench_api_page(server, count):
+    # Walks the pages of one type, following next_cursor
+    cursor = None
+    for _ in range(count):
+        path = "/transactions?transaction_type=debit&limit=50" + (f"&cursor={cursor}" if cursor else "")
+        cursor = json.loads(server.request("GET", path))["next_cursor"]
+
+
+@api_case("api_get")
+def bench_api_get(server, count):
+    rng = random.Random(2)
+    for _ in range(count):
+        server.request("GET", f"/transaction/{rng.choice(server.ids)}")
+
+
+@api_case("api_create")
+def bench_api_create(server, count):
+    for _ in range(count):
+        server.created += 1
+        record = dict(server.template, transaction_id=f"BENCH{server.created}")
+        server.request("POST", "/transactions", record, expect=201)
+
+
+@api_case("api_update")
+def bench_api_update(server, count):
+    for i in range(server.created - count + 1, server.created + 1):
+        record = dict(server.template, transaction_id=f"BENCH{i}", read="0")
+        server.request("PUT", f"/transactions/BENCH{i}", record)
+
+
+@api_case("api_delete")
+def bench_api_delete(server, count):
+    for i in range(server.created - count + 1, server.created + 1):
+        server.request("DELETE", f"/transactions/BENCH{i}")
+    server.created -= count
+
+
+# -- results -----------------------------------------------------------------
+
+def run_suite(args):
+    results = []
+    directory = args.data_dir or tempfile.mkdtemp(prefix="momo_bench_")
+    os.makedirs(directory, exist_ok=True)
+    args.servers = {}
+
+    try:
+        for size in args.sizes:
+            print(f"== {size} records", file=sys.stderr)
+            dataset = Dataset(directory, size)
+            for name in args.cases:
+                func, resident = CASES[name]
+                if resident and size > args.max_resident:
+                    print(f"  {name:<20} skipped (over --max-resident)", file=sys.stderr)
+                    continue
+                samples = [func(dataset, args) for _ in range(args.repeat)]
+                seconds = statistics.median(s for s, _ in samples)
+                items = samples[0][1]
+                results.append({"case": name, "size": size, "items": items, "seconds": seconds,
+                                "per_second": items / seconds if seconds else None,
+                                "samples": [s for s, _ in samples]})
+                print(f"  {name:<20} {seconds:10.4f} s  {items / seconds:14,.0f} /s", file=sys.stderr)
+            server = args.servers.pop(size, None)
+            if server:
+                server.close()
+    finally:
+        for server in args.servers.values():
+            server.close()
+        if not args.data_dir:
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            os.rmdir(directory)
+
+    return {
+        "format": RESULTS_FORMAT,
+        "created": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count()},
+        "settings": {"repeat": args.repeat, "requests": args.requests, "sample": args.sample,
+                     "lookups": args.lookups},
+        "results": results,
+    }
+
+
+def compare(current, baseline, tolerance):
+    """
+    Pair every result with the same case and size in the baseline. Returns
+    rows of (case, size, baseline /s, current /s, change, verdict).
+    """
+    before = {(r["case"], r["size"]): r for r in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        old = before.get((result["case"], result["size"]))
+        if old is None or not old["per_second"] or not result["per_second"]:
+            rows.append((result["case"], result["size"], None, result["per_second"], None, "new"))
+            continue
+        change = result["per_second"] / old["per_second"] - 1
+        verdict = "REGRESSION" if change < -tolerance / 100 else "faster" if change > tolerance / 100 else "ok"
+        rows.append((result["case"], result["size"], old["per_second"], result["per_second"], change, verdict))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=200, help="requests per API case")
+    parser.add_argument("--sample", type=int, default=100_000, help="message bodies for `extract`")
+    parser.add_argument("--lookups", type=int, default=50, help="searches for `lookup_linear`")
+    parser.add_argument("--max-resident", type=int, default=2_000_000)
+    parser.add_argument("--data-dir", help="keep generated datasets here and reuse them")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--results", help="compare this results file instead of running")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="percent slower counted as a regression")
+    args = parser.parse_args()
+
+    if args.results:
+        with open(args.results, "r", encoding="utf-8") as f:
+            current = json.load(f)
+    else:
+        current = run_suite(args)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    rows = compare(current, baseline, args.tolerance)
+
+    print(f"\n{'case':<20} {'size':>9} {'baseline /s':>14} {'current /s':>14} {'change':>8}")
+    for name, size, old, new, change, verdict in rows:
+        old_text = f"{old:14,.0f}" if old else f"{'-':>14}"
+        change_text = f"{change:+8.1%}" if change is not None else f"{'-':>8}"
+        print(f"{name:<20} {size:>9} {old_text} {new:14,.0f} {change_text}  {verdict}")
+
+    regressions = sum(1 for row in rows if row[-1] == "REGRESSION")
+    print(f"\n{regressions} regression(s) beyond {args.tolerance:g}%")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
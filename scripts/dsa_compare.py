@@ -3,16 +3,30 @@
 Data Structures & Algorithms (DSA) Integration
 Comparing Linear Search vs Dictionary Lookup for SMS Transaction Records
 
+The transactions are parsed from synthetic MoMo messages (see
+scripts/generate_backup.py) by the real ETL parser. The same searches run
+at dataset sizes up to 10M in scripts/bench_suite.py (lookup_linear,
+lookup_dict).
 
+Usage:
+    python -m scripts.dsa_compare
+    python scripts/dsa_compare.py
 """
 
+import os
+import sys
 import time
 import random
-import uuid
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import List, Dict, Optional, Tuple
 import statistics
 
+# Run as a plain script, the repo root is not on the path yet
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from etl.parse_xml import parse_sms_xml_to_json
+from scripts.generate_backup import iter_sms_lines
+
 
 class Transaction:
     """Represents an SMS transaction record"""
@@ -41,43 +55,47 @@ class Transaction:
         }
 
 
-def generate_sample_transactions(count: int = 50) -> List[Transaction]:
+def transactions_from_records(records) -> List[Transaction]:
     """
-    Generate sample transaction data for testing
+    Build Transaction objects from parsed SMS records
+    
+    Messages without a transaction id are keyed by their date instead.
     
     Args:
-        count: Number of transactions to generate (default 50)
+        records: Record dicts as produced by etl.parse_xml
     
     Returns:
         List of Transaction objects
     """
     transactions = []
     
-    # Sample phone numbers and names
-    phone_numbers = [f"+250{random.randint(700000000, 799999999)}" for _ in range(20)]
-    names = ["Alice", "Bob", "Charlie", "Diana", "Eve", "Frank", "Grace", "Henry", 
-             "Ivy", "Jack", "Karen", "Leo", "Mary", "Nick", "Olivia", "Paul"]
-    
-    for i in range(count):
-        transaction_id = f"TXN-{uuid.uuid4().hex[:8].upper()}"
-        sender = random.choice(names)
-        recipient = random.choice(names)
-        amount = round(random.uniform(100, 50000), 2)  # Random amount between 100-50000
-        
-        # Random timestamp within the last 30 days
-        days_ago = random.randint(0, 30)
-        timestamp = datetime.now() - timedelta(days=days_ago, 
-                                              hours=random.randint(0, 23),
-                                              minutes=random.randint(0, 59))
-        
-        status = random.choice(["completed", "pending", "failed"])
-        
-        transactions.append(Transaction(transaction_id, sender, recipient, 
-                                      amount, timestamp, status))
+    for record in records:
+        transaction_id = record.get("transaction_id") or f"SMS-{record['date']}"
+        amount = float(record.get("amount") or 0)
+        timestamp = datetime.fromtimestamp(int(record["date"]) / 1000)
+        transactions.append(Transaction(transaction_id, record.get("address"), record.get("counterparty"),
+                                        amount, timestamp, record.get("transaction_type") or "unknown"))
     
     return transactions
 
 
+def generate_sample_transactions(count: int = 50) -> List[Transaction]:
+    """
+    Generate sample transaction data for testing
+    
+    Renders `count` synthetic MoMo messages and runs them through the
+    ETL parser, so the records look like the ones the pipeline produces.
+    
+    Args:
+        count: Number of transactions to generate (default 50)
+    
+    Returns:
+        List of Transaction objects
+    """
+    document = "<smses>\n" + "".join(iter_sms_lines(count, seed=random.randrange(1 << 30))) + "</smses>\n"
+    return transactions_from_records(parse_sms_xml_to_json(document))
+
+
 def linear_search(transactions: List[Transaction], target_id: str) -> Optional[Transaction]:
     """
     Linear Search Implementation
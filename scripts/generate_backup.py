@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Synthetic MoMo SMS backup generator
+
+Writes <smses> backups in the same shape as data/raw/modified_sms_v2.xml,
+using the message templates seen in real MoMo backups, so that the ETL and
+API can be exercised at sizes far beyond the sample file.
+
+Usage:
+    python -m scripts.generate_backup OUTPUT.xml --count 1000000 [--seed 7]
+"""
+
+import argparse
+import random
+import uuid
+from datetime import datetime, timedelta
+from xml.sax.saxutils import quoteattr
+
+NAMES = ["Jane Smith", "Alex Doe", "Linda Green", "Samuel Carter", "Robert Brown",
+         "Cynthia Umuganwa", "Mediatrice Uwayisenga", "Abebe Chala"]
+MERCHANTS = ["DIRECT PAYMENT LTD", "ESICIA LTD", "KIGALI MART LTD"]
+
+
+def _money(amount, with_comma):
+    return f"{amount:,}" if with_comma else str(amount)
+
+
+def _render_body(rng, when, balance):
+    """Pick a template and render a message body; returns (body, new balance)"""
+    stamp = when.strftime("%Y-%m-%d %H:%M:%S")
+    name = rng.choice(NAMES)
+    tx_id = rng.randint(10000000000, 99999999999)
+    amount = rng.choice([500, 1000, 2000, 3000, 5000, 10000, 25000, 40000])
+    roll = rng.random()
+
+    if roll < 0.39:
+        balance = max(balance - amount, 0)
+        return (f"TxId: {tx_id}. Your payment of {_money(amount, True)} RWF to {name} "
+                f"{rng.randint(10000, 99999)} has been completed at {stamp}. Your new balance: "
+                f"{_money(balance, True)} RWF. Fee was 0 RWF.Kanda*182*16# wiyandikishe muri "
+                f"poromosiyo ya BivaMoMotima, ugire amahirwe yo gutsindira ibihembo bishimishije."), balance
+    if roll < 0.74:
+        fee = 100 if amount > 1000 else 20
+        balance = max(balance - amount - fee, 0)
+        return (f"*165*S*{amount} RWF transferred to {name} (2507{rng.randint(10000000, 99999999)}) "
+                f"from 36521838 at {stamp} . Fee was: {fee} RWF. New balance: {balance} RWF. "
+                f"Kugura ama inite cg interineti kuri MoMo, Kanda *182*2*1# .*EN#"), balance
+    if roll < 0.89:
+        balance += amount
+        return (f"*113*R*A bank deposit of {amount} RWF has been added to your mobile money account "
+                f"at {stamp}. Your NEW BALANCE :{balance} RWF. Cash Deposit::CASH::::0::250795963036."
+                f"Thank you for using MTN MobileMoney.*EN#"), balance
+    if roll < 0.93:
+        balance += amount
+        return (f"You have received {amount} RWF from {name} (*********{rng.randint(100, 999)}) on "
+                f"your mobile money account at {stamp}. Message from sender: . Your new balance:"
+                f"{balance} RWF. Financial Transaction Id: {tx_id}."), balance
+    if roll < 0.96:
+        balance = max(balance - amount, 0)
+        return (f"*162*TxId:{tx_id}*S*Your payment of {amount} RWF to Airtime with token  has been "
+                f"completed at {stamp}. Fee was 0 RWF. Your new balance: {balance} RWF . "
+                f"Message: - -. *EN#"), balance
+    if roll < 0.98:
+        balance = max(balance - amount, 0)
+        return (f"*164*S*Y'ello,A transaction of {amount} RWF by {rng.choice(MERCHANTS)}  on your MOMO "
+                f"account was successfully completed at {stamp}. Message from debit receiver: . "
+                f"Your new balance:{balance} RWF. Fee was 0 RWF. Financial Transaction Id: {tx_id}. "
+                f"External Transaction Id: {rng.randint(10000000, 99999999)}.*EN#"), balance
+    if roll < 0.99:
+        balance = max(balance - amount - 350, 0)
+        return (f"You {name} (*********036) have via agent: Agent Sophia (250790777777), withdrawn "
+                f"{amount} RWF from your mobile money account: 36521838 at {stamp} and you can now "
+                f"collect your money in cash. Your new balance: {balance} RWF. Fee paid: 350 RWF. "
+                f"Message from agent: 1. Financial Transaction Id: {tx_id}."), balance
+    return (f"Yello!Umaze kugura {amount}Rwf(1GB)/30days igura {_money(amount, True)} RWF"), balance
+
+
+def iter_sms_lines(count, seed=7, start=datetime(2024, 5, 10, 16, 30)):
+    """Yield `count` rendered <sms .../> lines in date order"""
+    rng = random.Random(seed)
+    when = start
+    balance = 0
+
+    for _ in range(count):
+        when += timedelta(seconds=rng.randint(30, 6 * 3600))
+        body, balance = _render_body(rng, when, balance)
+        date = int(when.timestamp() * 1000)
+        yield (f'  <sms protocol="0" address="M-Money" date="{date}" type="1" subject="null" '
+               f'body={quoteattr(body)} toa="null" sc_toa="null" service_center="+250788110381" '
+               f'read="1" status="-1" locked="0" date_sent="{date - rng.randint(1000, 9000)}" '
+               f'sub_id="6" readable_date="{when.strftime("%d %b %Y %I:%M:%S %p")}" '
+               f'contact_name="(Unknown)" />\n')
+
+
+def write_backup(path, count, seed=7, backup_set=None):
+    """Stream a synthetic backup of `count` messages to `path`"""
+    backup_set = backup_set or str(uuid.UUID(int=random.Random(seed).getrandbits(128)))
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        f.write(f'<smses count="{count}" backup_set="{backup_set}" '
+                f'backup_date="1737023646162" type="full">\n')
+        f.writelines(iter_sms_lines(count, seed))
+        f.write("</smses>\n")
+
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic MoMo SMS backup")
+    parser.add_argument("output", help="path of the XML file to write")
+    parser.add_argument("--count", type=int, default=10000, help="number of messages")
+    parser.add_argument("--seed", type=int, default=7, help="random seed")
+    args = parser.parse_args()
+
+    write_backup(args.output, args.count, args.seed)
+    print(f"Wrote {args.count} messages to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Load test: API throughput against the number of concurrent clients
+
+Starts the API in a child process on a synthetic dataset, once as the old
+single-threaded HTTPServer closing the connection after each response,
+once as the pooled HTTP/1.1 keep-alive server and once as the asyncio
+server (see scripts.loadtest_async for 1k+ clients). Each client thread issues
+GET /transaction/<id> lookups, with every `--dump-every`th request a full
+GET /transactions dump, and the script reports requests per second,
+lookup latency and failed requests (refused, reset or timed out) for each
+level of concurrency.
+
+Usage:
+    python -m scripts.loadtest_api [--records 20000] [--clients 1 4 16 64] [--seconds 5]
+"""
+
+import argparse
+import base64
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+from http.server import HTTPServer
+
+import api.app as app
+from api.async_server import AsyncHTTPServer
+from scripts.bench_api_lookup import make_dataset, percentile
+
+
+class QuietHandler(app.SMSHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class ClosingHandler(QuietHandler):
+    # One request per connection, as the server answered before
+    protocol_version = "HTTP/1.0"
+
+
+SERVERS = {
+    "single": (HTTPServer, ClosingHandler),
+    "pooled": (app.PooledHTTPServer, QuietHandler),
+    "async": (AsyncHTTPServer, QuietHandler),
+}
+
+
+def serve(mode, data_path, user_path, port_queue):
+    app.DATA_FILE = data_path
+    app.USER_FILE = user_path
+    server_class, handler_class = SERVERS[mode]
+    httpd = server_class(("127.0.0.1", 0), handler_class)
+    port_queue.put(httpd.server_address[1])
+    httpd.serve_forever()
+
+
+def client(port, auth, ids, deadline, dump_every, latencies, counts, errors):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    rng = random.Random()
+    done = failed = 0
+    while time.perf_counter() < deadline:
+        path = "/transactions" if dump_every and (done + 1) % dump_every == 0 else f"/transaction/{rng.choice(ids)}"
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=auth)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            # Refused, reset or timed out: count it and start a new connection
+            failed += 1
+            conn.close()
+            continue
+        assert response.status == 200
+        done += 1
+        if path != "/transactions":
+            latencies.append((time.perf_counter() - start) * 1000)
+    conn.close()
+    counts.append(done)
+    errors.append(failed)
+
+
+def run_level(port, auth, ids, clients, seconds, dump_every):
+    latencies, counts, errors = [], [], []
+    deadline = time.perf_counter() + seconds
+    threads = [threading.Thread(target=client,
+                                args=(port, auth, ids, deadline, dump_every, latencies, counts, errors))
+               for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return sum(counts) / elapsed, statistics.median(latencies), percentile(latencies, 99), sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=20_000)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--dump-every", type=int, default=200)
+    args = parser.parse_args()
+
+    auth = {"Authorization": "Basic " + base64.b64encode(b"bench@momo.rw:bench").decode()}
+
+    print(f"cores available: {os.cpu_count()}, records: {args.records}\n")
+    print(f"{'server':>7} {'clients':>8} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>9} {'errors':>7}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        user_path = os.path.join(tmp, "users.json")
+        with open(user_path, "w", encoding="utf-8") as f:
+            json.dump([{"email": "bench@momo.rw", "password": "bench"}], f)
+
+        data_path = make_dataset(tmp, args.records)
+        with open(data_path, "r", encoding="utf-8") as f:
+            ids = [r["transaction_id"] for r in json.load(f) if r.get("transaction_id")]
+
+        for mode in SERVERS:
+            port_queue = multiprocessing.Queue()
+            server = multiprocessing.Process(target=serve, args=(mode, data_path, user_path, port_queue),
+                                             daemon=True)
+            server.start()
+            port = port_queue.get()
+
+            for clients in args.clients:
+                rate, p50, p99, failed = run_level(port, auth, ids, clients, args.seconds, args.dump_every)
+                print(f"{mode:>7} {clients:>8} {rate:>9.0f} {p50:>8.2f} {p99:>9.2f} {failed:>7}")
+
+            server.terminate()
+            server.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Load test: connections and throughput at 1k+ concurrent keep-alive clients
+
+Starts the API in a child process on a synthetic dataset, once as the
+pooled thread-per-connection server (api.app.PooledHTTPServer) and once
+as the asyncio server (api.async_server.AsyncHTTPServer). For each number
+of clients, that many keep-alive connections are opened from one asyncio
+event loop, the way a fleet of dashboards holds them, and each issues
+GET /transaction/<id> lookups with `--think` ms between them. A client
+whose connection is closed or refused reconnects and carries on.
+
+Reported per server and level: connections open at the end of the run,
+requests per second, lookup latency and failed requests (refused, reset,
+closed or timed out).
+
+Usage:
+    python -m scripts.loadtest_async [--records 20000] [--clients 100 1000 2000] [--seconds 10] [--think 100]
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import multiprocessing
+import os
+import random
+import resource
+import tempfile
+import time
+
+import api.app as app
+from api.async_server import AsyncHTTPServer
+from scripts.bench_api_lookup import QuietHandler, make_dataset, percentile
+
+SERVERS = {
+    "pooled": app.PooledHTTPServer,
+    "async": AsyncHTTPServer,
+}
+
+# Seconds a client waits for a connection or a response
+CLIENT_TIMEOUT = 10
+
+
+def serve(mode, data_path, user_path, port_queue):
+    app.DATA_FILE = data_path
+    app.USER_FILE = user_path
+    httpd = SERVERS[mode](("127.0.0.1", 0), QuietHandler)
+    port_queue.put(httpd.server_address[1])
+    httpd.serve_forever()
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    close = False
+    for line in head.split(b"\r\n")[1:]:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"content-length":
+            length = int(value)
+        elif name == b"connection" and value.strip().lower() == b"close":
+            close = True
+    await reader.readexactly(length)
+    return status, close
+
+
+async def client(port, request_for, deadline, think, stats):
+    rng = random.Random()
+    # Spread the first requests over one think time, as a fleet would
+    await asyncio.sleep(rng.random() * think)
+    conn = None
+    while time.perf_counter() < deadline:
+        try:
+            if conn is None:
+                conn = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", port), CLIENT_TIMEOUT)
+            reader, writer = conn
+            start = time.perf_counter()
+            writer.write(request_for(rng))
+            status, close = await asyncio.wait_for(read_response(reader), CLIENT_TIMEOUT)
+            if status == 200:
+                stats["latencies"].append((time.perf_counter() - start) * 1000)
+                stats["done"] += 1
+            else:
+                stats["failed"] += 1
+            if close:
+                writer.close()
+                conn = None
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            stats["failed"] += 1
+            if conn is not None:
+                conn[1].close()
+                conn = None
+            await asyncio.sleep(0.1)
+            continue
+        await asyncio.sleep(think)
+
+    stats["open"] += conn is not None
+    if conn is not None:
+        conn[1].close()
+
+
+async def run_level(port, auth, ids, clients, seconds, think):
+    def request_for(rng):
+        return (f"GET /transaction/{rng.choice(ids)} HTTP/1.1\r\nHost: 127.0.0.1\r\n"
+                f"Authorization: {auth}\r\n\r\n").encode("ascii")
+
+    stats = {"latencies": [], "done": 0, "failed": 0, "open": 0}
+    start = time.perf_counter()
+    await asyncio.gather(*(client(port, request_for, start + seconds, think, stats) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    latencies = stats["latencies"] or [0]
+    return stats["open"], stats["done"] / elapsed, percentile(latencies, 50), percentile(latencies, 99), \
+        stats["failed"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--records", type=int, default=20_000)
+    parser.add_argument("--clients", type=int, nargs="+", default=[100, 1000, 2000])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--think", type=float, default=100, help="ms between a client's requests")
+    args = parser.parse_args()
+
+    # Every client is a socket here and one in the server
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, 2 * max(args.clients) + 256)), hard))
+
+    auth = "Basic " + base64.b64encode(b"bench@momo.rw:bench").decode()
+
+    print(f"cores available: {os.cpu_count()}, records: {args.records}, think time: {args.think:g} ms\n")
+    print(f"{'server':>7} {'clients':>8} {'open':>6} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>9} {'errors':>7}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        user_path = os.path.join(tmp, "users.json")
+        with open(user_path, "w", encoding="utf-8") as f:
+            json.dump([{"email": "bench@momo.rw", "password": "bench"}], f)
+
+        data_path = make_dataset(tmp, args.records)
+        with open(data_path, "r", encoding="utf-8") as f:
+            ids = [r["transaction_id"] for r in json.load(f) if r.get("transaction_id")]
+
+        for mode in SERVERS:
+            port_queue = multiprocessing.Queue()
+            server = multiprocessing.Process(target=serve, args=(mode, data_path, user_path, port_queue),
+                                             daemon=True)
+            server.start()
+            port = port_queue.get()
+
+            for clients in args.clients:
+                result = asyncio.run(run_level(port, auth, ids, clients, args.seconds, args.think / 1000))
+                opened, rate, p50, p99, failed = result
+                print(f"{mode:>7} {clients:>8} {opened:>6} {rate:>9.0f} {p50:>8.2f} {p99:>9.2f} {failed:>7}")
+
+            server.terminate()
+            server.join()
+
+
+if __name__ == "__main__":
+    main()
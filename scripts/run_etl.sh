@@ -0,0 +1,9 @@
+#!/usr/bin/env bash
+# Incremental ETL: merge the new messages of one or more SMS backups into
+# data/processed/sms_records.json. Pass --full to rescan whole backups.
+#
+#   scripts/run_etl.sh [backup.xml ...] [--full]
+set -euo pipefail
+
+cd "$(dirname "$0")/.."
+exec python3 -m etl.run "$@"
@@ -0,0 +1,36 @@
+import random
+
+# Words the generated bodies are made of: records draw from the first few
+# or from all of them, so some words are common and most are rare
+WORDS = [f"w{i}" for i in range(40)]
+
+COUNTERPARTIES = ["Jane Smith", "Samuel Carter", "Alex Doe", None]
+
+
+def make_records(count, seed=0):
+    """
+    `count` processed SMS records drawn from `seed`, in file order with the
+    ids tx-0, tx-1 and so on. Dates fall on the hour in May 2024, so many
+    share one, and every other field is now and then missing or not a
+    number, as in a real backup.
+    """
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        record = {"transaction_id": f"tx-{i}", "transaction_type": rng.choice(["sent", "received", "payment", None]),
+                  "counterparty": rng.choice(COUNTERPARTIES), "address": "M-Money",
+                  "service_center": rng.choice(["+250788110381", None]), "date_sent": rng.choice(["0", None])}
+        if rng.random() < 0.9:
+            hour = rng.randrange(28 * 24)
+            record["date"] = str(1714521600000 + hour * 3_600_000)
+            record["transaction_date"] = f"2024-05-{hour // 24 + 1:02d} {hour % 24:02d}:00:00"
+        record["amount"] = str(rng.randrange(100, 5000, 100)) if rng.random() < 0.9 else rng.choice([None, "n/a"])
+        record["balance"] = str(rng.randrange(100_000)) if rng.random() < 0.9 else None
+
+        body = " ".join(rng.choice(WORDS[:rng.choice([4, 40])]) for _ in range(5))
+        fee = rng.choice([None, 0, 100, 1250])
+        if fee is not None:
+            body += f". Fee was: {fee:,} RWF"
+        record["body"] = rng.choice([body, body, body + ", murakoze \N{MOBILE PHONE}", "", None])
+        records.append(record)
+    return records
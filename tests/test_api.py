@@ -0,0 +1,152 @@
+import base64
+import gzip
+import http.client
+import json
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer
+
+import pytest
+
+import api.app as app
+from conftest import make_records
+from etl.parse_xml import write_records_stream
+
+AUTH = {"Authorization": "Basic " + base64.b64encode(b"test@momo.rw:test").decode()}
+
+
+class QuietHandler(app.SMSHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def make_sms(**fields):
+    record = {"protocol": "0", "address": "M-Money", "date": "1714567990000", "type": "1",
+              "body": "You have received 2000 RWF", "subject": None, "toa": None, "sc_toa": None,
+              "service_center": None, "read": "1", "status": "-1", "locked": "0", "date_sent": "0", "sub_id": "1",
+              "readable_date": "", "contact_name": None}
+    record.update(fields)
+    return record
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    user_path = tmp_path / "users.json"
+    user_path.write_text(json.dumps([{"email": "test@momo.rw", "password": "test"}]))
+    data_path = os.path.join(str(tmp_path), "sms_records.json")
+    with open(data_path, "w", encoding="utf-8") as f:
+        write_records_stream(make_records(40), f)
+    monkeypatch.setattr(app, "DATA_FILE", data_path)
+    monkeypatch.setattr(app, "USER_FILE", str(user_path))
+    monkeypatch.setattr(app, "STORAGE", "json")
+
+
+def serve(server_class):
+    httpd = server_class(("127.0.0.1", 0), QuietHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+@pytest.fixture
+def server(dataset):
+    httpd = serve(HTTPServer)
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def request(httpd, method, path, body=None, headers=AUTH):
+    conn = http.client.HTTPConnection(*httpd.server_address)
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response, data
+
+
+def test_put_validates_like_post(server):
+    response, body = request(server, "PUT", "/transactions/tx-1", json.dumps(make_sms(date="yesterday")))
+    assert response.status == 400
+    assert json.loads(body) == {"error": "Field date must be digits, got str"}
+    fields = make_sms()
+    del fields["toa"]
+    assert json.loads(request(server, "PUT", "/transactions/tx-1", json.dumps(fields))[1]) == {
+        "error": "Missing required field: toa"}
+
+    response, body = request(server, "PUT", "/transactions/tx-1", json.dumps(make_sms(amount=5)))
+    assert response.status == 200 and json.loads(body)["amount"] == 5
+
+
+def test_pooled_server_serves_more_clients_than_workers(dataset, monkeypatch):
+    monkeypatch.setattr(app.PooledHTTPServer, "workers", 3)
+    monkeypatch.setattr(app.PooledHTTPServer, "queue_size", 2)
+    httpd = serve(app.PooledHTTPServer)
+
+    def client(number):
+        # Keep-alive, unless the server closes the connection to let others in
+        conn = http.client.HTTPConnection(*httpd.server_address)
+        statuses = []
+        for i in range(10):
+            if i == 5:
+                record = make_sms(transaction_id=f"client-{number}")
+                conn.request("POST", "/transactions", body=json.dumps(record), headers=AUTH)
+            else:
+                conn.request("GET", f"/transaction/tx-{i}", headers=AUTH)
+            response = conn.getresponse()
+            response.read()
+            statuses.append(response.status)
+            if response.getheader("Connection") == "close":
+                conn.close()
+                conn = http.client.HTTPConnection(*httpd.server_address)
+        conn.close()
+        return statuses
+
+    try:
+        with ThreadPoolExecutor(12) as pool:
+            results = list(pool.map(client, range(12)))
+        assert results == [[200] * 5 + [201] + [200] * 4] * 12
+        listing = json.loads(request(httpd, "GET", "/transactions")[1])
+        assert {f"client-{number}" for number in range(12)} <= {record["transaction_id"] for record in listing}
+        assert len(listing) == 40 + 12
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+@pytest.mark.parametrize("cache_bytes", [0, app.RESPONSE_CACHE_BYTES])
+def test_listing_is_gzipped_and_revalidated_by_etag(server, monkeypatch, cache_bytes):
+    monkeypatch.setattr(app, "RESPONSE_CACHE_BYTES", cache_bytes)
+    response, plain = request(server, "GET", "/transactions")
+    assert response.status == 200 and response.getheader("Transfer-Encoding") == "chunked"
+    assert [record["transaction_id"] for record in json.loads(plain)] == [f"tx-{i}" for i in range(40)]
+    etag = response.getheader("ETag")
+
+    response, zipped = request(server, "GET", "/transactions", headers=dict(AUTH, **{"Accept-Encoding": "br, gzip"}))
+    assert response.getheader("Content-Encoding") == "gzip" and response.getheader("Vary") == "Accept-Encoding"
+    assert gzip.decompress(zipped) == plain and len(zipped) < len(plain)
+    assert response.getheader("ETag") == etag
+    refused = request(server, "GET", "/transactions", headers=dict(AUTH, **{"Accept-Encoding": "gzip;q=0"}))
+    assert refused[0].getheader("Content-Encoding") is None and refused[1] == plain
+
+    for tags in (etag, etag.removeprefix("W/"), f'"other", {etag}', "*"):
+        response, body = request(server, "GET", "/transactions", headers=dict(AUTH, **{"If-None-Match": tags}))
+        assert response.status == 304 and body == b"" and response.getheader("ETag") == etag
+    assert request(server, "GET", "/transactions", headers=dict(AUTH, **{"If-None-Match": '"other"'}))[0].status == 200
+
+    # A write makes the tag stale
+    assert request(server, "DELETE", "/transactions/tx-0")[0].status == 200
+    response, body = request(server, "GET", "/transactions", headers=dict(AUTH, **{"If-None-Match": etag}))
+    assert response.status == 200 and response.getheader("ETag") != etag and len(json.loads(body)) == 39
+
+
+def test_http_1_0_listing_ends_with_the_connection(server):
+    with socket.create_connection(server.server_address) as sock:
+        sock.sendall(b"GET /transactions HTTP/1.0\r\nAuthorization: " + AUTH["Authorization"].encode() + b"\r\n\r\n")
+        data = b""
+        while chunk := sock.recv(65536):
+            data += chunk
+    head, _, body = data.partition(b"\r\n\r\n")
+    assert b"Transfer-Encoding" not in head and b"Connection: close" in head
+    assert len(json.loads(body)) == 40
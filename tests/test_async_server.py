@@ -0,0 +1,106 @@
+import asyncio
+import base64
+import http.client
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+import api.app as app
+import api.async_server as async_server
+from api.async_server import AsyncHTTPServer, _ResponseWriter
+
+AUTH = {"Authorization": "Basic " + base64.b64encode(b"test@momo.rw:test").decode()}
+
+
+def make_sms(i):
+    return {"protocol": "0", "address": "M-Money", "date": str(1714567990000 + i), "type": "1",
+            "body": f"You have received {i} RWF " + "x" * 200, "subject": None, "toa": None, "sc_toa": None,
+            "service_center": None, "read": "1", "status": "-1", "locked": "0", "date_sent": "0", "sub_id": "1",
+            "readable_date": "", "contact_name": None, "transaction_id": f"async-{i}"}
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    user_path = tmp_path / "users.json"
+    user_path.write_text(json.dumps([{"email": "test@momo.rw", "password": "test"}]))
+    monkeypatch.setattr(app, "DATA_FILE", str(tmp_path / "sms_records.json"))
+    monkeypatch.setattr(app, "USER_FILE", str(user_path))
+    monkeypatch.setattr(app, "STORAGE", "json")
+    monkeypatch.setattr(async_server, "IDLE_TIMEOUT", 0.5)
+    httpd = AsyncHTTPServer(("127.0.0.1", 0))
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    thread.join(5)
+    httpd.server_close()
+
+
+def send_head(httpd, length):
+    sock = socket.create_connection(httpd.server_address, timeout=5)
+    sock.sendall(f"POST /transactions/batch HTTP/1.1\r\nHost: x\r\nAuthorization: {AUTH['Authorization']}\r\n"
+                 f"Content-Length: {length}\r\n\r\n".encode())
+    return sock
+
+
+def read_all(sock):
+    data = b""
+    while chunk := sock.recv(65536):
+        data += chunk
+    return data
+
+
+def test_oversized_body_is_refused_unread(server):
+    sock = send_head(server, app.MAX_BATCH_BYTES + 1)
+    assert read_all(sock).startswith(b"HTTP/1.1 413")
+
+
+@pytest.mark.parametrize("length", [1000, async_server.MAX_BUFFERED_BODY + 1000])
+def test_stalled_body_is_dropped(server, length):
+    sock = send_head(server, length)
+    sock.sendall(b"x" * 100)
+    start = time.monotonic()
+    assert read_all(sock) == b""
+    assert time.monotonic() - start < 3
+
+
+def test_large_batch_is_streamed(server):
+    body = "".join(json.dumps(make_sms(i)) + "\n" for i in range(8000)).encode()
+    assert len(body) > async_server.MAX_BUFFERED_BODY
+    conn = http.client.HTTPConnection(*server.server_address)
+    conn.request("POST", "/transactions/batch", body=body, headers=AUTH)
+    response = conn.getresponse()
+    assert json.loads(response.read()) == {"accepted": 8000, "rejected": 0, "errors": []}
+
+    # The connection is still good for another request
+    conn.request("GET", "/transaction/async-7999", headers=AUTH)
+    assert conn.getresponse().status == 200
+    conn.close()
+
+
+def test_response_writer_reports_what_it_was_given():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    class Sink:
+        def __init__(self):
+            self.data = b""
+
+        def write(self, data):
+            self.data += data
+
+        async def drain(self):
+            pass
+
+    sink = Sink()
+    writer = _ResponseWriter(loop, sink)
+    assert writer.write(b"a" * (async_server.FLUSH_BYTES - 1)) == async_server.FLUSH_BYTES - 1
+    assert writer.write(b"bb") == 2
+    assert len(sink.data) == async_server.FLUSH_BYTES + 1
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
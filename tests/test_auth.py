@@ -0,0 +1,55 @@
+import base64
+import json
+
+from api.auth import UserTable, check_password, hash_password, migrate_users_file
+
+
+def basic(email, password):
+    return base64.b64encode(f"{email}:{password}".encode("utf-8")).decode("ascii")
+
+
+def write_users(path, users):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(users, f)
+
+
+def test_password_hashes_are_salted():
+    first, second = hash_password("s3cret", iterations=1000), hash_password("s3cret", iterations=1000)
+    assert first != second and first.startswith("pbkdf2_sha256$1000$")
+    assert check_password("s3cret", first) and check_password("s3cret", second)
+    assert not check_password("s3cret!", first)
+    assert not check_password("s3cret", "plain text") and not check_password("s3cret", "md5$1$a$b")
+
+
+def test_cached_header_does_not_let_other_passwords_in(tmp_path):
+    path = str(tmp_path / "users.json")
+    write_users(path, [{"email": "ann@momo.rw", "password_hash": hash_password("right", iterations=1000)},
+                       {"email": "bob@momo.rw", "password": "plain"}])
+    users = UserTable(path, cache_size=2)
+
+    assert users.verify_basic(basic("ann@momo.rw", "right"))
+    assert users.verify_basic(basic("ann@momo.rw", "right"))
+    assert not users.verify_basic(basic("ann@momo.rw", "wrong"))
+    assert not users.verify_basic(basic("ann@momo.rw", "right "))
+    assert not users.verify_basic(basic("eve@momo.rw", "right"))
+    assert users.verify_basic(basic("bob@momo.rw", "plain"))
+    assert not users.verify_basic(basic("bob@momo.rw", "Plain"))
+    assert len(users._verified) == 2
+
+    # A changed file forgets what was verified against the old one
+    write_users(path, [{"email": "bob@momo.rw", "password": "plain"}])
+    assert not users.verify_basic(basic("ann@momo.rw", "right"))
+    assert users.verify_basic(basic("bob@momo.rw", "plain"))
+
+
+def test_migration_keeps_every_password_working(tmp_path):
+    path = str(tmp_path / "users.json")
+    write_users(path, [{"email": "ann@momo.rw", "password": "one"}, {"email": "bob@momo.rw", "password": "two"}])
+    assert migrate_users_file(path) == 2
+    assert migrate_users_file(path) == 0
+
+    with open(path, "r", encoding="utf-8") as f:
+        assert all("password" not in user and "password_hash" in user for user in json.load(f))
+    users = UserTable(path)
+    assert users.verify("ann@momo.rw", "one") and users.verify("bob@momo.rw", "two")
+    assert not users.verify("ann@momo.rw", "two")
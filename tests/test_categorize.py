@@ -0,0 +1,79 @@
+import pytest
+
+from etl.categorize import AnchorTrie, Categorizer, KeywordAutomaton, categorize, message_template
+
+
+def test_automaton_finds_overlapping_keywords():
+    automaton = KeywordAutomaton(["he", "she", "his", "hers", "usher"])
+
+    assert automaton.find("ushers") == {0, 1, 3, 4}
+    assert automaton.find("ahishers") == {0, 1, 2, 3}
+    assert automaton.find("nothing here") == {0}
+    assert automaton.find("") == set()
+
+
+@pytest.mark.parametrize("body, category", [
+    ("You have received 2000 RWF from Jane Smith (*********013) on your mobile money account at 2024-05-10 16:30:51.", "incoming_money"),
+    ("TxId: 73214484437. Your payment of 1,000 RWF to Jane Smith 12845 has been completed at 2024-05-10 16:31:39.", "payment_to_code_holder"),
+    ("*165*S*2500 RWF transferred to Jane Smith (250791666666) from 36521838 at 2024-05-14 09:27:40 . Fee was: 100 RWF.", "transfer_to_mobile"),
+    ("*113*R*A bank deposit of 40000 RWF has been added to your mobile money account at 2024-05-11 18:43:49.", "bank_deposit"),
+    ("*162*TxId:13913173274*S*Your payment of 2000 RWF to Airtime with token  has been completed at 2024-05-12 11:41:28.", "airtime"),
+    ("*162*TxId:17841214930*S*Your payment of 322726 RWF to WASAC with token 888931 has been completed at 2025-01-02 14:03:47.", "bill_payment"),
+    ("You have transferred 50000 RWF to Robert Brown (250795963036) from your mobile money account 20077201001 imbank.bank at 2024-10-23 16:43:03.", "bank_transfer"),
+    ("Hello there", "other"),
+    ("", "other"),
+])
+def test_default_rules(body, category):
+    assert categorize(body) == category
+
+
+def test_first_matching_rule_wins():
+    categorizer = Categorizer([
+        ("refund", None, ("refund", "payment")),
+        ("payment", r"Your payment of ", ()),
+        ("payment_or_refund", None, ("payment",)),
+    ])
+
+    assert categorizer.categorize("Your payment of 5 RWF, refund issued") == "refund"
+    assert categorizer.categorize("Your payment of 5 RWF") == "payment"
+    assert categorizer.categorize("A PAYMENT was made") == "payment_or_refund"
+    assert categorizer.categorize("A refund was made") == "other"
+
+
+def test_overlapping_anchors_all_count():
+    categorizer = Categorizer([
+        ("bank", r"You have ", (".bank",)),
+        ("transfer", r"You have transferred ", ()),
+        ("have", r"You have ", ()),
+    ])
+
+    assert categorizer.categorize("You have transferred 5 RWF to X") == "transfer"
+    assert categorizer.categorize("You have transferred 5 RWF to X.bank") == "bank"
+    assert categorizer.categorize("You have received 5 RWF") == "have"
+    assert categorizer.categorize("You received 5 RWF") == "other"
+
+
+def test_trie_finds_every_anchor_in_one_walk():
+    trie = AnchorTrie(["You have ", "You have transferred ", "*#*S*# RWF ", "*###*TxId:"])
+
+    assert trie.find("You have transferred # RWF") == {0, 1}
+    assert trie.find("You have received") == {0}
+    assert trie.find("*###*S*#### RWF transferred") == {2}
+    assert trie.find("*#*TxId:##*S*") == {3}
+    assert trie.find("*###*S*RWF") == set()
+    assert trie.find("") == set()
+
+
+def test_rule_needs_anchor_or_keywords():
+    with pytest.raises(ValueError):
+        Categorizer([("empty", None, ())])
+
+
+def test_results_cached_per_template():
+    categorizer = Categorizer()
+    first = "You have received 2000 RWF from Jane Smith (*********013) on your mobile money account at 2024-05-10 16:30:51."
+    second = "You have received 5000 RWF from Jane Smith (*********711) on your mobile money account at 2024-09-06 21:11:07."
+
+    assert message_template(first) == message_template(second)
+    assert categorizer.categorize(first) == categorizer.categorize(second) == "incoming_money"
+    assert categorizer.cache_info().hits == 1
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from etl.clean_normalize import SmsRecord, compact_record, record_dict
+from etl.parse_xml import iter_sms_records, xml_file_path
+
+
+@pytest.fixture(scope="module")
+def records():
+    return list(iter_sms_records(xml_file_path))
+
+
+def test_compact_record_reads_like_the_dict(records):
+    for record in records:
+        compact = compact_record(record)
+
+        assert isinstance(compact, SmsRecord)
+        assert compact == record
+        assert list(compact) == list(record)
+        assert compact.to_dict() == record
+        assert compact.get("amount") == record.get("amount")
+
+
+def test_serializes_to_the_same_json(records):
+    compact = [compact_record(record) for record in records]
+
+    assert json.dumps(compact, indent=2, default=record_dict) == json.dumps(records, indent=2)
+    assert json.dumps(compact, default=dict) == json.dumps(records)
+
+
+def test_numeric_fields_held_as_ints():
+    compact = compact_record({"date": "1715351458724", "amount": "2000", "balance": "007"})
+
+    assert compact.date == 1715351458724
+    assert compact.amount == 2000
+    # Not canonical: an int could not give the same string back
+    assert compact.balance == "007"
+    assert compact["date"] == "1715351458724"
+
+
+def test_absent_keys_and_none_values():
+    compact = compact_record({"address": None, "body": "Hello"})
+
+    assert compact["address"] is None
+    assert "address" in compact
+    assert "amount" not in compact
+    assert compact.get("amount", "missing") == "missing"
+    with pytest.raises(KeyError):
+        compact["amount"]
+    assert len(compact) == 2
+
+
+@pytest.mark.parametrize("record", [
+    {"body": "Hello", "extra": "x"},
+    {"body": "Hello", "address": "M-Money"},
+    {"amount": 2000},
+])
+def test_other_shapes_kept_as_dicts(record):
+    assert compact_record(record) is record
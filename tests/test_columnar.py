@@ -0,0 +1,68 @@
+from conftest import make_records
+from etl.columnar import (CATEGORY_COLUMNS, INT_COLUMNS, NULL, ColumnAppender, ColumnarTable, record_fee,
+                          truncate_columns, write_columns)
+
+
+def expected_int(record, name):
+    if name == "fee":
+        fee = record_fee(record)
+        return NULL if fee is None else fee
+    try:
+        return int(record.get(name))
+    except (TypeError, ValueError):
+        return NULL
+
+
+def assert_table_holds(path, records):
+    table = ColumnarTable(path)
+    assert len(table) == len(records)
+    for name in INT_COLUMNS:
+        assert table.column(name).tolist() == [expected_int(record, name) for record in records]
+    for name in CATEGORY_COLUMNS:
+        values = table.categories(name)
+        assert [values[code] if code >= 0 else None for code in table.column(name).tolist()] == \
+            [record.get(name) for record in records]
+    assert [table.text("body", row) for row in range(len(records))] == [record["body"] or "" for record in records]
+
+
+def test_columns_round_trip(tmp_path):
+    records = make_records(500, seed=13)
+    path = str(tmp_path / "sms_columns")
+    assert write_columns(records, path) == 500
+    assert_table_holds(path, records)
+    assert ColumnarTable(path).code("counterparty", "Nobody") is None
+    assert record_fee({"body": "Fee paid: 1,250 RWF"}) == 1250
+
+    # Rebuilt, the directory is another table
+    first_id = ColumnarTable(path).id
+    write_columns(records[:10], path)
+    assert ColumnarTable(path).id != first_id
+    assert_table_holds(path, records[:10])
+
+
+def test_appends_truncation_and_uncommitted_rows(tmp_path):
+    records = make_records(300, seed=13)
+    path = str(tmp_path / "sms_columns")
+    with ColumnAppender(path, batch_size=32) as appender:
+        for record in records[:200]:
+            appender.add(record)
+    opened = ColumnarTable(path)
+
+    # Rows added but never committed are not seen, and are overwritten
+    appender = ColumnAppender(path, batch_size=32)
+    for record in make_records(100, seed=14):
+        appender.add(record)
+    appender.flush()
+    appender.close()
+    assert_table_holds(path, records[:200])
+
+    truncate_columns(path, 150)
+    truncate_columns(path, 180)
+    assert_table_holds(path, records[:150])
+    with ColumnAppender(path, batch_size=32) as appender:
+        for record in records[150:]:
+            appender.add(record)
+    assert_table_holds(path, records)
+    # A table opened earlier keeps the rows it was opened with
+    assert len(opened) == 200
+    assert opened.column("balance").tolist() == [expected_int(record, "balance") for record in records[:200]]
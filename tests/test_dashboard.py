@@ -0,0 +1,100 @@
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import make_records
+from etl.columnar import ColumnAppender, record_fee, write_columns
+from etl.config import TIMEZONE_OFFSET_HOURS
+from etl.dashboard import update_dashboard
+
+
+def number(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def naive_dashboard(records):
+    """The daily series, counterparties and balances, one record at a time"""
+    local = timezone(timedelta(hours=TIMEZONE_OFFSET_HOURS))
+    daily = defaultdict(lambda: defaultdict(lambda: [0, 0, 0]))
+    parties = defaultdict(lambda: [0, 0])
+    balances = {}
+    for record in records:
+        amount = number(record.get("amount")) or 0
+        date, balance = number(record.get("date")), number(record.get("balance"))
+        day = None
+        if date is not None:
+            day = datetime.fromtimestamp(date / 1000, local).strftime("%Y-%m-%d")
+        if day is not None and record.get("transaction_type") is not None:
+            totals = daily[day][record["transaction_type"]]
+            totals[0] += 1
+            totals[1] += amount
+            totals[2] += record_fee(record) or 0
+        if record.get("counterparty") is not None:
+            parties[record["counterparty"]][0] += 1
+            parties[record["counterparty"]][1] += amount
+        if day is not None and balance is not None:
+            if day not in balances or date >= balances[day][0]:
+                balances[day] = (date, balance)
+
+    return {
+        "daily": [{"period": day, "count": sum(t[0] for t in types.values()),
+                   "amount": sum(t[1] for t in types.values()), "fees": sum(t[2] for t in types.values()),
+                   "by_type": {name: {"count": t[0], "amount": t[1], "fees": t[2]} for name, t in types.items()}}
+                  for day, types in sorted(daily.items())],
+        "parties": {name: {"count": count, "amount": amount} for name, (count, amount) in parties.items()},
+        "balance": [{"date": day, "balance": balance} for day, (_, balance) in sorted(balances.items())],
+    }
+
+
+def read_dashboard(path):
+    with open(path, "r", encoding="utf-8") as f:
+        dashboard = json.load(f)
+    del dashboard["generated_at"]
+    return dashboard
+
+
+@pytest.mark.parametrize("seed", [15, 16])
+def test_dashboard_matches_a_record_by_record_computation(tmp_path, seed):
+    records = make_records(3000, seed)
+    columns, dashboard_path = str(tmp_path / "sms_columns"), str(tmp_path / "dashboard.json")
+    write_columns(records, columns)
+    assert update_dashboard(columns, dashboard_path, chunk_rows=700) == 3000
+
+    dashboard = read_dashboard(dashboard_path)
+    expected = naive_dashboard(records)
+    assert dashboard["records"] == 3000
+    assert dashboard["daily"] == expected["daily"]
+    assert dashboard["balance"] == expected["balance"]
+    assert {party["name"]: {"count": party["count"], "amount": party["amount"]}
+            for party in dashboard["top_counterparties"]} == expected["parties"]
+    assert dashboard["totals"]["count"] == sum(day["count"] for day in expected["daily"])
+    assert sum(month["amount"] for month in dashboard["monthly"]) == dashboard["totals"]["amount"]
+    assert all(datetime.strptime(week["period"], "%Y-%m-%d").weekday() == 0 for week in dashboard["weekly"])
+
+
+def test_incremental_update_matches_a_rebuild(tmp_path):
+    records = make_records(2000, seed=16)
+    columns, dashboard_path = str(tmp_path / "sms_columns"), str(tmp_path / "dashboard.json")
+    write_columns(records[:1200], columns)
+    update_dashboard(columns, dashboard_path)
+    assert update_dashboard(columns, dashboard_path) == 0
+
+    with ColumnAppender(columns) as appender:
+        for record in records[1200:]:
+            appender.add(record)
+    assert update_dashboard(columns, dashboard_path, chunk_rows=300) == 800
+
+    rebuilt = str(tmp_path / "rebuilt")
+    write_columns(records, rebuilt)
+    update_dashboard(rebuilt, str(tmp_path / "rebuilt.json"))
+    assert read_dashboard(dashboard_path) == read_dashboard(str(tmp_path / "rebuilt.json"))
+
+    # A rebuilt columnar directory starts the totals over
+    write_columns(records[:100], columns)
+    assert update_dashboard(columns, dashboard_path) == 100
+    assert read_dashboard(dashboard_path)["records"] == 100
@@ -0,0 +1,68 @@
+import os
+from urllib.parse import parse_qs
+
+from api.db import SQLiteStore
+from api.indexes import parse_query
+from api.store import TransactionStore
+from conftest import make_records
+from etl.load_db import load_records
+from etl.parse_xml import write_records_stream
+
+
+def open_stores(directory, records):
+    path = os.path.join(directory, "sms_records.json")
+    with open(path, "w", encoding="utf-8") as f:
+        write_records_stream(records, f)
+    db_path = os.path.join(directory, "momo.db")
+    assert load_records(records, db_path, batch_size=7, rows_per_transaction=20) == len(records)
+    return TransactionStore(path), SQLiteStore(db_path)
+
+
+def pages(store, query_string):
+    items, cursor = [], ""
+    while True:
+        page = store.page(parse_query(parse_qs(query_string + cursor)))
+        items.extend(dict(item) for item in page["items"])
+        if page["next_cursor"] is None:
+            return items
+        cursor = "&cursor=" + page["next_cursor"]
+
+
+QUERIES = ["limit=11", "limit=3&transaction_type=sent&min_amount=2000", "limit=8&counterparty=Samuel+Carter",
+           "limit=6&date_from=2024-05-04&date_to=2024-05-21", "limit=5&date_to=2024-05-09&fields=amount,body",
+           "limit=4&transaction_type=payment&counterparty=Jane+Smith&max_amount=3000&date_from=2024-05-15"]
+
+
+def assert_same(memory, database):
+    assert [dict(record) for record in memory.all()] == database.all()
+    for tx_id in ("tx-0", "tx-17", "tx-199", "tx-new", "tx-nope"):
+        expected = memory.get(tx_id)
+        assert database.get(tx_id) == (dict(expected) if expected is not None else None)
+    for query_string in QUERIES:
+        assert pages(memory, query_string) == pages(database, query_string)
+
+
+def test_sqlite_store_answers_like_the_json_store(tmp_path):
+    memory, database = open_stores(str(tmp_path), make_records(200, seed=9))
+    assert_same(memory, database)
+
+    version = database.version
+    for store in (memory, database):
+        store.add({"transaction_id": "tx-new", "transaction_type": "sent", "amount": "700",
+                   "transaction_date": "2024-05-05 05:00:00"})
+        store.add_many(make_records(20, seed=10)[10:])
+        store.update("tx-17", {"counterparty": "Jane Smith", "amount": "2500"})
+        store.delete("tx-0")
+        assert store.delete("tx-nope") is None and store.update("tx-nope", {"amount": "1"}) is None
+    assert database.version > version
+    assert_same(memory, database)
+
+
+def test_loading_again_replaces_or_appends(tmp_path):
+    records = make_records(30, seed=9)
+    _, database = open_stores(str(tmp_path), records)
+    db_path = os.path.join(str(tmp_path), "momo.db")
+    load_records(records[:5], db_path)
+    assert len(database.all()) == 35
+    load_records(records[:5], db_path, replace=True)
+    assert database.all() == records[:5]
@@ -0,0 +1,85 @@
+import os
+import random
+from urllib.parse import parse_qs
+
+import pytest
+
+from api.indexes import parse_query
+from api.store import TransactionStore
+from conftest import make_records
+from etl.parse_xml import write_records_stream
+
+
+def write_dataset(directory, records):
+    path = os.path.join(directory, "sms_records.json")
+    with open(path, "w", encoding="utf-8") as f:
+        write_records_stream(records, f)
+    return path
+
+
+def page_through(store, query_string):
+    items, cursor = [], ""
+    while True:
+        page = store.page(parse_query(parse_qs(query_string + cursor)))
+        items.extend(page["items"])
+        if page["next_cursor"] is None:
+            return items
+        assert page["items"]
+        cursor = "&cursor=" + page["next_cursor"]
+
+
+def scan(store, query_string):
+    """What paging should return, from a full scan of the store"""
+    query = parse_query(parse_qs(query_string))
+    matching = []
+    for record in store.all():
+        if any(name in query and record.get(name) != query[name] for name in ("transaction_type", "counterparty")):
+            continue
+        if "min_amount" in query or "max_amount" in query:
+            try:
+                amount = float(record["amount"])
+            except (TypeError, ValueError):
+                continue
+            if not query.get("min_amount", amount) <= amount <= query.get("max_amount", amount):
+                continue
+        matching.append(record)
+    if "date_from" not in query and "date_to" not in query:
+        return matching
+    dated = [record for record in matching if "transaction_date" in record
+             and query.get("date_from", "") <= record["transaction_date"] <= query.get("date_to", "9999")]
+    # By date, and in file order on the same date
+    return sorted(dated, key=lambda record: record["transaction_date"])
+
+
+QUERIES = ["limit=7", "limit=1&transaction_type=sent", "limit=13&counterparty=Jane+Smith&min_amount=1000",
+           "limit=10&transaction_type=payment&counterparty=Alex+Doe", "limit=9&date_from=2024-05-03&date_to=2024-05-20",
+           "limit=4&date_from=2024-05-10&transaction_type=received&max_amount=2500", "limit=50&date_to=2024-05-02",
+           "limit=5&counterparty=Nobody"]
+
+
+@pytest.mark.parametrize("seed", [6, 7])
+@pytest.mark.parametrize("query_string", QUERIES)
+def test_paging_matches_a_full_scan(tmp_path, query_string, seed):
+    store = TransactionStore(write_dataset(str(tmp_path), make_records(300, seed)))
+    assert page_through(store, query_string) == scan(store, query_string)
+
+    # The indexes follow writes
+    rng = random.Random(seed)
+    for record in make_records(40, seed + 100):
+        store.add(dict(record, transaction_id="new-" + record["transaction_id"]))
+    for i in rng.sample(range(300), 40):
+        store.delete(f"tx-{i}")
+    for i in rng.sample(range(300), 40):
+        store.update(f"tx-{i}", {"transaction_type": "sent", "counterparty": "Jane Smith", "amount": "1500"})
+    assert page_through(store, query_string) == scan(store, query_string)
+
+
+def test_cursor_must_fit_the_query(tmp_path):
+    store = TransactionStore(write_dataset(str(tmp_path), make_records(30)))
+    cursor = store.page(parse_query(parse_qs("limit=2")))["next_cursor"]
+    with pytest.raises(ValueError):
+        store.page(parse_query(parse_qs(f"limit=2&date_from=2024-05-01&cursor={cursor}")))
+    for params in ("cursor=bm9wZQ==", "limit=0", "limit=x", "date_from=May", "min_amount=lots",
+                   "min_amount=nan", "max_amount=inf", "max_amount=-Infinity"):
+        with pytest.raises(ValueError):
+            parse_query(parse_qs(params))
@@ -0,0 +1,136 @@
+import json
+import os
+import random
+import re
+
+import numpy as np
+
+from etl.clean_normalize import compact_record
+from etl.ingest import BloomFilter, KeySet, Provenance, ingest, record_key
+from etl.parse_xml import parse_sms_xml_to_json
+from etl.run import run
+from scripts.generate_backup import iter_sms_lines
+
+
+def write_backup(path, lines, backup_set):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        f.write(f'<smses count="{len(lines)}" backup_set="{backup_set}" type="full">\n')
+        f.writelines(lines)
+        f.write("</smses>\n")
+
+
+def store_paths(directory):
+    return dict(output=os.path.join(directory, "sms_records.json"),
+                state_path=os.path.join(directory, "etl_state.json"),
+                hashes_path=os.path.join(directory, "etl_hashes.bin"),
+                columns_path=os.path.join(directory, "sms_columns"),
+                search_path=os.path.join(directory, "sms_search"),
+                dashboard_path=os.path.join(directory, "dashboard.json"),
+                dead_letter_path=os.path.join(directory, "dead_letter"),
+                snapshot_path=os.path.join(directory, "sms_snapshot.bin"))
+
+
+def read_records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f, object_hook=compact_record)
+
+
+def read_records_from_lines(lines, numbers):
+    return parse_sms_xml_to_json("<smses>" + "".join(lines[i] for i in numbers) + "</smses>")
+
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    rng = np.random.default_rng(3)
+    keys = rng.integers(0, 2 ** 63, 20_000, dtype=np.uint64)
+    bloom = BloomFilter(20_000, 0.01)
+    bloom.add(keys)
+    assert bloom.might_contain(keys).all()
+    others = rng.integers(0, 2 ** 63, 100_000, dtype=np.uint64)
+    assert bloom.might_contain(others).mean() < 0.02
+
+
+def test_key_set_matches_a_set():
+    rng = np.random.default_rng(4)
+    keys = KeySet(np.sort(rng.choice(10 ** 6, 500, replace=False).astype(np.uint64)))
+    expected = set(keys.runs[0].tolist())
+    for _ in range(40):
+        fresh = np.setdiff1d(rng.integers(0, 10 ** 6, rng.integers(0, 60), dtype=np.uint64),
+                             np.array(sorted(expected), np.uint64))
+        keys.add(fresh)
+        expected.update(fresh.tolist())
+    probe = rng.integers(0, 10 ** 6, 5000, dtype=np.uint64)
+    assert keys.contains(probe).tolist() == [key in expected for key in probe.tolist()]
+    assert keys.array().tolist() == sorted(expected)
+    assert len(keys.runs) < 10
+
+
+def test_ingest_deduplicates_across_backups(tmp_path):
+    lines = list(iter_sms_lines(3000, seed=11))
+    backups = tmp_path / "backups"
+    backups.mkdir()
+    rng = random.Random(2)
+    windows = []
+    for phone in range(6):
+        start = rng.randrange(2000)
+        windows.append((start, start + 1000))
+        write_backup(str(backups / f"phone{phone}.xml"), lines[start:start + 1000], f"set-{phone}")
+    # The same phone again after a reinstall, with a message the others lack
+    write_backup(str(backups / "phone0_again.xml"), lines[windows[0][0]:windows[0][1]] + lines[-1:], "set-7")
+
+    store = tmp_path / "store"
+    store.mkdir()
+    paths = store_paths(str(store))
+    result = ingest(str(backups), ingest_path=str(store / "etl_ingest"), workers=1, chunk_size=16 * 1024, **paths)
+
+    covered = {i for start, end in windows for i in range(start, end)} | {len(lines) - 1}
+    records = read_records(paths["output"])
+    keys = [record_key(record) for record in records]
+    assert len(set(keys)) == len(keys)
+    assert result.parsed == 7 * 1000 + 1
+    assert result.new == len(records) == len({record_key(r) for r in read_records_from_lines(lines, sorted(covered))})
+    assert result.duplicates == result.parsed - result.new
+
+    provenance = Provenance(str(store / "etl_ingest"))
+    last, first = read_records_from_lines(lines, [len(lines) - 1, windows[0][0]])
+    assert provenance.sources_of(last) == [str(backups / "phone0_again.xml")]
+    assert {str(backups / "phone0.xml"), str(backups / "phone0_again.xml")} <= set(provenance.sources_of(first))
+    assert len(provenance.backups) == 7
+
+    # Nothing changed: every backup is skipped, also by etl.run
+    again = ingest(str(backups), ingest_path=str(store / "etl_ingest"), workers=1, **paths)
+    assert again.skipped == 7 and again.new == 0
+    assert run(str(backups / "phone3.xml"), **paths).unchanged
+
+    # A new backup only adds what no other held
+    write_backup(str(backups / "phone9.xml"), lines[2500:], "set-9")
+    more = ingest(str(backups / "phone9*.xml"), ingest_path=str(store / "etl_ingest"), workers=1, **paths)
+    assert more.new == len(set(range(2500, 3000)) - set(covered))
+    assert len(read_records(paths["output"])) == len(records) + more.new
+
+    # Another phone got the same messages a second later: those with a
+    # transaction_id are the same transactions, the others cannot be told apart
+    later = [re.sub(r' date="(\d+)"', lambda m: f' date="{int(m.group(1)) + 1000}"', line) for line in lines[:500]]
+    write_backup(str(backups / "other_phone.xml"), later, "set-10")
+    other = ingest(str(backups / "other_phone.xml"), ingest_path=str(store / "etl_ingest"), workers=1, **paths)
+    assert other.new == sum(record.get("transaction_id") is None or i not in covered
+                            for i, record in enumerate(read_records_from_lines(later, range(500))))
+
+
+def test_ingest_in_parallel_matches_serial(tmp_path):
+    lines = list(iter_sms_lines(1500, seed=12))
+    backups = tmp_path / "backups"
+    backups.mkdir()
+    for phone in range(3):
+        write_backup(str(backups / f"phone{phone}.xml"), lines[phone * 300:phone * 300 + 900], f"set-{phone}")
+
+    outputs = []
+    for workers in (1, 2):
+        store = tmp_path / f"store{workers}"
+        store.mkdir()
+        paths = store_paths(str(store))
+        ingest(str(backups), ingest_path=str(store / "etl_ingest"), workers=workers, chunk_size=16 * 1024, **paths)
+        outputs.append(read_records(paths["output"]))
+    assert outputs[0] == outputs[1]
+    assert len(outputs[0]) == 1500
+
@@ -0,0 +1,106 @@
+import json
+import os
+
+import pytest
+
+from api.journal import Journal
+from api.store import TransactionStore
+from conftest import make_records
+from etl.parse_xml import write_records_stream
+
+
+class Crash(Exception):
+    pass
+
+
+def write_dataset(directory, records):
+    path = os.path.join(directory, "sms_records.json")
+    with open(path, "w", encoding="utf-8") as f:
+        write_records_stream(records, f)
+    return path
+
+
+def open_store(path):
+    """The store a restarted process would open"""
+    store = TransactionStore(path, compact_bytes=1 << 30)
+    store.refresh()
+    return store
+
+
+def write_ops(store):
+    store.add({"transaction_id": "tx-new", "amount": 7})
+    store.update("tx-1", {"amount": 5})
+    store.delete("tx-2")
+    store.sync()
+
+
+def state(store):
+    return [(record["transaction_id"], record["amount"]) for record in store.all()]
+
+
+def test_replay_over_a_stale_data_file(tmp_path):
+    path = write_dataset(str(tmp_path), make_records(5))
+    store = open_store(path)
+    write_ops(store)
+    expected = state(store)
+    assert ("tx-new", 7) in expected and ("tx-1", 5) in expected and "tx-2" not in dict(expected)
+
+    # The data file was never rewritten: the ops are only in the journal
+    with open(path, "r", encoding="utf-8") as f:
+        assert len(json.load(f)) == 5
+    again = open_store(path)
+    assert state(again) == expected
+    assert again._journal.lsn == 3
+    again.add({"transaction_id": "tx-later", "amount": 1})
+    assert open_store(path)._journal.lsn == 4
+
+
+@pytest.mark.parametrize("crash_in", ["mark_compacted", "truncate_through"])
+def test_replay_after_an_interrupted_compaction(tmp_path, monkeypatch, crash_in):
+    path = write_dataset(str(tmp_path), make_records(5))
+    store = open_store(path)
+    write_ops(store)
+    expected = state(store)
+
+    journal = store._journal
+    step = getattr(journal, crash_in)
+
+    def crash(*args):
+        if crash_in == "mark_compacted":
+            step(*args)
+        raise Crash
+
+    # Before the new data file is in place the marker names a file that is
+    # not there, and every op is replayed; after it, the folded ops are not
+    monkeypatch.setattr(journal, crash_in, crash)
+    with pytest.raises(Crash):
+        store.compact()
+    with open(path, "r", encoding="utf-8") as f:
+        assert ("tx-new" in [record["transaction_id"] for record in json.load(f)]) == (crash_in == "truncate_through")
+    assert state(open_store(path)) == expected
+
+    # A compaction that then completes leaves nothing to replay
+    again = open_store(path)
+    again.compact()
+    assert os.path.getsize(path + ".journal") == 0
+    assert state(open_store(path)) == expected
+
+
+def test_torn_last_line_is_cut_off(tmp_path):
+    path = write_dataset(str(tmp_path), make_records(5))
+    store = open_store(path)
+    write_ops(store)
+    expected = state(store)
+
+    journal_path = path + ".journal"
+    good_size = os.path.getsize(journal_path)
+    with open(journal_path, "ab") as f:
+        f.write(b'{"op": "add", "record": {"transaction_id": "tx-torn"')
+
+    again = open_store(path)
+    assert state(again) == expected
+    assert os.path.getsize(journal_path) == good_size
+    again.add({"transaction_id": "tx-after", "amount": 9})
+    again.sync()
+    assert state(open_store(path)) == expected + [("tx-after", 9)]
+    assert [op["lsn"] for op in Journal(journal_path).replay(None)] == [1, 2, 3, 4]
@@ -0,0 +1,46 @@
+import pytest
+
+from etl import metrics
+
+
+def test_render_histogram_and_labels():
+    registry = metrics.Registry()
+    latency = registry.histogram("request_seconds", "Request latency", ("path",), buckets=(0.1, 1.0))
+    latency.labels('/a"b').observe(0.05)
+    latency.labels('/a"b').observe(0.5)
+    latency.labels('/a"b').observe(5)
+    registry.gauge("in_flight", "Requests in flight").labels().inc(2)
+
+    assert registry.render().splitlines() == [
+        "# HELP request_seconds Request latency",
+        "# TYPE request_seconds histogram",
+        'request_seconds_bucket{path="/a\\"b",le="0.1"} 1',
+        'request_seconds_bucket{path="/a\\"b",le="1.0"} 2',
+        'request_seconds_bucket{path="/a\\"b",le="+Inf"} 3',
+        'request_seconds_sum{path="/a\\"b"} 5.55',
+        'request_seconds_count{path="/a\\"b"} 3',
+        "# HELP in_flight Requests in flight",
+        "# TYPE in_flight gauge",
+        "in_flight 2",
+    ]
+
+
+def test_family_checks_labels():
+    registry = metrics.Registry()
+    family = registry.counter("hits_total", "Hits", ("route",))
+
+    assert registry.counter("hits_total", "Hits", ("route",)) is family
+    assert family.labels("/a") is family.labels("/a")
+    with pytest.raises(ValueError):
+        family.labels("/a", "GET")
+    with pytest.raises(ValueError):
+        registry.gauge("hits_total", "Hits", ("route",))
+
+
+def test_disabled_stage_records_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, "enabled", False)
+
+    with metrics.stage("test_disabled", 10) as stage:
+        stage.records = 20
+
+    assert "test_disabled" not in [name for name, _, _ in metrics.stage_summary()]
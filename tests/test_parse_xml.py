@@ -0,0 +1,122 @@
+import io
+import json
+import os
+
+from etl.parse_xml import (iter_sms_records, parse_sms_xml_to_json, write_records_stream,
+                           xml_file_path)
+
+SAMPLE = b"""<?xml version='1.0' encoding='utf-8'?>
+<smses count="2" backup_set="abc" type="full">
+  <sms protocol="0" address="M-Money" date="1" body="You have received 2000 RWF from Jane Smith (*********013) on your mobile money account at 2024-05-10 16:30:51. Your new balance:2000 RWF." />
+  <sms protocol="0" address="M-Money" date="2" body="TxId: 73214484437. Your payment of 1,000 RWF to Jane Smith 12845 has been completed at 2024-05-10 16:31:39. Your new balance: 1,000 RWF." />
+</smses>
+"""
+
+
+def test_stream_matches_whole_document_parse():
+    records = list(iter_sms_records(io.BytesIO(SAMPLE)))
+
+    assert records == parse_sms_xml_to_json(SAMPLE)
+    assert [r["transaction_type"] for r in records] == ["credit", "debit"]
+    assert records[1]["amount"] == "1000"
+
+
+def test_stream_matches_sample_backup():
+    with open(xml_file_path, "r", encoding="utf-8") as f:
+        expected = parse_sms_xml_to_json(f.read())
+
+    assert list(iter_sms_records(xml_file_path)) == expected
+
+
+def test_json_writer_matches_json_dump():
+    records = parse_sms_xml_to_json(SAMPLE)
+
+    for data in (records, []):
+        out = io.StringIO()
+        assert write_records_stream(iter(data), out) == len(data)
+        assert out.getvalue() == json.dumps(data, indent=2, ensure_ascii=False)
+
+
+def test_ndjson_writer_one_record_per_line():
+    records = parse_sms_xml_to_json(SAMPLE)
+    out = io.StringIO()
+
+    write_records_stream(records, out, ndjson=True)
+
+    assert [json.loads(line) for line in out.getvalue().splitlines()] == records
+
+
+def test_sample_backup_matches_processed_records():
+    processed = os.path.join(os.path.dirname(xml_file_path), "..", "processed", "sms_records.json")
+    with open(processed, "r", encoding="utf-8") as f:
+        expected = json.load(f)
+
+    assert list(iter_sms_records(xml_file_path)) == expected
+
+
+TRICKY_BODIES = [
+    # Names and messages carrying words the generic patterns look for
+    "TxId: 1. Your payment of 1,000 RWF to Jane Balance 12845 has been completed at 2024-05-10 16:31:39. Your new balance: 1,000 RWF.",
+    "TxId: 1. Your payment of 1,000,000 RWF to Jane Smith 12845 has been completed at 2024-05-10 16:31:39. Your new balance: 1,000 RWF.",
+    "You have received 20000 RWF from Alex Doe (*********721) on your mobile money account at 2024-10-18 23:00:18. Message from sender: fund-transfer to  250795963036. Your new balance:26250 RWF.",
+    "You have received 2,000 RWF from Jane Smith (*********013) on your mobile money account at 2024-05-10 16:30:51. Message from sender: . Your new balance:2000 RWF.",
+    "You Robert from (*********036) have via agent: Agent Sophia (250790777777), withdrawn 500 RWF from your mobile money account: 36521838 at 2024-01-01 00:00:00 and you can now collect your money in cash. Your new balance: 0 RWF. Fee paid: 350 RWF.",
+    "You Abebe Chala (*********036) have via agent: Agent Sophia (250790777777), withdrawn 500 RWF from your mobile money account: 36521838 at 2024-01-01 00:00:00 and you can now collect your money in cash. Your new balance: 0 RWF. Message from agent: 1 (ok). TxId 42",
+    "*165*S*10000 RWF transferred to Samuel Carter (250791666666) from 36521838 at 2024-05-11 20:34:47 . Fee was: 1,000,000 RWF. New balance: 28300 RWF. received 5 RWF",
+    "*113*R*A bank deposit of 40000 RWF has been added to your mobile money account at 2024-05-11 18:43:49. Your NEW BALANCE :40400 RWF. TxId:77",
+    "*162*TxId:13913173274*S*Your payment of 2000 RWF to Airtime with token 99 has been completed at 2024-05-12 11:41:28. Fee was 0 RWF. Your new balance: 25280 RWF .",
+    "TxId: 1. Your payment of 1,000 RWF to Jane\nSmith 12845 has been completed at 2024-05-10 16:31:39. Your new balance: 1,000 RWF.",
+    "",
+]
+
+
+def test_template_extraction_matches_generic_cascade(monkeypatch):
+    import etl.parse_xml as parse_xml
+
+    with open(xml_file_path, "r", encoding="utf-8") as f:
+        bodies = TRICKY_BODIES + [r["body"] for r in parse_sms_xml_to_json(f.read())]
+    fast = [parse_xml.parse_transaction_details(body) for body in bodies]
+
+    monkeypatch.setattr(parse_xml, "_TEMPLATES_BY_FIRST_CHAR", {})
+    assert fast == [parse_xml.parse_transaction_details(body) for body in bodies]
+
+
+def test_parallel_matches_serial_order_and_records():
+    from etl.parse_xml import iter_sms_records_parallel, split_sms_byte_ranges
+
+    ranges = split_sms_byte_ranges(xml_file_path, chunk_size=64 * 1024)
+    assert len(ranges) > 4
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+
+    parallel = list(iter_sms_records_parallel(xml_file_path, workers=2, chunk_size=64 * 1024, min_size=0))
+    assert parallel == list(iter_sms_records(xml_file_path))
+
+
+def test_batches_isolate_malformed_elements(tmp_path):
+    from etl.parse_xml import iter_sms_batches
+
+    broken = SAMPLE.replace(b'date="2" body="', b'date="2" body="un"quoted ')
+    path = tmp_path / "backup.xml"
+    path.write_bytes(broken)
+
+    batches = list(iter_sms_batches(str(path), workers=1))
+    records = [record for _, batch, _ in batches for record in batch]
+    rejects = [reject for _, _, batch in batches for reject in batch]
+
+    assert records == parse_sms_xml_to_json(SAMPLE)[:1]
+    assert len(rejects) == 1
+    offset, error, element = rejects[0]
+    assert broken[offset:].startswith(b'<sms protocol="0" address="M-Money" date="2"')
+    assert error.startswith("ParseError") and element.startswith('<sms ')
+    assert batches[-1][0] == broken.rfind(b'</smses>')
+
+
+def test_truncated_backup_keeps_its_whole_elements(tmp_path):
+    from etl.parse_xml import iter_sms_batches
+
+    path = tmp_path / "backup.xml"
+    path.write_bytes(SAMPLE[:SAMPLE.rfind(b'Your new balance: 1,000')])
+
+    (_, records, rejects), = iter_sms_batches(str(path), workers=1)
+    assert records == parse_sms_xml_to_json(SAMPLE)[:1]
+    assert len(rejects) == 1
@@ -0,0 +1,126 @@
+import base64
+import gzip
+import http.client
+import json
+import os
+import threading
+from http.server import HTTPServer
+
+import pytest
+
+import api.app as app
+from api.cache import CachedResponse, ResponseCache, response_key
+from api.store import TransactionStore, get_store
+from conftest import make_records
+from etl.parse_xml import write_records_stream
+
+AUTH = {"Authorization": "Basic " + base64.b64encode(b"test@momo.rw:test").decode()}
+
+
+class QuietHandler(app.SMSHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def write_dataset(directory, records):
+    path = os.path.join(directory, "sms_records.json")
+    with open(path, "w", encoding="utf-8") as f:
+        write_records_stream(records, f)
+    return path
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    user_path = tmp_path / "users.json"
+    user_path.write_text(json.dumps([{"email": "test@momo.rw", "password": "test"}]))
+    monkeypatch.setattr(app, "DATA_FILE", write_dataset(str(tmp_path), make_records(40)))
+    monkeypatch.setattr(app, "USER_FILE", str(user_path))
+    monkeypatch.setattr(app, "STORAGE", "json")
+    httpd = HTTPServer(("127.0.0.1", 0), QuietHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def request(httpd, method, path, body=None, headers=()):
+    conn = http.client.HTTPConnection(*httpd.server_address)
+    conn.request(method, path, body=body, headers=dict(AUTH, **dict(headers)))
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response, data
+
+
+def test_response_key_normalizes_the_query():
+    assert response_key("/stats", "b=2&a=1&a=3", 7) == response_key("/stats", "a=1&a=3&b=2", 7)
+    assert response_key("/stats", "a=1&a=3", 7) != response_key("/stats", "a=3&a=1", 7)
+    assert response_key("/stats", "a=1", 7) != response_key("/stats", "a=1", 8)
+
+
+def test_cache_is_bounded_and_drops_changed_entries(tmp_path):
+    store = TransactionStore(write_dataset(str(tmp_path), make_records(10)))
+    cache = ResponseCache(4 * 1024, max_entry_bytes=1024)
+    store.index(lambda: cache)
+
+    def put(path, version=None, tx_id=None, size=100):
+        return cache.put(CachedResponse(response_key(path, "", version), 200, (), b"x" * size, tx_id=tx_id),
+                         cache.token())
+
+    assert not put("/transactions", 1, size=2000)
+    for i in range(10):
+        assert put(f"/transaction/tx-{i}", tx_id=f"tx-{i}")
+    assert cache.stats()["evictions"] == 4 and cache.bytes <= cache.max_bytes
+    assert cache.get(response_key("/transaction/tx-0", "")) is None
+    assert cache.get(response_key("/transaction/tx-9", "")) is not None
+
+    put("/transactions", store.version)
+    token = cache.token()
+    store.update("tx-8", {"amount": 1})
+    assert cache.get(response_key("/transactions", "", store.version - 1)) is None
+    assert cache.get(response_key("/transaction/tx-8", "")) is None
+    assert cache.get(response_key("/transaction/tx-9", "")) is not None
+    # Made before the write: not kept
+    assert not cache.put(CachedResponse(response_key("/transaction/tx-8", ""), 200, (), b"old", tx_id="tx-8"), token)
+
+    stats = cache.stats()
+    assert stats["invalidations"] == 2
+    assert stats["hits"] == 2 and stats["misses"] == 3
+
+
+def test_repeat_reads_are_served_from_the_cache(server):
+    store = get_store(app.DATA_FILE)
+    cache = store.index(app.response_cache)
+
+    for path in ("/transactions", "/transactions?limit=5&transaction_type=sent", "/stats", "/transaction/tx-3",
+                 "/transaction/nope"):
+        first, first_body = request(server, "GET", path)
+        again, again_body = request(server, "GET", path)
+        assert (again.status, again_body) == (first.status, first_body)
+        assert again.getheader("ETag") == first.getheader("ETag")
+    assert cache.stats()["hits"] == 5 and cache.stats()["misses"] == 5
+
+    # Both encodings of one cached listing
+    plain = request(server, "GET", "/transactions?transaction_type=sent&limit=5")[1]
+    response, zipped = request(server, "GET", "/transactions?transaction_type=sent&limit=5",
+                               headers=[("Accept-Encoding", "gzip")])
+    assert response.getheader("Content-Encoding") == "gzip"
+    assert gzip.decompress(zipped) == plain
+    assert request(server, "GET", "/transactions?limit=5&transaction_type=sent",
+                   headers=[("Accept-Encoding", "gzip")])[1] == zipped
+
+    # A write drops the listings and the record it touched, and nothing else
+    listing = json.loads(request(server, "GET", "/transactions")[1])
+    fields = dict(listing[3], amount=5, protocol="0", address="M-Money", type="1", body="", subject=None, toa=None,
+                  sc_toa=None, service_center=None, read="1", status="-1", locked="0", date_sent="0", sub_id="1",
+                  readable_date="", contact_name=None)
+    assert request(server, "PUT", "/transactions/tx-3", json.dumps(fields))[0].status == 200
+    misses = cache.stats()["misses"]
+    assert json.loads(request(server, "GET", "/transaction/tx-3")[1])["amount"] == 5
+    assert json.loads(request(server, "GET", "/transactions")[1])[3]["amount"] == 5
+    assert request(server, "GET", "/transaction/nope")[0].status == 404
+    assert cache.stats()["misses"] == misses + 2
+
+    record = dict(fields, transaction_id="nope")
+    assert request(server, "POST", "/transactions", json.dumps(record))[0].status == 201
+    assert request(server, "GET", "/transaction/nope")[0].status == 200
@@ -0,0 +1,199 @@
+import json
+import os
+from functools import partial
+
+import pytest
+
+import etl.run
+from etl.parse_xml import iter_sms_batches, write_records_stream
+from etl.pipeline import content_hash
+from etl.run import run
+from scripts.generate_backup import iter_sms_lines
+
+
+class Killed(Exception):
+    pass
+
+
+def write_backup(path, lines, backup_set):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        f.write(f'<smses count="{len(lines)}" backup_set="{backup_set}" type="full">\n')
+        f.writelines(lines)
+        f.write("</smses>\n")
+
+
+def store_paths(directory):
+    return dict(output=os.path.join(directory, "sms_records.json"),
+                state_path=os.path.join(directory, "etl_state.json"),
+                hashes_path=os.path.join(directory, "etl_hashes.bin"),
+                columns_path=os.path.join(directory, "sms_columns"),
+                search_path=os.path.join(directory, "sms_search"),
+                dashboard_path=os.path.join(directory, "dashboard.json"),
+                dead_letter_path=os.path.join(directory, "dead_letter"),
+                snapshot_path=os.path.join(directory, "sms_snapshot.bin"))
+
+
+def read_records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def stored_rows(paths):
+    with open(os.path.join(paths["columns_path"], "meta.json"), "r", encoding="utf-8") as f:
+        rows = json.load(f)["rows"]
+    return rows, os.path.getsize(paths["hashes_path"]) // 8
+
+
+def kill_after(monkeypatch, batches):
+    """Make the next run stop as if killed once `batches` batches are stored"""
+    batches_of = etl.run._batches
+
+    def _batches(source, offset, size):
+        for number, batch in enumerate(batches_of(source, offset, size)):
+            if number == batches:
+                monkeypatch.setattr(etl.run, "_batches", batches_of)
+                raise Killed
+            yield batch
+
+    monkeypatch.setattr(etl.run, "_batches", _batches)
+
+
+@pytest.fixture
+def backup(tmp_path, monkeypatch):
+    """A backup parsed in ranges small enough for several batches, and the records of a run over it"""
+    monkeypatch.setattr(etl.run, "iter_sms_batches", partial(iter_sms_batches, chunk_size=16 * 1024))
+    path = str(tmp_path / "backup.xml")
+    write_backup(path, list(iter_sms_lines(600, seed=21)), "set-1")
+    clean = tmp_path / "clean"
+    clean.mkdir()
+    paths = store_paths(str(clean))
+    run(path, checkpoint_records=100, **paths)
+    return path, read_records(paths["output"])
+
+
+def test_killed_run_resumes_from_its_checkpoint(tmp_path, monkeypatch, backup):
+    path, expected = backup
+    paths = store_paths(str(tmp_path))
+    kill_after(monkeypatch, 3)
+    with pytest.raises(Killed):
+        run(path, checkpoint_records=100, **paths)
+    with open(paths["state_path"], "r", encoding="utf-8") as f:
+        checkpoint = json.load(f)["checkpoint"]
+    assert 0 < checkpoint["new"] == len(read_records(paths["output"])) < len(expected)
+
+    result = run(path, checkpoint_records=100, **paths)
+    assert result.resumed and not result.unchanged
+    assert result.new == len(expected) and result.parsed == 600
+    assert read_records(paths["output"]) == expected
+    assert stored_rows(paths) == (len(expected), len(expected))
+
+
+def test_torn_append_is_rolled_back(tmp_path, monkeypatch, backup):
+    path, expected = backup
+    paths = store_paths(str(tmp_path))
+    kill_after(monkeypatch, 2)
+    with pytest.raises(Killed):
+        run(path, checkpoint_records=100, **paths)
+    # Killed halfway through writing the next batch
+    stored = read_records(paths["output"])
+    with open(paths["output"], "r+b") as f:
+        f.truncate(f.seek(-2, os.SEEK_END))
+        f.write(b',\n  {\n    "protocol": "0",\n    "addr')
+    with open(paths["hashes_path"], "ab") as f:
+        f.write(content_hash(expected[len(stored)]).to_bytes(8, "little"))
+
+    result = run(path, checkpoint_records=100, **paths)
+    assert result.resumed
+    assert read_records(paths["output"]) == expected
+    assert stored_rows(paths) == (len(expected), len(expected))
+
+
+def test_output_rewritten_after_a_kill_is_indexed_again(tmp_path, monkeypatch, backup):
+    path, expected = backup
+    paths = store_paths(str(tmp_path))
+    kill_after(monkeypatch, 3)
+    with pytest.raises(Killed):
+        run(path, checkpoint_records=100, **paths)
+    # The API folds its journal into the file before the next run: one
+    # record added, and the file written anew
+    posted = {"transaction_id": "api-1", "address": "M-Money", "date": "1706745600000", "type": "1",
+              "body": "posted through the API"}
+    records = read_records(paths["output"]) + [posted]
+    with open(paths["output"] + ".tmp", "w", encoding="utf-8") as f:
+        write_records_stream(records, f)
+    os.replace(paths["output"] + ".tmp", paths["output"])
+
+    result = run(path, checkpoint_records=100, **paths)
+    assert not result.resumed
+    assert result.parsed == 600 and result.new == len(expected) - len(records) + 1
+    stored = read_records(paths["output"])
+    assert stored[:len(records)] == records
+    assert sorted(map(content_hash, stored)) == sorted(map(content_hash, expected + [posted]))
+    assert stored_rows(paths) == (len(stored), len(stored))
+
+
+def test_unchanged_source_is_skipped(tmp_path):
+    path = str(tmp_path / "backup.xml")
+    write_backup(path, list(iter_sms_lines(300, seed=22)), "set-1")
+    paths = store_paths(str(tmp_path))
+    first = run(path, **paths)
+    assert first.new == 300 and not first.unchanged
+
+    again = run(path, **paths)
+    assert again.unchanged and again.parsed == 0 and again.watermark == first.watermark
+    # Touched, the file is parsed again, but adds nothing
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    touched = run(path, **paths)
+    assert not touched.unchanged and touched.new == 0
+    assert len(read_records(paths["output"])) == 300
+
+
+def test_next_backup_is_parsed_from_the_watermark(tmp_path):
+    lines = list(iter_sms_lines(600, seed=23))
+    path = str(tmp_path / "backup.xml")
+    write_backup(path, lines[:400], "set-1")
+    paths = store_paths(str(tmp_path))
+    first = run(path, **paths)
+    dates = [int(record["date"]) for record in read_records(paths["output"])]
+    assert first.watermark == max(dates)
+
+    # The phone's next backup holds the same messages and 200 more
+    write_backup(path, lines, "set-2")
+    second = run(path, **paths)
+    assert second.new == 200
+    assert second.parsed < 600 and second.duplicates == second.parsed - 200
+    clean = tmp_path / "clean"
+    clean.mkdir()
+    run(path, **store_paths(str(clean)))
+    assert read_records(paths["output"]) == read_records(store_paths(str(clean))["output"])
+
+
+def test_backup_under_a_new_name_starts_from_its_sets_watermark(tmp_path):
+    lines = list(iter_sms_lines(600, seed=25))
+    paths = store_paths(str(tmp_path))
+    write_backup(str(tmp_path / "monday.xml"), lines[:400], "set-1")
+    first = run(str(tmp_path / "monday.xml"), **paths)
+
+    write_backup(str(tmp_path / "tuesday.xml"), lines, "set-1")
+    second = run(str(tmp_path / "tuesday.xml"), **paths)
+    assert second.new == 200 and second.parsed < 600 and second.watermark > first.watermark
+    # Another backup set under a new name is parsed in full
+    write_backup(str(tmp_path / "other.xml"), lines, "set-2")
+    other = run(str(tmp_path / "other.xml"), **paths)
+    assert other.parsed == 600 and other.new == 0
+    assert len(read_records(paths["output"])) == 600
+
+
+def test_messages_are_deduplicated_by_content(tmp_path):
+    lines = list(iter_sms_lines(300, seed=24))
+    path = str(tmp_path / "backup.xml")
+    write_backup(path, lines, "set-1")
+    paths = store_paths(str(tmp_path))
+    run(path, **paths)
+
+    # Marked unread and re-exported: flags do not make a message new
+    write_backup(path, [line.replace(' read="1"', ' read="0"') for line in lines], "set-2")
+    result = run(path, full=True, **paths)
+    assert result.parsed == 300 and result.new == 0 and result.duplicates == 300
+    assert stored_rows(paths) == (300, 300)
@@ -0,0 +1,34 @@
+import pytest
+
+from api.schemas import SMS_RECORD, Schema, ValidationError
+
+
+def make_sms(**fields):
+    record = {name: "0" for name in SMS_RECORD.required}
+    record.update(date="1714567990000", body="You have received 2000 RWF")
+    record.update(fields)
+    return record
+
+
+def test_sms_record_accepts_backup_and_etl_fields():
+    record = make_sms(amount=2000.0, counterparty=None, transaction_type="received")
+    assert SMS_RECORD.validate(record) is record
+    assert SMS_RECORD.validate(make_sms(date=1714567990000))
+
+
+@pytest.mark.parametrize("record, message", [
+    (["not", "an", "object"], "record must be a JSON object"),
+    ({"body": "hi"}, "Missing required field: protocol"),
+    (make_sms(date="yesterday"), "Field date must be digits, got str"),
+    (make_sms(date=True), "Field date must be digits, got bool"),
+    (make_sms(body=None), "Field body must be text, got NoneType"),
+    (make_sms(amount={"value": 1}), "Field amount must be scalar, got dict"),
+])
+def test_sms_record_rejects(record, message):
+    with pytest.raises(ValidationError, match=f"^{message}$"):
+        SMS_RECORD.validate(record)
+
+
+def test_schema_rejects_unknown_kind():
+    with pytest.raises(ValueError):
+        Schema({"date": "timestamp"})
@@ -0,0 +1,110 @@
+import random
+
+import numpy as np
+
+from api import search
+from api.search import SearchIndex, parse_search_query
+from conftest import make_records
+from etl import search_index
+from etl.search_index import Segment, SearchIndexAppender, open_segments, record_terms, tokenize, truncate_search_index
+
+
+def postings_of(segments, term):
+    rows = []
+    for segment in segments:
+        i = segment.find(term)
+        if i is not None:
+            rows.extend(segment.decode(i).tolist())
+    return rows
+
+
+def test_tokenize_matches_word_regex():
+    assert tokenize("Fee was: 1,000 RWF.Kanda*182*16#") == ["fee", "was", "1", "000", "rwf", "kanda", "182", "16"]
+    assert tokenize("Murakoze cyane – ça va") == ["murakoze", "cyane", "ça", "va"]
+    assert tokenize(None) == []
+    assert record_terms({"body": "Sent to Jane", "counterparty": "Jane Smith"}) == \
+        {"sent", "to", "jane", "smith", "c:jane", "c:smith"}
+
+
+def test_segment_round_trip_with_wide_gaps():
+    postings = {"a": [0, 1, 2, 300, 70_000], "b": [5], "c": list(range(0, 1_000_000, 3_000)) + [5_000_000_000]}
+    terms = sorted(postings)
+    arrays = search_index.encode_postings(terms, [len(postings[t]) for t in terms],
+                                          [row for t in terms for row in postings[t]])
+    segment = Segment(0, 5_000_000_001, arrays)
+
+    assert segment.find("zz") is None
+    for term, rows in postings.items():
+        i = segment.find(term)
+        assert segment.decode(i).tolist() == rows
+        blocks = [segment.decode_block(i, block) for block in range(len(segment.block_starts(i)))]
+        assert np.concatenate(blocks).tolist() == rows
+    assert segment.unpack()[0] == terms
+
+
+def test_appender_merges_and_truncates(tmp_path, monkeypatch):
+    monkeypatch.setattr(search_index, "SEGMENT_RECORDS", 200)
+    records = make_records(1000, seed=5)
+    path = str(tmp_path / "sms_search")
+    search_index.write_search_index(records, path)
+    truncate_search_index(path, 650)
+
+    appender = SearchIndexAppender(path)
+    for record in records[650:]:
+        appender.add(record)
+    appender.commit()
+
+    segments = open_segments(path)
+    assert len(segments) < 5
+    for term in ("w0", "w39", "c:jane"):
+        assert postings_of(segments, term) == [i for i, r in enumerate(records) if term in record_terms(r)]
+
+
+def search_all(index, records, q):
+    seen, cursor = [], None
+    while True:
+        params = {"q": [q], "limit": ["7"], "fields": ["transaction_id"]}
+        if cursor:
+            params["cursor"] = [cursor]
+        page = index.search(records, parse_search_query(params))
+        seen.extend(int(item["transaction_id"][3:]) for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return seen
+
+
+def expected_order(records, words, boost):
+    return sorted((seq for seq, r in records.items() if set(words) <= record_terms(r)),
+                  key=lambda seq: (-(boost in record_terms(records[seq])), -seq))
+
+
+def test_search_ranks_counterparty_then_newest_and_follows_writes():
+    records = dict(enumerate(make_records(500, seed=5)))
+    index = SearchIndex("/nonexistent/sms_search", "/nonexistent/sms_records.json")
+    index.rebuild(records)
+
+    records[500] = {"transaction_id": "tx-500", "body": "w1 w2 jane", "counterparty": "Jane Smith"}
+    index.added(500, records[500])
+    index.removed(3, records.pop(3))
+
+    seen = search_all(index, records, "W1 jane")
+    assert seen == expected_order(records, ["w1", "jane"], "c:jane")
+    assert seen[0] == 500
+
+
+def test_merged_segments_cover_the_seqs_of_deleted_records(monkeypatch):
+    monkeypatch.setattr(search, "SEGMENT_RECORDS", 4)
+    records = {seq: {"transaction_id": f"tx-{seq}", "body": "Fee was 100", "counterparty": None} for seq in range(9)}
+    del records[4]
+    index = SearchIndex("/nonexistent/sms_search", "/nonexistent/sms_records.json")
+    index.rebuild(records)
+    assert search_all(index, records, "fee was") == [8, 7, 6, 5, 3, 2, 1, 0]
+
+    # Many segments, several words, and deletes before the first search
+    monkeypatch.setattr(search, "SEGMENT_RECORDS", 16)
+    records = dict(enumerate(make_records(600, seed=6)))
+    for seq in random.Random(7).sample(range(600), 150):
+        del records[seq]
+    index.rebuild(records)
+    for q, words, boost in (("w1 w2", ["w1", "w2"], "c:w1"), ("w3 jane w4", ["w3", "jane", "w4"], "c:jane")):
+        assert search_all(index, records, q) == expected_order(records, words, boost)
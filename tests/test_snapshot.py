@@ -0,0 +1,171 @@
+import os
+import random
+from bisect import bisect_left
+
+import pytest
+
+from api.indexes import MergedKeys, decode_cursor
+from api.store import TransactionStore
+from etl.parse_xml import write_records_stream
+from etl.snapshot import Snapshot, SnapshotWriter, open_snapshot, write_snapshot
+
+TYPES = ["sent", "received", "withdrawal", None]
+COUNTERPARTIES = ["Jane", "John", "Shop", None]
+
+
+def make_record(rng, i):
+    day, second = rng.randrange(1, 29), rng.randrange(86400)
+    return {"transaction_id": rng.choice([f"tx-{i}", f"tx-{i}", f"tx-{i % 50}", None]),
+            "transaction_type": rng.choice(TYPES), "counterparty": rng.choice(COUNTERPARTIES),
+            "transaction_date": rng.choice([f"2024-02-{day:02d} {second // 3600:02d}:{second // 60 % 60:02d}:"
+                                            f"{second % 60:02d}", None]),
+            "date": str(1706745600000 + rng.randrange(28 * 86400) * 1000),
+            "amount": rng.choice([rng.randrange(100, 90000), None]), "balance": rng.randrange(10 ** 6)}
+
+
+def write_dataset(directory, records, snapshot):
+    os.makedirs(directory)
+    path = os.path.join(directory, "sms_records.json")
+    with open(path, "w", encoding="utf-8") as f:
+        write_records_stream(records, f)
+    if snapshot:
+        write_snapshot(records, os.path.join(directory, "sms_snapshot.bin"), path)
+    return path
+
+
+def every_page(store, query):
+    items, cursor = [], None
+    while True:
+        page = store.page(dict(query, cursor=decode_cursor(cursor)) if cursor else query)
+        items.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return items
+
+
+QUERIES = [{"limit": 7}, {"limit": 5, "transaction_type": "sent"}, {"limit": 9, "counterparty": "Shop"},
+           {"limit": 4, "date_from": "2024-02-10", "date_to": "2024-02-20"},
+           {"limit": 6, "transaction_type": "received", "date_from": "2024-02-03 12:00:00"}]
+
+
+def assert_same(snapshot_store, json_store, ids):
+    assert snapshot_store.all() == json_store.all()
+    for tx_id in ids:
+        assert snapshot_store.get(tx_id) == json_store.get(tx_id)
+    for query in QUERIES:
+        assert every_page(snapshot_store, query) == every_page(json_store, query)
+    for query in ({}, {"date_from": 1707000000000, "date_to": 1708000000000, "transaction_type": ["sent"]}):
+        assert snapshot_store.stats(query) == json_store.stats(query)
+
+
+def test_snapshot_round_trip(tmp_path):
+    rng = random.Random(1)
+    records = [make_record(rng, i) for i in range(500)]
+    path = write_dataset(str(tmp_path / "data"), records, snapshot=True)
+
+    snapshot = open_snapshot(str(tmp_path / "data" / "sms_snapshot.bin"), path)
+    snapshot.verify()
+    assert snapshot.rows == len(records)
+    assert list(map(dict, snapshot.iter_records())) == records
+    assert snapshot.find_id("tx-7") == next(i for i, r in enumerate(records) if r["transaction_id"] == "tx-7")
+    assert snapshot.find_id("missing") is None
+
+    # Once the processed file changes, its snapshot no longer describes it
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(" ")
+    assert open_snapshot(str(tmp_path / "data" / "sms_snapshot.bin"), path) is None
+
+
+def test_snapshot_on_top_of_another(tmp_path, monkeypatch):
+    # Small chunks, so the base's records span whole and partial chunks
+    monkeypatch.setattr("etl.snapshot.CHUNK_BYTES", 4096)
+    rng = random.Random(2)
+    records = [make_record(rng, i) for i in range(400)]
+    target = str(tmp_path / "sms_snapshot.bin")
+    write_snapshot(records[:250], target)
+
+    writer = SnapshotWriter(target, Snapshot(target))
+    for record in records[250:]:
+        writer.add(record)
+    writer.commit()
+
+    snapshot = Snapshot(target)
+    snapshot.verify()
+    assert list(map(dict, snapshot.iter_records())) == records
+    assert not os.path.exists(target + ".spool")
+
+
+def test_corrupted_snapshot_is_detected_and_skipped(tmp_path):
+    rng = random.Random(3)
+    records = [make_record(rng, i) for i in range(300)]
+    path = write_dataset(str(tmp_path / "data"), records, snapshot=True)
+    snapshot_path = str(tmp_path / "data" / "sms_snapshot.bin")
+    stat = os.stat(snapshot_path)
+    with open(snapshot_path, "r+b") as f:
+        f.seek(100)
+        byte = f.read(1)
+        f.seek(100)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    with pytest.raises(ValueError, match="checksum"):
+        Snapshot(snapshot_path).verify()
+
+    # The store reads records lazily, so the bad chunk surfaces on the
+    # first read; a damaged table of contents falls back to the JSON
+    with open(snapshot_path, "r+b") as f:
+        f.seek(stat.st_size - 40)
+        f.write(b"\0")
+    store = TransactionStore(path)
+    assert store.all() == records
+
+
+def test_store_from_snapshot_matches_store_from_json(tmp_path):
+    rng = random.Random(5)
+    records = [make_record(rng, i) for i in range(1500)]
+    snapshot_store = TransactionStore(write_dataset(str(tmp_path / "a"), records, snapshot=True))
+    json_store = TransactionStore(write_dataset(str(tmp_path / "b"), records, snapshot=False))
+    snapshot_store.refresh()
+    assert snapshot_store.query(lambda r: hasattr(r, "snapshot"))
+    assert not json_store.query(lambda r: hasattr(r, "snapshot"))
+
+    ids = [f"tx-{i}" for i in range(0, 1700, 7)] + ["tx-3", "tx-49", None]
+    # Writes before any index exists are replayed when one is restored
+    for step in range(300):
+        choice = rng.random()
+        for store in (snapshot_store, json_store):
+            rng_state = rng.getstate()
+            if choice < 0.4:
+                store.add(make_record(rng, 1500 + step))
+            elif choice < 0.7:
+                store.update(f"tx-{rng.randrange(60)}", {"amount": rng.randrange(100), "transaction_type": "sent"})
+            else:
+                store.delete(f"tx-{rng.randrange(60)}")
+            if store is snapshot_store:
+                rng.setstate(rng_state)
+        if step == 150:
+            assert_same(snapshot_store, json_store, ids)
+    assert_same(snapshot_store, json_store, ids)
+
+    # Reloading replays the journal over the snapshot
+    reloaded = TransactionStore(snapshot_store.path)
+    assert_same(reloaded, json_store, ids)
+
+
+def test_merged_keys_match_a_sorted_list():
+    rng = random.Random(6)
+    base = sorted(rng.sample(range(10 ** 6), 3000))
+    keys = MergedKeys(len(base), base.__getitem__, lambda key: bisect_left(base, key))
+    expected = list(base)
+    for step in range(3000):
+        if rng.random() < 0.5 or not expected:
+            key = rng.randrange(10 ** 6) + 0.5
+            keys.add(key)
+            expected.insert(bisect_left(expected, key), key)
+        else:
+            key = expected.pop(rng.randrange(len(expected)))
+            keys.remove(key)
+        if step % 300 == 0:
+            assert len(keys) == len(expected)
+            assert [keys[i] for i in range(len(keys))] == expected
+            assert keys[-1] == expected[-1]
+    assert [keys[i] for i in range(len(keys))] == expected
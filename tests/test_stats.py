@@ -0,0 +1,78 @@
+import math
+import random
+
+import pytest
+
+from api import stats
+from api.stats import StatsIndex, parse_stats_query
+from etl.record_keys import record_value
+
+
+def make_record(rng):
+    return {"date": str(rng.randrange(1000)), "transaction_type": rng.choice(["sent", "received", None]),
+            "amount": rng.choice([None, rng.randrange(1, 5000)]), "balance": rng.choice(["n/a", rng.randrange(9000)])}
+
+
+def expected_stats(records, date_from, date_to):
+    by_type = {}
+    for record in records.values():
+        if record["transaction_type"] is None or not date_from <= int(record["date"]) <= date_to:
+            continue
+        entry = by_type.setdefault(record["transaction_type"], {"count": 0, "amount": [], "balance": []})
+        entry["count"] += 1
+        for field in ("amount", "balance"):
+            value = record_value(record, field)
+            if not math.isnan(value):
+                entry[field].append(value)
+
+    return {tx_type: {"count": entry["count"],
+                      **{field: {"count": len(values), "sum": sum(values), "min": min(values, default=None),
+                                 "max": max(values, default=None)} for field, values in entry.items()
+                         if field != "count"}}
+            for tx_type, entry in by_type.items()}
+
+
+def test_stats_match_a_scan_through_adds_updates_and_deletes(monkeypatch):
+    # Small enough that the buffer, the delta and the main tree all fill up
+    monkeypatch.setattr(stats, "BUFFER_RECORDS", 16)
+    monkeypatch.setattr(stats, "DELTA_SHARE", 2)
+    rng = random.Random(4)
+    records = {seq: make_record(rng) for seq in range(2000)}
+    index = StatsIndex()
+    index.rebuild(records)
+
+    next_seq = len(records)
+    for step in range(2000):
+        choice = rng.random()
+        if choice < 0.5:
+            records[next_seq] = make_record(rng)
+            index.added(next_seq, records[next_seq])
+            next_seq += 1
+        else:
+            seq = rng.choice(list(records))
+            index.removed(seq, records.pop(seq))
+            if choice < 0.75:
+                records[seq] = make_record(rng)
+                index.added(seq, records[seq])
+
+        if step % 250 == 0:
+            for _ in range(20):
+                date_from = rng.randrange(1000)
+                date_to = rng.randrange(date_from, 1000)
+                result = index.stats(records, {"date_from": date_from, "date_to": date_to})
+                assert result["types"] == expected_stats(records, date_from, date_to)
+                assert result["total"]["count"] == sum(s["count"] for s in result["types"].values())
+
+
+def test_parse_stats_query():
+    assert parse_stats_query({"date_from": ["5"], "transaction_type": ["sent", "sent"]}) == \
+        {"date_from": 5, "transaction_type": ["sent"]}
+    # Dates as GET /transactions takes them, in Kigali time (UTC+2)
+    assert parse_stats_query({"date_from": ["2024-05-01"], "date_to": ["2024-05-01"]}) == \
+        {"date_from": 1714514400000, "date_to": 1714600799999}
+    assert parse_stats_query({"date_from": ["2024-05-01 12:00:00"], "date_to": ["2024-05-01 12:00:00"]}) == \
+        {"date_from": 1714557600000, "date_to": 1714557600999}
+    for params in ({"date_from": ["2024-13-01"]}, {"date_from": ["01/05/2024"]}, {"date_from": ["9"], "date_to": ["1"]},
+                   {"date_to": ["1", "2"]}, {"date_to": ["9" * 30]}):
+        with pytest.raises(ValueError):
+            parse_stats_query(params)
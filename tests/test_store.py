@@ -0,0 +1,102 @@
+import os
+import threading
+import time
+
+from api.store import ReadWriteLock, TransactionStore
+from conftest import make_records
+from etl.parse_xml import write_records_stream
+
+
+def write_dataset(directory, records):
+    path = os.path.join(directory, "sms_records.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        write_records_stream(records, f)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def test_lookups_by_transaction_id(tmp_path):
+    records = make_records(50)
+    # Repeated ids: the first in file order is the one found
+    records[30]["transaction_id"] = records[40]["transaction_id"] = "tx-7"
+    records.append({"transaction_id": None, "amount": 1})
+    store = TransactionStore(write_dataset(str(tmp_path), records))
+
+    assert store.get("tx-12") == records[12]
+    assert store.get("tx-30") is None and store.get(None) is None
+    assert store.get("tx-7") == records[7]
+
+    store.delete("tx-7")
+    assert store.get("tx-7") == records[30]
+    store.update("tx-7", {"transaction_id": "tx-moved"})
+    assert store.get("tx-7") == records[40]
+    assert store.get("tx-moved") == dict(records[30], transaction_id="tx-moved")
+    store.add({"transaction_id": "tx-7", "amount": 1})
+    assert store.get("tx-7") == records[40]
+    store.delete("tx-7")
+    assert store.get("tx-7")["amount"] == 1
+    assert store.delete("tx-nope") is None and store.update("tx-nope", {"amount": 1}) is None
+
+    expected = {record["transaction_id"]: record for record in reversed(store.all()) if record["transaction_id"]}
+    for tx_id, record in expected.items():
+        assert store.get(tx_id) == record
+
+
+def test_file_written_by_another_process_is_read_again(tmp_path):
+    path = write_dataset(str(tmp_path), make_records(5))
+    store = TransactionStore(path)
+    assert store.get("tx-9") is None
+
+    write_dataset(str(tmp_path), make_records(10))
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+    assert store.get("tx-9") == make_records(10)[9]
+    assert len(store.all()) == 10
+
+
+def test_waiting_writer_holds_back_new_readers():
+    lock = ReadWriteLock()
+    events = []
+
+    def take(kind):
+        with getattr(lock, kind)():
+            events.append(kind)
+
+    with lock.read():
+        writer = threading.Thread(target=take, args=("write",))
+        writer.start()
+        time.sleep(0.05)
+        reader = threading.Thread(target=take, args=("read",))
+        reader.start()
+        time.sleep(0.05)
+        # Neither gets in while the first reader holds the lock
+        assert events == []
+    writer.join(1)
+    reader.join(1)
+    assert events == ["write", "read"]
+
+    with lock.read(), lock.read():
+        pass
+
+
+def test_concurrent_reads_and_writes_leave_the_store_consistent(tmp_path):
+    store = TransactionStore(write_dataset(str(tmp_path), make_records(20)))
+
+    def write(number):
+        for i in range(50):
+            store.add({"transaction_id": f"w{number}-{i}", "amount": i})
+            if i % 2:
+                store.delete(f"w{number}-{i - 1}")
+
+    def read():
+        for _ in range(200):
+            records = store.all()
+            assert len({record["transaction_id"] for record in records}) == len(records)
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(3)] + \
+        [threading.Thread(target=read) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(store.all()) == 20 + 3 * 25
+    assert all(store.get(f"w{n}-{i}")["amount"] == i for n in range(3) for i in range(1, 50, 2))